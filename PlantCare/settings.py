@@ -207,6 +207,177 @@ from django.urls import reverse_lazy
 LOGIN_URL = reverse_lazy('users:login')
 LOGIN_REDIRECT_URL = reverse_lazy('home')
 
+# ==============================================================================
+# CACHE
+# ==============================================================================
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'plantcare-default',
+    },
+    # Bashorat keshi: LRU (MAX_ENTRIES dan oshsa eng eski ishlatilganlari o'chiriladi) + TTL
+    'predictions': {
+        'BACKEND': os.getenv('PREDICTION_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('PREDICTION_CACHE_LOCATION', 'plantcare-predictions'),
+        'TIMEOUT': int(os.getenv('PREDICTION_CACHE_TIMEOUT', str(60 * 60 * 24))),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('PREDICTION_CACHE_MAX_ENTRIES', '5000')),
+        },
+    },
+}
+
+
+# ==============================================================================
+# ML INFERENCE
+# ==============================================================================
+
+# Modellar import vaqtida yuklanmaydi. True bo'lsa WSGI ilova yaratilganda
+# (birinchi so'rovdan oldin) oldindan yuklanadi; aks holda birinchi bashoratda
+INFERENCE_WARMUP = os.getenv('INFERENCE_WARMUP', 'False').lower() in ('true', '1', 'yes')
+
+# gunicorn preload_app rejimi (gunicorn.conf.py): master fork oldidan kutubxonalarni import
+# qiladi va convert_model artefaktlarining og'irliklarini tayyorlaydi - workerlar ularni
+# copy-on-write orqali bo'lishadi. TF runtime esa har bir workerda fork dan keyin ishga tushadi
+INFERENCE_PRELOAD = os.getenv('INFERENCE_PRELOAD', 'False').lower() in ('true', '1', 'yes')
+INFERENCE_PRELOAD_IMPORT_TF = os.getenv('INFERENCE_PRELOAD_IMPORT_TF', 'True').lower() in ('true', '1', 'yes')
+# TFLite uchun XNNPACK delegatini o'chirib, og'irliklarni mmap qilingan fayldan o'qish
+# (xotira kamayadi, lekin bashorat sekinlashishi mumkin - benchmark_worker_memory bilan o'lchang)
+INFERENCE_TFLITE_SHARED_WEIGHTS = os.getenv('INFERENCE_TFLITE_SHARED_WEIGHTS', 'False').lower() in ('true', '1', 'yes')
+# ONNX initializerlarini masterda o'qib workerlarga bo'lishish (INFERENCE_PRELOAD=True bilan);
+# prepacking o'chiriladi - MatMul/Conv sekinlashadi, benchmark_worker_memory bilan o'lchang
+INFERENCE_ONNX_SHARED_WEIGHTS = os.getenv('INFERENCE_ONNX_SHARED_WEIGHTS', 'False').lower() in ('true', '1', 'yes')
+
+# AIModel da convert_model yaratgan TFLite/ONNX artefakti bo'lsa, Keras o'rniga shu ishlatiladi
+INFERENCE_PREFER_OPTIMIZED = os.getenv('INFERENCE_PREFER_OPTIMIZED', 'True').lower() in ('true', '1', 'yes')
+
+# Keras modeli model.predict o'rniga qat'iy (None, 224, 224, 3) signaturali tf.function orqali
+# chaqiriladi; batch INFERENCE_BATCH_BUCKETS dagi eng yaqin o'lchamgacha to'ldiriladi
+INFERENCE_COMPILED_CALL = os.getenv('INFERENCE_COMPILED_CALL', 'True').lower() in ('true', '1', 'yes')
+INFERENCE_BATCH_BUCKETS = tuple(
+    int(size) for size in os.getenv('INFERENCE_BATCH_BUCKETS', '1,2,4,8,16,32,64').split(',') if size.strip()
+)
+# Har bir worker jarayoni uchun TensorFlow/TFLite/ONNX threadlari (0 - kutubxona standarti).
+# Bir serverda N ta worker bo'lsa, intra_op ~ CPU yadrolari / N qilib qo'yish tavsiya etiladi
+INFERENCE_INTRA_OP_THREADS = int(os.getenv('INFERENCE_INTRA_OP_THREADS', '0'))
+INFERENCE_INTER_OP_THREADS = int(os.getenv('INFERENCE_INTER_OP_THREADS', '0'))
+
+# AIModel o'zgarsa (admin, convert_model) workerlar qayta ishga tushirilmasdan modellar
+# fon oqimida yangilanadi. Tekshiruv INFERENCE_RELOAD_CHECK_INTERVAL soniyada bir marta,
+# eski modellar INFERENCE_RELOAD_GRACE_SECONDS dan keyin xotiradan bo'shatiladi
+INFERENCE_HOT_RELOAD = os.getenv('INFERENCE_HOT_RELOAD', 'True').lower() in ('true', '1', 'yes')
+INFERENCE_RELOAD_CHECK_INTERVAL = float(os.getenv('INFERENCE_RELOAD_CHECK_INTERVAL', '10'))
+INFERENCE_RELOAD_GRACE_SECONDS = float(os.getenv('INFERENCE_RELOAD_GRACE_SECONDS', '60'))
+
+# Har bir worker jarayonida yuklangan modellar uchun xotira budjeti (MB, 0 - cheklovsiz).
+# Oshib ketsa eng uzoq ishlatilmagan o'simlik modellari chiqariladi; INFERENCE_PINNED_MODELS
+# dagi kalitlar (umumiy model) hech qachon chiqarilmaydi
+INFERENCE_MEMORY_BUDGET_MB = float(os.getenv('INFERENCE_MEMORY_BUDGET_MB', '0'))
+INFERENCE_PINNED_MODELS = tuple(
+    key.strip() for key in os.getenv('INFERENCE_PINNED_MODELS', 'disease_all').split(',') if key.strip()
+)
+
+# Shadow sinov: AIModel.is_shadow=True nomzod model so'rovlarning shu ulushida (0 - o'chiq)
+# fon threadida bashorat qiladi va natija ShadowPrediction ga yoziladi. Asosiy inference
+# och qolmasligi uchun: threadlar soni, navbat hajmi (to'lsa namuna tashlanadi),
+# har bir thread CPU ulushi (0.25 - ishlagan vaqtining 3 baravari dam oladi) va nice
+INFERENCE_SHADOW_SAMPLE_RATE = float(os.getenv('INFERENCE_SHADOW_SAMPLE_RATE', '0'))
+INFERENCE_SHADOW_WORKERS = int(os.getenv('INFERENCE_SHADOW_WORKERS', '1'))
+INFERENCE_SHADOW_QUEUE_SIZE = int(os.getenv('INFERENCE_SHADOW_QUEUE_SIZE', '64'))
+INFERENCE_SHADOW_CPU_SHARE = float(os.getenv('INFERENCE_SHADOW_CPU_SHARE', '0.25'))
+INFERENCE_SHADOW_THREADS = int(os.getenv('INFERENCE_SHADOW_THREADS', '1'))
+INFERENCE_SHADOW_NICE = int(os.getenv('INFERENCE_SHADOW_NICE', '10'))
+
+# Micro-batching: bir vaqtda kelgan so'rovlar bitta batch predict ga yig'iladi.
+# Model-server pul jarayonlarida o'chiriladi (jarayon bir vaqtda bitta so'rov bajaradi)
+INFERENCE_BATCHING_ENABLED = os.getenv('INFERENCE_BATCHING_ENABLED', 'True').lower() in ('true', '1', 'yes')
+INFERENCE_BATCH_WINDOW_MS = float(os.getenv('INFERENCE_BATCH_WINDOW_MS', '10'))
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv('INFERENCE_MAX_BATCH_SIZE', '16'))
+# Batcher navbati cheklangan (0 - cheklanmagan): to'lganda yangi so'rovlar kutadi
+INFERENCE_BATCH_QUEUE_SIZE = int(os.getenv('INFERENCE_BATCH_QUEUE_SIZE', '64'))
+
+# Bosqichli pipeline (models/pipeline.py): rasmlar INFERENCE_DECODE_WORKERS ta threadda
+# dekodlanadi va INFERENCE_PIPELINE_QUEUE_SIZE o'lchamli navbat orqali batcherga o'tadi -
+# dekodlash inference bilan ustma-ust bajariladi. Bosqichlar bandligi inference_metrics da
+INFERENCE_PIPELINE_ENABLED = os.getenv('INFERENCE_PIPELINE_ENABLED', 'True').lower() in ('true', '1', 'yes')
+INFERENCE_DECODE_WORKERS = int(os.getenv('INFERENCE_DECODE_WORKERS', '4'))
+INFERENCE_PIPELINE_QUEUE_SIZE = int(os.getenv('INFERENCE_PIPELINE_QUEUE_SIZE', '32'))
+
+# Kaskadning birinchi bosqichi (models/gatekeeper.py): o'lchami kichik, xira yoki o'simlik
+# piksellari kam rasmlar CNN va Gemini dan oldin bir necha millisekundda rad etiladi
+INFERENCE_GATE_ENABLED = os.getenv('INFERENCE_GATE_ENABLED', 'True').lower() in ('true', '1', 'yes')
+INFERENCE_GATE_MIN_SIDE = int(os.getenv('INFERENCE_GATE_MIN_SIDE', '160'))
+INFERENCE_GATE_MIN_SHARPNESS = float(os.getenv('INFERENCE_GATE_MIN_SHARPNESS', '15'))
+INFERENCE_GATE_MIN_PLANT_RATIO = float(os.getenv('INFERENCE_GATE_MIN_PLANT_RATIO', '0.05'))
+
+# Bo'lakli (tiled) inference (API da tiled=1): katta rasm bir-birini qoplaydigan 224x224
+# bo'laklarga ajratiladi. Dekodlash eng uzun tomon INFERENCE_TILE_MAX_SIDE bilan, bo'laklar
+# soni INFERENCE_TILE_MAX_TILES bilan cheklanadi; xulosa har bir sinfning eng yuqori
+# INFERENCE_TILE_TOP_FRACTION qism bo'laklari o'rtachasidan olinadi
+INFERENCE_TILE_MAX_SIDE = int(os.getenv('INFERENCE_TILE_MAX_SIDE', '2048'))
+INFERENCE_TILE_MAX_TILES = int(os.getenv('INFERENCE_TILE_MAX_TILES', '64'))
+INFERENCE_TILE_OVERLAP = float(os.getenv('INFERENCE_TILE_OVERLAP', '0.25'))
+INFERENCE_TILE_TOP_FRACTION = float(os.getenv('INFERENCE_TILE_TOP_FRACTION', '0.05'))
+
+# Yaqin-dublikat yuklamalar (diagnosis/duplicates.py): shu foydalanuvchi yoki Telegram chat
+# DUPLICATE_WINDOW_MINUTES ichida pHash bo'yicha DUPLICATE_MAX_DISTANCE bitdan kam farq
+# qiladigan rasm yuborsa, CNN ishga tushirilmaydi va oldingi natija qaytariladi.
+# Oxirgi yuklamalar 'predictions' keshida: LocMem da har bir jarayon o'zi uchun,
+# workerlar o'rtasida umumiy bo'lishi uchun PREDICTION_CACHE_BACKEND (Redis/Memcached)
+DUPLICATE_DETECTION_ENABLED = os.getenv('DUPLICATE_DETECTION_ENABLED', 'True').lower() in ('true', '1', 'yes')
+DUPLICATE_MAX_DISTANCE = int(os.getenv('DUPLICATE_MAX_DISTANCE', '8'))
+DUPLICATE_WINDOW_MINUTES = int(os.getenv('DUPLICATE_WINDOW_MINUTES', '30'))
+
+# O'xshash o'tgan holatlar (diagnosis/embeddings.py): yakunlangan tashxislarning embeddinglari
+# model bo'yicha float16 memmap omborga fon navbatida qo'shiladi; arxiv
+# `manage.py rebuild_embeddings` bilan qayta quriladi. Ombor EMBEDDING_IVF_MIN_VECTORS dan
+# katta bo'lsa IVF indeks o'qitiladi va qidiruv EMBEDDING_SEARCH_NPROBE klasterni ko'radi.
+# Ombor shu chegaraga yetganda (va keyin har ikki barobar o'sganda) web jarayoni o'qitishni so'raydi,
+# k-means ni `run_diagnosis_worker` EMBEDDING_TRAIN_CHECK_INTERVAL soniyada bir tekshirib bajaradi
+EMBEDDING_STORE_ENABLED = os.getenv('EMBEDDING_STORE_ENABLED', 'False').lower() in ('true', '1', 'yes')
+EMBEDDING_STORE_DIR = os.getenv('EMBEDDING_STORE_DIR', str(BASE_DIR / 'embeddings'))
+EMBEDDING_SEARCH_NPROBE = int(os.getenv('EMBEDDING_SEARCH_NPROBE', '8'))
+EMBEDDING_IVF_MIN_VECTORS = int(os.getenv('EMBEDDING_IVF_MIN_VECTORS', '20000'))
+EMBEDDING_INDEX_QUEUE_SIZE = int(os.getenv('EMBEDDING_INDEX_QUEUE_SIZE', '256'))
+EMBEDDING_REFRESH_INTERVAL = float(os.getenv('EMBEDDING_REFRESH_INTERVAL', '5'))
+EMBEDDING_TRAIN_CHECK_INTERVAL = float(os.getenv('EMBEDDING_TRAIN_CHECK_INTERVAL', '60'))
+
+# Inference rejimi: 'local' - model shu jarayonda yuklanadi,
+# 'server' - bashorat `manage.py run_model_server` puliga Unix socket orqali yuboriladi
+INFERENCE_MODE = os.getenv('INFERENCE_MODE', 'local')
+MODEL_SERVER_SOCKET = os.getenv('MODEL_SERVER_SOCKET', '/tmp/plantcare_model_server.sock')
+MODEL_SERVER_WORKERS = int(os.getenv('MODEL_SERVER_WORKERS', '2'))
+MODEL_SERVER_TIMEOUT = float(os.getenv('MODEL_SERVER_TIMEOUT', '60'))
+
+# Bir xil rasm (baytlar xeshi) + model versiyasi uchun bashorat keshi
+PREDICTION_CACHE_ENABLED = os.getenv('PREDICTION_CACHE_ENABLED', 'True').lower() in ('true', '1', 'yes')
+PREDICTION_CACHE_ALIAS = 'predictions'
+# AIModel holati (generation) necha soniyada bir marta bazadan tekshiriladi
+PREDICTION_CACHE_GENERATION_TTL = float(os.getenv('PREDICTION_CACHE_GENERATION_TTL', '5'))
+
+# Gemini tavsiyalari keshi (Recommendation jadvali + xotira)
+RECOMMENDATION_CACHE_ENABLED = os.getenv('RECOMMENDATION_CACHE_ENABLED', 'True').lower() in ('true', '1', 'yes')
+RECOMMENDATION_MAX_AGE_DAYS = int(os.getenv('RECOMMENDATION_MAX_AGE_DAYS', '30'))
+RECOMMENDATION_MEMORY_TIMEOUT = int(os.getenv('RECOMMENDATION_MEMORY_TIMEOUT', str(60 * 60)))
+
+# Fon rejimidagi tashxis: True bo'lsa /diagnosis/test/ rasmni navbatga qo'yib job id qaytaradi,
+# tahlilni `manage.py run_diagnosis_worker` bajaradi (so'rovda async=1 bilan ham yoqiladi)
+DIAGNOSIS_ASYNC = os.getenv('DIAGNOSIS_ASYNC', 'False').lower() in ('true', '1', 'yes')
+# Egallangan, lekin shu vaqt (soniya) ichida tugamagan job qayta navbatga qo'yiladi
+DIAGNOSIS_JOB_STALE_AFTER = int(os.getenv('DIAGNOSIS_JOB_STALE_AFTER', '300'))
+DIAGNOSIS_JOB_MAX_ATTEMPTS = int(os.getenv('DIAGNOSIS_JOB_MAX_ATTEMPTS', '3'))
+
+# Bulk tashxis API (/api/v1/predict/bulk/): bir so'rovdagi rasmlar soni, bitta rasm hajmi
+# va parallel dekodlash threadlari
+BULK_DIAGNOSIS_MAX_IMAGES = int(os.getenv('BULK_DIAGNOSIS_MAX_IMAGES', '64'))
+BULK_DIAGNOSIS_MAX_IMAGE_BYTES = int(os.getenv('BULK_DIAGNOSIS_MAX_IMAGE_BYTES', str(15 * 1024 * 1024)))
+BULK_DIAGNOSIS_DECODE_WORKERS = int(os.getenv('BULK_DIAGNOSIS_DECODE_WORKERS', '4'))
+
+# Bir nechta rasmli tashxis sessiyasi (diagnosis/sessions.py): bitta o'simlikning shuncha rasmi
+# bitta batch bilan baholanib, umumiy xulosaga birlashtiriladi
+DIAGNOSIS_SESSION_MIN_IMAGES = int(os.getenv('DIAGNOSIS_SESSION_MIN_IMAGES', '2'))
+DIAGNOSIS_SESSION_MAX_IMAGES = int(os.getenv('DIAGNOSIS_SESSION_MAX_IMAGES', '10'))
+
 # ==============================================================================
 # TELEGRAM BOT SETTINGS
 # ==============================================================================
@@ -14,3 +14,18 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'PlantCare.settings')
 
 application = get_wsgi_application()
+
+# Modellarni oldindan yuklash (INFERENCE_WARMUP=True). Management buyruqlari
+# (migrate, collectstatic, ...) wsgi.py ni import qilmaydi va ML narxini to'lamaydi.
+# INFERENCE_PRELOAD=True da wsgi.py gunicorn masterida import qilinadi: bu yerda faqat
+# fork-safe tayyorgarlik, modellar esa gunicorn.conf.py dagi post_fork da yuklanadi.
+from django.conf import settings
+
+if settings.INFERENCE_PRELOAD:
+    from models.preload import preload_for_fork
+
+    preload_for_fork()
+elif settings.INFERENCE_WARMUP:
+    from diagnosis.model_loader import warmup
+
+    warmup()
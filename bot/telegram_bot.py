@@ -3,13 +3,19 @@ PlantCare Telegram Bot
 Foydalanuvchilar rasm yuborib o'simlik kasalliklarini tekshirishi mumkin
 """
 import os
+import asyncio
 import logging
+from asgiref.sync import sync_to_async
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
 from django.core.files.uploadedfile import SimpleUploadedFile
 from diagnosis.model_loader import predict_plant_disease
 from diagnosis.ai_utils import get_ai_recommendation
+from diagnosis.sessions import diagnose_session
+from models.gatekeeper import ImageRejected
 from PIL import Image
 import io
 
@@ -20,6 +26,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Albom (media group) rasmlari alohida update bo'lib keladi - shu vaqt kutilib,
+# bitta o'simlikning rasmlari sifatida bitta sessiyada tahlil qilinadi
+ALBUM_WAIT_SECONDS = 1.5
+_albums = {}
+
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start command handler"""
@@ -47,7 +58,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     help_text = """
 📚 Qanday foydalanish kerak?
 
-1. O'simlik rasmini yuboring (kasallangan joyini yaxshi ko'rinadigan qilib)
+1. O'simlik rasmini yuboring (kasallangan joyini yaxshi ko'rinadigan qilib).
+   Bitta o'simlikning 2-10 ta bargini albom qilib yuborsangiz, umumiy xulosa beriladi
 2. Bir necha soniya kuting
 3. Natijani va tavsiyalarni oling
 
@@ -90,6 +102,10 @@ Fermerlar va bog'bonlarga kasalliklarni erta bosqichda aniqlash va samarali davo
 
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle photo messages"""
+    if update.message.media_group_id:
+        collect_album_photo(update, context)
+        return
+    
     try:
         # Send processing message
         processing_msg = await update.message.reply_text("🔄 Rasm tahlil qilinmoqda, iltimos kuting...")
@@ -106,8 +122,10 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         temp_path = f"/tmp/telegram_{update.effective_user.id}_{photo.file_id}.jpg"
         image.save(temp_path)
         
-        # Predict disease
-        disease_name, confidence = predict_plant_disease(temp_path)
+        # Predict disease (bloklovchi inference va DB so'rovlari alohida oqimda)
+        disease_name, confidence = await sync_to_async(predict_plant_disease)(
+            temp_path, chat_id=update.effective_chat.id
+        )
         
         # Delete processing message
         await processing_msg.delete()
@@ -126,7 +144,7 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
             # Get AI recommendation
             try:
-                ai_recommendation = get_ai_recommendation(disease_name, lang='uz')
+                ai_recommendation = await sync_to_async(get_ai_recommendation)(disease_name, lang='uz')
             except:
                 ai_recommendation = "AI tavsiya olishda xatolik yuz berdi."
             
@@ -160,6 +178,80 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 
+def resolve_user(telegram_user):
+    """
+    Telegram foydalanuvchisiga mos sayt foydalanuvchisi (``tg_<id>``, parolsiz) -
+    albom sessiyalari tarixda saqlanishi uchun; birinchi murojaatda yaratiladi
+    """
+    user, _ = get_user_model().objects.get_or_create(
+        username=f"tg_{telegram_user.id}",
+        defaults={
+            'first_name': (telegram_user.first_name or '')[:150],
+            'password': make_password(None),
+        },
+    )
+    return user
+
+
+def collect_album_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Albom rasmini yig'ish; birinchi rasm kelganda tahlil rejalashtiriladi"""
+    group_id = update.message.media_group_id
+    photos = _albums.get(group_id)
+    if photos is None:
+        photos = _albums[group_id] = []
+        context.application.create_task(handle_album(group_id, update, context))
+    photos.append(update.message.photo[-1])
+
+
+async def handle_album(group_id, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Bitta o'simlikning bir nechta rasmi: bitta batch va umumiy xulosa"""
+    await asyncio.sleep(ALBUM_WAIT_SECONDS)
+    photos = _albums.pop(group_id, [])[:getattr(settings, 'DIAGNOSIS_SESSION_MAX_IMAGES', 10)]
+    try:
+        processing_msg = await update.message.reply_text(
+            f"🔄 {len(photos)} ta rasm bitta o'simlik sifatida tahlil qilinmoqda, iltimos kuting..."
+        )
+        items = []
+        for photo in photos:
+            file = await context.bot.get_file(photo.file_id)
+            items.append((f"telegram_{photo.file_id}.jpg", bytes(await file.download_as_bytearray())))
+        
+        user = await sync_to_async(resolve_user)(update.effective_user)
+        result = await sync_to_async(diagnose_session)(items, user=user)
+        await processing_msg.delete()
+        
+        if not result['confident']:
+            await update.message.reply_text(
+                "❌ Kasallik aniqlanmadi - rasmlar bo'yicha aniqlik juda past. "
+                "Iltimos, aniqroq rasmlar yuboring yoki boshqa burchakdan oling."
+            )
+            return
+        
+        analysed = sum(1 for image in result['images'] if not image['error'])
+        agreed = round(result['agreement'] * analysed)
+        response_text = f"""
+🔍 **Umumiy tahlil ({result['image_count']} ta rasm):**
+
+🌱 Kasallik: **{result['disease']}**
+✅ Aniqlik: **{result['confidence']:.1f}%**
+🧩 Moslik: **{agreed}/{analysed}** rasm shu xulosaga mos
+
+💊 **Tavsiyalar:**
+{result['recommendation'][:800]}...
+
+📊 Batafsil ma'lumot uchun: https://plantcare.uz
+"""
+        await update.message.reply_text(response_text, parse_mode='Markdown')
+    
+    except ImageRejected as e:
+        await update.message.reply_text(f"❌ Kasallik aniqlanmadi - {e.message}")
+    except Exception as e:
+        logger.error(f"Error processing album: {e}")
+        await update.message.reply_text(
+            "❌ Xatolik yuz berdi. Iltimos, qaytadan urinib ko'ring yoki @plantcare_support ga murojaat qiling."
+        )
+
+
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle text messages"""
     text = update.message.text.lower()
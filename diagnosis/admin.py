@@ -1,5 +1,9 @@
-from django.contrib import admin
-from .models import Disease, PlantImage, Recommendation, AIModel, PlantType
+from django.contrib import admin, messages
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html
+from .models import Disease, PlantImage, Recommendation, AIModel, PlantType, ShadowPrediction, DiagnosisSession
 
 
 @admin.register(PlantType)
@@ -30,22 +34,91 @@ class DiseaseAdmin(admin.ModelAdmin):
 
 @admin.register(PlantImage)
 class PlantImageAdmin(admin.ModelAdmin):
-    list_display = ('user', 'uploaded_at', 'disease', 'confidence')
+    list_display = ('user', 'uploaded_at', 'disease', 'confidence', 'confirmed', 'duplicate_of')
     search_fields = ('user__username',)
-    list_filter = ('disease',)
+    list_filter = ('disease', 'confirmed')
+    actions = ['confirm_diagnoses', 'unconfirm_diagnoses']
+    
+    def _set_confirmed(self, request, queryset, value):
+        """Bazadagi va embedding omboridagi tasdiq belgisini birga yangilash"""
+        from .embeddings import set_confirmed
+        
+        updated = queryset.update(confirmed=value)
+        try:
+            set_confirmed(queryset.only('pk', 'detection_type', 'plant_type_code'), value)
+        except Exception as e:
+            self.message_user(request, f"⚠️ Embedding ombori yangilanmadi: {e}", level=messages.WARNING)
+        self.message_user(request, f"✅ {updated} ta tashxis yangilandi")
+    
+    def confirm_diagnoses(self, request, queryset):
+        self._set_confirmed(request, queryset, True)
+    confirm_diagnoses.short_description = "Tanlangan tashxislarni tasdiqlash (o'xshash holatlarda ko'rsatiladi)"
+    
+    def unconfirm_diagnoses(self, request, queryset):
+        self._set_confirmed(request, queryset, False)
+    unconfirm_diagnoses.short_description = 'Tanlangan tashxislar tasdig\'ini bekor qilish'
+    
+    def get_urls(self):
+        return [
+            path(
+                'duplicates/',
+                self.admin_site.admin_view(self.duplicate_clusters_view),
+                name='diagnosis_plantimage_duplicates'
+            ),
+        ] + super().get_urls()
+    
+    def duplicate_clusters_view(self, request):
+        """pHash bo'yicha yaqin-dublikat klasterlar (``?days=`` - oxirgi kunlar, standart 30)"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from .duplicates import find_clusters
+        
+        try:
+            days = int(request.GET.get('days', 30))
+        except ValueError:
+            days = 30
+        queryset = PlantImage.objects.filter(created_at__gte=timezone.now() - timedelta(days=days))
+        clusters = find_clusters(queryset)
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            title="Yaqin-dublikat rasmlar",
+            days=days,
+            clusters=clusters[:100],
+            total_clusters=len(clusters),
+            total_images=sum(cluster['size'] for cluster in clusters),
+            conflicting=sum(1 for cluster in clusters if cluster['conflicting']),
+        )
+        return TemplateResponse(request, 'admin/diagnosis/plantimage/duplicate_clusters.html', context)
 
 @admin.register(Recommendation)
 class RecommendationAdmin(admin.ModelAdmin):
-    list_display = ('disease', 'language', 'ai_source', 'created_at')
+    list_display = ('disease', 'language', 'ai_source', 'created_at', 'updated_at')
     list_filter = ('language', 'ai_source')
+    actions = ['regenerate_recommendations']
+    
+    def regenerate_recommendations(self, request, queryset):
+        """Tanlangan tavsiyalarni Gemini dan qayta olish"""
+        from .ai_utils import generate_ai_recommendation
+        from .recommendation_cache import regenerate
+        
+        updated = sum(
+            1 for recommendation in queryset.select_related('disease')
+            if regenerate(recommendation, generate_ai_recommendation)
+        )
+        failed = queryset.count() - updated
+        self.message_user(request, f"✅ {updated} ta tavsiya yangilandi")
+        if failed:
+            self.message_user(request, f"⚠️ {failed} ta tavsiyani yangilab bo'lmadi", level=messages.WARNING)
+    regenerate_recommendations.short_description = 'Tanlangan tavsiyalarni qayta yaratish (Gemini)'
 
 
 @admin.register(AIModel)
 class AIModelAdmin(admin.ModelAdmin):
-    list_display = ('name', 'detection_type', 'plant_type', 'version', 'is_active', 'accuracy', 'uploaded_at', 'uploaded_by')
-    list_filter = ('detection_type', 'plant_type', 'is_active', 'uploaded_at')
+    list_display = ('name', 'detection_type', 'plant_type', 'version', 'is_active', 'is_shadow', 'accuracy', 'optimized_format', 'uploaded_at', 'uploaded_by')
+    list_filter = ('detection_type', 'plant_type', 'is_active', 'is_shadow', 'uploaded_at')
     search_fields = ('name', 'description', 'version')
-    readonly_fields = ('uploaded_at', 'updated_at', 'get_model_key')
+    readonly_fields = ('uploaded_at', 'updated_at', 'get_model_key', 'shadow_report_link')
     
     fieldsets = (
         ('Asosiy ma\'lumotlar', {
@@ -54,9 +127,17 @@ class AIModelAdmin(admin.ModelAdmin):
         ('Model fayllari', {
             'fields': ('model_file', 'class_indices_file')
         }),
+        ('Optimallashtirilgan model', {
+            'fields': ('optimized_file', 'optimized_format', 'optimization_report'),
+            'classes': ('collapse',)
+        }),
         ('Holat va statistika', {
             'fields': ('is_active', 'accuracy', 'total_classes')
         }),
+        ('Shadow sinov', {
+            'fields': ('is_shadow', 'shadow_report_link'),
+            'classes': ('collapse',)
+        }),
         ('Qo\'shimcha ma\'lumotlar', {
             'fields': ('uploaded_by', 'uploaded_at', 'updated_at', 'get_model_key'),
             'classes': ('collapse',)
@@ -72,4 +153,63 @@ class AIModelAdmin(admin.ModelAdmin):
         """Model kalitini ko'rsatish"""
         return obj.get_model_key()
     get_model_key.short_description = 'Model kaliti'
+    
+    def shadow_report_link(self, obj):
+        if not obj.pk:
+            return '-'
+        url = reverse('admin:diagnosis_aimodel_shadow_report', args=[obj.pk])
+        return format_html('<a href="{}">Shadow hisobotini ko\'rish ({} ta bashorat)</a>', url, obj.shadow_predictions.count())
+    shadow_report_link.short_description = 'Shadow hisobot'
+    
+    def get_urls(self):
+        return [
+            path(
+                '<int:pk>/shadow/',
+                self.admin_site.admin_view(self.shadow_report_view),
+                name='diagnosis_aimodel_shadow_report'
+            ),
+        ] + super().get_urls()
+    
+    def shadow_report_view(self, request, pk):
+        """Nomzod model: asosiy model bilan moslik, sinflar bo'yicha confusion va latency"""
+        from .shadow import build_report
+        
+        candidate = get_object_or_404(AIModel, pk=pk)
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            original=candidate,
+            title=f'Shadow hisobot: {candidate.name} v{candidate.version}',
+            report=build_report(candidate),
+        )
+        return TemplateResponse(request, 'admin/diagnosis/aimodel/shadow_report.html', context)
+
+
+@admin.register(ShadowPrediction)
+class ShadowPredictionAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'candidate', 'model_key', 'primary_label', 'candidate_label', 'agreed', 'latency_ms')
+    list_filter = ('agreed', 'candidate', 'model_key')
+    readonly_fields = [field.name for field in ShadowPrediction._meta.fields]
+    
+    def has_add_permission(self, request):
+        return False
+
+
+class SessionImageInline(admin.TabularInline):
+    model = PlantImage
+    fields = ('image', 'disease_name', 'confidence', 'status')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+
 
+@admin.register(DiagnosisSession)
+class DiagnosisSessionAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'user', 'disease_name', 'confidence', 'agreement', 'image_count')
+    list_filter = ('detection_type', 'created_at')
+    search_fields = ('user__username', 'disease_name')
+    readonly_fields = ('created_at',)
+    inlines = [SessionImageInline]
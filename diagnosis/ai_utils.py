@@ -49,84 +49,96 @@ def markdown_formatter(text):
 
     return formatted_text
 
-# Google Generative AI import
-try:
-    import google.generativeai as genai
-    GENAI_AVAILABLE = True
-except ImportError:
-    GENAI_AVAILABLE = False
-    genai = None
+
+class IncrementalMarkdownFormatter:
+    """
+    Oqim (stream) bo'laklarini ``markdown_formatter`` orqali HTML ga aylantiradi.
+    Faqat tugallangan bloklar (bo'sh qator bilan ajratilgan) formatlanadi, shuning
+    uchun ro'yxat yoki ``**`` belgisi bo'laklar orasida bo'linib qolmaydi.
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._parts = []
+
+    def feed(self, chunk):
+        """Yangi bo'lakni qo'shish; tayyor bo'lgan HTML qismini (yoki '') qaytaradi"""
+        self._buffer += chunk
+        self._parts.append(chunk)
+        boundary = self._buffer.rfind('\n\n')
+        if boundary == -1:
+            return ''
+        ready, self._buffer = self._buffer[:boundary], self._buffer[boundary + 2:]
+        return markdown_formatter(ready) if ready.strip() else ''
+
+    def flush(self):
+        """Qolgan (oxirgi) blokni formatlash"""
+        ready, self._buffer = self._buffer, ''
+        return markdown_formatter(ready) if ready.strip() else ''
+
+    @property
+    def text(self):
+        """Hozirgacha kelgan to'liq markdown matn"""
+        return ''.join(self._parts)
 
 load_dotenv()
 
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 
-# Configure Gemini AI
-if GEMINI_API_KEY and GENAI_AVAILABLE:
+_genai = None
+_genai_loaded = False
+
+
+def _get_genai():
+    """
+    Google Generative AI ni birinchi chaqiruvda import qilish va sozlash.
+    Import vaqtida gRPC/protobuf yuklanmaydi, shuning uchun Django tez ishga tushadi.
+    """
+    global _genai, _genai_loaded
+    if _genai_loaded:
+        return _genai
+    _genai_loaded = True
     try:
-        genai.configure(api_key=GEMINI_API_KEY)
-    except Exception as e:
-        print(f"Gemini AI configuration error: {e}")
-        GENAI_AVAILABLE = False
+        import google.generativeai as genai
+    except ImportError:
+        return None
+    if GEMINI_API_KEY:
+        try:
+            genai.configure(api_key=GEMINI_API_KEY)
+        except Exception as e:
+            print(f"Gemini AI configuration error: {e}")
+            return None
+    _genai = genai
+    return _genai
 
 def get_ai_recommendation(disease_name, lang='uz'):
     """
-    GEMINI AI dan kasallik bo'yicha tavsiya olish
+    GEMINI AI dan kasallik bo'yicha tavsiya olish.
+    Natija (kasallik, til) bo'yicha Recommendation jadvalida keshlanadi.
+    """
+    from . import recommendation_cache
+    
+    if not recommendation_cache.is_enabled():
+        return generate_ai_recommendation(disease_name, lang)[0]
+    return recommendation_cache.get_recommendation(disease_name, lang, generate_ai_recommendation)
+
+def generate_ai_recommendation(disease_name, lang='uz'):
+    """
+    GEMINI AI dan tavsiyani keshsiz olish.
+
+    Returns:
+        tuple: (html, ai_source) - ai_source faqat haqiqiy Gemini javobi uchun
+        'GEMINI', xato yoki fallback matnlari uchun None (ular keshlanmaydi)
     """
     if not GEMINI_API_KEY:
-        return "AI tavsiya xizmati hozircha mavjud emas. API kalit sozlanmagan."
+        return "AI tavsiya xizmati hozircha mavjud emas. API kalit sozlanmagan.", None
     
-    if not GENAI_AVAILABLE:
-        return "Google Generative AI kutubxonasi mavjud emas. Iltimos, kutubxonani o'rnating."
+    genai = _get_genai()
+    if genai is None:
+        return "Google Generative AI kutubxonasi mavjud emas. Iltimos, kutubxonani o'rnating.", None
     
     try:
-        # Language-specific prompts
-        prompts = {
-            'uz': f"""
-            {disease_name} kasalligi aniqlandi. 
-            
-            Iltimos, quyidagi ma'lumotlarni o'zbek tilida bering:
-            1. Kasallik haqida qisqa ma'lumot
-            2. Asosiy belgilar va alomatlar
-            3. Kasallikning sabablari
-            4. O'zbekistan sharoitida davolash usullari
-            5. Oldini olish choralari
-            6. Tavsiya etiladigan dori vositalari (agar mavjud bo'lsa)
-            7. Qo'shimcha parvarish bo'yicha maslahatlar
-            
-            Javobni aniq va tushunarli tarzda yozing. O'zbekistan fermerlari uchun amaliy bo'lsin.
-            """,
-            'ru': f"""
-            Обнаружена болезнь: {disease_name}
-            
-            Пожалуйста, предоставьте информацию на русском языке:
-            1. Краткая информация о болезни
-            2. Основные симптомы и признаки
-            3. Причины заболевания
-            4. Методы лечения в условиях Узбекистана
-            5. Профилактические меры
-            6. Рекомендуемые препараты (если имеются)
-            7. Дополнительные советы по уходу
-            
-            Ответ должен быть практичным для фермеров Узбекистана.
-            """,
-            'en': f"""
-            Disease detected: {disease_name}
-            
-            Please provide information in English:
-            1. Brief information about the disease
-            2. Main symptoms and signs
-            3. Causes of the disease
-            4. Treatment methods suitable for Uzbekistan conditions
-            5. Prevention measures
-            6. Recommended medications (if available)
-            7. Additional care advice
-            
-            The answer should be practical for farmers in Uzbekistan.
-            """
-        }
-        
-        prompt = prompts.get(lang, prompts['uz'])
+        prompt = _build_recommendation_prompt(disease_name, lang)
         
         # Initialize Gemini model
         model = genai.GenerativeModel('gemini-2.5-pro')
@@ -135,24 +147,141 @@ def get_ai_recommendation(disease_name, lang='uz'):
         response = model.generate_content(prompt)
         
         if response and response.text:
-            return markdown_formatter(response.text.strip())
+            return markdown_formatter(response.text.strip()), 'GEMINI'
         else:
-            return "AI javob bermadi. Iltimos, keyinroq urinib ko'ring."
+            return "AI javob bermadi. Iltimos, keyinroq urinib ko'ring.", None
             
     except Exception as e:
-        error_msg = str(e)
-        print(f"❌ AI xatolik: {error_msg}")
+        return _recommendation_error(e, disease_name, lang), None
+
+def stream_ai_recommendation(disease_name, lang='uz'):
+    """
+    GEMINI AI tavsiyasini oqim (stream) sifatida olish (keshsiz).
+
+    Yields:
+        str: tayyor bo'lgan HTML bo'laklari
+    Returns:
+        tuple: ``generate_ai_recommendation`` kabi (html, ai_source); html
+        to'liq matnning ``markdown_formatter`` natijasi
+    """
+    if not GEMINI_API_KEY:
+        text = "AI tavsiya xizmati hozircha mavjud emas. API kalit sozlanmagan."
+        yield text
+        return text, None
+    
+    genai = _get_genai()
+    if genai is None:
+        text = "Google Generative AI kutubxonasi mavjud emas. Iltimos, kutubxonani o'rnating."
+        yield text
+        return text, None
+    
+    formatter = IncrementalMarkdownFormatter()
+    try:
+        model = genai.GenerativeModel('gemini-2.5-pro')
+        response = model.generate_content(_build_recommendation_prompt(disease_name, lang), stream=True)
+        for chunk in response:
+            html = formatter.feed(chunk.text)
+            if html:
+                yield html
+    except Exception as e:
+        text = _recommendation_error(e, disease_name, lang)
+        yield text
+        return text, None
+    
+    html = formatter.flush()
+    if html:
+        yield html
+    if not formatter.text.strip():
+        text = "AI javob bermadi. Iltimos, keyinroq urinib ko'ring."
+        yield text
+        return text, None
+    return markdown_formatter(formatter.text.strip()), 'GEMINI'
+
+def stream_recommendation(disease_name, lang='uz'):
+    """
+    ``get_ai_recommendation`` ning oqimli varianti: keshda bo'lsa bitta bo'lak,
+    aks holda Gemini javobi kelishi bilan bo'laklab.
+
+    Returns:
+        str: to'liq (kanonik) HTML tavsiya
+    """
+    from . import recommendation_cache
+    
+    if recommendation_cache.is_enabled():
+        cached = recommendation_cache.lookup(disease_name, lang)
+        if cached is not None:
+            yield cached
+            return cached
+    
+    text, ai_source = yield from stream_ai_recommendation(disease_name, lang)
+    if recommendation_cache.is_enabled():
+        recommendation_cache.store_generated(disease_name, lang, text, ai_source)
+    return text
+
+def _build_recommendation_prompt(disease_name, lang):
+    """Kasallik va til bo'yicha Gemini prompti"""
+    prompts = {
+        'uz': f"""
+        {disease_name} kasalligi aniqlandi. 
+        
+        Iltimos, quyidagi ma'lumotlarni o'zbek tilida bering:
+        1. Kasallik haqida qisqa ma'lumot
+        2. Asosiy belgilar va alomatlar
+        3. Kasallikning sabablari
+        4. O'zbekistan sharoitida davolash usullari
+        5. Oldini olish choralari
+        6. Tavsiya etiladigan dori vositalari (agar mavjud bo'lsa)
+        7. Qo'shimcha parvarish bo'yicha maslahatlar
+        
+        Javobni aniq va tushunarli tarzda yozing. O'zbekistan fermerlari uchun amaliy bo'lsin.
+        """,
+        'ru': f"""
+        Обнаружена болезнь: {disease_name}
         
-        # Agar quota tugagan bo'lsa yoki limit oshgan bo'lsa, fallback
-        if any(word in error_msg.lower() for word in ["quota", "limit", "429", "rate"]):
-            print("⚠️ Gemini API limiti tugagan, fallback rejimiga o'tilmoqda...")
-            try:
-                from .ai_utils_simple import get_ai_recommendation as fallback_recommendation
-                return fallback_recommendation(disease_name, lang)
-            except:
-                pass
+        Пожалуйста, предоставьте информацию на русском языке:
+        1. Краткая информация о болезни
+        2. Основные симптомы и признаки
+        3. Причины заболевания
+        4. Методы лечения в условиях Узбекистана
+        5. Профилактические меры
+        6. Рекомендуемые препараты (если имеются)
+        7. Дополнительные советы по уходу
         
-        return f"AI tavsiya olishda vaqtincha xatolik. Iltimos, keyinroq qayta urinib ko'ring."
+        Ответ должен быть практичным для фермеров Узбекистана.
+        """,
+        'en': f"""
+        Disease detected: {disease_name}
+        
+        Please provide information in English:
+        1. Brief information about the disease
+        2. Main symptoms and signs
+        3. Causes of the disease
+        4. Treatment methods suitable for Uzbekistan conditions
+        5. Prevention measures
+        6. Recommended medications (if available)
+        7. Additional care advice
+        
+        The answer should be practical for farmers in Uzbekistan.
+        """
+    }
+    
+    return prompts.get(lang, prompts['uz'])
+
+def _recommendation_error(error, disease_name, lang):
+    """Gemini xatoligi uchun foydalanuvchiga ko'rsatiladigan matn (limitda - fallback)"""
+    error_msg = str(error)
+    print(f"❌ AI xatolik: {error_msg}")
+    
+    # Agar quota tugagan bo'lsa yoki limit oshgan bo'lsa, fallback
+    if any(word in error_msg.lower() for word in ["quota", "limit", "429", "rate"]):
+        print("⚠️ Gemini API limiti tugagan, fallback rejimiga o'tilmoqda...")
+        try:
+            from .ai_utils_simple import get_ai_recommendation as fallback_recommendation
+            return fallback_recommendation(disease_name, lang)
+        except:
+            pass
+    
+    return f"AI tavsiya olishda vaqtincha xatolik. Iltimos, keyinroq qayta urinib ko'ring."
 
 def chat_with_ai(question, lang='uz'):
     """
@@ -161,7 +290,8 @@ def chat_with_ai(question, lang='uz'):
     if not GEMINI_API_KEY:
         return "AI chat xizmati hozircha mavjud emas. API kalit sozlanmagan."
     
-    if not GENAI_AVAILABLE:
+    genai = _get_genai()
+    if genai is None:
         return "Google Generative AI kutubxonasi mavjud emas. Iltimos, kutubxonani o'rnating."
     
     try:
@@ -0,0 +1,159 @@
+"""
+Ko'p rasmli (bulk) tashxis: bir so'rovda multipart ro'yxat yoki zip arxiv.
+
+Har bir rasm avval kaskad filtridan o'tadi (rad etilganlar CNN ga bormaydi),
+so'ng parallel dekodlanib modeldan batch bilan o'tadi (model-server rejimida
+bo'laklar ``predict_batch`` so'rovlari bilan). Tavsiya har bir aniqlangan
+kasallik uchun bir marta olinadi, ``PlantImage`` yozuvlari esa
+``bulk_create`` bilan bitta so'rovda saqlanadi.
+"""
+import os
+import zipfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from models.gatekeeper import ImageRejected
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+
+class BulkUploadError(ValueError):
+    """Yuklangan fayllar qabul qilinmadi (400 javob)"""
+
+
+def _limits():
+    return (
+        getattr(settings, 'BULK_DIAGNOSIS_MAX_IMAGES', 64),
+        getattr(settings, 'BULK_DIAGNOSIS_MAX_IMAGE_BYTES', 15 * 1024 * 1024),
+    )
+
+
+def _read_archive(archive, max_images, max_bytes):
+    try:
+        zf = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise BulkUploadError("Zip arxiv o'qilmadi")
+    items = []
+    with zf:
+        for info in zf.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or name.startswith('.') or not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            if len(items) >= max_images:
+                raise BulkUploadError(f"Bir so'rovda ko'pi bilan {max_images} ta rasm")
+            # Zip bomb: ochilgan hajm sarlavhadan tekshiriladi, o'qish ham cheklanadi
+            if info.file_size > max_bytes:
+                raise BulkUploadError(f"{name}: rasm hajmi juda katta")
+            with zf.open(info) as f:
+                items.append((name, f.read(max_bytes + 1)[:max_bytes]))
+    return items
+
+
+def collect_images(files):
+    """
+    So'rov fayllaridan ``[(nom, baytlar), ...]``: ``images`` ro'yxati va/yoki
+    ``archive`` zip fayli.
+    """
+    max_images, max_bytes = _limits()
+    items = []
+    for upload in files.getlist('images'):
+        if upload.size > max_bytes:
+            raise BulkUploadError(f"{upload.name}: rasm hajmi juda katta")
+        items.append((upload.name, upload.read()))
+    if 'archive' in files:
+        items.extend(_read_archive(files['archive'], max_images - len(items), max_bytes))
+    if not items:
+        raise BulkUploadError("Rasmlar topilmadi ('images' yoki 'archive' maydoni)")
+    if len(items) > max_images:
+        raise BulkUploadError(f"Bir so'rovda ko'pi bilan {max_images} ta rasm")
+    return items
+
+
+def diagnose_images(items, detection_type='disease', plant_type='all', lang='uz', user=None):
+    """
+    Rasmlar ro'yxati uchun tashxis.
+
+    Ishonch chegarasidan o'tmagan (``is_confident``) rasmlar tashxisi
+    LOW_CONFIDENCE_LABEL bo'ladi va ular uchun tavsiya so'ralmaydi.
+
+    Returns:
+        dict: ``results`` (har bir rasm uchun) va ``recommendations``
+        (kasallik nomi -> tavsiya HTML, har biri bir marta)
+    """
+    from . import duplicates
+    from .embeddings import maybe_index
+    from .jobs import PROGRESS_DONE
+    from .model_loader import LOW_CONFIDENCE_LABEL, is_confident, predict_detailed_batch
+    from .models import Disease, PlantImage
+    from .views import get_ai_recommendation
+
+    predictions = predict_detailed_batch(
+        [data for _, data in items], detection_type=detection_type, plant_type=plant_type
+    )
+
+    diseases = {}
+    recommendations = {}
+    for prediction in predictions:
+        if isinstance(prediction, Exception) or not is_confident(prediction[2]):
+            continue
+        name = prediction[0]
+        if name not in diseases:
+            diseases[name] = Disease.get_or_create_detected(name)
+            recommendations[name] = get_ai_recommendation(name, lang=lang)
+
+    results = []
+    rows = []
+    for index, ((filename, data), prediction) in enumerate(zip(items, predictions)):
+        if isinstance(prediction, ImageRejected):
+            results.append({
+                'index': index, 'filename': filename, 'error': True,
+                'rejected': True, 'reason': prediction.reason, 'message': prediction.message,
+            })
+            continue
+        if isinstance(prediction, Exception):
+            results.append({'index': index, 'filename': filename, 'error': True, 'message': str(prediction)})
+            continue
+        name, confidence, top_k = prediction
+        confident = is_confident(top_k)
+        if not confident:
+            name = LOW_CONFIDENCE_LABEL
+        results.append({
+            'index': index,
+            'filename': filename,
+            'error': False,
+            'disease': name,
+            'confident': confident,
+            'confidence': round(confidence * 100, 2),
+            'top_predictions': [
+                {'disease': label, 'confidence': round(probability * 100, 2)}
+                for label, probability in top_k
+            ],
+            'image_id': None,
+        })
+        if user is not None:
+            # bulk_create save() ni chaqirmaydi - accuracy shu yerda to'ldiriladi
+            rows.append((len(results) - 1, PlantImage(
+                user=user,
+                image=ContentFile(data, name=filename),
+                disease=diseases.get(name),
+                disease_name=name,
+                confidence=confidence,
+                accuracy=confidence * 100,
+                top_predictions=PlantImage.format_top_predictions(top_k),
+                ai_result=recommendations.get(name, ''),
+                phash=duplicates.compute(data) or '',
+                language=lang,
+                detection_type=detection_type,
+                plant_type_code=plant_type,
+                progress=PROGRESS_DONE,
+                status='completed',
+            )))
+
+    if rows:
+        created = PlantImage.objects.bulk_create([plant_image for _, plant_image in rows])
+        for (position, _), plant_image in zip(rows, created):
+            results[position]['image_id'] = plant_image.pk
+            maybe_index(plant_image)
+
+    return {'results': results, 'recommendations': recommendations}
@@ -0,0 +1,98 @@
+"""
+Tashxis kaskadi: arzon filtr (``models.gatekeeper``) -> CNN -> Gemini tavsiyasi.
+
+Har bir bosqich vaqti va filtr rad etgan rasmlar ulushi jarayon bo'yicha
+yig'iladi (``/diagnosis/metrics/`` da ``cascade``). Qimmat bosqichlar faqat
+filtrdan o'tgan rasmlar uchun ishlaydi.
+"""
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from models.gatekeeper import ImageRejected, check
+
+STAGES = ('gate', 'cnn', 'recommendation')
+
+_lock = threading.Lock()
+_timings = {stage: deque(maxlen=1000) for stage in STAGES}
+_counts = Counter()
+_rejections = Counter()
+
+
+def is_enabled():
+    return getattr(settings, 'INFERENCE_GATE_ENABLED', True)
+
+
+def record(stage, seconds):
+    with _lock:
+        _counts[stage] += 1
+        _timings.setdefault(stage, deque(maxlen=1000)).append(seconds)
+
+
+@contextmanager
+def timed(stage):
+    """Bosqich vaqtini o'lchash: ``with timed('cnn'): ...``"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+def screen(image_bytes):
+    """
+    Kaskadning birinchi bosqichi. Rasm rad etilsa ``ImageRejected``.
+
+    Returns:
+        dict yoki None: filtr ko'rsatkichlari (filtr o'chirilgan bo'lsa None)
+    """
+    if not is_enabled():
+        return None
+    with timed('gate'):
+        metrics = check(
+            image_bytes,
+            min_side=getattr(settings, 'INFERENCE_GATE_MIN_SIDE', 160),
+            min_sharpness=getattr(settings, 'INFERENCE_GATE_MIN_SHARPNESS', 15.0),
+            min_plant_ratio=getattr(settings, 'INFERENCE_GATE_MIN_PLANT_RATIO', 0.05),
+        )
+    if metrics['reason']:
+        with _lock:
+            _rejections[metrics['reason']] += 1
+        print(f"🚫 Rasm filtrda rad etildi: {metrics['reason']} {metrics}")
+        raise ImageRejected(metrics['reason'], metrics)
+    return metrics
+
+
+def get_stats():
+    """Bosqichlar bo'yicha soni va vaqtlar (ms), filtr rad etish ulushi"""
+    import numpy as np
+
+    with _lock:
+        counts = dict(_counts)
+        timings = {stage: list(values) for stage, values in _timings.items()}
+        rejections = dict(_rejections)
+
+    stages = {}
+    for stage, values in timings.items():
+        entry = {'count': counts.get(stage, 0)}
+        if values:
+            values_ms = np.array(values) * 1000
+            entry.update(
+                mean_ms=round(float(values_ms.mean()), 2),
+                p50_ms=round(float(np.percentile(values_ms, 50)), 2),
+                p95_ms=round(float(np.percentile(values_ms, 95)), 2),
+            )
+        stages[stage] = entry
+
+    checked = counts.get('gate', 0)
+    rejected = sum(rejections.values())
+    return {
+        'enabled': is_enabled(),
+        'stages': stages,
+        'rejected': rejected,
+        'rejection_rate': round(rejected / checked, 4) if checked else 0.0,
+        'rejections': rejections,
+    }
@@ -0,0 +1,196 @@
+"""
+Yaqin-dublikat yuklamalar: bir foydalanuvchi (yoki Telegram chat) qisqa vaqt
+ichida o'sha bargni qayta suratga olib yoki qayta siqilgan holda yuborsa,
+CNN qayta ishga tushirilmaydi - oldingi natija qaytariladi.
+
+Har bir doira (``user:<id>`` / ``chat:<id>``) uchun oxirgi
+DUPLICATE_WINDOW_MINUTES daqiqadagi pHash lar va natijalar bashorat keshida
+(``predictions`` alias) saqlanadi. Standart LocMemCache jarayon ichida: har bir
+gunicorn worker va bot jarayoni faqat o'zi ko'rgan yuklamalarni taniydi.
+Workerlar o'rtasida umumiy bo'lishi uchun PREDICTION_CACHE_BACKEND ni Redis
+yoki Memcached ga sozlash kerak. pHash ``PlantImage.phash`` ga ham yoziladi.
+
+Doira MAX_RECENT ta alohida kalitdan (slot) iborat halqa: ``remember`` slot
+raqamini ``cache.incr`` bilan oladi, shuning uchun bir vaqtda kelgan ikki
+yuklama bir-birini o'chirmaydi (umumiy ro'yxatni o'qib-yozish atomar emas edi).
+
+Ikki ongli chetlanish:
+
+* pHash CNN tensoridan olinmaydi - ``compute`` rasmni alohida (JPEG draft,
+  1/8 masshtab, kulrang) dekodlaydi. Xesh CNN ishga tushadimi yo'qligini hal
+  qiladi, shuning uchun inference dan oldin kerak; bu dekodlash to'liq
+  dekodlashdan bir necha barobar arzon
+* ``lookup`` doiradagi MAX_RECENT yozuvni to'g'ridan-to'g'ri skanerlaydi -
+  50 ta Hamming masofasi BK-daraxtdan tezroq; BK-daraxt faqat butun jadval
+  bo'yicha klaster analitikasida (``find_clusters``)
+"""
+import threading
+import time
+
+from django.conf import settings
+
+from models.image_hash import cluster, from_hex, hamming, phash, to_hex
+
+_lock = threading.Lock()
+_stats = {'checks': 0, 'hits': 0}
+
+# Bitta doirada saqlanadigan oxirgi yuklamalar soni
+MAX_RECENT = 50
+
+
+def is_enabled():
+    return getattr(settings, 'DUPLICATE_DETECTION_ENABLED', True)
+
+
+def max_distance():
+    return getattr(settings, 'DUPLICATE_MAX_DISTANCE', 8)
+
+
+def scope_for(user=None, chat_id=None):
+    """Dublikat qidiriladigan doira: autentifikatsiyalangan foydalanuvchi yoki chat"""
+    if user is not None and getattr(user, 'is_authenticated', False):
+        return f"user:{user.pk}"
+    if chat_id is not None:
+        return f"chat:{chat_id}"
+    return None
+
+
+def _cache_key(scope, detection_type, plant_type):
+    from .prediction_cache import get_model_generation
+
+    # Model almashsa (generation) eski natijalar qaytarilmaydi
+    return f"duplicates:{get_model_generation()}:{scope}:{detection_type}:{plant_type}"
+
+
+def _window():
+    return getattr(settings, 'DUPLICATE_WINDOW_MINUTES', 30) * 60
+
+
+def _recent(key):
+    """Doiraning oyna ichidagi yozuvlari (eskidan yangiga)"""
+    from .prediction_cache import get_cache
+
+    now = time.time()
+    entries = get_cache().get_many([f"{key}:{slot}" for slot in range(MAX_RECENT)]).values()
+    return sorted((entry for entry in entries if now - entry[1] <= _window()), key=lambda entry: entry[1])
+
+
+def _next_slot(key):
+    """Halqadagi keyingi slot - ``incr`` atomar (LocMem, Redis, Memcached)"""
+    from .prediction_cache import get_cache
+
+    cache = get_cache()
+    counter = f"{key}:next"
+    cache.add(counter, 0, timeout=_window())
+    try:
+        value = cache.incr(counter)
+    except ValueError:
+        # Hisoblagich add va incr orasida eskirdi - qaytadan boshlanadi
+        cache.add(counter, 0, timeout=_window())
+        value = cache.incr(counter)
+    # Faol doirada hisoblagich eskirmaydi (aks holda yangi slotlar eskilari ustiga yoziladi)
+    cache.touch(counter, _window())
+    return value % MAX_RECENT
+
+
+def compute(source):
+    """Rasm uchun pHash (hex); rasm o'qilmasa None"""
+    try:
+        return to_hex(phash(source))
+    except Exception as e:
+        print(f"⚠️ pHash hisoblanmadi: {e}")
+        return None
+
+
+def lookup(scope, image_hash, detection_type, plant_type):
+    """
+    Doiradagi eng yaqin oldingi yuklama.
+
+    Returns:
+        dict yoki None: ``prediction`` (predicted_class, confidence, top_k),
+        ``image_id`` (oldingi ``PlantImage``, bo'lmasa None) va ``distance``
+    """
+    if not is_enabled() or scope is None or image_hash is None:
+        return None
+    value = from_hex(image_hash)
+    best = None
+    for entry in _recent(_cache_key(scope, detection_type, plant_type)):
+        distance = hamming(value, entry[0])
+        if distance <= max_distance() and (best is None or distance < best['distance']):
+            best = {'prediction': tuple(entry[2]), 'image_id': entry[3], 'distance': distance}
+    with _lock:
+        _stats['checks'] += 1
+        if best is not None:
+            _stats['hits'] += 1
+    if best is not None:
+        print(f"♻️ Yaqin-dublikat ({best['distance']} bit): oldingi natija qaytarildi - {best['prediction'][0]}")
+    return best
+
+
+def remember(scope, image_hash, detection_type, plant_type, prediction, image_id=None):
+    """Muvaffaqiyatli bashoratni doiraning oxirgi yuklamalariga qo'shish"""
+    if not is_enabled() or scope is None or image_hash is None or not prediction[2]:
+        return
+    from .prediction_cache import get_cache
+
+    key = _cache_key(scope, detection_type, plant_type)
+    entry = (from_hex(image_hash), time.time(), tuple(prediction), image_id)
+    get_cache().set(f"{key}:{_next_slot(key)}", entry, timeout=_window())
+
+
+def predict(image_path, predict_fn, scope, detection_type, plant_type):
+    """
+    Dublikat bo'lsa oldingi natija, aks holda ``predict_fn(image_path,
+    detection_type, plant_type)``. Natija saqlangandan keyin chaqiruvchi
+    ``remember`` ni chaqiradi (``PlantImage`` id si bilan).
+
+    Returns:
+        tuple: (prediction, image_hash, duplicate) - ``duplicate`` ``lookup`` natijasi yoki None
+    """
+    image_hash = compute(image_path) if is_enabled() and scope is not None else None
+    duplicate = lookup(scope, image_hash, detection_type, plant_type)
+    if duplicate is not None:
+        return duplicate['prediction'], image_hash, duplicate
+    return predict_fn(image_path, detection_type, plant_type), image_hash, None
+
+
+def find_clusters(queryset=None, radius=None, limit=20000):
+    """
+    Admin analitikasi: ``phash`` bo'yicha yaqin-dublikat klasterlar (BK-daraxt).
+
+    Returns:
+        list: har bir klaster uchun dict - ``images`` (PlantImage lar),
+        ``users``, ``labels`` (klaster ichidagi turli tashxislar) va ``conflicting``
+    """
+    from .models import PlantImage
+
+    if queryset is None:
+        queryset = PlantImage.objects.all()
+    radius = max_distance() if radius is None else radius
+    rows = list(
+        queryset.exclude(phash='').order_by('-pk').values_list('pk', 'phash')[:limit]
+    )
+    groups = cluster([from_hex(value) for _, value in rows], radius)
+    images = PlantImage.objects.select_related('user').in_bulk(
+        [rows[i][0] for group in groups for i in group]
+    )
+    clusters = []
+    for group in groups:
+        members = sorted((images[rows[i][0]] for i in group), key=lambda image: image.created_at)
+        labels = sorted({image.disease_name for image in members if image.disease_name})
+        clusters.append({
+            'images': members,
+            'size': len(members),
+            'users': len({image.user_id for image in members}),
+            'labels': labels,
+            'conflicting': len(labels) > 1,
+        })
+    return clusters
+
+
+def get_stats():
+    with _lock:
+        stats = dict(_stats)
+    stats['hit_rate'] = round(stats['hits'] / stats['checks'], 4) if stats['checks'] else 0.0
+    stats['enabled'] = is_enabled()
+    return stats
@@ -0,0 +1,315 @@
+"""
+O'xshash o'tgan holatlar: tashxis qo'yilgan har bir ``PlantImage`` ning
+klassifikatordan oldingi qatlam embeddingi ``models.vector_store`` omborida
+saqlanadi (model bo'yicha alohida ombor, EMBEDDING_STORE_DIR ichida).
+
+* yangi tashxis yakunlanganda rasm fon navbatiga qo'yiladi va batch bilan
+  embedding qilinib omborga qo'shiladi (``maybe_index``)
+* arxiv ``manage.py rebuild_embeddings`` bilan to'liq qayta quriladi
+* ``similar_cases`` yangi rasm uchun shu hududdagi boshqa foydalanuvchilarning
+  tasdiqlangan tashxislarini qaytaradi - eski rasmlar model orqali qayta
+  o'tkazilmaydi
+"""
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+_lock = threading.Lock()
+_embed_lock = threading.Lock()
+_stores = {}
+_embedders = {}
+_indexer = None
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def is_enabled():
+    return _setting('EMBEDDING_STORE_ENABLED', False)
+
+
+def store_path(model_config):
+    """Model konfiguratsiyasi uchun ombor papkasi (AIModel almashsa - yangi ombor)"""
+    name = f"{model_config['key']}-{model_config['ai_model_id'] or 'static'}"
+    return os.path.join(str(_setting('EMBEDDING_STORE_DIR', settings.BASE_DIR / 'embeddings')), name)
+
+
+def model_config_for(detection_type, plant_type):
+    """Rasm tashxisida ishlatiladigan model konfiguratsiyasi (model yuklanmaydi)"""
+    from models.model_manager import model_manager
+
+    model_key = model_manager.get_model_key(detection_type, plant_type)
+    if not model_key:
+        raise ValueError(
+            f"Ushbu parametrlar uchun model topilmadi: "
+            f"detection_type={detection_type}, plant_type={plant_type}"
+        )
+    return model_manager.models[model_key]
+
+
+def get_store(model_config, dim=None):
+    """
+    Jarayon bo'yicha ochilgan ombor. Boshqa workerlar qo'shgan qatorlar
+    EMBEDDING_REFRESH_INTERVAL soniyada bir marta o'qiladi. Ombor yo'q bo'lsa
+    ``dim`` berilganda yaratiladi, aks holda None.
+    """
+    from models.vector_store import VectorStore
+
+    path = store_path(model_config)
+    with _lock:
+        entry = _stores.get(path)
+        if entry is None:
+            try:
+                entry = _stores[path] = [VectorStore(path, dim=dim), time.monotonic()]
+            except FileNotFoundError:
+                return None
+        elif time.monotonic() - entry[1] > _setting('EMBEDDING_REFRESH_INTERVAL', 5):
+            entry[0].refresh()
+            entry[1] = time.monotonic()
+        return entry[0]
+
+
+def reset_stores():
+    """Ochilgan omborlarni unutish (qayta qurilgandan keyin yoki testlarda)"""
+    with _lock:
+        _stores.clear()
+
+
+def embed_images(model_config, batch):
+    """
+    ``(N, 224, 224, 3)`` batch uchun embeddinglar. Umumiy dvigatel TFLite/ONNX
+    artefaktidan ishlasa, Keras modeli embedding uchun alohida yuklanadi.
+    """
+    from models.model_manager import model_manager
+
+    try:
+        return model_manager.embed_batch(model_config['token'], batch)
+    except ValueError:
+        pass
+    with _embed_lock:
+        embedder = _embedders.get(model_config['token'])
+        if embedder is None:
+            from models.model_manager import load_keras_model
+            from models.runtimes import CompiledKerasModel
+
+            print(f"🔄 Embedding uchun Keras modeli yuklanmoqda: {model_config['description']}")
+            embedder = CompiledKerasModel(load_keras_model(model_config['model_path']))
+            # Eski model versiyasining embedderi tashlanadi
+            _embedders.clear()
+            _embedders[model_config['token']] = embedder
+    return embedder.embed(batch)
+
+
+def _append(model_config, plant_images, vectors):
+    store = get_store(model_config, dim=vectors.shape[1])
+    added = store.append(
+        vectors,
+        image_ids=[plant_image.pk for plant_image in plant_images],
+        user_ids=[plant_image.user_id for plant_image in plant_images],
+        regions=[plant_image.user.region if plant_image.user else '' for plant_image in plant_images],
+        labels=[plant_image.disease_name for plant_image in plant_images],
+        confirmed=[plant_image.confirmed for plant_image in plant_images],
+    )
+    # Web jarayonida faqat belgi qo'yiladi - k-means ni tashxis worker bajaradi
+    if added and store.request_training(_setting('EMBEDDING_IVF_MIN_VECTORS', 20000)):
+        print(f"🧭 Embedding IVF indeksini o'qitish so'raldi: {len(store)} vektor")
+    return added
+
+
+def train_requested_stores():
+    """
+    ``train_requested`` belgisi qo'yilgan omborlarda IVF ni o'qitish. Tashxis
+    worker (``DiagnosisWorker``) davriy chaqiradi - gunicorn workerlarida emas.
+
+    Returns:
+        dict: {ombor nomi: klasterlar soni}
+    """
+    from models.vector_store import VectorStore
+
+    root = str(_setting('EMBEDDING_STORE_DIR', settings.BASE_DIR / 'embeddings'))
+    if not os.path.isdir(root):
+        return {}
+    trained = {}
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if name.endswith(('.old', '.rebuild')) or not os.path.exists(os.path.join(path, 'header.json')):
+            continue
+        started = time.perf_counter()
+        nlist = VectorStore(path).train_if_requested()
+        if nlist:
+            trained[name] = nlist
+            print(f"🧭 {name}: IVF indeksi o'qitildi, {nlist} klaster ({time.perf_counter() - started:.1f} s)")
+    return trained
+
+
+def index_images(plant_images):
+    """Rasmlarni embedding qilib omborga qo'shish (model bo'yicha guruhlab); qo'shilganlar soni"""
+    from models.preprocessing import preprocess_parallel
+
+    groups = {}
+    for plant_image in plant_images:
+        config = model_config_for(plant_image.detection_type, plant_image.plant_type_code)
+        groups.setdefault(config['token'], (config, []))[1].append(plant_image)
+
+    added = 0
+    for config, group in groups.values():
+        batch, errors = preprocess_parallel(
+            [plant_image.image.path for plant_image in group],
+            workers=_setting('BULK_DIAGNOSIS_DECODE_WORKERS', 4),
+        )
+        ok = [i for i in range(len(group)) if i not in errors]
+        if not ok:
+            continue
+        vectors = embed_images(config, batch[ok] if errors else batch)
+        added += _append(config, [group[i] for i in ok], vectors)
+    return added
+
+
+class Indexer:
+    """Yangi tashxislarni fon oqimida batch bilan omborga qo'shuvchi cheklangan navbat"""
+
+    def __init__(self, queue_size=256, batch_size=16, window=0.5):
+        self.batch_size = batch_size
+        self.window = window
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stats = {'submitted': 0, 'dropped': 0, 'indexed': 0, 'failed': 0}
+        self._thread = threading.Thread(target=self._worker, name='embedding-indexer', daemon=True)
+        self._thread.start()
+
+    def submit(self, pk):
+        try:
+            self._queue.put_nowait(pk)
+        except queue.Full:
+            with _lock:
+                self._stats['dropped'] += 1
+            return False
+        with _lock:
+            self._stats['submitted'] += 1
+        return True
+
+    def _collect(self):
+        pks = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(pks) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pks.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return pks
+
+    def _worker(self):
+        from .models import PlantImage
+
+        while True:
+            pks = self._collect()
+            close_old_connections()
+            try:
+                plant_images = list(PlantImage.objects.select_related('user').filter(pk__in=pks))
+                added = index_images(plant_images)
+                with _lock:
+                    self._stats['indexed'] += added
+            except Exception as e:
+                with _lock:
+                    self._stats['failed'] += len(pks)
+                print(f"⚠️ Embedding omborga qo'shilmadi: {e}")
+            finally:
+                close_old_connections()
+
+    def get_stats(self):
+        with _lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        return stats
+
+
+def get_indexer():
+    global _indexer
+    if _indexer is None:
+        with _lock:
+            if _indexer is None:
+                _indexer = Indexer(queue_size=_setting('EMBEDDING_INDEX_QUEUE_SIZE', 256))
+    return _indexer
+
+
+def maybe_index(plant_image):
+    """Yakunlangan tashxisni omborga qo'shish uchun navbatga qo'yish (javob kutmaydi)"""
+    if not is_enabled() or plant_image.pk is None or plant_image.status != 'completed':
+        return False
+    return get_indexer().submit(plant_image.pk)
+
+
+def similar_cases(plant_image, k=5):
+    """
+    Shu hududdagi boshqa foydalanuvchilarning eng o'xshash tasdiqlangan tashxislari.
+
+    Rasm omborda bo'lsa saqlangan embedding ishlatiladi, aks holda faqat shu
+    rasm embedding qilinadi (va ombor yoqilgan bo'lsa qo'shiladi).
+    """
+    from models.preprocessing import preprocess_parallel
+    from .models import PlantImage
+
+    config = model_config_for(plant_image.detection_type, plant_image.plant_type_code)
+    store = get_store(config)
+    vector = store.get_vector(plant_image.pk) if store is not None else None
+    if vector is None:
+        batch, errors = preprocess_parallel([plant_image.image.path], workers=1)
+        if errors:
+            raise errors[0]
+        vectors = embed_images(config, batch)
+        vector = vectors[0]
+        if is_enabled() and plant_image.status == 'completed':
+            _append(config, [plant_image], vectors)
+            store = get_store(config)
+    if store is None:
+        return []
+
+    region = plant_image.user.region if plant_image.user else ''
+    hits = store.search(
+        vector, k=k, region=region, exclude_user=plant_image.user_id, exclude_image=plant_image.pk,
+        nprobe=_setting('EMBEDDING_SEARCH_NPROBE', 8),
+    )
+    # Ombordagi belgi eskirgan bo'lishi mumkin - tasdiq bazadan qayta tekshiriladi
+    images = PlantImage.objects.filter(confirmed=True).in_bulk([image_id for image_id, _, _ in hits])
+    return [
+        {
+            'image_id': image_id,
+            'disease': images[image_id].disease_name,
+            'similarity': round(score, 4),
+            'image_url': images[image_id].image.url,
+            'created_at': images[image_id].created_at.isoformat(),
+        }
+        for image_id, score, _ in hits if image_id in images
+    ]
+
+
+def set_confirmed(plant_images, value=True):
+    """Admin tasdiqlaganda ombordagi belgini ham yangilash"""
+    groups = {}
+    for plant_image in plant_images:
+        config = model_config_for(plant_image.detection_type, plant_image.plant_type_code)
+        groups.setdefault(config['token'], (config, []))[1].append(plant_image.pk)
+    updated = 0
+    for config, pks in groups.values():
+        store = get_store(config)
+        if store is not None:
+            updated += store.set_confirmed(pks, value)
+    return updated
+
+
+def get_stats():
+    """Ochilgan omborlar hajmi va fon navbati holati"""
+    with _lock:
+        stores = {os.path.basename(path): entry[0].get_info() for path, entry in _stores.items()}
+    return {
+        'enabled': is_enabled(),
+        'stores': stores,
+        'indexer': _indexer.get_stats() if _indexer is not None else None,
+    }
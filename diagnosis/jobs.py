@@ -0,0 +1,314 @@
+"""
+Fon rejimidagi tashxis (job) navbati.
+
+Navbat alohida jadval emas - ``PlantImage`` ning o'zi: ``status='queued'``
+yozuvlar worker tomonidan shartli UPDATE bilan egallanadi (SQLite va
+PostgreSQL da bir xil ishlaydi), so'ng CNN va Gemini bosqichlari bajariladi.
+Web so'rov faqat faylni saqlab, job id qaytaradi.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from models.gatekeeper import ImageRejected
+
+# Progress bosqichlari (foizda)
+PROGRESS_CLAIMED = 10
+PROGRESS_PREDICTED = 50
+PROGRESS_RECOMMENDED = 90
+PROGRESS_DONE = 100
+
+
+def enqueue_diagnosis(plant_image, detection_type='disease', plant_type='all', lang='uz'):
+    """Saqlanmagan yoki yangi ``PlantImage`` ni navbatga qo'yish"""
+    plant_image.status = 'queued'
+    plant_image.detection_type = detection_type
+    plant_image.plant_type_code = plant_type
+    plant_image.language = lang
+    plant_image.progress = 0
+    plant_image.claimed_at = None
+    plant_image.save()
+    return plant_image
+
+
+def _set_progress(plant_image, progress):
+    plant_image.progress = progress
+    plant_image.save(update_fields=['progress'])
+
+
+def predict_diagnosis(plant_image):
+    """CNN bosqichi: kasallik nomi, ishonchlilik va Disease yozuvi"""
+    from . import duplicates
+    from .models import Disease, PlantImage
+    from .views import predict_image
+
+    # Shu foydalanuvchining yaqinda yuklagan o'sha rasmi bo'lsa - CNN siz oldingi natija
+    scope = duplicates.scope_for(user=plant_image.user)
+    (label, confidence, top_k), image_hash, duplicate = duplicates.predict(
+        plant_image.image.path, predict_image, scope,
+        plant_image.detection_type, plant_image.plant_type_code
+    )
+    plant_image.phash = image_hash or ''
+    if duplicate is not None:
+        plant_image.duplicate_of_id = duplicate['image_id']
+    else:
+        duplicates.remember(
+            scope, image_hash, plant_image.detection_type, plant_image.plant_type_code,
+            (label, confidence, top_k), plant_image.pk
+        )
+    plant_image.disease = Disease.get_or_create_detected(label)
+    plant_image.disease_name = label
+    plant_image.confidence = confidence
+    plant_image.accuracy = confidence * 100
+    plant_image.top_predictions = PlantImage.format_top_predictions(top_k)
+    plant_image.progress = PROGRESS_PREDICTED
+    plant_image.save()
+    return plant_image
+
+
+def complete_diagnosis(plant_image, recommendation):
+    """Tavsiya tayyor bo'lgach tahlilni yakunlash"""
+    from .embeddings import maybe_index
+
+    plant_image.ai_result = recommendation
+    plant_image.status = 'completed'
+    plant_image.progress = PROGRESS_DONE
+    plant_image.save()
+    maybe_index(plant_image)
+    return plant_image
+
+
+def fail_diagnosis(plant_image, error):
+    plant_image.status = 'failed'
+    plant_image.ai_result = f"Xatolik yuz berdi: {str(error)}"
+    plant_image.save()
+
+
+def abort_streamed_diagnosis(plant_image, error=None):
+    """
+    Oqimli javob tavsiyasiz tugadi: tavsiya xatosida ``failed``, klient
+    uzilganda (``error`` None) bashorat tavsiyasiz yakunlanadi
+    """
+    if error is not None:
+        fail_diagnosis(plant_image, error)
+    else:
+        complete_diagnosis(plant_image, '')
+
+
+def reject_diagnosis(plant_image, rejection):
+    """Filtr rad etgan rasm: CNN va tavsiya ishlamaydi, foydalanuvchiga sabab ko'rsatiladi"""
+    plant_image.status = 'failed'
+    plant_image.ai_result = rejection.message
+    plant_image.progress = PROGRESS_DONE
+    plant_image.save()
+
+
+def build_rejection(rejection):
+    """Filtr rad etgan rasm uchun JSON javob"""
+    return {
+        'success': False,
+        'rejected': True,
+        'reason': rejection.reason,
+        'error': rejection.message,
+    }
+
+
+def run_diagnosis(plant_image):
+    """
+    Bitta rasm uchun to'liq tahlil: CNN bashorati, Disease yozuvi va tavsiya.
+    Sinxron view va worker uchun umumiy yo'l.
+    """
+    from .cascade import timed
+    from .views import get_ai_recommendation
+
+    try:
+        predict_diagnosis(plant_image)
+        with timed('recommendation'):
+            ai_tavsiya = get_ai_recommendation(plant_image.disease_name, lang=plant_image.language)
+        _set_progress(plant_image, PROGRESS_RECOMMENDED)
+        complete_diagnosis(plant_image, ai_tavsiya)
+    except ImageRejected as e:
+        reject_diagnosis(plant_image, e)
+        raise
+    except Exception as e:
+        fail_diagnosis(plant_image, e)
+        raise
+    return plant_image
+
+
+def build_prediction(plant_image):
+    """CNN natijasi (tavsiyasiz) - oqimli javobning birinchi hodisasi uchun"""
+    return {
+        'success': True,
+        'disease': plant_image.disease_name,
+        'confidence': round((plant_image.confidence or 0) * 100, 2),
+        'description': plant_image.disease.description if plant_image.disease else '',
+        'image_url': plant_image.image.url,
+        'duplicate_of': plant_image.duplicate_of_id,
+        'top_predictions': [
+            {'disease': item['disease_name'], 'confidence': round(item['confidence'] * 100, 2)}
+            for item in plant_image.top_predictions
+        ],
+    }
+
+
+def build_result(plant_image):
+    """Yakunlangan tahlil uchun frontend kutadigan JSON"""
+    return dict(build_prediction(plant_image), recommendations=plant_image.ai_result)
+
+
+def get_job_status(plant_image):
+    """Polling endpoint javobi: holat, progress va tayyor bo'lsa natija"""
+    data = {
+        'job_id': plant_image.pk,
+        'status': plant_image.status,
+        'progress': plant_image.progress,
+    }
+    if plant_image.status == 'completed':
+        data['result'] = build_result(plant_image)
+    elif plant_image.status == 'failed':
+        data['error'] = plant_image.ai_result
+    return data
+
+
+def claim_next_job():
+    """
+    Navbatdagi eng eski jobni egallash. Bir nechta worker bir vaqtda ishlasa,
+    ``status='queued'`` shartli UPDATE faqat bittasida muvaffaqiyatli bo'ladi.
+    """
+    from .models import PlantImage
+
+    candidates = (
+        PlantImage.objects.filter(status='queued')
+        .order_by('pk')
+        .values_list('pk', flat=True)[:10]
+    )
+    for pk in candidates:
+        claimed = PlantImage.objects.filter(pk=pk, status='queued').update(
+            status='processing',
+            claimed_at=timezone.now(),
+            attempts=F('attempts') + 1,
+            progress=PROGRESS_CLAIMED,
+        )
+        if claimed:
+            return PlantImage.objects.select_related('disease').get(pk=pk)
+    return None
+
+
+def requeue_stale_jobs(stale_after=None, max_attempts=None):
+    """
+    Worker o'lib qolgan (``claimed_at`` eski) joblarni qayta navbatga qo'yish,
+    urinishlar tugagan bo'lsa - ``failed``.
+    """
+    from .models import PlantImage
+
+    if stale_after is None:
+        stale_after = getattr(settings, 'DIAGNOSIS_JOB_STALE_AFTER', 300)
+    if max_attempts is None:
+        max_attempts = getattr(settings, 'DIAGNOSIS_JOB_MAX_ATTEMPTS', 3)
+
+    stale = PlantImage.objects.filter(
+        status='processing',
+        claimed_at__lt=timezone.now() - timedelta(seconds=stale_after),
+    )
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status='failed', ai_result="Xatolik yuz berdi: tahlil vaqti tugadi"
+    )
+    requeued = stale.filter(attempts__lt=max_attempts).update(
+        status='queued', claimed_at=None, progress=0
+    )
+    return requeued, failed
+
+
+def process_next_job():
+    """Bitta jobni egallab bajarish. Job bo'lmasa False"""
+    plant_image = claim_next_job()
+    if plant_image is None:
+        return False
+    print(f"🔄 Job #{plant_image.pk} tahlil qilinmoqda (urinish {plant_image.attempts})")
+    started = time.perf_counter()
+    try:
+        run_diagnosis(plant_image)
+        print(f"✅ Job #{plant_image.pk}: {plant_image.disease_name} ({time.perf_counter() - started:.2f}s)")
+    except Exception as e:
+        print(f"❌ Job #{plant_image.pk} xatolik: {e}")
+    return True
+
+
+class DiagnosisWorker:
+    """
+    Navbatni bir nechta threadda qayta ishlovchi worker. CNN bosqichi
+    umumiy inference dvigateli (micro-batching yoki model server) orqali
+    o'tadi, Gemini kutish vaqtida boshqa threadlar ishlayveradi.
+    """
+
+    def __init__(self, threads=2, poll_interval=1.0, stale_after=None):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self._stop = threading.Event()
+        self._workers = []
+        self._last_requeue = 0.0
+        self._last_train_check = 0.0
+
+    def _maybe_requeue(self):
+        # Eskirgan joblarni tekshirish faqat birinchi threadda va kamdan-kam
+        now = time.monotonic()
+        if now - self._last_requeue < 30:
+            return
+        self._last_requeue = now
+        requeued, failed = requeue_stale_jobs(self.stale_after)
+        if requeued or failed:
+            print(f"♻️ Eskirgan joblar: {requeued} ta qayta navbatga, {failed} ta xato")
+
+    def _maybe_train_embeddings(self):
+        # Web jarayoni so'ragan IVF o'qitish shu yerda (gunicorn workerlarida emas)
+        from . import embeddings
+
+        now = time.monotonic()
+        if not embeddings.is_enabled() or now - self._last_train_check < getattr(
+            settings, 'EMBEDDING_TRAIN_CHECK_INTERVAL', 60
+        ):
+            return
+        self._last_train_check = now
+        embeddings.train_requested_stores()
+
+    def _run(self, index):
+        while not self._stop.is_set():
+            close_old_connections()
+            try:
+                if index == 0:
+                    self._maybe_requeue()
+                    self._maybe_train_embeddings()
+                if not process_next_job():
+                    self._stop.wait(self.poll_interval)
+            except Exception as e:
+                print(f"❌ Worker {index} xatolik: {e}")
+                self._stop.wait(self.poll_interval)
+        close_old_connections()
+
+    def start(self):
+        for i in range(self.threads):
+            worker = threading.Thread(target=self._run, args=(i,), name=f'diagnosis-worker-{i}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for worker in self._workers:
+            worker.join(timeout)
+
+    def run_forever(self):
+        self.start()
+        try:
+            while any(worker.is_alive() for worker in self._workers):
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            print("🛑 Worker to'xtatilmoqda...")
+        finally:
+            self.stop()
@@ -0,0 +1,87 @@
+"""
+Bitta chaqiruv xarajatini o'lchash: Keras ``model.predict`` va qat'iy
+signaturali ``tf.function`` (CompiledKerasModel) turli batch o'lchamlarida
+"""
+
+import json
+import statistics
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+
+def build_tiny_model():
+    """Hisoblash deyarli yo'q kichik model - natijada faqat chaqiruv xarajati qoladi"""
+    import tensorflow as tf
+
+    inputs = tf.keras.Input(shape=(224, 224, 3))
+    x = tf.keras.layers.Conv2D(8, 3, strides=4, activation='relu')(inputs)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    outputs = tf.keras.layers.Dense(38, activation='softmax')(x)
+    return tf.keras.Model(inputs, outputs)
+
+
+class Command(BaseCommand):
+    help = "model.predict va kompilyatsiya qilingan chaqiruvning har chaqiruvdagi xarajatini solishtiradi"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model-key', default='disease_all',
+            help='ModelManager kaliti (--tiny berilsa e\'tiborga olinmaydi)'
+        )
+        parser.add_argument('--tiny', action='store_true', help='Haqiqiy model o\'rniga kichik sintetik model')
+        parser.add_argument('--batch-sizes', default='1,3,8,16', help='Vergul bilan ajratilgan batch o\'lchamlari')
+        parser.add_argument('--repeat', type=int, default=50, help='Har bir o\'lcham uchun chaqiruvlar soni')
+        parser.add_argument('--json', dest='json_path', help='Natijalarni JSON faylga yozish')
+
+    def _time_calls(self, fn, batch, repeat):
+        fn(batch)  # birinchi chaqiruv (trace/warmup) hisobga olinmaydi
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn(batch)
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def handle(self, *args, **options):
+        from models.runtimes import DEFAULT_BATCH_BUCKETS, CompiledKerasModel
+
+        if options['tiny']:
+            keras_model = build_tiny_model()
+        else:
+            from models.model_manager import load_keras_model, model_manager
+            config = model_manager.models.get(options['model_key'])
+            if config is None:
+                raise CommandError(f"❌ Model topilmadi: {options['model_key']}")
+            keras_model = load_keras_model(config['model_path'])
+
+        compiled = CompiledKerasModel(keras_model, buckets=DEFAULT_BATCH_BUCKETS)
+        rng = np.random.default_rng(0)
+        results = []
+
+        for size in [int(s) for s in options['batch_sizes'].split(',') if s.strip()]:
+            batch = rng.random((size, 224, 224, 3), dtype=np.float32)
+            keras_ms = self._time_calls(lambda b: keras_model.predict(b, verbose=0), batch, options['repeat'])
+            compiled_ms = self._time_calls(compiled.predict, batch, options['repeat'])
+            diff = float(np.abs(keras_model.predict(batch, verbose=0) - compiled.predict(batch)).max())
+            results.append({
+                'batch_size': size,
+                'keras_predict_ms': round(keras_ms, 3),
+                'compiled_ms': round(compiled_ms, 3),
+                'saved_ms': round(keras_ms - compiled_ms, 3),
+                'max_abs_diff': diff,
+            })
+            self.stdout.write(
+                f"📊 batch={size:<3} model.predict {keras_ms:8.2f} ms   "
+                f"compiled {compiled_ms:8.2f} ms   farq {keras_ms - compiled_ms:+7.2f} ms  "
+                f"(maks. natija farqi {diff:.2e})"
+            )
+
+        # tf.function signaturasi qat'iy - barcha o'lchamlar uchun bitta graf
+        traces = compiled._fn.experimental_get_tracing_count()
+        self.stdout.write(self.style.SUCCESS(f"✅ tf.function trace soni: {traces}"))
+
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as f:
+                json.dump({'results': results, 'traces': traces}, f, indent=2)
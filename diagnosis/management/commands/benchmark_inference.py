@@ -0,0 +1,305 @@
+"""
+Inference benchmark: har bir AIModel kaliti uchun preprocessing + bashorat
+latency (p50/p95/p99), batch o'lchami bo'yicha o'tkazuvchanlik (1..64),
+sovuq yuklash vaqti va RSS. Natija JSON ga yoziladi va saqlangan baseline
+bilan solishtirilib, regressiyalar belgilanadi.
+"""
+
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+DEFAULT_BATCH_SIZES = '1,2,4,8,16,32,64'
+
+# Sovuq yuklash alohida jarayonda o'lchanadi (joriy jarayonda model allaqachon issiq bo'lishi mumkin)
+COLD_LOAD_SNIPPET = """
+import json, os, sys, time
+import django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'PlantCare.settings')
+django.setup()
+import numpy as np
+from models.model_manager import ModelManager, get_process_rss
+rss_before = get_process_rss()
+started = time.perf_counter()
+manager = ModelManager()
+config = manager.acquire(sys.argv[1])
+loaded = time.perf_counter()
+manager.predict_batch(config['token'], np.zeros((1, 224, 224, 3), dtype=np.float32))
+print(json.dumps({
+    'load_s': loaded - started,
+    'first_predict_s': time.perf_counter() - loaded,
+    'rss_bytes': get_process_rss(),
+    'rss_delta_bytes': get_process_rss() - rss_before,
+}))
+"""
+
+# metrika yo'li -> yaxshilanish yo'nalishi ('lower' - kichigi yaxshi)
+TRACKED_METRICS = {
+    ('latency_ms', 'p50'): 'lower',
+    ('latency_ms', 'p95'): 'lower',
+    ('latency_ms', 'p99'): 'lower',
+    ('cold_load', 'load_s'): 'lower',
+    ('cold_load', 'rss_bytes'): 'lower',
+}
+
+
+def percentiles(values):
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        'p50': round(float(np.percentile(values, 50)), 3),
+        'p95': round(float(np.percentile(values, 95)), 3),
+        'p99': round(float(np.percentile(values, 99)), 3),
+        'mean': round(float(values.mean()), 3),
+    }
+
+
+def synthetic_jpeg(rng, size=(1600, 1200)):
+    """Telefon rasmiga o'xshash o'lchamdagi tasodifiy JPEG (draft dekodlash ham o'lchanadi)"""
+    from PIL import Image
+
+    noise = rng.integers(0, 256, (size[1] // 8, size[0] // 8, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(noise).resize(size).save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def compare_to_baseline(current, baseline, tolerance=0.10):
+    """
+    Joriy natijani baseline bilan solishtirish.
+
+    Returns:
+        list: har bir model/metrika uchun ``{'model', 'metric', 'baseline', 'current',
+        'change', 'regression'}`` - ``change`` nisbiy o'zgarish (+ yomonlashuv)
+    """
+    rows = []
+    for key, model in current.get('models', {}).items():
+        base = baseline.get('models', {}).get(key)
+        if not base:
+            continue
+        checks = []
+        for (section, name), direction in TRACKED_METRICS.items():
+            checks.append((f'{section}.{name}', model.get(section, {}) or {}, base.get(section, {}) or {}, name, direction))
+        for size in model.get('throughput', {}):
+            checks.append((f'throughput.{size}', model['throughput'], base.get('throughput', {}), size, 'higher'))
+
+        for metric, values, base_values, name, direction in checks:
+            value, base_value = values.get(name), base_values.get(name)
+            if not isinstance(value, (int, float)) or not isinstance(base_value, (int, float)) or not base_value:
+                continue
+            change = (value - base_value) / base_value
+            if direction == 'higher':
+                change = -change
+            rows.append({
+                'model': key,
+                'metric': metric,
+                'baseline': base_value,
+                'current': value,
+                'change': round(change, 4),
+                'regression': change > tolerance,
+            })
+    return rows
+
+
+class Command(BaseCommand):
+    help = "Har bir AIModel kaliti uchun latency, batch o'tkazuvchanligi, sovuq yuklash va RSS ni o'lchaydi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model-key', action='append', help='Faqat shu kalitlar (bir necha marta berish mumkin)')
+        parser.add_argument('--samples', help='Namuna rasmlar papkasi (berilmasa oxirgi PlantImage rasmlari)')
+        parser.add_argument('--num-samples', type=int, default=32, help='Namuna rasmlar soni')
+        parser.add_argument('--repeat', type=int, default=100, help='Latency o\'lchovlari soni')
+        parser.add_argument('--batch-sizes', default=DEFAULT_BATCH_SIZES, help='O\'tkazuvchanlik uchun batch o\'lchamlari')
+        parser.add_argument('--batch-repeat', type=int, default=10, help='Har bir batch o\'lchami uchun takrorlar')
+        parser.add_argument('--skip-cold', action='store_true', help='Sovuq yuklashni o\'lchamaslik')
+        parser.add_argument('--json', dest='json_path', help='Natijalarni JSON faylga yozish')
+        parser.add_argument('--baseline', help='Solishtirish uchun avvalgi JSON natija')
+        parser.add_argument('--tolerance', type=float, default=0.10, help='Regressiya chegarasi (0.10 = 10%%)')
+        parser.add_argument('--fail-on-regression', action='store_true', help='Regressiya bo\'lsa xato bilan chiqish')
+
+    # ------------------------------------------------------------------
+    # Rasmlar
+    # ------------------------------------------------------------------
+
+    def _sample_images(self, options):
+        from diagnosis.models import PlantImage
+
+        limit = options['num_samples']
+        paths = []
+        if options['samples']:
+            paths = sorted(
+                p for p in Path(options['samples']).iterdir()
+                if p.suffix.lower() in ('.jpg', '.jpeg', '.png')
+            )[:limit]
+        else:
+            for plant_image in PlantImage.objects.filter(status='completed').exclude(image='').order_by('-pk')[:limit * 2]:
+                if os.path.exists(plant_image.image.path):
+                    paths.append(Path(plant_image.image.path))
+                if len(paths) >= limit:
+                    break
+        return [path.read_bytes() for path in paths]
+
+    # ------------------------------------------------------------------
+    # O'lchovlar
+    # ------------------------------------------------------------------
+
+    def _cold_load(self, model_key):
+        env = dict(os.environ, TF_CPP_MIN_LOG_LEVEL='3')
+        result = subprocess.run(
+            [sys.executable, '-c', COLD_LOAD_SNIPPET, model_key],
+            cwd=str(settings.BASE_DIR), env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            self.stdout.write(self.style.WARNING(f"⚠️ {model_key}: sovuq yuklash o'lchanmadi: {result.stderr.strip()[-300:]}"))
+            return None
+        measured = json.loads(result.stdout.strip().splitlines()[-1])
+        return {name: round(value, 4) if isinstance(value, float) else value for name, value in measured.items()}
+
+    def _latency(self, config, images, repeat):
+        """Bitta so'rov yo'li: bayt -> preprocess_image -> predict_batch"""
+        from models.model_manager import model_manager
+        from models.preprocessing import preprocess_image
+
+        preprocess_ms, inference_ms, total_ms = [], [], []
+        model_manager.predict_batch(config['token'], preprocess_image(io.BytesIO(images[0])))  # warmup
+        for i in range(repeat):
+            started = time.perf_counter()
+            tensor = preprocess_image(io.BytesIO(images[i % len(images)]))
+            decoded = time.perf_counter()
+            model_manager.predict_batch(config['token'], tensor)
+            finished = time.perf_counter()
+            preprocess_ms.append((decoded - started) * 1000)
+            inference_ms.append((finished - decoded) * 1000)
+            total_ms.append((finished - started) * 1000)
+        return {
+            'preprocess': percentiles(preprocess_ms),
+            'inference': percentiles(inference_ms),
+            'total': percentiles(total_ms),
+        }
+
+    def _throughput(self, config, batch_sizes, repeat):
+        """Batch o'lchami bo'yicha rasm/soniya (faqat model, preprocessing siz)"""
+        from models.model_manager import model_manager
+
+        rng = np.random.default_rng(0)
+        results = {}
+        for size in batch_sizes:
+            batch = rng.random((size, 224, 224, 3), dtype=np.float32)
+            model_manager.predict_batch(config['token'], batch)  # warmup / trace
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                model_manager.predict_batch(config['token'], batch)
+                timings.append(time.perf_counter() - started)
+            results[str(size)] = round(size / float(np.median(timings)), 2)
+        return results
+
+    def _benchmark_model(self, model_key, synthetic, samples, options):
+        from models.model_manager import model_manager
+
+        self.stdout.write(f"🔄 {model_key}")
+        cold = None if options['skip_cold'] else self._cold_load(model_key)
+        config = model_manager.acquire(model_key)
+        batch_sizes = [int(size) for size in options['batch_sizes'].split(',') if size.strip()]
+
+        latency = {'synthetic': self._latency(config, synthetic, options['repeat'])}
+        if samples:
+            latency['samples'] = self._latency(config, samples, options['repeat'])
+        # Baseline bilan solishtiriladigan asosiy qiymat - haqiqiy rasmlar bo'lsa ular, aks holda sintetik
+        headline = latency.get('samples', latency['synthetic'])['total']
+        return {
+            'backend': config['backend'],
+            'ai_model_id': config['ai_model_id'],
+            'version': config['version'],
+            'cold_load': cold,
+            'latency_ms': headline,
+            'latency_breakdown_ms': latency,
+            'throughput': self._throughput(config, batch_sizes, options['batch_repeat']),
+        }
+
+    # ------------------------------------------------------------------
+
+    def handle(self, *args, **options):
+        from models.model_manager import model_manager
+
+        keys = options['model_key'] or list(model_manager.models)
+        missing = [key for key in keys if key not in model_manager.models]
+        if missing:
+            raise CommandError(f"❌ Model topilmadi: {', '.join(missing)}")
+
+        rng = np.random.default_rng(0)
+        synthetic = [synthetic_jpeg(rng) for _ in range(4)]
+        samples = self._sample_images(options)
+        self.stdout.write(f"🖼️ Sintetik: {len(synthetic)}, namuna rasmlar: {len(samples)}")
+
+        result = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'machine': platform.machine(),
+                'cpu_count': os.cpu_count(),
+                'repeat': options['repeat'],
+            },
+            'models': {},
+        }
+        for key in keys:
+            try:
+                result['models'][key] = self._benchmark_model(key, synthetic, samples, options)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"❌ {key}: {e}"))
+                result['models'][key] = {'error': str(e)}
+
+        self._print_results(result)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"✅ Natijalar saqlandi: {options['json_path']}"))
+
+        if options['baseline']:
+            with open(options['baseline'], 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+            rows = compare_to_baseline(result, baseline, options['tolerance'])
+            regressions = self._print_comparison(rows)
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f"❌ {regressions} ta regressiya (chegara {options['tolerance']:.0%})")
+
+    def _print_results(self, result):
+        for key, model in result['models'].items():
+            if 'error' in model:
+                continue
+            latency = model['latency_ms']
+            self.stdout.write(
+                f"📊 {key} ({model['backend']}): p50 {latency['p50']:.1f} ms  "
+                f"p95 {latency['p95']:.1f} ms  p99 {latency['p99']:.1f} ms"
+            )
+            curve = '  '.join(f"{size}:{ips:.0f}" for size, ips in model['throughput'].items())
+            self.stdout.write(f"   🚀 rasm/s (batch:ips) {curve}")
+            cold = model['cold_load']
+            if cold:
+                self.stdout.write(
+                    f"   ❄️ sovuq yuklash {cold['load_s']:.2f}s + birinchi bashorat {cold['first_predict_s']:.2f}s, "
+                    f"RSS {cold['rss_bytes'] / 1024 / 1024:.0f} MB"
+                )
+
+    def _print_comparison(self, rows):
+        regressions = 0
+        for row in rows:
+            if row['regression']:
+                regressions += 1
+                self.stdout.write(self.style.ERROR(
+                    f"🔻 {row['model']} {row['metric']}: {row['baseline']} -> {row['current']} ({row['change']:+.1%})"
+                ))
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS(f"✅ Baseline bilan solishtirildi: regressiya yo'q ({len(rows)} ta metrika)"))
+        return regressions
@@ -0,0 +1,89 @@
+"""
+Preprocessing benchmark: eski yo'l (to'liq dekodlash + float64) va
+models.preprocessing (JPEG draft + float32) katta JPEG rasmlarda
+"""
+
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+
+def legacy_preprocess(path):
+    """Avvalgi predict_plant_disease / predict_with_manager ketma-ketligi"""
+    img = Image.open(path).convert('RGB')
+    img = img.resize((224, 224))
+    img_array = np.array(img) / 255.0
+    return np.expand_dims(img_array, axis=0)
+
+
+def make_synthetic_jpeg(path, size, seed):
+    """Telefon rasmiga o'xshash katta JPEG yaratish (silliq gradient + shovqin)"""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    x = np.linspace(0, 1, width, dtype=np.float32)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    pixels = rng.normal(0, 12, size=(height, width, 3)).astype(np.float32)
+    pixels[..., 0] += x * 120 + 40
+    pixels[..., 1] += y * 160 + 60
+    pixels[..., 2] += (x + y) * 50 + 20
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(path, 'JPEG', quality=90)
+
+
+class Command(BaseCommand):
+    help = "Eski va yangi rasm preprocessing yo'llarini katta JPEG larda solishtiradi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('images', nargs='*', help='JPEG fayllar (berilmasa sintetik 12 MP rasmlar yaratiladi)')
+        parser.add_argument('--synthetic', type=int, default=4, help='Sintetik rasmlar soni')
+        parser.add_argument('--width', type=int, default=4000)
+        parser.add_argument('--height', type=int, default=3000)
+        parser.add_argument('--repeat', type=int, default=3, help='Har bir rasm necha marta qayta ishlanadi')
+
+    def _time_per_image(self, func, paths, repeat):
+        timings = []
+        for _ in range(repeat):
+            for path in paths:
+                started = time.perf_counter()
+                func(path)
+                timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def handle(self, *args, **options):
+        from models.preprocessing import preprocess_batch, preprocess_image
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = [Path(p) for p in options['images']]
+            if not paths:
+                size = (options['width'], options['height'])
+                self.stdout.write(f"🖼️ {options['synthetic']} ta sintetik {size[0]}x{size[1]} JPEG yaratilmoqda...")
+                for i in range(options['synthetic']):
+                    path = Path(tmp_dir) / f'synthetic_{i}.jpg'
+                    make_synthetic_jpeg(path, size, seed=i)
+                    paths.append(path)
+
+            legacy = self._time_per_image(legacy_preprocess, paths, options['repeat'])
+            new = self._time_per_image(preprocess_image, paths, options['repeat'])
+
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                batch = preprocess_batch(paths)
+            batch_ms = (time.perf_counter() - started) * 1000 / (options['repeat'] * len(paths))
+
+            # Natijalar qanchalik yaqinligi (draft dekodlash piksellarni biroz o'zgartiradi)
+            diffs = [
+                float(np.abs(legacy_preprocess(path).astype(np.float32) - preprocess_image(path)).mean())
+                for path in paths
+            ]
+
+        legacy_median = statistics.median(legacy)
+        new_median = statistics.median(new)
+        self.stdout.write(f"📊 Eski yo'l:        {legacy_median:8.2f} ms/rasm (median)")
+        self.stdout.write(f"📊 Yangi (draft):    {new_median:8.2f} ms/rasm (median)")
+        self.stdout.write(f"📊 Yangi (batch):    {batch_ms:8.2f} ms/rasm, buffer {batch.shape} {batch.dtype}")
+        self.stdout.write(f"📊 O'rtacha farq:    {statistics.mean(diffs):.4f} (0..1 shkalada)")
+        self.stdout.write(self.style.SUCCESS(f"🚀 Tezlashish: {legacy_median / new_median:.1f}x"))
@@ -0,0 +1,114 @@
+"""
+Django ishga tushish narxini o'lchash: `manage.py check` ning vaqti va RSS xotirasi
+ML stek (TensorFlow, Gemini SDK, modellar) bilan va usiz
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Har bir variant alohida Python jarayonida ishga tushiriladi
+SCENARIOS = {
+    # Hozirgi holat: ML stek faqat birinchi bashoratda yuklanadi
+    'check': (
+        "import runpy, sys; sys.argv = ['manage.py', 'check']; "
+        "runpy.run_path('manage.py', run_name='__main__')"
+    ),
+    # ML kutubxonalari import vaqtida yuklangan holat (avvalgi xatti-harakat)
+    'check_with_ml_imports': (
+        "import runpy, sys\n"
+        "import tensorflow\n"
+        "try:\n"
+        "    import google.generativeai\n"
+        "except ImportError:\n"
+        "    pass\n"
+        "sys.argv = ['manage.py', 'check']\n"
+        "runpy.run_path('manage.py', run_name='__main__')"
+    ),
+    # ML kutubxonalari va modellar oldindan yuklangan holat (INFERENCE_WARMUP=True)
+    'check_with_warmup': (
+        "import runpy, sys\n"
+        "sys.argv = ['manage.py', 'check']\n"
+        "runpy.run_path('manage.py', run_name='__main__')\n"
+        "from diagnosis.model_loader import warmup\n"
+        "warmup()"
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = "manage.py check uchun ishga tushish vaqti va RSS ni ML stek bilan va usiz o'lchaydi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3, help='Har bir variant necha marta ishga tushiriladi')
+        parser.add_argument(
+            '--scenario', action='append', choices=sorted(SCENARIOS),
+            help='Faqat tanlangan variantlar (bir necha marta berish mumkin)'
+        )
+        parser.add_argument('--json', dest='json_path', help='Natijalarni JSON faylga yozish')
+
+    def _run_once(self, code):
+        env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1', TF_CPP_MIN_LOG_LEVEL='3')
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, '-c', code],
+            cwd=str(settings.BASE_DIR),
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        # wait4 aynan shu bola jarayonning resurslarini qaytaradi
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        elapsed = time.perf_counter() - started
+        # Linuxda ru_maxrss kilobaytlarda
+        return elapsed, rusage.ru_maxrss * 1024, process.returncode
+
+    def handle(self, *args, **options):
+        scenarios = options['scenario'] or list(SCENARIOS)
+        results = {}
+
+        for name in scenarios:
+            times, peaks, failures = [], [], 0
+            for _ in range(options['repeat']):
+                elapsed, peak_rss, returncode = self._run_once(SCENARIOS[name])
+                if returncode != 0:
+                    failures += 1
+                    continue
+                times.append(elapsed)
+                peaks.append(peak_rss)
+
+            if not times:
+                self.stdout.write(self.style.ERROR(f"❌ {name}: barcha urinishlar muvaffaqiyatsiz"))
+                results[name] = {'failed': failures}
+                continue
+
+            results[name] = {
+                'runs': len(times),
+                'failed': failures,
+                'wall_time_median_s': round(statistics.median(times), 3),
+                'wall_time_min_s': round(min(times), 3),
+                'peak_rss_mb': round(max(peaks) / 1024 / 1024, 1),
+            }
+            self.stdout.write(
+                f"📊 {name:<24} {results[name]['wall_time_median_s']:>7.3f}s (median)  "
+                f"{results[name]['peak_rss_mb']:>8.1f} MB RSS"
+            )
+
+        baseline = results.get('check', {}).get('wall_time_median_s')
+        if baseline:
+            for name, result in results.items():
+                if name != 'check' and 'wall_time_median_s' in result:
+                    extra = result['wall_time_median_s'] - baseline
+                    self.stdout.write(f"   {name}: {extra:+.3f}s ishga tushish narxi")
+
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"✅ Natijalar saqlandi: {options['json_path']}"))
@@ -0,0 +1,156 @@
+"""
+gunicorn workerlarining xotirasini o'lchash: 1/4/8 worker uchun preload
+(copy-on-write) rejimida va usiz har bir workerning PSS/USS/RSS qiymatlari
+"""
+
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+MODES = ('baseline', 'preload')
+
+
+def find_children(pid):
+    """``pid`` ning bevosita bola jarayonlari (/proc/*/stat dagi ppid bo'yicha)"""
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                # comm qavs ichida bo'sh joy saqlashi mumkin - oxirgi ')' dan keyin ajratamiz
+                fields = f.read().rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+class Command(BaseCommand):
+    help = "gunicorn workerlari uchun PSS/USS ni preload (copy-on-write) bilan va usiz o'lchaydi"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', default='1,4,8', help="Workerlar soni ro'yxati (vergul bilan)"
+        )
+        parser.add_argument('--mode', action='append', choices=MODES, help='Faqat tanlangan rejimlar')
+        parser.add_argument(
+            '--settle', type=float, default=3.0,
+            help="PSS shu muddat davomida o'zgarmasa workerlar tayyor hisoblanadi (soniya)"
+        )
+        parser.add_argument('--timeout', type=float, default=180.0, help='Bitta ishga tushirish uchun maksimal kutish')
+        parser.add_argument('--json', dest='json_path', help='Natijalarni JSON faylga yozish')
+
+    def _wait_ready(self, master, workers, settle, timeout):
+        """Barcha workerlar paydo bo'lib, umumiy PSS barqarorlashguncha kutish"""
+        from models.preload import get_process_memory
+
+        deadline = time.monotonic() + timeout
+        last_total, stable_since = None, None
+        while time.monotonic() < deadline:
+            time.sleep(0.5)
+            if master.poll() is not None:
+                raise CommandError(f"❌ gunicorn to'xtadi (kod {master.returncode})")
+            children = find_children(master.pid)
+            if len(children) < workers:
+                continue
+            try:
+                total = sum(get_process_memory(pid)['pss'] for pid in children)
+            except OSError:
+                continue
+            if last_total is not None and abs(total - last_total) <= last_total * 0.01:
+                stable_since = stable_since or time.monotonic()
+                if time.monotonic() - stable_since >= settle:
+                    return children
+            else:
+                stable_since = None
+            last_total = total
+        raise CommandError(f"❌ {workers} ta worker {timeout:.0f}s ichida tayyor bo'lmadi")
+
+    def _run(self, workers, mode, options):
+        from models.preload import get_process_memory
+
+        env = dict(
+            os.environ,
+            INFERENCE_PRELOAD='True' if mode == 'preload' else 'False',
+            INFERENCE_WARMUP='True',
+            TF_CPP_MIN_LOG_LEVEL='3',
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            command = [
+                sys.executable, '-m', 'gunicorn', 'PlantCare.wsgi:application',
+                '--config', str(settings.BASE_DIR / 'gunicorn.conf.py'),
+                '--bind', f"unix:{os.path.join(tmp_dir, 'gunicorn.sock')}",
+                '--workers', str(workers),
+                '--log-level', 'warning',
+            ]
+            master = subprocess.Popen(
+                command, cwd=str(settings.BASE_DIR), env=env,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            try:
+                children = self._wait_ready(master, workers, options['settle'], options['timeout'])
+                per_worker = [get_process_memory(pid) for pid in children]
+                master_memory = get_process_memory(master.pid)
+            finally:
+                master.send_signal(signal.SIGTERM)
+                try:
+                    master.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    master.kill()
+
+        def mean(key):
+            return sum(item[key] for item in per_worker) / len(per_worker)
+
+        return {
+            'workers': workers,
+            'mode': mode,
+            'worker_pss': mean('pss'),
+            'worker_uss': mean('uss'),
+            'worker_rss': mean('rss'),
+            'total_pss': master_memory['pss'] + sum(item['pss'] for item in per_worker),
+            'per_worker': per_worker,
+        }
+
+    def handle(self, *args, **options):
+        if not os.path.exists('/proc/self/smaps_rollup'):
+            raise CommandError("❌ /proc/<pid>/smaps_rollup kerak (Linux 4.14+)")
+        try:
+            worker_counts = [int(value) for value in options['workers'].split(',') if value.strip()]
+        except ValueError:
+            raise CommandError("❌ --workers butun sonlar ro'yxati bo'lishi kerak, masalan 1,4,8")
+
+        results = []
+        for workers in worker_counts:
+            for mode in options['mode'] or MODES:
+                self.stdout.write(f"🔄 {workers} worker, {mode} rejimi...")
+                results.append(self._run(workers, mode, options))
+
+        mb = 1024 * 1024
+        self.stdout.write('')
+        self.stdout.write(f"{'workers':>7}  {'rejim':<9} {'PSS/worker':>11} {'USS/worker':>11} {'RSS/worker':>11} {'jami PSS':>10}")
+        for row in results:
+            self.stdout.write(
+                f"{row['workers']:>7}  {row['mode']:<9} {row['worker_pss'] / mb:>9.1f}MB "
+                f"{row['worker_uss'] / mb:>9.1f}MB {row['worker_rss'] / mb:>9.1f}MB {row['total_pss'] / mb:>8.1f}MB"
+            )
+
+        by_key = {(row['workers'], row['mode']): row for row in results}
+        for workers in worker_counts:
+            baseline, preload = by_key.get((workers, 'baseline')), by_key.get((workers, 'preload'))
+            if baseline and preload and baseline['total_pss']:
+                saved = 1 - preload['total_pss'] / baseline['total_pss']
+                self.stdout.write(self.style.SUCCESS(f"💾 {workers} worker: preload jami PSS ni {saved:.1%} kamaytirdi"))
+
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"✅ Natijalar saqlandi: {options['json_path']}"))
@@ -0,0 +1,223 @@
+"""
+AIModel ning .h5 faylini CPU uchun optimallashtirilgan formatga (TFLite
+float16/int8 yoki ONNX) o'tkazish, aniqlik mosligini tekshirish va
+latency/RSS bo'yicha taqqoslash hisobotini saqlash
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+
+# Modelni alohida jarayonda yuklab, yuklash vaqti va RSS ni o'lchash
+MEASURE_SNIPPET = """
+import json, sys, time
+import numpy as np
+from models.model_manager import get_process_rss, load_keras_model
+from models.runtimes import load_optimized_model
+path, model_format = sys.argv[1], sys.argv[2]
+rss_before = get_process_rss()
+started = time.perf_counter()
+model = load_keras_model(path) if model_format == 'keras' else load_optimized_model(path, model_format)
+model.predict(np.zeros((1, 224, 224, 3), dtype=np.float32), verbose=0)
+print(json.dumps({
+    'load_and_first_predict_s': time.perf_counter() - started,
+    'rss_bytes': get_process_rss(),
+    'rss_delta_bytes': get_process_rss() - rss_before,
+}))
+"""
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+class Command(BaseCommand):
+    help = "AIModel .h5 faylini TFLite (float16/int8) yoki ONNX ga o'tkazadi va natijani solishtiradi"
+
+    def add_arguments(self, parser):
+        from models.runtimes import FORMATS
+
+        parser.add_argument('ai_model_id', type=int, help='AIModel id si')
+        parser.add_argument('--format', dest='model_format', choices=FORMATS, default='tflite_float16')
+        parser.add_argument(
+            '--samples', help='Tekshiruv rasmlari papkasi (berilmasa oxirgi yuklangan PlantImage rasmlari)'
+        )
+        parser.add_argument('--num-samples', type=int, default=64, help='Tekshiruv uchun rasmlar soni')
+        parser.add_argument(
+            '--min-agreement', type=float, default=0.98,
+            help='Top-1 mosligining minimal ulushi; past bo\'lsa artefakt saqlanmaydi'
+        )
+        parser.add_argument('--repeat', type=int, default=20, help='Latency o\'lchash takrorlari')
+        parser.add_argument('--force', action='store_true', help='Moslik past bo\'lsa ham saqlash')
+        parser.add_argument('--dry-run', action='store_true', help='Faqat hisobot, AIModel o\'zgarmaydi')
+        parser.add_argument('--json', dest='json_path', help='Hisobotni JSON faylga yozish')
+
+    def _sample_paths(self, options):
+        from diagnosis.models import PlantImage
+
+        limit = options['num_samples']
+        if options['samples']:
+            folder = Path(options['samples'])
+            paths = sorted(
+                p for p in folder.iterdir()
+                if p.suffix.lower() in ('.jpg', '.jpeg', '.png')
+            )[:limit]
+        else:
+            paths = []
+            for plant_image in PlantImage.objects.filter(status='completed').exclude(image='').order_by('-pk'):
+                if os.path.exists(plant_image.image.path):
+                    paths.append(Path(plant_image.image.path))
+                if len(paths) >= limit:
+                    break
+        if not paths:
+            raise CommandError("❌ Tekshiruv uchun rasmlar topilmadi (--samples papkasini bering)")
+        return paths
+
+    def _predict_all(self, model, samples, batch_size=16):
+        return np.concatenate([
+            model.predict(samples[i:i + batch_size], verbose=0)
+            for i in range(0, len(samples), batch_size)
+        ])
+
+    def _latency_ms(self, model, samples, repeat):
+        timings = []
+        for i in range(repeat):
+            sample = samples[i % len(samples)][np.newaxis]
+            started = time.perf_counter()
+            model.predict(sample, verbose=0)
+            timings.append((time.perf_counter() - started) * 1000)
+        return {
+            'p50': round(percentile(timings, 50), 2),
+            'p95': round(percentile(timings, 95), 2),
+            'mean': round(statistics.mean(timings), 2),
+        }
+
+    def _measure_process(self, path, model_format):
+        env = dict(os.environ, TF_CPP_MIN_LOG_LEVEL='3')
+        result = subprocess.run(
+            [sys.executable, '-c', MEASURE_SNIPPET, str(path), model_format],
+            cwd=str(settings.BASE_DIR), env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            self.stdout.write(self.style.WARNING(f"⚠️ {model_format} RSS o'lchanmadi: {result.stderr.strip()[-300:]}"))
+            return None
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        from diagnosis.models import AIModel
+        from models.model_manager import load_keras_model
+        from models.preprocessing import preprocess_batch
+        from models.runtimes import FORMAT_EXTENSIONS, convert_keras_model, load_optimized_model
+
+        try:
+            ai_model = AIModel.objects.get(pk=options['ai_model_id'])
+        except AIModel.DoesNotExist:
+            raise CommandError(f"❌ AIModel topilmadi: {options['ai_model_id']}")
+
+        model_format = options['model_format']
+        paths = self._sample_paths(options)
+        self.stdout.write(f"🖼️ {len(paths)} ta tekshiruv rasmi tayyorlanmoqda...")
+        samples = preprocess_batch(paths)
+
+        self.stdout.write(f"🔄 Keras modeli yuklanmoqda: {ai_model.model_file.path}")
+        keras_model = load_keras_model(ai_model.model_file.path)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = Path(tmp_dir) / f"{ai_model.get_model_key()}_{model_format}{FORMAT_EXTENSIONS[model_format]}"
+            self.stdout.write(f"⚙️ {model_format} ga o'tkazilmoqda...")
+            started = time.perf_counter()
+            convert_keras_model(keras_model, model_format, str(output_path), representative_data=samples)
+            convert_time = time.perf_counter() - started
+            optimized_model = load_optimized_model(str(output_path), model_format)
+
+            # Aniqlik mosligi: bir xil rasmlarda ikkala model natijalari
+            reference = self._predict_all(keras_model, samples)
+            candidate = self._predict_all(optimized_model, samples)
+            reference_top1 = reference.argmax(axis=1)
+            candidate_top3 = np.argsort(candidate, axis=1)[:, -3:]
+            abs_diff = np.abs(reference - candidate)
+
+            report = {
+                'format': model_format,
+                'samples': len(paths),
+                'convert_time_s': round(convert_time, 2),
+                'size_bytes': {
+                    'keras': os.path.getsize(ai_model.model_file.path),
+                    'optimized': os.path.getsize(output_path),
+                },
+                'parity': {
+                    'top1_agreement': round(float((reference_top1 == candidate.argmax(axis=1)).mean()), 4),
+                    'top3_contains_reference': round(float(
+                        (candidate_top3 == reference_top1[:, None]).any(axis=1).mean()
+                    ), 4),
+                    'max_abs_prob_diff': round(float(abs_diff.max()), 5),
+                    'mean_abs_prob_diff': round(float(abs_diff.mean()), 6),
+                },
+                'latency_ms': {
+                    'keras': self._latency_ms(keras_model, samples, options['repeat']),
+                    'optimized': self._latency_ms(optimized_model, samples, options['repeat']),
+                },
+                'process': {
+                    'keras': self._measure_process(ai_model.model_file.path, 'keras'),
+                    'optimized': self._measure_process(output_path, model_format),
+                },
+            }
+            self._print_report(report)
+
+            agreement = report['parity']['top1_agreement']
+            if agreement < options['min_agreement'] and not options['force']:
+                raise CommandError(
+                    f"❌ Top-1 moslik {agreement:.2%} < {options['min_agreement']:.2%}, artefakt saqlanmadi "
+                    f"(--force bilan majburlash mumkin)"
+                )
+
+            if options['json_path']:
+                with open(options['json_path'], 'w', encoding='utf-8') as f:
+                    json.dump(report, f, indent=2)
+
+            if options['dry_run']:
+                self.stdout.write(self.style.WARNING('⚠️ --dry-run: AIModel o\'zgartirilmadi'))
+                return
+
+            with open(output_path, 'rb') as f:
+                ai_model.optimized_file.save(output_path.name, File(f), save=False)
+            ai_model.optimized_format = model_format
+            ai_model.optimization_report = report
+            # updated_at o'zgaradi -> bashorat keshi va ishlayotgan jarayonlar yangi artefaktni ko'radi
+            ai_model.save()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {ai_model.name}: {model_format} artefakti saqlandi ({ai_model.optimized_file.name})"
+        ))
+
+    def _print_report(self, report):
+        parity = report['parity']
+        size = report['size_bytes']
+        self.stdout.write(f"📦 Hajm: {size['keras'] / 1024 / 1024:.1f} MB -> {size['optimized'] / 1024 / 1024:.1f} MB")
+        self.stdout.write(
+            f"🎯 Top-1 moslik: {parity['top1_agreement']:.2%}, "
+            f"top-3 ichida: {parity['top3_contains_reference']:.2%}, "
+            f"maks. ehtimollik farqi: {parity['max_abs_prob_diff']:.4f}"
+        )
+        for name in ('keras', 'optimized'):
+            latency = report['latency_ms'][name]
+            process = report['process'][name] or {}
+            rss = process.get('rss_bytes')
+            rss_text = f"{rss / 1024 / 1024:8.1f} MB RSS" if rss else '       - RSS'
+            self.stdout.write(
+                f"📊 {name:<10} p50 {latency['p50']:7.2f} ms  p95 {latency['p95']:7.2f} ms  {rss_text}"
+            )
+        keras_p50 = report['latency_ms']['keras']['p50']
+        optimized_p50 = report['latency_ms']['optimized']['p50']
+        if optimized_p50:
+            self.stdout.write(self.style.SUCCESS(f"🚀 Tezlashish (p50): {keras_p50 / optimized_p50:.1f}x"))
@@ -0,0 +1,48 @@
+"""
+pHash maydoni bo'sh PlantImage yozuvlari uchun perseptual xeshni hisoblash
+(yaqin-dublikat klaster analitikasi eski rasmlarni ham ko'rishi uchun).
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "pHash i bo'sh PlantImage yozuvlari uchun perseptual xeshni hisoblaydi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Bazadan bir marta o\'qiladigan yozuvlar')
+        parser.add_argument('--workers', type=int, default=4, help='Dekodlash threadlari')
+        parser.add_argument('--limit', type=int, help='Ko\'pi bilan shuncha rasm')
+
+    def handle(self, *args, **options):
+        from diagnosis.duplicates import compute
+        from diagnosis.models import PlantImage
+
+        queryset = PlantImage.objects.filter(phash='').exclude(image='').order_by('pk')
+        total = hashed = 0
+        last_id = 0
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            while not options['limit'] or total < options['limit']:
+                size = options['chunk_size']
+                if options['limit']:
+                    size = min(size, options['limit'] - total)
+                rows = list(queryset.filter(pk__gt=last_id).values_list('pk', 'image')[:size])
+                if not rows:
+                    break
+                hashes = executor.map(compute, [os.path.join(settings.MEDIA_ROOT, image) for _, image in rows])
+                updates = [PlantImage(pk=pk, phash=value) for (pk, _), value in zip(rows, hashes) if value]
+                PlantImage.objects.bulk_update(updates, ['phash'])
+                total += len(rows)
+                hashed += len(updates)
+                last_id = rows[-1][0]
+                self.stdout.write(f"📦 {total} ta rasm, {hashed} ta xesh  id<={last_id}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {hashed}/{total} ta rasm xeshlandi ({time.perf_counter() - started:.1f} s)"
+        ))
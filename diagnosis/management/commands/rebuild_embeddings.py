@@ -0,0 +1,175 @@
+"""
+Embedding omborini PlantImage arxividan qayta qurish: yakunlangan rasmlar id
+tartibida bo'laklab o'qiladi, threadlarda dekodlanadi, batch bilan embedding
+qilinadi (bo'lak embedding qilinayotganda keyingilari dekodlanadi) va vaqtinchalik papkaga yoziladi. Yetarlicha yozuv bo'lsa IVF indeks
+o'qitiladi, so'ng papka eski ombor o'rniga almashtiriladi - ishlab turgan
+workerlar keyingi ``refresh`` da yangi omborni ko'radi.
+"""
+
+import os
+import shutil
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "O'xshash holatlar uchun embedding omborini PlantImage arxividan qayta quradi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model-key', default='disease_all', help='Model kaliti (standart: disease_all)')
+        parser.add_argument('--chunk-size', type=int, default=512, help='Bazadan bir marta o\'qiladigan yozuvlar')
+        parser.add_argument('--batch-size', type=int, default=32, help='Embedding batch hajmi')
+        parser.add_argument('--workers', type=int, default=4, help='Dekodlash threadlari')
+        parser.add_argument('--nlist', type=int, help='IVF klasterlar soni (standart: 4*sqrt(N))')
+        parser.add_argument('--limit', type=int, help='Ko\'pi bilan shuncha rasm')
+        parser.add_argument('--queries', type=int, default=200, help='Qurilgandan keyin qidiruv latency si o\'lchanadigan so\'rovlar')
+
+    def _rows(self, config, options):
+        """Shu model tashxis qo'yadigan yakunlangan rasmlar (id tartibida, bo'laklab)"""
+        from diagnosis.embeddings import model_config_for
+        from diagnosis.models import PlantImage
+
+        queryset = (
+            PlantImage.objects.filter(status='completed', detection_type=config['type'])
+            .exclude(image='')
+            .order_by('pk')
+        )
+        if config['plant'] != 'all':
+            queryset = queryset.filter(plant_type_code=config['plant'])
+        keys = {}
+        last_id, seen = 0, 0
+        while not options['limit'] or seen < options['limit']:
+            chunk = list(
+                queryset.filter(pk__gt=last_id).values_list(
+                    'pk', 'image', 'plant_type_code', 'user_id', 'user__region', 'disease_name', 'confirmed'
+                )[:options['chunk_size']]
+            )
+            if not chunk:
+                return
+            last_id = chunk[-1][0]
+            rows = []
+            for row in chunk:
+                # O'z modeli bor o'simlik rasmlari umumiy model omboriga kirmaydi
+                plant = row[2]
+                if plant not in keys:
+                    keys[plant] = model_config_for(config['type'], plant)['key']
+                if keys[plant] == config['key']:
+                    rows.append(row)
+            if options['limit']:
+                rows = rows[:options['limit'] - seen]
+            seen += len(rows)
+            if rows:
+                yield rows
+
+    def handle(self, *args, **options):
+        from diagnosis import embeddings
+        from diagnosis.models import PlantImage
+        from models.model_manager import model_manager
+        from models.pipeline import InferencePipeline
+        from models.vector_store import VectorStore
+
+        config = model_manager.models.get(options['model_key'])
+        if config is None:
+            raise CommandError(f"❌ Model topilmadi: {options['model_key']}")
+
+        final_path = embeddings.store_path(config)
+        build_path = final_path + '.rebuild'
+        shutil.rmtree(build_path, ignore_errors=True)
+        # Qurilish paytida yakunlangan tashxislar oxirida alohida qo'shiladi
+        started_max_pk = PlantImage.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+        self.stdout.write(f"🔄 Embedding ombori qurilmoqda: {config['description']} -> {final_path}")
+        store = None
+        total = failed = 0
+        started = time.perf_counter()
+        pipeline = InferencePipeline(decode_workers=options['workers'])
+        try:
+            for rows in self._rows(config, options):
+                for ok, vectors, errors in pipeline.map_batches(
+                    [os.path.join(settings.MEDIA_ROOT, row[1]) for row in rows],
+                    lambda batch: embeddings.embed_images(config, batch),
+                    batch_size=options['batch_size'],
+                ):
+                    failed += len(errors)
+                    if not ok:
+                        continue
+                    if store is None:
+                        store = VectorStore(build_path, dim=vectors.shape[1])
+                    part = [rows[i] for i in ok]
+                    total += store.append(
+                        vectors,
+                        image_ids=[row[0] for row in part],
+                        user_ids=[row[3] for row in part],
+                        regions=[row[4] or '' for row in part],
+                        labels=[row[5] for row in part],
+                        confirmed=[row[6] for row in part],
+                    )
+                rate = total / max(time.perf_counter() - started, 1e-9)
+                self.stdout.write(f"📦 {total} ta embedding  {rate:.1f} rasm/s  (xato: {failed})")
+        finally:
+            pipeline.close()
+        self._print_stages(pipeline.get_metrics())
+
+        if store is None:
+            raise CommandError("❌ Embedding qilinadigan rasm topilmadi")
+
+        if options['nlist'] or total >= getattr(settings, 'EMBEDDING_IVF_MIN_VECTORS', 20000):
+            train_started = time.perf_counter()
+            store.train(nlist=options['nlist'])
+            self.stdout.write(
+                f"🧭 IVF indeks: {store.header['nlist']} klaster ({time.perf_counter() - train_started:.1f} s)"
+            )
+
+        # Almashtirish: eski ombor nomi o'zgartirilib, yangisi o'rniga qo'yiladi
+        old_path = final_path + '.old'
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(final_path):
+            os.rename(final_path, old_path)
+        os.rename(build_path, final_path)
+        shutil.rmtree(old_path, ignore_errors=True)
+        embeddings.reset_stores()
+
+        late = list(
+            PlantImage.objects.select_related('user')
+            .filter(pk__gt=started_max_pk, status='completed', detection_type=config['type'])
+            .exclude(image='')
+        )
+        late = [
+            plant_image for plant_image in late
+            if embeddings.model_config_for(plant_image.detection_type, plant_image.plant_type_code)['key'] == config['key']
+        ]
+        if late:
+            self.stdout.write(f"➕ Qurilish paytida qo'shilgan {embeddings.index_images(late)} ta tashxis")
+
+        self._measure(VectorStore(final_path), options['queries'])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Tayyor: {total} ta embedding, {failed} ta xato, {time.perf_counter() - started:.1f} s"
+        ))
+
+    def _print_stages(self, metrics):
+        """Bosqichlar bandligi: dekodlash ~100% va embedding past bo'lsa --workers ni oshirish kerak"""
+        decode, infer = metrics['decode'], metrics['infer']['bulk']
+        self.stdout.write(
+            f"⚙️ Dekodlash: {decode['workers']} thread, bandlik {decode['utilisation']:.0%}, "
+            f"{decode['avg_ms']:.1f} ms/rasm  |  Embedding: bandlik {infer['utilisation']:.0%}, "
+            f"tensorlarni kutish {infer['blocked_seconds']:.1f} s"
+        )
+
+    def _measure(self, store, queries):
+        """Ombordagi tasodifiy vektorlar bilan qidiruv latency si"""
+        count = len(store)
+        if not queries or not count:
+            return
+        rng = np.random.default_rng(0)
+        nprobe = getattr(settings, 'EMBEDDING_SEARCH_NPROBE', 8)
+        latencies = []
+        for index in rng.integers(0, count, size=queries):
+            query = store._snapshot.vectors[index].astype(np.float32)
+            started = time.perf_counter()
+            store.search(query, k=5, confirmed_only=False, nprobe=nprobe)
+            latencies.append((time.perf_counter() - started) * 1000)
+        p50, p95 = np.percentile(latencies, [50, 95])
+        self.stdout.write(f"🔍 Qidiruv ({count} ta vektor, nprobe={nprobe}): p50 {p50:.2f} ms, p95 {p95:.2f} ms")
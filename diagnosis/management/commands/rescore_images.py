@@ -0,0 +1,274 @@
+"""
+PlantImage arxivini yangi AIModel bilan qayta baholash: rasmlar id tartibida
+bo'laklab o'qiladi, jarayonlar pulida dekodlanadi, batch bilan bashorat
+qilinadi va (``--write`` bo'lsa) ``bulk_update`` bilan yoziladi. Har bir
+bo'lakdan keyin checkpoint saqlanadi - buyruq to'xtatilsa, shu joydan davom etadi.
+"""
+
+import gc
+import json
+import multiprocessing
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+
+def decode_image(path):
+    """Jarayonlar pulida ishlaydi: rasm -> ``(224, 224, 3)`` uint8 yoki xato matni"""
+    from models.preprocessing import load_image
+
+    try:
+        return np.asarray(load_image(path), dtype=np.uint8)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+
+
+class Command(BaseCommand):
+    help = "PlantImage arxivini yangi AIModel bilan qayta baholaydi (checkpoint, bulk_update, confusion)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('ai_model_id', type=int, help='Yangi AIModel id si (faol bo\'lishi shart emas)')
+        parser.add_argument('--chunk-size', type=int, default=256, help='Bazadan bir marta o\'qiladigan yozuvlar')
+        parser.add_argument('--batch-size', type=int, default=32, help='Inference batch hajmi')
+        parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1), help='Dekodlash jarayonlari')
+        parser.add_argument('--max-memory-mb', type=int, default=2048, help='RSS chegarasi; oshsa bo\'lak kichraytiriladi')
+        parser.add_argument('--plant', help="Faqat shu plant_type_code (standart: model o'simligi, 'all' - filtrsiz)")
+        parser.add_argument('--limit', type=int, help='Ko\'pi bilan shuncha rasm (shu ishga tushirishda)')
+        parser.add_argument('--write', action='store_true', help='Natijalarni PlantImage ga yozish (aks holda faqat hisobot)')
+        parser.add_argument('--checkpoint', help='Checkpoint fayli (standart: MEDIA_ROOT/rescore/<id>.json)')
+        parser.add_argument('--restart', action='store_true', help='Checkpoint ni e\'tiborsiz qoldirib boshidan boshlash')
+        parser.add_argument('--json', dest='json_path', help='Yakuniy hisobotni JSON faylga yozish')
+
+    # ------------------------------------------------------------------
+    # Checkpoint
+    # ------------------------------------------------------------------
+
+    def _checkpoint_path(self, options):
+        if options['checkpoint']:
+            return Path(options['checkpoint'])
+        return Path(settings.MEDIA_ROOT) / 'rescore' / f"{options['ai_model_id']}.json"
+
+    def _load_state(self, path, options):
+        empty = {
+            'ai_model_id': options['ai_model_id'],
+            'write': options['write'],
+            'last_id': 0,
+            'processed': 0,
+            'changed': 0,
+            'failed': 0,
+            'seconds': 0.0,
+            'confusion': {},
+        }
+        if options['restart'] or not path.exists():
+            return empty
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get('ai_model_id') != options['ai_model_id'] or state.get('write') != options['write']:
+            raise CommandError(f"❌ {path} boshqa parametrlar bilan yaratilgan (--restart bilan qayta boshlang)")
+        self.stdout.write(f"↩️ Checkpoint dan davom: id > {state['last_id']}, {state['processed']} ta rasm bajarilgan")
+        return state
+
+    def _save_state(self, path, state):
+        # Atomar yozish: to'xtatilganda yarim yozilgan checkpoint qolmaydi
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    # ------------------------------------------------------------------
+    # Asosiy sikl
+    # ------------------------------------------------------------------
+
+    def _load_model(self, ai_model):
+        from models.model_manager import ModelManager
+
+        manager = ModelManager(lazy=True)
+        manager._configs_loaded = True
+        key = manager.add_ai_model(ai_model)
+        return manager, manager.acquire(key)
+
+    def _queryset(self, ai_model, options):
+        from diagnosis.models import PlantImage
+
+        queryset = PlantImage.objects.filter(
+            status='completed', detection_type=ai_model.detection_type
+        ).exclude(image='')
+        # Umumiy ('all') model har qanday o'simlik rasmini baholay oladi
+        plant = options['plant'] or (ai_model.plant_type.code if ai_model.plant_type else 'all')
+        if plant != 'all':
+            queryset = queryset.filter(plant_type_code=plant)
+        return queryset.order_by('pk')
+
+    def _predict(self, manager, config, images, batch_size, buffer):
+        """uint8 rasmlar -> top-k; bitta oldindan ajratilgan float32 buffer ishlatiladi"""
+        from models.model_manager import top_k_predictions
+
+        results = []
+        for start in range(0, len(images), batch_size):
+            part = images[start:start + batch_size]
+            batch = buffer[:len(part)]
+            for i, image in enumerate(part):
+                batch[i] = image
+            batch *= np.float32(1.0 / 255.0)
+            probabilities = manager.predict_batch(config['token'], batch)
+            results.extend(top_k_predictions(row, config['labels'], k=3) for row in probabilities)
+        return results
+
+    def handle(self, *args, **options):
+        from diagnosis import recommendation_cache
+        from diagnosis.models import AIModel, Disease, PlantImage
+        from models.model_manager import get_process_rss
+
+        try:
+            ai_model = AIModel.objects.select_related('plant_type').get(pk=options['ai_model_id'])
+        except AIModel.DoesNotExist:
+            raise CommandError(f"❌ AIModel topilmadi: {options['ai_model_id']}")
+
+        checkpoint = self._checkpoint_path(options)
+        state = self._load_state(checkpoint, options)
+        confusion = Counter({tuple(key.split('\t', 1)): n for key, n in state['confusion'].items()})
+
+        self.stdout.write(f"🔄 Model yuklanmoqda: {ai_model.name} v{ai_model.version}")
+        manager, config = self._load_model(ai_model)
+        buffer = np.empty((options['batch_size'], 224, 224, 3), dtype=np.float32)
+
+        queryset = self._queryset(ai_model, options)
+        remaining = queryset.filter(pk__gt=state['last_id']).count()
+        if options['limit']:
+            remaining = min(remaining, options['limit'])
+        self.stdout.write(f"🖼️ Qayta baholanadigan rasmlar: {remaining}")
+
+        max_rss = options['max_memory_mb'] * 1024 * 1024
+        chunk_size = options['chunk_size']
+        diseases = {}
+        done_this_run = 0
+        started = time.perf_counter()
+
+        # spawn: TensorFlow runtime fork-safe emas, dekoderlarga esa faqat PIL kerak
+        executor = ProcessPoolExecutor(
+            max_workers=options['workers'], mp_context=multiprocessing.get_context('spawn')
+        )
+        with executor:
+            while not options['limit'] or done_this_run < options['limit']:
+                size = chunk_size
+                if options['limit']:
+                    size = min(size, options['limit'] - done_this_run)
+                rows = list(
+                    queryset.filter(pk__gt=state['last_id'])
+                    .values_list('pk', 'image', 'disease_name', 'language')[:size]
+                )
+                if not rows:
+                    break
+
+                chunk_started = time.perf_counter()
+                paths = [os.path.join(settings.MEDIA_ROOT, image) for _, image, _, _ in rows]
+                # map tartibni saqlaydi; chunksize IPC xarajatini kamaytiradi
+                decoded = list(executor.map(decode_image, paths, chunksize=8))
+                ok = [i for i, image in enumerate(decoded) if not isinstance(image, str)]
+                state['failed'] += len(rows) - len(ok)
+                predictions = self._predict(
+                    manager, config, [decoded[i] for i in ok], options['batch_size'], buffer
+                )
+                del decoded
+
+                updates = []
+                for i, top_k in zip(ok, predictions):
+                    pk, _, old_name, lang = rows[i]
+                    new_name, confidence = top_k[0]
+                    confusion[(old_name or '-', new_name)] += 1
+                    if new_name != old_name:
+                        state['changed'] += 1
+                    if options['write']:
+                        if new_name not in diseases:
+                            diseases[new_name] = Disease.get_or_create_detected(new_name)
+                        plant_image = PlantImage(
+                            pk=pk,
+                            disease=diseases[new_name],
+                            disease_name=new_name,
+                            confidence=confidence,
+                            accuracy=confidence * 100,
+                            top_predictions=PlantImage.format_top_predictions(top_k),
+                        )
+                        fields = ['disease', 'disease_name', 'confidence', 'accuracy', 'top_predictions']
+                        if new_name != old_name:
+                            # Tavsiya Gemini ga bormasdan, faqat keshda bo'lsa yangilanadi
+                            plant_image.ai_result = recommendation_cache.lookup(new_name, lang)
+                            if plant_image.ai_result is not None:
+                                fields.append('ai_result')
+                        updates.append((plant_image, fields))
+
+                with transaction.atomic():
+                    for fields in {tuple(fields) for _, fields in updates}:
+                        PlantImage.objects.bulk_update(
+                            [plant_image for plant_image, f in updates if tuple(f) == fields], fields
+                        )
+
+                done_this_run += len(rows)
+                state['processed'] += len(rows)
+                state['last_id'] = rows[-1][0]
+                state['seconds'] += time.perf_counter() - chunk_started
+                state['confusion'] = {f"{old}\t{new}": n for (old, new), n in confusion.items()}
+                self._save_state(checkpoint, state)
+
+                rate = len(rows) / max(time.perf_counter() - chunk_started, 1e-9)
+                rss = get_process_rss()
+                self.stdout.write(
+                    f"📦 {done_this_run}/{remaining}  id<={state['last_id']}  "
+                    f"{rate:.1f} rasm/s  RSS {rss / 1024 / 1024:.0f} MB"
+                )
+
+                if rss > max_rss:
+                    gc.collect()
+                    if chunk_size <= options['batch_size']:
+                        raise CommandError(
+                            f"❌ RSS {rss / 1024 / 1024:.0f} MB > --max-memory-mb; checkpoint saqlandi, "
+                            f"kichikroq --batch-size bilan davom ettiring"
+                        )
+                    chunk_size = max(options['batch_size'], chunk_size // 2)
+                    self.stdout.write(self.style.WARNING(f"⚠️ Xotira chegarasi: bo'lak hajmi {chunk_size} ga kamaytirildi"))
+
+        self._report(state, confusion, time.perf_counter() - started, done_this_run, options)
+
+    def _report(self, state, confusion, elapsed, done_this_run, options):
+        scored = sum(confusion.values())
+        agreed = sum(n for (old, new), n in confusion.items() if old == new)
+        report = {
+            'ai_model_id': state['ai_model_id'],
+            'written': options['write'],
+            'processed': state['processed'],
+            'failed': state['failed'],
+            'changed': state['changed'],
+            'agreement': round(agreed / scored, 4) if scored else 0.0,
+            'images_per_second': round(state['processed'] / state['seconds'], 2) if state['seconds'] else 0.0,
+            'this_run': {'images': done_this_run, 'seconds': round(elapsed, 2)},
+            'disagreements': [
+                {'old': old, 'new': new, 'count': n}
+                for (old, new), n in confusion.most_common() if old != new
+            ],
+        }
+
+        self.stdout.write('')
+        self.stdout.write(
+            f"🎯 Moslik: {report['agreement']:.2%} ({agreed}/{scored}), o'zgargan: {state['changed']}, "
+            f"o'qilmadi: {state['failed']}"
+        )
+        self.stdout.write(f"🚀 O'tkazuvchanlik: {report['images_per_second']} rasm/s")
+        if report['disagreements']:
+            self.stdout.write("🔀 Eng ko'p farqlar (eski -> yangi):")
+            for item in report['disagreements'][:15]:
+                self.stdout.write(f"   {item['count']:>6}  {item['old']} -> {item['new']}")
+
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Tayyor{' (natijalar yozildi)' if options['write'] else ' (faqat hisobot, --write berilmagan)'}"
+        ))
@@ -0,0 +1,40 @@
+"""
+Navbatdagi (fon rejimidagi) tashxis joblarini qayta ishlovchi worker
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "status='queued' bo'lgan PlantImage joblarini fon rejimida tahlil qiladi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2, help='Parallel ishlovchi threadlar soni')
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Navbat bo\'sh bo\'lganda tekshirish oralig\'i (soniya)'
+        )
+        parser.add_argument(
+            '--stale-after', type=int, default=settings.DIAGNOSIS_JOB_STALE_AFTER,
+            help='Shu vaqtdan (soniya) beri tugamagan job qayta navbatga qo\'yiladi'
+        )
+        parser.add_argument('--warmup', action='store_true', help='Modellarni oldindan yuklash')
+
+    def handle(self, *args, **options):
+        from diagnosis.jobs import DiagnosisWorker
+
+        if options['warmup']:
+            from diagnosis.model_loader import warmup
+            warmup()
+
+        worker = DiagnosisWorker(
+            threads=options['threads'],
+            poll_interval=options['poll_interval'],
+            stale_after=options['stale_after'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"🚀 Tashxis worker ishga tushdi ({options['threads']} ta thread)"
+        ))
+        worker.run_forever()
+        self.stdout.write(self.style.WARNING('⏹️ Tashxis worker to\'xtatildi'))
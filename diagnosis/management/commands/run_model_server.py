@@ -0,0 +1,44 @@
+"""
+Inference uchun alohida model-server jarayonlari pulini ishga tushirish
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Model-server pulini ishga tushiradi (INFERENCE_MODE=server uchun)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.MODEL_SERVER_WORKERS,
+            help='Model-server jarayonlari soni'
+        )
+        parser.add_argument(
+            '--socket', default=settings.MODEL_SERVER_SOCKET,
+            help='Unix socket yo\'li'
+        )
+        parser.add_argument(
+            '--warmup', nargs='*', default=['disease_all'],
+            help='Har bir jarayonda oldindan yuklanadigan model kalitlari'
+        )
+
+    def handle(self, *args, **options):
+        from models.model_server import ModelServer
+
+        server = ModelServer(
+            options['socket'],
+            workers=options['workers'],
+            warmup_keys=options['warmup'],
+        )
+        server.start()
+        self.stdout.write(self.style.SUCCESS(
+            f"🚀 Model server ishga tushdi: {options['socket']} ({options['workers']} ta jarayon)"
+        ))
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('⏹️ Model server to\'xtatildi'))
+        finally:
+            server.shutdown()
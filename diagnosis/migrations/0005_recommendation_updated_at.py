@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-18 02:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnosis', '0004_planttype_aimodel'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recommendation',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.23 on 2026-10-18 02:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnosis', '0005_recommendation_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plantimage',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='plantimage',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='plantimage',
+            name='detection_type',
+            field=models.CharField(default='disease', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='plantimage',
+            name='language',
+            field=models.CharField(default='uz', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='plantimage',
+            name='plant_type_code',
+            field=models.CharField(default='all', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='plantimage',
+            name='progress',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='plantimage',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Navbatda'), ('processing', 'Tahlil qilinmoqda'), ('completed', 'Yakunlandi'), ('failed', 'Xato')], db_index=True, default='completed', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-18 02:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnosis', '0006_plantimage_job_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plantimage',
+            name='top_predictions',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
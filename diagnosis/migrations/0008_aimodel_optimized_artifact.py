@@ -0,0 +1,28 @@
+# Generated by Django 4.2.23 on 2026-10-18 02:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnosis', '0007_plantimage_top_predictions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aimodel',
+            name='optimization_report',
+            field=models.JSONField(blank=True, default=dict, help_text='Aniqlik mosligi, latency va RSS taqqoslash', verbose_name='Konvertatsiya hisoboti'),
+        ),
+        migrations.AddField(
+            model_name='aimodel',
+            name='optimized_file',
+            field=models.FileField(blank=True, help_text="convert_model buyrug'i yaratgan TFLite/ONNX fayli", upload_to='ai_models/optimized/', verbose_name='Optimallashtirilgan model'),
+        ),
+        migrations.AddField(
+            model_name='aimodel',
+            name='optimized_format',
+            field=models.CharField(blank=True, choices=[('tflite_float16', 'TFLite (float16)'), ('tflite_int8', 'TFLite (int8)'), ('onnx', 'ONNX')], max_length=20, verbose_name='Optimallashtirilgan format'),
+        ),
+    ]
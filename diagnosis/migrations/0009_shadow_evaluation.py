@@ -0,0 +1,40 @@
+# Generated by Django 4.2.23 on 2026-10-18 02:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnosis', '0008_aimodel_optimized_artifact'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aimodel',
+            name='is_shadow',
+            field=models.BooleanField(default=False, help_text="Nomzod model: jonli so'rovlarning bir qismida fonda ishlaydi, javobga ta'sir qilmaydi", verbose_name='Shadow sinov'),
+        ),
+        migrations.CreateModel(
+            name='ShadowPrediction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_key', models.CharField(max_length=100, verbose_name='Model kaliti')),
+                ('primary_label', models.CharField(max_length=255, verbose_name='Asosiy natija')),
+                ('primary_confidence', models.FloatField(verbose_name='Asosiy ishonchlilik')),
+                ('candidate_label', models.CharField(max_length=255, verbose_name='Nomzod natija')),
+                ('candidate_confidence', models.FloatField(verbose_name='Nomzod ishonchlilik')),
+                ('agreed', models.BooleanField(db_index=True, verbose_name='Mos keldi')),
+                ('latency_ms', models.FloatField(verbose_name='Nomzod latency (ms)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shadow_predictions', to='diagnosis.aimodel', verbose_name='Nomzod model')),
+                ('primary', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='diagnosis.aimodel', verbose_name='Asosiy model')),
+            ],
+            options={
+                'verbose_name': 'Shadow bashorat',
+                'verbose_name_plural': 'Shadow bashoratlar',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-18 02:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnosis', '0009_shadow_evaluation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plantimage',
+            name='confirmed',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
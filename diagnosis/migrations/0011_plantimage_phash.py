@@ -0,0 +1,24 @@
+# Generated by Django 4.2.23 on 2026-10-18 02:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnosis', '0010_plantimage_confirmed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plantimage',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='near_duplicates', to='diagnosis.plantimage'),
+        ),
+        migrations.AddField(
+            model_name='plantimage',
+            name='phash',
+            field=models.CharField(blank=True, db_index=True, max_length=16),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.23 on 2026-10-18 02:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('diagnosis', '0011_plantimage_phash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiagnosisSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('disease_name', models.CharField(blank=True, max_length=255, verbose_name='Umumiy tashxis')),
+                ('confidence', models.FloatField(blank=True, null=True, verbose_name='Ishonchlilik')),
+                ('agreement', models.FloatField(blank=True, help_text='Tashxisi umumiy xulosaga mos rasmlar ulushi (0..1)', null=True, verbose_name='Rasmlar mosligi')),
+                ('image_count', models.PositiveSmallIntegerField(default=0, verbose_name='Rasmlar soni')),
+                ('top_predictions', models.JSONField(blank=True, default=list)),
+                ('ai_result', models.TextField(blank=True)),
+                ('detection_type', models.CharField(default='disease', max_length=20)),
+                ('plant_type_code', models.CharField(default='all', max_length=50)),
+                ('language', models.CharField(default='uz', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('disease', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='diagnosis.disease')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='diagnosis_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Tashxis sessiyasi',
+                'verbose_name_plural': 'Tashxis sessiyalari',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='plantimage',
+            name='session',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='images', to='diagnosis.diagnosissession'),
+        ),
+    ]
@@ -1,177 +1,407 @@
 """
 PlantCare AI Model Loader - TensorFlow 2.19 compatible
+
+Model endi bu yerda alohida yuklanmaydi: barcha bashoratlar jarayon bo'yicha
+yagona ``models.model_manager.model_manager`` dvigateli orqali bajariladi.
+``INFERENCE_MODE = 'server'`` bo'lsa, bashorat model-server puliga yuboriladi
+va bu jarayonda TensorFlow umuman import qilinmaydi.
 """
-import os
-import json
-import numpy as np
-from PIL import Image
 from django.conf import settings
 
-# Global variables
-model = None
-class_indices = {}
+from models.gatekeeper import ImageRejected
+
+# Asosiy (umumiy) kasallik modeli parametrlari
+DEFAULT_DETECTION_TYPE = 'disease'
+DEFAULT_PLANT_TYPE = 'all'
+
+# Past aniqlik chegarasi (65%)
+CONFIDENCE_THRESHOLD = 0.65
+# Chegaradan past bo'lsa ham, 1- va 2-o'rin orasidagi farq shundan katta bo'lsa natija qabul qilinadi
+CONFIDENCE_MARGIN = 0.40
+# Saqlanadigan va ko'rsatiladigan muqobil bashoratlar soni
+TOP_K = 3
+
+# Ishonchsiz natija (is_confident False) o'rniga qaytariladigan tashxis
+LOW_CONFIDENCE_LABEL = "Kasallik aniqlanmadi - Aniqlik juda past"
 
-def load_class_indices():
-    """Load class indices from JSON file"""
-    global class_indices
+
+def initialize_model():
+    """Asosiy modelni umumiy dvigatelga oldindan yuklash"""
+    print("🚀 Initializing PlantCare AI Model...")
     try:
-        class_indices_path = os.path.join(settings.BASE_DIR, 'models', 'class_indices.json')
-        if os.path.exists(class_indices_path):
-            with open(class_indices_path, 'r') as f:
-                class_indices = json.load(f)
-                print(f"✅ Loaded {len(class_indices)} classes from JSON")
-                return True
-        else:
-            print(f"❌ Class indices file not found: {class_indices_path}")
-            return False
+        from models.model_manager import model_manager
+        model_manager.get_model(DEFAULT_DETECTION_TYPE, DEFAULT_PLANT_TYPE)
+        print("🎉 Model initialization completed successfully!")
+        return True
     except Exception as e:
-        print(f"❌ Error loading class indices: {e}")
+        print(f"⚠️ Model initialization failed: {e}")
         return False
 
-def load_tensorflow_model():
-    """Load TensorFlow model with version compatibility"""
-    global model
-    try:
-        import tensorflow as tf
-        print(f"🔧 Using TensorFlow {tf.__version__}")
-        
-        model_path = os.path.join(settings.BASE_DIR, 'models', 'plant_disease_model.h5')
-        
-        if not os.path.exists(model_path):
-            print(f"❌ Model file not found: {model_path}")
-            return False
-            
-        # Try multiple loading strategies
-        loading_strategies = [
-            {"compile": False, "safe_mode": False},
-            {"compile": False},
-            {"custom_objects": None, "compile": False},
-        ]
-        
-        for i, strategy in enumerate(loading_strategies):
+
+def warmup(model_keys=None):
+    """
+    Modellarni birinchi so'rovdan oldin yuklash uchun aniq hook.
+
+    Server rejimida modellar model-server jarayonlarida yuklanadi, shuning
+    uchun bu yerda faqat ulanish tekshiriladi.
+    """
+    if is_server_mode():
+        from models.model_server import get_client, ModelServerError
+        try:
+            return {'server': get_client().ping()}
+        except ModelServerError as e:
+            print(f"⚠️ Model server javob bermadi: {e}")
+            return {'server': False}
+
+    from models.model_manager import model_manager
+    return model_manager.warmup(model_keys)
+
+
+def is_server_mode():
+    """Inference alohida model-server jarayonlarida bajariladimi"""
+    return getattr(settings, 'INFERENCE_MODE', 'local') == 'server'
+
+
+def predict(image_path, detection_type=DEFAULT_DETECTION_TYPE, plant_type=DEFAULT_PLANT_TYPE):
+    """
+    Rasm bo'yicha bashorat (lokal dvigatel yoki model-server orqali).
+
+    Returns:
+        tuple: (predicted_class, confidence)
+    """
+    predicted_class, confidence, _ = predict_detailed(image_path, detection_type, plant_type)
+    return predicted_class, confidence
+
+
+def predict_detailed(image_path, detection_type=DEFAULT_DETECTION_TYPE, plant_type=DEFAULT_PLANT_TYPE):
+    """
+    ``predict`` bilan bir xil, lekin bitta inference dan top-k muqobillar bilan.
+    Avval bashorat keshi tekshiriladi.
+
+    Returns:
+        tuple: (predicted_class, confidence, top_k) - top_k [(class_name, probability), ...]
+    """
+    from . import prediction_cache
+
+    with open(image_path, 'rb') as f:
+        image_bytes = f.read()
+
+    cache_key = None
+    if prediction_cache.is_enabled():
+        cache_key = prediction_cache.make_key(image_bytes, detection_type, plant_type)
+        cached = prediction_cache.lookup(cache_key)
+        # Eski formatdagi (top-k siz) yozuvlar e'tiborga olinmaydi
+        if cached is not None and len(cached) == 3:
+            print(f"⚡ Bashorat keshdan olindi: {cached[0]}")
+            return cached
+
+    prediction = _predict_bytes(image_bytes, detection_type, plant_type)
+
+    if cache_key is not None:
+        prediction_cache.store(cache_key, prediction)
+    return prediction
+
+
+def predict_detailed_batch(images, detection_type=DEFAULT_DETECTION_TYPE, plant_type=DEFAULT_PLANT_TYPE):
+    """
+    Ko'p rasm uchun ``predict_detailed``: keshda yo'q rasmlar parallel
+    dekodlanadi va modeldan bitta (yoki bir necha) batch bilan o'tadi.
+
+    Args:
+        images: rasm baytlari ro'yxati
+
+    Returns:
+        list: har bir rasm uchun (predicted_class, confidence, top_k) yoki
+        ``Exception`` (filtr rad etdi - ``ImageRejected``, rasm o'qilmadi /
+        bashorat xatosi)
+    """
+    from . import prediction_cache
+
+    results = [None] * len(images)
+    keys = [None] * len(images)
+    if prediction_cache.is_enabled():
+        for i, image_bytes in enumerate(images):
+            keys[i] = prediction_cache.make_key(image_bytes, detection_type, plant_type)
+            cached = prediction_cache.lookup(keys[i])
+            if cached is not None and len(cached) == 3:
+                results[i] = cached
+
+    pending = [i for i, result in enumerate(results) if result is None]
+    if pending:
+        predictions = _predict_many(
+            [images[i] for i in pending], detection_type, plant_type
+        )
+        for i, prediction in zip(pending, predictions):
+            results[i] = prediction
+            if keys[i] is not None and not isinstance(prediction, Exception):
+                prediction_cache.store(keys[i], prediction)
+    return results
+
+
+def _screen_many(images):
+    """
+    Kaskad filtri (``cascade.screen``) har bir rasm uchun - bulk yuklamalar
+    ham bitta rasm va sessiya kabi filtrdan o'tadi.
+
+    Returns:
+        dict: ``{index: ImageRejected}`` - rad etilgan rasmlar
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from . import cascade
+
+    if not cascade.is_enabled():
+        return {}
+
+    def screen_one(image_bytes):
+        try:
+            cascade.screen(image_bytes)
+        except ImageRejected as e:
+            return e
+        return None
+
+    workers = max(1, min(getattr(settings, 'BULK_DIAGNOSIS_DECODE_WORKERS', 4), len(images)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        verdicts = list(executor.map(screen_one, images))
+    return {i: verdict for i, verdict in enumerate(verdicts) if verdict is not None}
+
+
+def _predict_many(images, detection_type, plant_type, screen=True):
+    """
+    Bir nechta rasm uchun (predicted_class, confidence, top_k) yoki ``Exception``
+    (filtr rad etdi - ``ImageRejected``, rasm o'qilmadi yoki bashorat xatosi).
+    """
+    predictions = [None] * len(images)
+    if screen:
+        for i, rejection in _screen_many(images).items():
+            predictions[i] = rejection
+    pending = [i for i in range(len(images)) if predictions[i] is None]
+    if not pending:
+        return predictions
+
+    if is_server_mode():
+        # Bo'laklar (INFERENCE_MAX_BATCH_SIZE) bittadan ``predict_batch`` so'rovi bilan
+        # yuboriladi: server pul jarayonida har bo'lak bitta batch predict bo'ladi.
+        # Parallel so'rovlar MODEL_SERVER_WORKERS bilan cheklangan - ko'prog'i pulda navbat kutadi
+        from concurrent.futures import ThreadPoolExecutor
+        from models.model_server import get_client
+
+        batch_size = max(1, getattr(settings, 'INFERENCE_MAX_BATCH_SIZE', 16))
+        chunks = [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+
+        def predict_chunk(chunk):
             try:
-                print(f"🔄 Trying loading strategy {i+1}/{len(loading_strategies)}")
-                
-                if hasattr(tf.keras.models, 'load_model'):
-                    model = tf.keras.models.load_model(model_path, **strategy)
-                else:
-                    from tensorflow.keras.models import load_model
-                    model = load_model(model_path, **strategy)
-                
-                # Recompile model
-                model.compile(
-                    optimizer='adam',
-                    loss='sparse_categorical_crossentropy',
-                    metrics=['accuracy']
+                return get_client().predict_batch(
+                    [images[i] for i in chunk], detection_type=detection_type, plant_type=plant_type, top_k=TOP_K
                 )
-                
-                print(f"✅ Model loaded successfully with strategy {i+1}")
-                print(f"📊 Model input shape: {model.input_shape}")
-                print(f"📊 Model output shape: {model.output_shape}")
-                return True
-                
-            except Exception as strategy_error:
-                print(f"❌ Strategy {i+1} failed: {strategy_error}")
-                continue
-        
-        print("❌ All loading strategies failed")
-        return False
-        
-    except ImportError as e:
-        print(f"❌ TensorFlow import error: {e}")
-        return False
-    except Exception as e:
-        print(f"❌ Unexpected error loading model: {e}")
-        return False
+            except Exception as e:
+                return [e] * len(chunk)
 
-def initialize_model():
-    """Initialize model and class indices"""
-    print("🚀 Initializing PlantCare AI Model...")
-    
-    # Load class indices first
-    indices_loaded = load_class_indices()
-    if not indices_loaded:
-        print("⚠️ Failed to load class indices")
+        workers = max(1, min(getattr(settings, 'MODEL_SERVER_WORKERS', 2), len(chunks)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for chunk, results in zip(chunks, executor.map(predict_chunk, chunks)):
+                for i, result in zip(chunk, results):
+                    predictions[i] = result
+        return predictions
+
+    from models.model_manager import top_k_predictions
+
+    probabilities, labels, errors = _local_distributions([images[i] for i in pending], detection_type, plant_type)
+    for position, error in errors.items():
+        predictions[pending[position]] = error
+    decoded = [i for position, i in enumerate(pending) if position not in errors]
+    for i, row in zip(decoded, probabilities):
+        top = top_k_predictions(row, labels, k=TOP_K)
+        predictions[i] = (top[0][0], top[0][1], top)
+    return predictions
+
+
+def _local_distributions(images, detection_type, plant_type):
+    """
+    Rasmlar parallel dekodlanib, batch bilan modeldan o'tadi. Pipeline yoqilgan
+    bo'lsa bo'lak inference qilinayotganda keyingi bo'laklar pipeline ning
+    dekodlash threadlarida (INFERENCE_DECODE_WORKERS) tayyorlanadi, aks holda
+    BULK_DIAGNOSIS_DECODE_WORKERS ta thread bilan.
+    """
+    import io
+    import numpy as np
+    from models.model_manager import get_pipeline, predict_probabilities_batch
+    from models.preprocessing import preprocess_parallel
+
+    batch_size = getattr(settings, 'INFERENCE_MAX_BATCH_SIZE', 16)
+    pipeline = get_pipeline()
+    if pipeline is not None:
+        labels = []
+
+        def infer(batch):
+            probabilities, batch_labels = predict_probabilities_batch(
+                batch, detection_type, plant_type, batch_size=batch_size
+            )
+            labels[:] = batch_labels
+            return probabilities
+
+        rows, errors = [], {}
+        for _, probabilities, chunk_errors in pipeline.map_batches(
+            [io.BytesIO(data) for data in images], infer, batch_size=batch_size
+        ):
+            errors.update(chunk_errors)
+            if probabilities is not None:
+                rows.append(probabilities)
+        if not rows:
+            return np.zeros((0, 0), dtype=np.float32), [], errors
+        return np.concatenate(rows), labels, errors
+
+    workers = getattr(settings, 'BULK_DIAGNOSIS_DECODE_WORKERS', 4)
+    batch, errors = preprocess_parallel([io.BytesIO(data) for data in images], workers=workers)
+    decoded = [i for i in range(len(images)) if i not in errors]
+    if not decoded:
+        return np.zeros((0, 0), dtype=np.float32), [], errors
+    probabilities, labels = predict_probabilities_batch(
+        batch[decoded] if errors else batch, detection_type, plant_type, batch_size=batch_size,
+    )
+    return probabilities, labels, errors
+
+
+def predict_distributions(images, detection_type=DEFAULT_DETECTION_TYPE, plant_type=DEFAULT_PLANT_TYPE):
+    """
+    Bir nechta rasm uchun to'liq ehtimolliklar (kesh chetlab o'tiladi) - bir
+    o'simlik rasmlarini bitta xulosaga birlashtirish uchun.
+
+    Args:
+        images: rasm baytlari ro'yxati
+
+    Returns:
+        tuple: (probabilities ``(M, C)`` - faqat o'qilgan rasmlar, tartib
+        saqlanadi; labels; errors ``{index: exception}``). Model-server
+        rejimida vektorlar top-k dan tuziladi (qolgan sinflar 0).
+    """
+    import numpy as np
+
+    if not is_server_mode():
+        return _local_distributions(images, detection_type, plant_type)
+
+    # Sessiya rasmlari chaqiruvchida filtrdan o'tgan
+    predictions = _predict_many(images, detection_type, plant_type, screen=False)
+    errors = {i: p for i, p in enumerate(predictions) if isinstance(p, Exception)}
+    rows = [p for p in predictions if not isinstance(p, Exception)]
+    labels = sorted({name for _, _, top in rows for name, _ in top})
+    index = {label: i for i, label in enumerate(labels)}
+    probabilities = np.zeros((len(rows), len(labels)), dtype=np.float32)
+    for row, (_, _, top) in zip(probabilities, rows):
+        for name, probability in top:
+            row[index[name]] = probability
+    return probabilities, labels, errors
+
+
+def _predict_bytes(image_bytes, detection_type, plant_type):
+    from . import cascade
+
+    # Kaskadning birinchi bosqichi: o'simlik bargiga o'xshamagan rasm CNN ga bormaydi
+    cascade.screen(image_bytes)
+
+    with cascade.timed('cnn'):
+        if is_server_mode():
+            from models.model_server import get_client
+            return get_client().predict(
+                image_bytes, detection_type=detection_type, plant_type=plant_type, top_k=TOP_K
+            )
+
+        import io
+        from models.model_manager import predict_top_k
+        top = predict_top_k(io.BytesIO(image_bytes), detection_type, plant_type, k=TOP_K)
+        return top[0][0], top[0][1], top
+
+
+def predict_tiled_detailed(image_path, detection_type=DEFAULT_DETECTION_TYPE, plant_type=DEFAULT_PLANT_TYPE):
+    """
+    Katta dala/dron rasmlari uchun ``predict_detailed``: rasm bo'laklarga
+    ajratib baholanadi (``models.tiling``).
+
+    Returns:
+        tuple: (predicted_class, confidence, top_k, tiles) - ``tiles`` to'r
+        o'lchami, bo'lak koordinatalari va top-k sinflar uchun issiqlik xaritasi;
+        model-server rejimida oddiy bashorat qilinadi va ``tiles`` None
+    """
+    if is_server_mode():
+        # Model-server protokoli bitta tensor uchun - bu yerda model yuklanmaydi
+        print("⚠️ Tiled rejim model-server bilan qo'llab-quvvatlanmaydi, oddiy bashorat")
+        return tuple(predict_detailed(image_path, detection_type, plant_type)) + (None,)
+
+    from models.model_manager import top_k_predictions
+    from models.tiling import predict_tiled
+
+    result = predict_tiled(image_path, detection_type, plant_type)
+    top = top_k_predictions(result['probabilities'], result['labels'], k=TOP_K)
+    label_index = {label: i for i, label in enumerate(result['labels'])}
+    tiles = {
+        'rows': result['rows'],
+        'cols': result['cols'],
+        'boxes': result['boxes'],
+        'heatmap': {
+            label: result['heatmap'][:, :, label_index[label]].round(4).tolist()
+            for label, _ in top
+        },
+    }
+    return top[0][0], top[0][1], top, tiles
+
+
+def is_confident(top_k):
+    """
+    Natija ishonchlimi: 1-o'rin ehtimolligi chegaradan yuqori yoki
+    2-o'rindan sezilarli (CONFIDENCE_MARGIN) farq qiladi
+    """
+    if not top_k:
         return False
-    
-    # Try to load TensorFlow model
-    model_loaded = load_tensorflow_model()
-    if model_loaded:
-        print("🎉 Model initialization completed successfully!")
+    confidence = top_k[0][1]
+    if confidence >= CONFIDENCE_THRESHOLD:
         return True
-    else:
-        print("⚠️ TensorFlow model loading failed, using fallback mode")
-        return False
+    runner_up = top_k[1][1] if len(top_k) > 1 else 0.0
+    return confidence - runner_up >= CONFIDENCE_MARGIN
+
 
-def predict_plant_disease(image_path):
+def predict_plant_disease(image_path, chat_id=None):
     """
     Predict plant disease from image
-    
+
     Args:
         image_path (str): Path to the image file
-        
+        chat_id: Telegram chat - shu chatga yaqinda yuborilgan o'sha rasm
+            (yaqin-dublikat) uchun oldingi natija qaytariladi
+
     Returns:
         tuple: (predicted_class, confidence)
     """
-    global model, class_indices
-    
-    # Ensure model is loaded
-    if model is None and class_indices:
-        if not load_tensorflow_model():
-            return "Model yuklanmadi", 0.0
-    
-    if not class_indices:
-        if not load_class_indices():
-            return "Class indices yuklanmadi", 0.0
-    
+    from . import duplicates
+
     try:
-        # Load and preprocess image
         print(f"🔍 Processing image: {image_path}")
-        
-        # Use PIL for image loading
-        img = Image.open(image_path).convert('RGB')
-        img = img.resize((224, 224))
-        
-        # Convert to numpy array
-        img_array = np.array(img, dtype=np.float32)
-        img_array = img_array / 255.0  # Normalize
-        img_array = np.expand_dims(img_array, axis=0)  # Add batch dimension
-        
-        print(f"📊 Input shape: {img_array.shape}")
-        
-        # Make prediction
-        if model is not None:
-            predictions = model.predict(img_array, verbose=0)
-            pred_idx = np.argmax(predictions[0])
-            confidence = float(predictions[0][pred_idx])
-        else:
-            # Fallback prediction
-            print("⚠️ Using random fallback prediction")
-            pred_idx = np.random.randint(0, len(class_indices))
-            confidence = np.random.uniform(0.6, 0.9)
-        
-        # Convert index to class name
-        idx_to_class = {v: k for k, v in class_indices.items()}
-        predicted_class = idx_to_class.get(pred_idx, "Unknown")
-        
+
+        scope = duplicates.scope_for(chat_id=chat_id)
+        (predicted_class, confidence, top_k), image_hash, duplicate = duplicates.predict(
+            image_path, predict_detailed, scope, DEFAULT_DETECTION_TYPE, DEFAULT_PLANT_TYPE
+        )
+        if duplicate is None:
+            duplicates.remember(
+                scope, image_hash, DEFAULT_DETECTION_TYPE, DEFAULT_PLANT_TYPE,
+                (predicted_class, confidence, top_k)
+            )
+
         print(f"🎯 Prediction: {predicted_class}")
         print(f"📊 Confidence: {confidence:.4f}")
-        print(f"📊 Prediction index: {pred_idx}")
-        
-        # Check for low confidence (65% threshold)
-        if confidence < 0.65:
-            predicted_class = "Kasallik aniqlanmadi - Aniqlik juda past"
+
+        # Check for low confidence (65% threshold, or a clear top-k margin)
+        if not is_confident(top_k):
+            predicted_class = LOW_CONFIDENCE_LABEL
             confidence = 0.0
             print("⚠️ Confidence too low, returning no disease detected")
-        
+
         return predicted_class, confidence
-        
+
+    except ImageRejected as e:
+        print(f"🚫 Image rejected by gatekeeper: {e.reason}")
+        return f"Kasallik aniqlanmadi - {e.message}", 0.0
+
     except Exception as e:
         print(f"❌ Error in prediction: {e}")
         import traceback
         traceback.print_exc()
         return f"Bashorat xatolik: {str(e)}", 0.0
-
-# Initialize on module import
-if __name__ != "__main__":
-    initialize_model()
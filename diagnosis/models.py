@@ -48,6 +48,19 @@ class Disease(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def get_or_create_detected(cls, name):
+        """Model aniqlagan kasallik nomi bo'yicha Disease yozuvini olish yoki yaratish"""
+        disease, _ = cls.objects.get_or_create(
+            name=name,
+            defaults={
+                'description': f'{name} kasalligi aniqlandi',
+                'symptoms': 'Belgilar aniqlanmoqda...',
+                'treatment': 'Davolash usullari tayyorlanmoqda...'
+            }
+        )
+        return disease
+
 class PlantImage(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
     image = models.ImageField(upload_to='plant_images/')
@@ -59,10 +72,32 @@ class PlantImage(models.Model):
     accuracy = models.FloatField(null=True, blank=True)  # History uchun qo'shildi
     ai_result = models.TextField(blank=True)
     status = models.CharField(max_length=20, default='completed', choices=[
+        ('queued', 'Navbatda'),
         ('processing', 'Tahlil qilinmoqda'),
         ('completed', 'Yakunlandi'),
         ('failed', 'Xato')
-    ])
+    ], db_index=True)
+    # Fon rejimidagi tahlil (jobs) uchun parametrlar va holat
+    detection_type = models.CharField(max_length=20, default='disease')
+    plant_type_code = models.CharField(max_length=50, default='all')
+    language = models.CharField(max_length=10, default='uz')
+    progress = models.PositiveSmallIntegerField(default=0)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Muqobil bashoratlar: [{"disease_name": ..., "confidence": 0.12}, ...] kamayish tartibida
+    top_predictions = models.JSONField(default=list, blank=True)
+    # Agronom/admin tasdiqlagan tashxis - o'xshash holatlar qidiruvida faqat shular ko'rsatiladi
+    confirmed = models.BooleanField(default=False, db_index=True)
+    # Perseptual xesh (64 bit, hex) - yaqin-dublikat yuklamalarni topish uchun
+    phash = models.CharField(max_length=16, blank=True, db_index=True)
+    # Natijasi qayta ishlatilgan oldingi yuklama (CNN ishga tushirilmagan)
+    duplicate_of = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='near_duplicates'
+    )
+    # Bir nechta rasmli tashxis sessiyasi (bitta o'simlik, umumiy xulosa)
+    session = models.ForeignKey(
+        'DiagnosisSession', on_delete=models.CASCADE, null=True, blank=True, related_name='images'
+    )
 
     class Meta:
         ordering = ['-created_at']
@@ -70,6 +105,14 @@ class PlantImage(models.Model):
     def __str__(self):
         return f"{self.user} - {self.disease_name or 'Unknown'} - {self.created_at}"
     
+    @staticmethod
+    def format_top_predictions(top_k):
+        """``[(class_name, probability), ...]`` ni ``top_predictions`` JSON ko'rinishiga o'tkazish"""
+        return [
+            {'disease_name': name, 'confidence': round(float(probability), 6)}
+            for name, probability in top_k
+        ]
+    
     def save(self, *args, **kwargs):
         # Confidence ni accuracy ga ham saqlash
         if self.confidence and not self.accuracy:
@@ -82,6 +125,7 @@ class Recommendation(models.Model):
     language = models.CharField(max_length=10, default='uz')
     ai_source = models.CharField(max_length=50, default='GEMINI')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.disease.name} - {self.language}"
@@ -103,9 +147,20 @@ class AIModel(models.Model):
     model_file = models.FileField(upload_to='ai_models/', verbose_name='Model fayli (.h5)', help_text='TensorFlow/Keras .h5 model fayli')
     class_indices_file = models.FileField(upload_to='ai_models/', verbose_name='Class indices fayli (.json)', help_text='Sinflar indekslari JSON fayli')
     
+    # CPU uchun optimallashtirilgan artefakt (manage.py convert_model)
+    OPTIMIZED_FORMATS = [
+        ('tflite_float16', 'TFLite (float16)'),
+        ('tflite_int8', 'TFLite (int8)'),
+        ('onnx', 'ONNX'),
+    ]
+    optimized_file = models.FileField(upload_to='ai_models/optimized/', blank=True, verbose_name='Optimallashtirilgan model', help_text='convert_model buyrug\'i yaratgan TFLite/ONNX fayli')
+    optimized_format = models.CharField(max_length=20, choices=OPTIMIZED_FORMATS, blank=True, verbose_name='Optimallashtirilgan format')
+    optimization_report = models.JSONField(default=dict, blank=True, verbose_name='Konvertatsiya hisoboti', help_text='Aniqlik mosligi, latency va RSS taqqoslash')
+    
     # Qo'shimcha ma'lumotlar
     description = models.TextField(blank=True, verbose_name='Tavsif', help_text='Model haqida qo\'shimcha ma\'lumot')
     is_active = models.BooleanField(default=True, verbose_name='Faol', help_text='Faqat faol modellar ishlatiladi')
+    is_shadow = models.BooleanField(default=False, verbose_name='Shadow sinov', help_text='Nomzod model: jonli so\'rovlarning bir qismida fonda ishlaydi, javobga ta\'sir qilmaydi')
     version = models.CharField(max_length=50, blank=True, verbose_name='Versiya', help_text='Model versiyasi')
     
     # Statistika
@@ -132,4 +187,76 @@ class AIModel(models.Model):
         """Model kalitini qaytarish (model_manager uchun)"""
         plant_code = self.plant_type.code if self.plant_type else 'all'
         return f"{self.detection_type}_{plant_code}"
+    
+    @classmethod
+    def get_generation(cls):
+        """
+        AIModel jadvali holatining arzon belgisi (modellar soni, oxirgi o'zgarish va
+        faol / shadow modellar to'plami). Model qayta yuklansa, o'chirilsa yoki
+        is_active / is_shadow o'zgarsa, qiymat o'zgaradi - ``QuerySet.update()``
+        ``updated_at`` ni yangilamaydi, shuning uchun holat alohida hisoblanadi.
+        """
+        serving = models.Q(is_active=True, is_shadow=False)
+        shadow = models.Q(is_shadow=True)
+        state = cls.objects.aggregate(
+            total=models.Count('id'),
+            last_change=models.Max('updated_at'),
+            serving=models.Count('id', filter=serving),
+            serving_ids=models.Sum('id', filter=serving),
+            shadow=models.Count('id', filter=shadow),
+            shadow_ids=models.Sum('id', filter=shadow),
+        )
+        last_change = state['last_change'].timestamp() if state['last_change'] else 0
+        return (
+            f"{state['total']}-{last_change:.6f}-"
+            f"{state['serving']}:{state['serving_ids'] or 0}-{state['shadow']}:{state['shadow_ids'] or 0}"
+        )
+
+
+class ShadowPrediction(models.Model):
+    """Nomzod (shadow) model bashorati asosiy model natijasi bilan yonma-yon"""
+    
+    candidate = models.ForeignKey(AIModel, on_delete=models.CASCADE, related_name='shadow_predictions', verbose_name='Nomzod model')
+    primary = models.ForeignKey(AIModel, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name='Asosiy model')
+    model_key = models.CharField(max_length=100, verbose_name='Model kaliti')
+    primary_label = models.CharField(max_length=255, verbose_name='Asosiy natija')
+    primary_confidence = models.FloatField(verbose_name='Asosiy ishonchlilik')
+    candidate_label = models.CharField(max_length=255, verbose_name='Nomzod natija')
+    candidate_confidence = models.FloatField(verbose_name='Nomzod ishonchlilik')
+    agreed = models.BooleanField(db_index=True, verbose_name='Mos keldi')
+    latency_ms = models.FloatField(verbose_name='Nomzod latency (ms)')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Shadow bashorat'
+        verbose_name_plural = 'Shadow bashoratlar'
+    
+    def __str__(self):
+        mark = '✅' if self.agreed else '❌'
+        return f"{mark} {self.primary_label} / {self.candidate_label}"
+
 
+class DiagnosisSession(models.Model):
+    """Bitta o'simlikning bir nechta rasmi bo'yicha umumiy tashxis"""
+    
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='diagnosis_sessions')
+    disease = models.ForeignKey(Disease, on_delete=models.SET_NULL, null=True, blank=True)
+    disease_name = models.CharField(max_length=255, blank=True, verbose_name='Umumiy tashxis')
+    confidence = models.FloatField(null=True, blank=True, verbose_name='Ishonchlilik')
+    agreement = models.FloatField(null=True, blank=True, verbose_name='Rasmlar mosligi', help_text='Tashxisi umumiy xulosaga mos rasmlar ulushi (0..1)')
+    image_count = models.PositiveSmallIntegerField(default=0, verbose_name='Rasmlar soni')
+    top_predictions = models.JSONField(default=list, blank=True)
+    ai_result = models.TextField(blank=True)
+    detection_type = models.CharField(max_length=20, default='disease')
+    plant_type_code = models.CharField(max_length=50, default='all')
+    language = models.CharField(max_length=10, default='uz')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Tashxis sessiyasi'
+        verbose_name_plural = 'Tashxis sessiyalari'
+    
+    def __str__(self):
+        return f"{self.user} - {self.disease_name or 'Unknown'} ({self.image_count} ta rasm)"
@@ -0,0 +1,98 @@
+"""
+Bashorat keshi: rasm baytlari xeshi + AIModel id/versiyasi + aniqlash/o'simlik
+turi bo'yicha. Bir xil rasm qayta yuborilsa (Telegram forward, formani qayta
+yuborish), CNN qayta ishga tushirilmaydi.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'stores': 0}
+_generation = {'value': None, 'checked_at': 0.0}
+
+
+def is_enabled():
+    return getattr(settings, 'PREDICTION_CACHE_ENABLED', True)
+
+
+def get_cache():
+    return caches[getattr(settings, 'PREDICTION_CACHE_ALIAS', 'predictions')]
+
+
+def hash_image(image_bytes):
+    """Rasm baytlarining kontent xeshi"""
+    return hashlib.blake2b(image_bytes, digest_size=20).hexdigest()
+
+
+def get_model_generation():
+    """
+    AIModel jadvali holati. Bazaga har so'rovda emas, balki
+    PREDICTION_CACHE_GENERATION_TTL soniyada bir marta murojaat qilinadi.
+    """
+    ttl = getattr(settings, 'PREDICTION_CACHE_GENERATION_TTL', 5)
+    now = time.monotonic()
+    if _generation['value'] is None or now - _generation['checked_at'] > ttl:
+        from .models import AIModel
+        _generation['value'] = AIModel.get_generation()
+        _generation['checked_at'] = now
+    return _generation['value']
+
+
+def reset_generation():
+    """Joriy jarayonda generation ni darhol qayta o'qishga majburlash"""
+    _generation['value'] = None
+
+
+def _model_identity(detection_type, plant_type):
+    """Ishlatiladigan model kaliti, AIModel id va versiyasi (TensorFlowsiz)"""
+    from models.model_manager import model_manager
+
+    model_key = model_manager.get_model_key(detection_type, plant_type)
+    config = model_manager.models.get(model_key) or {}
+    return model_key, config.get('ai_model_id'), config.get('version') or ''
+
+
+def make_key(image_bytes, detection_type, plant_type):
+    model_key, model_id, version = _model_identity(detection_type, plant_type)
+    identity = '|'.join([
+        get_model_generation(),
+        str(model_key),
+        str(model_id),
+        version,
+        detection_type,
+        plant_type,
+    ])
+    # Versiya nomida bo'sh joy va boshqa belgilar bo'lishi mumkin - kalitga xesh sifatida qo'shiladi
+    identity_hash = hashlib.blake2b(identity.encode('utf-8'), digest_size=8).hexdigest()
+    return f"prediction:{identity_hash}:{hash_image(image_bytes)}"
+
+
+def lookup(key):
+    """Keshdagi (class_name, confidence, top_k) yoki None"""
+    value = get_cache().get(key)
+    with _lock:
+        if value is None:
+            _stats['misses'] += 1
+        else:
+            _stats['hits'] += 1
+    return tuple(value) if value is not None else None
+
+
+def store(key, prediction):
+    get_cache().set(key, tuple(prediction))
+    with _lock:
+        _stats['stores'] += 1
+
+
+def get_stats():
+    """Joriy jarayondagi kesh statistikasi va hit rate"""
+    with _lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+    stats['enabled'] = is_enabled()
+    return stats
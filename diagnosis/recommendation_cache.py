@@ -0,0 +1,152 @@
+"""
+Gemini tavsiyalari uchun read-through kesh.
+
+Prompt faqat kasallik nomi va tilga bog'liq, shuning uchun tayyor (sanitizatsiya
+qilingan) HTML har bir (kasallik, til) uchun bir marta ``Recommendation``
+jadvaliga yoziladi. Keyingi so'rovlar avval xotiradagi keshdan, so'ng bazadan
+xizmat qilinadi; RECOMMENDATION_MAX_AGE_DAYS dan eski yozuvlar yangilanadi.
+"""
+import hashlib
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone, translation
+
+_lock = threading.Lock()
+_stats = {'memory_hits': 0, 'db_hits': 0, 'generated': 0}
+
+
+def is_enabled():
+    return getattr(settings, 'RECOMMENDATION_CACHE_ENABLED', True)
+
+
+def normalize_language(lang):
+    """Qo'llab-quvvatlanmaydigan tillar uchun standart tilga ('uz') qaytish"""
+    codes = [code for code, _ in settings.LANGUAGES]
+    return lang if lang in codes else settings.LANGUAGE_CODE
+
+
+def _memory_key(disease_name, lang):
+    digest = hashlib.blake2b(disease_name.encode('utf-8'), digest_size=12).hexdigest()
+    return f"recommendation:{lang}:{digest}"
+
+
+def _is_fresh(recommendation):
+    max_age_days = getattr(settings, 'RECOMMENDATION_MAX_AGE_DAYS', 30)
+    if not max_age_days:
+        return True
+    return recommendation.updated_at >= timezone.now() - timedelta(days=max_age_days)
+
+
+def save_recommendation(disease, lang, text, ai_source='GEMINI'):
+    """(kasallik, til) uchun tavsiyani yaratish yoki yangilash"""
+    from .models import Recommendation
+
+    recommendation = (
+        Recommendation.objects.filter(disease=disease, language=lang)
+        .order_by('-updated_at')
+        .first()
+    )
+    if recommendation is None:
+        recommendation = Recommendation(disease=disease, language=lang)
+    recommendation.ai_source = ai_source
+    with translation.override(lang):
+        recommendation.text = text
+    recommendation.save()
+    cache.set(
+        _memory_key(disease.name, lang), text,
+        getattr(settings, 'RECOMMENDATION_MEMORY_TIMEOUT', 60 * 60)
+    )
+    return recommendation
+
+
+def lookup(disease_name, lang):
+    """Xotira yoki bazadagi yangi (eskirmagan) tavsiya, bo'lmasa None"""
+    from .models import Recommendation
+
+    lang = normalize_language(lang)
+    memory_key = _memory_key(disease_name, lang)
+
+    text = cache.get(memory_key)
+    if text is not None:
+        with _lock:
+            _stats['memory_hits'] += 1
+        return text
+
+    recommendation = (
+        Recommendation.objects.filter(disease__name=disease_name, language=lang)
+        .order_by('-updated_at')
+        .first()
+    )
+    if recommendation is not None and _is_fresh(recommendation):
+        with translation.override(lang):
+            text = recommendation.text
+        if text:
+            cache.set(memory_key, text, getattr(settings, 'RECOMMENDATION_MEMORY_TIMEOUT', 60 * 60))
+            with _lock:
+                _stats['db_hits'] += 1
+            return text
+    return None
+
+
+def store_generated(disease_name, lang, text, ai_source):
+    """Yangi yaratilgan tavsiyani saqlash (``ai_source`` None bo'lsa saqlanmaydi)"""
+    from .models import Disease
+
+    if not ai_source:
+        return None
+    recommendation = save_recommendation(
+        Disease.get_or_create_detected(disease_name), normalize_language(lang), text, ai_source
+    )
+    with _lock:
+        _stats['generated'] += 1
+    return recommendation
+
+
+def get_recommendation(disease_name, lang, generate):
+    """
+    Tavsiyani kesh orqali olish.
+
+    Args:
+        generate: ``generate(disease_name, lang) -> (html, ai_source)``;
+            ``ai_source`` None bo'lsa (xato, limit) natija keshga yozilmaydi
+    """
+    from .models import Recommendation
+
+    lang = normalize_language(lang)
+    text = lookup(disease_name, lang)
+    if text is not None:
+        return text
+
+    text, ai_source = generate(disease_name, lang)
+    if ai_source:
+        store_generated(disease_name, lang, text, ai_source)
+        return text
+
+    # Gemini ishlamasa ham eskirgan, lekin haqiqiy tavsiya xato matnidan yaxshiroq
+    stale = (
+        Recommendation.objects.filter(disease__name=disease_name, language=lang)
+        .order_by('-updated_at')
+        .first()
+    )
+    if stale is not None:
+        with translation.override(lang):
+            return stale.text or text
+    return text
+
+
+def regenerate(recommendation, generate):
+    """Admin uchun: mavjud tavsiyani Gemini dan qayta olish"""
+    lang = normalize_language(recommendation.language)
+    text, ai_source = generate(recommendation.disease.name, lang)
+    if not ai_source:
+        return False
+    save_recommendation(recommendation.disease, lang, text, ai_source)
+    return True
+
+
+def get_stats():
+    with _lock:
+        return dict(_stats)
@@ -0,0 +1,208 @@
+"""
+Bir nechta rasmli tashxis sessiyasi: fermer bitta kasal o'simlikning 2-10
+bargini suratga oladi. Rasmlar modeldan bitta batch bilan o'tadi, har bir
+rasmning ehtimolliklar vektori o'rtachalanib bitta xulosa va moslik ko'rsatkichi
+olinadi, tavsiya esa faqat umumiy tashxis uchun bir marta so'raladi.
+Umumiy va har bir rasm tashxisiga bitta rasmdagi kabi ishonch chegarasi
+(``is_confident``) qo'llanadi.
+"""
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from models.gatekeeper import ImageRejected
+
+
+class SessionUploadError(ValueError):
+    """Sessiya rasmlari qabul qilinmadi (400 javob)"""
+
+
+def _limits():
+    return (
+        getattr(settings, 'DIAGNOSIS_SESSION_MIN_IMAGES', 2),
+        getattr(settings, 'DIAGNOSIS_SESSION_MAX_IMAGES', 10),
+    )
+
+
+def collect_session_images(files):
+    """So'rovdagi ``images`` fayllaridan ``[(nom, baytlar), ...]``"""
+    min_images, max_images = _limits()
+    max_bytes = getattr(settings, 'BULK_DIAGNOSIS_MAX_IMAGE_BYTES', 15 * 1024 * 1024)
+    uploads = files.getlist('images')
+    if not min_images <= len(uploads) <= max_images:
+        raise SessionUploadError(
+            f"Bitta o'simlik uchun {min_images} tadan {max_images} tagacha rasm yuboring"
+        )
+    items = []
+    for upload in uploads:
+        if upload.size > max_bytes:
+            raise SessionUploadError(f"{upload.name}: rasm hajmi juda katta")
+        items.append((upload.name, upload.read()))
+    return items
+
+
+def aggregate(probabilities, labels, k=3):
+    """
+    Rasmlar ehtimolliklarini bitta xulosaga birlashtirish.
+
+    Xulosa - o'rtacha ehtimolliklar vektorining eng kattasi (yumshoq ovoz).
+    ``agreement`` - birinchi o'rindagi tashxisi xulosaga mos rasmlar ulushi.
+
+    Returns:
+        dict: ``disease``, ``confidence``, ``agreement``, ``top_k`` va ``votes``
+        (tashxis -> rasmlar soni)
+    """
+    from models.model_manager import top_k_predictions
+
+    probabilities = np.asarray(probabilities, dtype=np.float32)
+    mean = probabilities.mean(axis=0)
+    verdict = int(np.argmax(mean))
+    winners = np.argmax(probabilities, axis=1)
+    return {
+        'disease': labels[verdict],
+        'confidence': float(mean[verdict]),
+        'agreement': round(float(np.mean(winners == verdict)), 4),
+        'top_k': top_k_predictions(mean, labels, k=k),
+        'votes': dict(Counter(labels[i] for i in winners).most_common()),
+    }
+
+
+def diagnose_session(items, detection_type='disease', plant_type='all', lang='uz', user=None):
+    """
+    Bitta o'simlik rasmlari uchun umumiy tashxis. Filtr rad etgan yoki
+    o'qilmagan rasmlar xulosaga kirmaydi va ``images`` da sababi bilan
+    qaytariladi; birorta rasm qolmasa - birinchi rad etish sababi (ImageRejected).
+
+    Xulosa ishonchsiz bo'lsa ``disease`` - LOW_CONFIDENCE_LABEL, tavsiya so'ralmaydi.
+
+    Returns:
+        dict: ``session_id``, ``disease``, ``confident``, ``confidence``,
+        ``agreement``, ``votes``, ``top_predictions``, ``recommendation`` va ``images``
+    """
+    from . import cascade, duplicates
+    from .embeddings import maybe_index
+    from .jobs import PROGRESS_DONE
+    from .model_loader import LOW_CONFIDENCE_LABEL, TOP_K, is_confident, predict_distributions
+    from .models import DiagnosisSession, Disease, PlantImage
+    from .views import get_ai_recommendation
+    from models.model_manager import top_k_predictions
+
+    images = [
+        {'index': i, 'filename': name, 'error': False, 'image_id': None}
+        for i, (name, _) in enumerate(items)
+    ]
+    rejections = []
+    accepted = []
+    for i, (_, data) in enumerate(items):
+        try:
+            cascade.screen(data)
+            accepted.append(i)
+        except ImageRejected as e:
+            rejections.append(e)
+            images[i].update(error=True, rejected=True, reason=e.reason, message=e.message)
+    if not accepted:
+        raise rejections[0]
+
+    with cascade.timed('cnn'):
+        probabilities, labels, errors = predict_distributions(
+            [items[i][1] for i in accepted], detection_type=detection_type, plant_type=plant_type
+        )
+    for position, error in errors.items():
+        images[accepted[position]].update(error=True, message=str(error))
+    decoded = [i for position, i in enumerate(accepted) if position not in errors]
+    if not decoded:
+        raise ValueError("Birorta rasm o'qilmadi")
+
+    per_image = {}
+    for i, row in zip(decoded, probabilities):
+        top = top_k_predictions(row, labels, k=TOP_K)
+        per_image[i] = top
+        confident = is_confident(top)
+        images[i].update(
+            disease=top[0][0] if confident else LOW_CONFIDENCE_LABEL,
+            confident=confident,
+            confidence=round(top[0][1] * 100, 2),
+            top_predictions=[
+                {'disease': name, 'confidence': round(probability * 100, 2)} for name, probability in top
+            ],
+        )
+
+    result = aggregate(probabilities, labels, k=TOP_K)
+    confident = is_confident(result['top_k'])
+    verdict = result['disease'] if confident else LOW_CONFIDENCE_LABEL
+    print(
+        f"🧩 Sessiya: {len(decoded)} ta rasm -> {verdict} "
+        f"({result['confidence']:.2%}, moslik {result['agreement']:.0%})"
+    )
+    recommendation = ''
+    if confident:
+        with cascade.timed('recommendation'):
+            recommendation = get_ai_recommendation(verdict, lang=lang)
+
+    session_id = None
+    if user is not None:
+        disease = Disease.get_or_create_detected(verdict) if confident else None
+        session = DiagnosisSession.objects.create(
+            user=user,
+            disease=disease,
+            disease_name=verdict,
+            confidence=result['confidence'],
+            agreement=result['agreement'],
+            image_count=len(items),
+            top_predictions=PlantImage.format_top_predictions(result['top_k']),
+            ai_result=recommendation,
+            detection_type=detection_type,
+            plant_type_code=plant_type,
+            language=lang,
+        )
+        session_id = session.pk
+        diseases = {verdict: disease} if confident else {}
+        rows = []
+        for i, (filename, data) in enumerate(items):
+            plant_image = PlantImage(
+                user=user,
+                session=session,
+                image=ContentFile(data, name=filename),
+                phash=duplicates.compute(data) or '',
+                language=lang,
+                detection_type=detection_type,
+                plant_type_code=plant_type,
+                progress=PROGRESS_DONE,
+            )
+            if i in per_image:
+                top = per_image[i]
+                if images[i]['confident']:
+                    if top[0][0] not in diseases:
+                        diseases[top[0][0]] = Disease.get_or_create_detected(top[0][0])
+                    plant_image.disease = diseases[top[0][0]]
+                plant_image.disease_name = images[i]['disease']
+                plant_image.confidence = top[0][1]
+                plant_image.accuracy = top[0][1] * 100
+                plant_image.top_predictions = PlantImage.format_top_predictions(top)
+                plant_image.ai_result = recommendation
+                plant_image.status = 'completed'
+            else:
+                plant_image.ai_result = images[i]['message']
+                plant_image.status = 'failed'
+            rows.append(plant_image)
+        for i, plant_image in enumerate(PlantImage.objects.bulk_create(rows)):
+            images[i]['image_id'] = plant_image.pk
+            maybe_index(plant_image)
+
+    return {
+        'session_id': session_id,
+        'disease': verdict,
+        'confident': confident,
+        'confidence': round(result['confidence'] * 100, 2),
+        'agreement': result['agreement'],
+        'votes': result['votes'],
+        'image_count': len(items),
+        'top_predictions': [
+            {'disease': name, 'confidence': round(probability * 100, 2)}
+            for name, probability in result['top_k']
+        ],
+        'recommendation': recommendation,
+        'images': images,
+    }
@@ -0,0 +1,268 @@
+"""
+Nomzod (shadow) modellarni jonli so'rovlarda sinash.
+
+Asosiy bashoratdan keyin tayyor tensor so'rovlarning INFERENCE_SHADOW_SAMPLE_RATE
+qismi uchun fon navbatiga qo'yiladi; nomzod model (``AIModel.is_shadow``)
+shu tensorni alohida threadda bashorat qiladi va natija ``ShadowPrediction``
+ga asosiy natija bilan yonma-yon yoziladi. Foydalanuvchi javobi kutilmaydi.
+
+Asosiy inference ni och qoldirmaslik uchun:
+* navbat cheklangan (INFERENCE_SHADOW_QUEUE_SIZE) - to'lsa namuna tashlanadi
+* threadlar soni INFERENCE_SHADOW_WORKERS, TFLite/ONNX nomzodlari
+  INFERENCE_SHADOW_THREADS ta intra-op thread bilan yuklanadi
+* har bir thread CPU ulushi INFERENCE_SHADOW_CPU_SHARE bilan cheklanadi
+  (bashoratdan keyin mos ravishda kutadi) va past ustuvorlikda ishlaydi
+* nomzodlar registrini fon threadi yangilaydi (AIModel generation so'rovi va
+  ModelManager qurish); so'rov threadi faqat lug'atga qaraydi, lock olmaydi
+"""
+import os
+import queue
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+_lock = threading.Lock()
+_evaluator = None
+
+# Nomzodlar registri shu oraliqda (soniya) qayta tekshiriladi
+REFRESH_INTERVAL = 10
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def is_enabled():
+    return _setting('INFERENCE_SHADOW_SAMPLE_RATE', 0.0) > 0
+
+
+class ShadowEvaluator:
+    """Nomzod modellar registri va cheklangan fon navbati"""
+
+    def __init__(self, workers=1, queue_size=64, cpu_share=0.25):
+        self.cpu_share = min(max(cpu_share, 0.01), 1.0)
+        self._queue = queue.Queue(maxsize=queue_size)
+        # (manager, {model_key: ai_model_id}) - bitta tuple sifatida almashtiriladi
+        self._registry = (None, {})
+        self._generation = None
+        self._checked_at = 0.0
+        self._registry_lock = threading.Lock()
+        self._stats = {'submitted': 0, 'dropped': 0, 'completed': 0, 'failed': 0}
+        self._threads = [
+            threading.Thread(target=self._worker, name=f'shadow-{i}', daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    # --- nomzodlar registri ---
+
+    def _refresh(self):
+        """AIModel o'zgargan bo'lsa nomzodlar ro'yxatini qayta o'qish (REFRESH_INTERVAL da bir marta)"""
+        from models.model_manager import ModelManager
+        from .models import AIModel
+
+        now = time.monotonic()
+        if self._registry[0] is not None and now - self._checked_at < REFRESH_INTERVAL:
+            return
+        self._checked_at = now
+        generation = AIModel.get_generation()
+        if generation == self._generation:
+            return
+
+        manager = ModelManager(lazy=True)
+        manager._configs_loaded = True
+        # Keras threadlari jarayon bo'yicha umumiy; TFLite/ONNX nomzodlari kamroq thread oladi
+        manager.num_threads = _setting('INFERENCE_SHADOW_THREADS', 1)
+        candidates = {}
+        for ai_model in AIModel.objects.filter(is_shadow=True).select_related('plant_type'):
+            key = manager.add_ai_model(ai_model)
+            candidates[key] = ai_model.pk
+        # Eski nomzod modellar shu yerda tashlanadi (keyingi bashoratda yangisi yuklanadi)
+        self._registry, self._generation = (manager, candidates), generation
+        if candidates:
+            print(f"🕶️ Shadow nomzodlar: {', '.join(candidates)}")
+
+    def _maybe_refresh(self):
+        """Fon threadidan: registrni yangilash (bir vaqtda faqat bitta thread)"""
+        if not self._registry_lock.acquire(blocking=False):
+            return
+        close_old_connections()
+        try:
+            self._refresh()
+        except Exception as e:
+            print(f"⚠️ Shadow nomzodlar o'qilmadi: {e}")
+        finally:
+            close_old_connections()
+            self._registry_lock.release()
+
+    def has_candidate(self, model_key):
+        # So'rov threadida: DB so'rovi ham, lock ham yo'q
+        return model_key in self._registry[1]
+
+    # --- navbat ---
+
+    def submit(self, model_key, primary_model_id, tensor, primary_label, primary_confidence):
+        """Namunani navbatga qo'yish; navbat to'la bo'lsa tashlanadi (asosiy so'rov kutmaydi)"""
+        item = (model_key, primary_model_id, tensor, primary_label, primary_confidence)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with _lock:
+                self._stats['dropped'] += 1
+            return False
+        with _lock:
+            self._stats['submitted'] += 1
+        return True
+
+    def _worker(self):
+        # Linuxda nice qiymati thread darajasida - faqat shu thread past ustuvorlikka o'tadi
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), _setting('INFERENCE_SHADOW_NICE', 10))
+        except (AttributeError, OSError):
+            pass
+        while True:
+            self._maybe_refresh()
+            try:
+                item = self._queue.get(timeout=REFRESH_INTERVAL)
+            except queue.Empty:
+                continue
+            if item is None:
+                return
+            started = time.perf_counter()
+            close_old_connections()
+            try:
+                self._evaluate(*item)
+                with _lock:
+                    self._stats['completed'] += 1
+            except Exception as e:
+                with _lock:
+                    self._stats['failed'] += 1
+                print(f"⚠️ Shadow bashorat xatolik: {e}")
+            finally:
+                close_old_connections()
+            # CPU ulushi: ishlagan vaqtga mutanosib dam olish
+            busy = time.perf_counter() - started
+            time.sleep(busy * (1.0 / self.cpu_share - 1.0))
+
+    def _evaluate(self, model_key, primary_model_id, tensor, primary_label, primary_confidence):
+        from models.model_manager import top_k_predictions
+        from .models import ShadowPrediction
+
+        manager, candidates = self._registry
+        candidate_id = candidates.get(model_key)
+        if manager is None or candidate_id is None:
+            return None
+
+        config = manager.acquire(model_key)
+        started = time.perf_counter()
+        probabilities = manager.predict_batch(config['token'], tensor)[0]
+        latency_ms = (time.perf_counter() - started) * 1000
+        candidate_label, candidate_confidence = top_k_predictions(probabilities, config['labels'], k=1)[0]
+
+        return ShadowPrediction.objects.create(
+            candidate_id=candidate_id,
+            primary_id=primary_model_id,
+            model_key=model_key,
+            primary_label=primary_label,
+            primary_confidence=float(primary_confidence),
+            candidate_label=candidate_label,
+            candidate_confidence=candidate_confidence,
+            agreed=candidate_label == primary_label,
+            latency_ms=latency_ms,
+        )
+
+    def get_stats(self):
+        with _lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['candidates'] = sorted(self._registry[1])
+        return stats
+
+    def stop(self):
+        for _ in self._threads:
+            self._queue.put(None)
+
+
+def get_evaluator():
+    """Jarayon bo'yicha yagona ShadowEvaluator (o'chirilgan bo'lsa None)"""
+    global _evaluator
+    if not is_enabled():
+        return None
+    if _evaluator is None:
+        with _lock:
+            if _evaluator is None:
+                _evaluator = ShadowEvaluator(
+                    workers=_setting('INFERENCE_SHADOW_WORKERS', 1),
+                    queue_size=_setting('INFERENCE_SHADOW_QUEUE_SIZE', 64),
+                    cpu_share=_setting('INFERENCE_SHADOW_CPU_SHARE', 0.25),
+                )
+    return _evaluator
+
+
+def maybe_shadow(model_config, tensor, probabilities):
+    """
+    Asosiy bashoratdan keyin chaqiriladi: namuna olinsa tensor nomzod model
+    navbatiga qo'yiladi. Har qanday xato asosiy javobga ta'sir qilmaydi.
+    """
+    if not is_enabled() or random.random() >= _setting('INFERENCE_SHADOW_SAMPLE_RATE', 0.0):
+        return False
+    try:
+        from models.model_manager import top_k_predictions
+
+        evaluator = get_evaluator()
+        model_key = model_config['key']
+        if evaluator is None or not evaluator.has_candidate(model_key):
+            return False
+        label, confidence = top_k_predictions(probabilities, model_config['labels'], k=1)[0]
+        return evaluator.submit(model_key, model_config['ai_model_id'], tensor, label, confidence)
+    except Exception as e:
+        print(f"⚠️ Shadow namunasi yuborilmadi: {e}")
+        return False
+
+
+def build_report(candidate, limit=5000):
+    """Admin uchun: moslik, sinflar bo'yicha confusion va nomzod latency persentillari"""
+    import numpy as np
+    from collections import Counter
+
+    rows = list(
+        candidate.shadow_predictions.order_by('-created_at')
+        .values_list('primary_label', 'candidate_label', 'latency_ms')[:limit]
+    )
+    if not rows:
+        return {'count': 0}
+
+    latencies = np.array([latency for _, _, latency in rows])
+    pairs = Counter((primary, shadow) for primary, shadow, _ in rows)
+    per_class = {}
+    for (primary, shadow), n in pairs.items():
+        entry = per_class.setdefault(primary, {'label': primary, 'total': 0, 'agreed': 0, 'confused_with': Counter()})
+        entry['total'] += n
+        if primary == shadow:
+            entry['agreed'] += n
+        else:
+            entry['confused_with'][shadow] += n
+    classes = sorted(per_class.values(), key=lambda entry: -entry['total'])
+    for entry in classes:
+        entry['agreement'] = entry['agreed'] / entry['total']
+        entry['confused_with'] = entry['confused_with'].most_common(3)
+
+    agreed = sum(n for (primary, shadow), n in pairs.items() if primary == shadow)
+    return {
+        'count': len(rows),
+        'agreement': agreed / len(rows),
+        'latency_ms': {
+            'p50': float(np.percentile(latencies, 50)),
+            'p95': float(np.percentile(latencies, 95)),
+            'p99': float(np.percentile(latencies, 99)),
+        },
+        'classes': classes,
+        'disagreements': [
+            {'primary': primary, 'candidate': shadow, 'count': n}
+            for (primary, shadow), n in pairs.most_common() if primary != shadow
+        ][:20],
+    }
@@ -0,0 +1,75 @@
+"""
+Tashxis natijasini Server-Sent Events (SSE) sifatida yuborish.
+
+CNN natijasi (~100 ms) darhol ``prediction`` hodisasi bilan yuboriladi,
+Gemini tavsiyasi esa kelishi bilan ``recommendation`` bo'laklari sifatida.
+Oxirgi ``done`` hodisasida to'liq (kanonik) HTML bor - klient oraliq
+bo'laklarni shu bilan almashtiradi.
+"""
+import json
+
+from django.http import StreamingHttpResponse
+
+
+def sse_event(event, data):
+    """Bitta SSE hodisasi"""
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def diagnosis_events(prediction, lang, on_complete=None, on_abort=None, result_key='recommendations'):
+    """
+    Tashxis hodisalari generatori.
+
+    Args:
+        prediction: darhol yuboriladigan dict (kamida ``disease`` kaliti bilan)
+        on_complete: ``on_complete(recommendation_html)`` - tavsiya tayyor
+            bo'lgach (masalan, PlantImage ni saqlash uchun)
+        on_abort: ``on_abort(error)`` - oqim tavsiyasiz tugasa: tavsiya
+            xatosi (``error`` istisno) yoki klient uzilgani (``error`` None,
+            generator ``GeneratorExit`` bilan yopiladi). Yozuv ``processing``
+            holatida qolib ketmasligi uchun
+        result_key: ``done`` hodisasida tavsiya qaysi kalit ostida yuboriladi
+    """
+    from .ai_utils import stream_recommendation
+
+    finished = False
+    error = None
+    try:
+        yield sse_event('prediction', prediction)
+        try:
+            stream = stream_recommendation(prediction['disease'], lang)
+            while True:
+                try:
+                    html = next(stream)
+                except StopIteration as stop:
+                    recommendation = stop.value
+                    break
+                yield sse_event('recommendation', {'html': html})
+            if on_complete is not None:
+                on_complete(recommendation)
+            finished = True
+        except Exception as e:
+            print(f"❌ Tavsiya oqimi xatolik: {e}")
+            error = e
+            yield sse_event('error', {'error': str(e)})
+            return
+        yield sse_event('done', dict(prediction, **{result_key: recommendation}))
+    finally:
+        if not finished and on_abort is not None:
+            on_abort(error)
+
+
+def sse_response(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx buferlashini o'chirish, aks holda bo'laklar oxirida birga keladi
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def wants_stream(request):
+    """So'rov oqimli javob so'raganmi (``stream=1`` yoki ``Accept: text/event-stream``)"""
+    if request.POST.get('stream') in ('1', 'true') or request.GET.get('stream') in ('1', 'true'):
+        return True
+    return 'text/event-stream' in request.headers.get('Accept', '')
@@ -1,3 +1,1755 @@
-from django.test import TestCase
+"""
+Tests for diagnosis inference helpers
+"""
+import io
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from diagnosis import jobs, prediction_cache, recommendation_cache
+from diagnosis.ai_utils import IncrementalMarkdownFormatter, markdown_formatter
+from diagnosis.model_loader import is_confident, predict
+from diagnosis.models import AIModel, PlantImage, PlantType, Recommendation, ShadowPrediction
+from diagnosis.shadow import REFRESH_INTERVAL, ShadowEvaluator, maybe_shadow
+
+from models.batcher import MicroBatcher
+from models.model_manager import ModelManager, build_label_array, top_k_predictions
+from models.model_server import recv_message, send_message
+from models.preload import after_fork, get_process_memory
+from models.preprocessing import preprocess_batch, preprocess_image
+
+
+TOMATO_TOP_K = [('Tomato___Late_blight', 0.91), ('Tomato___Early_blight', 0.06), ('Tomato___healthy', 0.02)]
+
+
+def make_jpeg_bytes(size=(1600, 1200), color=(60, 140, 50)):
+    """Build an in-memory JPEG for preprocessing tests"""
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+class MicroBatcherTestCase(SimpleTestCase):
+    """Tests for the micro-batching layer"""
+
+    def test_concurrent_requests_share_one_batch(self):
+        """Concurrent submits are coalesced and results fan back out in order"""
+        calls = []
+
+        def fake_predict(model_key, batch):
+            calls.append((model_key, batch.shape[0]))
+            # Each "probability vector" echoes the image's marker value
+            return batch[:, 0, 0, :1].copy()
+
+        batcher = MicroBatcher(fake_predict, window_ms=200, max_batch_size=4)
+        results = {}
+
+        def submit(value):
+            array = np.full((224, 224, 3), value, dtype=np.float32)
+            results[value] = float(batcher.submit('disease_all', array, timeout=5)[0])
+
+        threads = [threading.Thread(target=submit, args=(v,)) for v in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, {0: 0.0, 1: 1.0, 2: 2.0, 3: 3.0})
+        self.assertEqual(calls, [('disease_all', 4)])
+
+        metrics = batcher.get_metrics()
+        self.assertEqual(metrics['batch_size_histogram'], {4: 1})
+        self.assertEqual(metrics['total_requests'], 4)
+        self.assertIn('p95', metrics['wait_time_ms'])
+
+    def test_predict_errors_propagate_to_callers(self):
+        """A failing batch raises in every waiting caller"""
+        def broken_predict(model_key, batch):
+            raise RuntimeError('model failed')
+
+        batcher = MicroBatcher(broken_predict, window_ms=1, max_batch_size=2)
+        with self.assertRaises(RuntimeError):
+            batcher.submit('disease_all', np.zeros((1, 224, 224, 3), dtype=np.float32), timeout=5)
+        self.assertEqual(batcher.get_metrics()['failed_batches'], 1)
+
+    def test_retire_drains_queue_and_stops_worker(self):
+        """Retiring a key finishes queued requests and ends its worker thread"""
+        batcher = MicroBatcher(lambda key, batch: batch[:, 0, 0, :1].copy(), window_ms=1, max_batch_size=2)
+        batcher.submit('disease_all#1', np.ones((1, 224, 224, 3), dtype=np.float32), timeout=5)
+        worker = batcher._workers['disease_all#1']
+
+        batcher.retire('disease_all#1')
+        worker.join(timeout=5)
+
+        self.assertFalse(worker.is_alive())
+        self.assertNotIn('disease_all#1', batcher._queues)
+
+    def test_submit_racing_retire_fails_instead_of_hanging(self):
+        """A request that loses the race with retire is failed, not left behind the sentinel"""
+        batcher = MicroBatcher(lambda key, batch: batch[:, 0, 0, :1].copy(), window_ms=1, max_batch_size=2)
+        array = np.ones((224, 224, 3), dtype=np.float32)
+        batcher.submit('disease_all#1', array, timeout=5)
+        stale_queue = batcher._queues['disease_all#1']
+        worker = batcher._workers['disease_all#1']
+
+        batcher.retire('disease_all#1')
+        # submit_async already fetched the queue through the lock-free fast path
+        with mock.patch.object(batcher, '_get_queue', return_value=stale_queue):
+            future = batcher.submit_async('disease_all#1', array)
+        with self.assertRaises(RuntimeError):
+            future.result(timeout=5)
+
+        # Late submits to a retired key do not start a new, never-retired worker
+        with self.assertRaises(RuntimeError):
+            batcher.submit('disease_all#1', array, timeout=5)
+        worker.join(timeout=5)
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(batcher._workers, {})
+
+
+class ModelServerProtocolTestCase(SimpleTestCase):
+    """Tests for the model server wire protocol"""
+
+    def test_message_roundtrip_with_binary_payload(self):
+        """Header and raw image bytes survive a socket roundtrip"""
+        left, right = socket.socketpair()
+        try:
+            payload = bytes(range(256)) * 1000
+            sender = threading.Thread(
+                target=send_message,
+                args=(left, {'op': 'predict', 'plant_type': 'tomato'}, payload),
+            )
+            sender.start()
+            header, received = recv_message(right)
+            sender.join()
+        finally:
+            left.close()
+            right.close()
+
+        self.assertEqual(header['op'], 'predict')
+        self.assertEqual(header['plant_type'], 'tomato')
+        self.assertEqual(header['size'], len(payload))
+        self.assertEqual(received, payload)
+
+    def test_pool_worker_runs_without_the_micro_batcher(self):
+        from models.model_server import _init_worker
+
+        with override_settings(INFERENCE_BATCHING_ENABLED=True, INFERENCE_PIPELINE_ENABLED=True):
+            _init_worker([])
+            import models.model_manager as manager_module
+            self.assertIsNone(manager_module.get_batcher())
+            self.assertIsNone(manager_module.get_pipeline())
+
+    def test_predict_batch_op_sends_all_images_to_one_pool_call(self):
+        from models.model_server import ModelServer, ModelServerClient, ModelServerError
+
+        class InlinePool:
+            calls = []
+
+            def __init__(self, **kwargs):
+                pass
+
+            def apply(self, fn, args):
+                self.calls.append(len(args[0]))
+                return fn(*args)
+
+            def terminate(self):
+                pass
+
+            def join(self):
+                pass
+
+        labels = np.array(['Tomato___Late_blight', 'Tomato___healthy'], dtype=object)
+        batch_sizes = []
+
+        def fake_batch(batch, detection_type, plant_type, batch_size=32):
+            batch_sizes.append(len(batch))
+            return np.tile([[0.8, 0.2]], (len(batch), 1)), labels
+
+        socket_path = os.path.join(tempfile.mkdtemp(), 'model.sock')
+        server = ModelServer(socket_path, workers=1)
+        with mock.patch('multiprocessing.Pool', InlinePool), \
+                mock.patch('models.model_manager.predict_probabilities_batch', side_effect=fake_batch):
+            server.start()
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            try:
+                results = ModelServerClient(socket_path, timeout=10).predict_batch(
+                    [make_jpeg_bytes(), b'not an image', make_jpeg_bytes((800, 600))]
+                )
+            finally:
+                server.shutdown()
+
+        self.assertEqual(InlinePool.calls, [3])
+        self.assertEqual(batch_sizes, [2])
+        self.assertEqual(results[0][0], 'Tomato___Late_blight')
+        self.assertAlmostEqual(results[0][1], 0.8, places=5)
+        self.assertIsInstance(results[1], ModelServerError)
+        self.assertEqual([name for name, _ in results[2][2]], ['Tomato___Late_blight', 'Tomato___healthy'])
+
+
+class PreprocessingTestCase(SimpleTestCase):
+    """Tests for the shared preprocessing module"""
+
+    def test_preprocess_image_returns_float32_batch(self):
+        """Large JPEGs are decoded to a normalised (1, 224, 224, 3) float32 tensor"""
+        array = preprocess_image(make_jpeg_bytes())
+        self.assertEqual(array.shape, (1, 224, 224, 3))
+        self.assertEqual(array.dtype, np.float32)
+        np.testing.assert_allclose(array[0, 112, 112], np.array([60, 140, 50]) / 255.0, atol=0.03)
+
+    def test_preprocess_batch_fills_contiguous_buffer(self):
+        """Mixed-format inputs are written into one contiguous batch buffer"""
+        png = io.BytesIO()
+        Image.new('L', (300, 500), 255).save(png, 'PNG')
+        batch = preprocess_batch([make_jpeg_bytes(), png.getvalue()])
+        self.assertEqual(batch.shape, (2, 224, 224, 3))
+        self.assertTrue(batch.flags['C_CONTIGUOUS'])
+        self.assertAlmostEqual(float(batch[1].min()), 1.0, places=5)
+
+
+class TopKPredictionTestCase(SimpleTestCase):
+    """Tests for top-k selection over the precomputed label array"""
+
+    def test_top_k_matches_full_sort(self):
+        class_indices = {f'class_{i}': i for i in range(38)}
+        labels = build_label_array(class_indices)
+        probabilities = np.random.default_rng(0).dirichlet(np.ones(38)).astype(np.float32)
+
+        top = top_k_predictions(probabilities, labels, k=5)
+        expected = np.argsort(probabilities)[::-1][:5]
+        self.assertEqual([name for name, _ in top], [f'class_{i}' for i in expected])
+        self.assertAlmostEqual(top[0][1], float(probabilities.max()))
+        self.assertEqual(len(top_k_predictions(probabilities, labels, k=100)), 38)
+
+    def test_low_confidence_uses_margin(self):
+        self.assertTrue(is_confident([('A', 0.7), ('B', 0.2)]))
+        self.assertTrue(is_confident([('A', 0.55), ('B', 0.1)]))
+        self.assertFalse(is_confident([('A', 0.5), ('B', 0.4)]))
+        self.assertFalse(is_confident([]))
+
+
+class OptimizedBackendTestCase(SimpleTestCase):
+    """Tests for choosing the converted TFLite/ONNX artifact over the .h5 model"""
+
+    def setUp(self):
+        self.manager = ModelManager(lazy=True)
+        self.manager._configs_loaded = True
+        handle, self.artifact = tempfile.mkstemp(suffix='.tflite')
+        os.close(handle)
+        self.manager.add_model_config(
+            'disease', 'all', 'plant_disease_model.h5', 'class_indices.json',
+            optimized_path=self.artifact, optimized_format='tflite_int8',
+        )
+
+    def tearDown(self):
+        os.unlink(self.artifact)
+
+    def test_optimized_artifact_is_preferred(self):
+        optimized = mock.Mock(backend='tflite')
+        with mock.patch('models.runtimes.load_optimized_model', return_value=optimized) as load:
+            model, backend = self.manager._load_backend(self.manager.models['disease_all'])
+        load.assert_called_once_with(
+            self.artifact, 'tflite_int8', num_threads=None, shared_weights=False, initializers=None
+        )
+        self.assertIs(model, optimized)
+        self.assertEqual(backend, 'tflite')
+
+    @override_settings(INFERENCE_PREFER_OPTIMIZED=False, INFERENCE_COMPILED_CALL=False)
+    def test_keras_is_used_when_disabled(self):
+        with mock.patch.object(self.manager, '_load_keras_model', return_value='keras-model'):
+            self.assertEqual(self.manager._load_backend(self.manager.models['disease_all']), ('keras-model', 'keras'))
+
+
+class HotReloadTestCase(SimpleTestCase):
+    """Tests for swapping AIModel changes into a running ModelManager"""
+
+    def setUp(self):
+        self.manager = ModelManager(lazy=True)
+        self.manager._configs_loaded = True
+        self.manager.add_model_config('disease', 'all', 'old.h5', 'class_indices.json', version='1.0')
+
+    def _loaded(self, config, name):
+        config.update(model=mock.Mock(name=name), labels=np.array(['A']), loaded=True)
+        config['model'].predict.return_value = name
+        return config
+
+    def test_changed_model_is_swapped_and_old_token_keeps_serving(self):
+        old = self._loaded(self.manager.models['disease_all'], 'old-model')
+
+        def load_configs(staging):
+            staging._configs_loaded = True
+            staging._generation = 'next'
+            staging.add_model_config('disease', 'all', 'new.h5', 'class_indices.json', version='2.0')
+
+        def ensure_loaded(staging, config):
+            self._loaded(config, 'new-model')
+
+        with mock.patch.object(ModelManager, 'load_model_configs', load_configs), \
+                mock.patch.object(ModelManager, '_ensure_loaded', ensure_loaded), \
+                mock.patch('threading.Timer') as timer:
+            self.manager._reload()
+
+        new = self.manager.models['disease_all']
+        self.assertIsNot(new, old)
+        self.assertEqual(self.manager.predict_batch(new['token'], None), 'new-model')
+        # A request that started before the swap finishes on the model it resolved
+        self.assertEqual(self.manager.predict_batch(old['token'], None), 'old-model')
+        self.assertEqual(self.manager.get_registry_info()['reload_count'], 1)
+
+        self.manager._release(timer.call_args.kwargs['args'][0])
+        self.assertNotIn(old['token'], self.manager._tokens)
+        self.assertIsNone(old['model'])
+
+    def test_unchanged_model_is_reused(self):
+        old = self._loaded(self.manager.models['disease_all'], 'old-model')
+
+        def load_configs(staging):
+            staging._configs_loaded = True
+            staging.add_model_config('disease', 'all', 'old.h5', 'class_indices.json', version='1.0')
+
+        with mock.patch.object(ModelManager, 'load_model_configs', load_configs), \
+                mock.patch.object(ModelManager, '_ensure_loaded') as ensure_loaded:
+            self.manager._reload()
+
+        ensure_loaded.assert_not_called()
+        self.assertIs(self.manager.models['disease_all'], old)
+
+    @override_settings(INFERENCE_HOT_RELOAD=True)
+    def test_check_for_updates_only_reloads_on_new_generation(self):
+        self.manager._generation = 'current'
+        with mock.patch('models.model_manager._read_generation', return_value='current'), \
+                mock.patch.object(self.manager, '_reload') as reload:
+            self.assertFalse(self.manager.check_for_updates(force=True))
+        with mock.patch('models.model_manager._read_generation', return_value='next'), \
+                mock.patch.object(self.manager, '_reload') as reload:
+            self.assertTrue(self.manager.check_for_updates(force=True))
+            self.manager._reload_thread.join(timeout=5)
+        reload.assert_called_once_with()
+
+
+@override_settings(INFERENCE_MEMORY_BUDGET_MB=2, INFERENCE_PINNED_MODELS=('disease_all',))
+class ModelResidencyTestCase(SimpleTestCase):
+    """Tests for the memory-budgeted LRU residency of loaded models"""
+
+    def setUp(self):
+        self.manager = ModelManager(lazy=True)
+        self.manager._configs_loaded = True
+        for plant in ('all', 'tomato', 'potato'):
+            self.manager.add_model_config('disease', plant, f'{plant}.h5', 'class_indices.json')
+
+        def fake_load(config):
+            config.update(model=mock.Mock(), memory_bytes=1024 * 1024, load_time=0.5, loaded=True)
+            return True
+
+        patcher = mock.patch.object(self.manager, '_ensure_loaded', side_effect=lambda config: (
+            False if config['loaded'] else fake_load(config)
+        ))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_least_recently_used_model_is_evicted_but_pinned_one_stays(self):
+        self.manager.acquire('disease_all')
+        self.manager.acquire('disease_tomato')
+        self.manager.acquire('disease_potato')
+
+        self.assertTrue(self.manager.models['disease_all']['loaded'])
+        self.assertFalse(self.manager.models['disease_tomato']['loaded'])
+        self.assertIsNone(self.manager.models['disease_tomato']['model'])
+
+        self.manager.acquire('disease_potato')
+        info = self.manager.get_residency_info()
+        self.assertEqual(info['resident'], ['disease_all', 'disease_potato'])
+        self.assertEqual(info['pinned'], ['disease_all'])
+        self.assertEqual((info['hits'], info['misses'], info['evictions']), (1, 3, 1))
+        self.assertEqual(info['used_bytes'], 2 * 1024 * 1024)
+        self.assertEqual(info['avg_load_seconds'], 0.5)
+
+    def test_evicted_model_is_reloaded_on_next_predict(self):
+        self.manager.acquire('disease_all')
+        tomato = self.manager.acquire('disease_tomato')
+        self.manager.acquire('disease_potato')
+
+        self.manager.predict_batch(tomato['token'], np.zeros((1, 224, 224, 3), dtype=np.float32))
+
+        self.assertTrue(tomato['loaded'])
+        self.assertFalse(self.manager.models['disease_potato']['loaded'])
+        self.assertEqual(self.manager.get_residency_info()['evictions'], 2)
+
+
+@override_settings(
+    INFERENCE_MODE='local', INFERENCE_BATCHING_ENABLED=False, INFERENCE_SHADOW_SAMPLE_RATE=0,
+    PREDICTION_CACHE_ENABLED=False, DUPLICATE_DETECTION_ENABLED=False,
+)
+class SharedModelManagerTestCase(SimpleTestCase):
+    """Tests that every prediction entry point runs on the one process-wide ModelManager"""
+
+    def setUp(self):
+        self.manager = ModelManager(lazy=True)
+        self.manager._configs_loaded = True
+        self.manager.add_model_config('disease', 'all', 'model.h5', 'class_indices.json')
+        self.model = mock.Mock()
+        self.model.predict.side_effect = lambda batch, verbose=0: np.tile([[0.05, 0.85, 0.10]], (len(batch), 1))
+        labels = build_label_array({'Tomato___Early_blight': 0, 'Tomato___Late_blight': 1, 'Tomato___healthy': 2})
+
+        def fake_load(config):
+            if config['loaded']:
+                return False
+            config.update(model=self.model, labels=labels, memory_bytes=0, load_time=0.0, loaded=True)
+            return True
+
+        for patcher in (
+            mock.patch('models.model_manager.model_manager', self.manager),
+            mock.patch.object(self.manager, '_ensure_loaded', side_effect=fake_load),
+            mock.patch.object(self.manager, 'check_for_updates', return_value=False),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.image_path = os.path.join(tempfile.mkdtemp(), 'leaf.jpg')
+        with open(self.image_path, 'wb') as f:
+            f.write(make_leaf_jpeg())
+
+    def test_view_api_and_bot_share_one_loaded_model(self):
+        from diagnosis.model_loader import predict_plant_disease
+        from diagnosis.models import Disease
+        from diagnosis.views import predict_image
+
+        predicted_class, confidence, top_k = predict_image(self.image_path)
+        self.assertEqual(predicted_class, 'Tomato___Late_blight')
+        self.assertAlmostEqual(confidence, 0.85, places=5)
+        self.assertEqual([name for name, _ in top_k], ['Tomato___Late_blight', 'Tomato___healthy', 'Tomato___Early_blight'])
+
+        with open(self.image_path, 'rb') as f, \
+                mock.patch('plantapi.views.Disease.objects.get_or_create',
+                           side_effect=lambda name, defaults: (Disease(name=name, **defaults), True)), \
+                mock.patch('plantapi.views.get_ai_recommendation', return_value='Tavsiya'):
+            response = self.client.post(reverse('api_predict'), {'image': f})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['disease'], 'Tomato___Late_blight')
+        self.assertEqual(response.json()['confidence'], 85.0)
+
+        self.assertEqual(predict_plant_disease(self.image_path, chat_id=1)[0], 'Tomato___Late_blight')
+
+        # One load, then cache hits: all three paths reached the same manager and model
+        self.assertEqual(self.model.predict.call_count, 3)
+        residency = self.manager.get_residency_info()
+        self.assertEqual((residency['misses'], residency['hits']), (1, 2))
+
+
+class ForkPreloadTestCase(SimpleTestCase):
+    """Tests for the gunicorn preload helpers"""
+
+    def test_process_memory_reports_pss_and_uss(self):
+        if not os.path.exists('/proc/self/smaps_rollup'):
+            self.skipTest('smaps_rollup is Linux-only')
+        memory = get_process_memory()
+        self.assertGreater(memory['rss'], 0)
+        self.assertGreater(memory['uss'], 0)
+        self.assertLessEqual(memory['uss'], memory['rss'])
+
+    @override_settings(INFERENCE_WARMUP=False, INFERENCE_INTRA_OP_THREADS=0, INFERENCE_INTER_OP_THREADS=0)
+    def test_after_fork_drops_inherited_threads(self):
+        with mock.patch('models.model_manager._batcher', mock.Mock()), \
+                mock.patch('diagnosis.model_loader.warmup') as warmup:
+            after_fork()
+            import models.model_manager as manager_module
+            self.assertIsNone(manager_module._batcher)
+        warmup.assert_not_called()
+
+    @override_settings(INFERENCE_PRELOAD_IMPORT_TF=False)
+    def test_onnx_initializers_are_preloaded_only_when_sharing_is_enabled(self):
+        from models import preload
+
+        handle, path = tempfile.mkstemp(suffix='.onnx')
+        os.close(handle)
+        self.addCleanup(os.unlink, path)
+        manager = mock.Mock(models={'disease_all': {'optimized_path': path, 'optimized_format': 'onnx'}})
+        weights = {'w0': np.zeros((4, 4), dtype=np.float32)}
+
+        with mock.patch.object(preload, '_shared_initializers', {}), \
+                mock.patch.object(preload, '_load_onnx_initializers', return_value=weights) as load:
+            # onnxruntime would prepack a private copy anyway - the master keeps nothing
+            with override_settings(INFERENCE_ONNX_SHARED_WEIGHTS=False):
+                preload.preload_for_fork(manager)
+            load.assert_not_called()
+            self.assertIsNone(preload.get_shared_initializers(path))
+
+            with override_settings(INFERENCE_ONNX_SHARED_WEIGHTS=True):
+                preload.preload_for_fork(manager)
+            self.assertIs(preload.get_shared_initializers(path), weights)
+
+
+class PredictionCacheTestCase(TestCase):
+    """Tests for the content-addressed prediction cache"""
+
+    def setUp(self):
+        prediction_cache.get_cache().clear()
+        prediction_cache.reset_generation()
+        plant_type = PlantType.objects.create(code='all', name_uz='Barcha')
+        self.ai_model = AIModel.objects.create(
+            name='Umumiy model', plant_type=plant_type, version='1.0',
+            model_file='ai_models/model.h5', class_indices_file='ai_models/class_indices.json',
+        )
+        handle, self.image_path = tempfile.mkstemp(suffix='.jpg')
+        with os.fdopen(handle, 'wb') as f:
+            f.write(make_jpeg_bytes(size=(64, 64)))
+
+    def tearDown(self):
+        os.unlink(self.image_path)
+
+    @mock.patch('diagnosis.prediction_cache._model_identity', return_value=('disease_all', 1, '1.0'))
+    @mock.patch('diagnosis.model_loader._predict_bytes', return_value=TOMATO_TOP_K[0] + (TOMATO_TOP_K,))
+    def test_repeated_image_is_served_from_cache(self, predict_bytes, model_identity):
+        """The same bytes are only run through the model once"""
+        hits_before = prediction_cache.get_stats()['hits']
+        self.assertEqual(predict(self.image_path), ('Tomato___Late_blight', 0.91))
+        self.assertEqual(predict(self.image_path), ('Tomato___Late_blight', 0.91))
+        self.assertEqual(predict_bytes.call_count, 1)
+        self.assertEqual(prediction_cache.get_stats()['hits'], hits_before + 1)
+
+    @mock.patch('diagnosis.prediction_cache._model_identity', return_value=('disease_all', 1, '1.0'))
+    @mock.patch('diagnosis.model_loader._predict_bytes', return_value=TOMATO_TOP_K[0] + (TOMATO_TOP_K,))
+    def test_model_change_invalidates_cache(self, predict_bytes, model_identity):
+        """Deactivating or re-uploading an AIModel changes the cache key"""
+        predict(self.image_path)
+        self.ai_model.is_active = False
+        self.ai_model.save()
+        prediction_cache.reset_generation()
+        predict(self.image_path)
+        self.assertEqual(predict_bytes.call_count, 2)
+
+
+class RecommendationCacheTestCase(TestCase):
+    """Tests for the Gemini recommendation read-through cache"""
+
+    def setUp(self):
+        cache.clear()
+        self.generate = mock.Mock(return_value=('<p>Mis sulfat bilan ishlang</p>', 'GEMINI'))
+
+    def test_recommendation_is_generated_once_per_language(self):
+        """Later requests are served from memory or the Recommendation table"""
+        first = recommendation_cache.get_recommendation('Tomato___Late_blight', 'ru', self.generate)
+        cache.clear()
+        second = recommendation_cache.get_recommendation('Tomato___Late_blight', 'ru', self.generate)
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.generate.call_count, 1)
+        self.assertEqual(Recommendation.objects.filter(language='ru').count(), 1)
+
+        recommendation_cache.get_recommendation('Tomato___Late_blight', 'en', self.generate)
+        self.assertEqual(self.generate.call_count, 2)
+
+    def test_failed_generation_is_not_cached(self):
+        """Error and fallback texts are returned but never stored"""
+        self.generate.return_value = ('AI javob bermadi.', None)
+        recommendation_cache.get_recommendation('Potato___Early_blight', 'uz', self.generate)
+        recommendation_cache.get_recommendation('Potato___Early_blight', 'uz', self.generate)
+        self.assertEqual(self.generate.call_count, 2)
+        self.assertFalse(Recommendation.objects.exists())
+
+    def test_stale_recommendation_is_refreshed(self):
+        """Rows older than RECOMMENDATION_MAX_AGE_DAYS are regenerated"""
+        recommendation_cache.get_recommendation('Apple___scab', 'uz', self.generate)
+        Recommendation.objects.update(updated_at=timezone.now() - timedelta(days=365))
+        cache.clear()
+
+        self.generate.return_value = ('<p>Yangi tavsiya</p>', 'GEMINI')
+        text = recommendation_cache.get_recommendation('Apple___scab', 'uz', self.generate)
+        self.assertEqual(text, '<p>Yangi tavsiya</p>')
+        self.assertEqual(Recommendation.objects.count(), 1)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class DiagnosisJobTestCase(TestCase):
+    """Tests for the queued (asynchronous) diagnosis pipeline"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='farmer', password='secret123')
+        self.client.force_login(self.user)
+
+    def _upload(self, **extra):
+        data = {'image': SimpleUploadedFile('leaf.jpg', make_jpeg_bytes(), content_type='image/jpeg')}
+        data.update(extra)
+        return self.client.post(reverse('diagnosis:test_image'), data)
+
+    @mock.patch('diagnosis.views.get_ai_recommendation', return_value='<p>Tavsiya</p>')
+    @mock.patch('diagnosis.views.predict_detailed', return_value=TOMATO_TOP_K[0] + (TOMATO_TOP_K,))
+    def test_async_upload_is_queued_and_processed_by_worker(self, mock_predict, mock_recommendation):
+        """The request only enqueues; the worker fills in the result"""
+        response = self._upload(plant_type='tomato', **{'async': '1'})
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['job_id']
+        mock_predict.assert_not_called()
+
+        status = self.client.get(response.json()['status_url']).json()
+        self.assertEqual(status['status'], 'queued')
+
+        self.assertTrue(jobs.process_next_job())
+        self.assertFalse(jobs.process_next_job())
+        mock_predict.assert_called_once()
+        self.assertEqual(mock_predict.call_args.kwargs['plant_type'], 'tomato')
+
+        status = self.client.get(reverse('diagnosis:job_status', args=[job_id])).json()
+        self.assertEqual(status['status'], 'completed')
+        self.assertEqual(status['progress'], 100)
+        self.assertEqual(status['result']['disease'], 'Tomato___Late_blight')
+        self.assertEqual(status['result']['recommendations'], '<p>Tavsiya</p>')
+        self.assertEqual(
+            [item['disease'] for item in status['result']['top_predictions']],
+            [name for name, _ in TOMATO_TOP_K]
+        )
+
+    def test_job_can_only_be_claimed_once(self):
+        """A conditional UPDATE keeps concurrent workers from taking the same job"""
+        plant_image = PlantImage(user=self.user, image=SimpleUploadedFile('leaf.jpg', make_jpeg_bytes()))
+        jobs.enqueue_diagnosis(plant_image)
+
+        claimed = jobs.claim_next_job()
+        self.assertEqual(claimed.pk, plant_image.pk)
+        self.assertEqual(claimed.status, 'processing')
+        self.assertEqual(claimed.attempts, 1)
+        self.assertIsNone(jobs.claim_next_job())
+
+        # Worker o'lib qolsa job qayta navbatga qaytadi
+        PlantImage.objects.filter(pk=plant_image.pk).update(claimed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(jobs.requeue_stale_jobs(stale_after=60), (1, 0))
+        self.assertEqual(jobs.claim_next_job().pk, plant_image.pk)
+
+    def test_status_is_private_to_owner(self):
+        plant_image = PlantImage(user=self.user, image=SimpleUploadedFile('leaf.jpg', make_jpeg_bytes()))
+        jobs.enqueue_diagnosis(plant_image)
+        other = get_user_model().objects.create_user(username='other', password='secret123')
+        self.client.force_login(other)
+        response = self.client.get(reverse('diagnosis:job_status', args=[plant_image.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+def fake_gemini_stream(disease_name, lang='uz'):
+    """Stand-in for the streaming Gemini call"""
+    formatter = IncrementalMarkdownFormatter()
+    for chunk in ['**Kasal', 'lik** haqida.\n\n- Birinchi', '\n- Ikkinchi']:
+        html = formatter.feed(chunk)
+        if html:
+            yield html
+    yield formatter.flush()
+    return markdown_formatter(formatter.text), 'GEMINI'
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class DiagnosisStreamTestCase(TestCase):
+    """Tests for the streamed (SSE) diagnosis response"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='farmer', password='secret123')
+        self.client.force_login(self.user)
+
+    def test_incremental_formatter_emits_complete_blocks(self):
+        formatter = IncrementalMarkdownFormatter()
+        self.assertEqual(formatter.feed('**Qalin'), '')
+        self.assertEqual(formatter.feed(' matn**\n\nKeyingi'), '<p><b>Qalin matn</b></p>')
+        self.assertEqual(formatter.flush(), '<p>Keyingi</p>')
+        self.assertEqual(formatter.text, '**Qalin matn**\n\nKeyingi')
+
+    @mock.patch('diagnosis.ai_utils.stream_ai_recommendation', side_effect=fake_gemini_stream)
+    @mock.patch('diagnosis.views.predict_detailed', return_value=TOMATO_TOP_K[0] + (TOMATO_TOP_K,))
+    def test_prediction_is_sent_before_recommendation(self, mock_predict, mock_stream):
+        response = self.client.post(reverse('diagnosis:test_image'), {
+            'image': SimpleUploadedFile('leaf.jpg', make_jpeg_bytes(), content_type='image/jpeg'),
+            'stream': '1',
+        })
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = [
+            (block.split('\n')[0][len('event: '):], json.loads(block.split('\n')[1][len('data: '):]))
+            for block in b''.join(response.streaming_content).decode().strip().split('\n\n')
+        ]
+
+        self.assertEqual(events[0][0], 'prediction')
+        self.assertEqual(events[0][1]['disease'], 'Tomato___Late_blight')
+        self.assertEqual([name for name, _ in events[1:-1]], ['recommendation', 'recommendation'])
+        self.assertEqual(events[-1][0], 'done')
+
+        plant_image = PlantImage.objects.get()
+        self.assertEqual(plant_image.status, 'completed')
+        self.assertEqual(plant_image.ai_result, events[-1][1]['recommendations'])
+        # Oqim natijasi keshga yoziladi - keyingi so'rov Gemini ga bormaydi
+        self.assertEqual(Recommendation.objects.count(), 1)
+
+    @mock.patch('diagnosis.ai_utils.stream_ai_recommendation', side_effect=fake_gemini_stream)
+    @mock.patch('diagnosis.views.predict_detailed', return_value=TOMATO_TOP_K[0] + (TOMATO_TOP_K,))
+    def test_client_disconnect_after_prediction_does_not_leave_row_processing(self, mock_predict, mock_stream):
+        response = self.client.post(reverse('diagnosis:test_image'), {
+            'image': SimpleUploadedFile('leaf.jpg', make_jpeg_bytes(), content_type='image/jpeg'),
+            'stream': '1',
+        })
+        plant_image = PlantImage.objects.get()
+        self.assertEqual(plant_image.status, 'processing')
+        # The stale-job sweep can see stream rows if the process dies mid-stream
+        self.assertIsNotNone(plant_image.claimed_at)
+
+        first = next(iter(response.streaming_content)).decode()
+        self.assertTrue(first.startswith('event: prediction'))
+        # WSGI servers close the response when the client goes away
+        response.close()
+
+        plant_image.refresh_from_db()
+        self.assertEqual(plant_image.status, 'completed')
+        self.assertEqual(plant_image.disease_name, 'Tomato___Late_blight')
+        self.assertEqual(plant_image.ai_result, '')
+
+    @mock.patch('diagnosis.ai_utils.stream_ai_recommendation', side_effect=RuntimeError('Gemini ishlamayapti'))
+    @mock.patch('diagnosis.views.predict_detailed', return_value=TOMATO_TOP_K[0] + (TOMATO_TOP_K,))
+    def test_recommendation_error_fails_streamed_row(self, mock_predict, mock_stream):
+        response = self.client.post(reverse('diagnosis:test_image'), {
+            'image': SimpleUploadedFile('leaf.jpg', make_jpeg_bytes(), content_type='image/jpeg'),
+            'stream': '1',
+        })
+        content = b''.join(response.streaming_content).decode()
+
+        self.assertIn('event: error', content)
+        plant_image = PlantImage.objects.get()
+        self.assertEqual(plant_image.status, 'failed')
+        self.assertIn('Gemini ishlamayapti', plant_image.ai_result)
+
+
+# Flat test images would not pass the leaf gatekeeper; gate tests enable it explicitly
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), PREDICTION_CACHE_ENABLED=False, INFERENCE_GATE_ENABLED=False)
+class BulkDiagnosisTestCase(TestCase):
+    """Tests for the multi-image diagnosis endpoint"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='agronom', password='secret123')
+        self.client.force_login(self.user)
+        labels = np.array(['Tomato___Late_blight', 'Tomato___healthy'], dtype=object)
+
+        def fake_batch(batch, detection_type, plant_type, batch_size=32):
+            # Yashilroq rasm -> sog'lom
+            healthy = batch[:, 0, 0, 1] > 0.5
+            return np.stack([np.where(healthy, 0.1, 0.9), np.where(healthy, 0.9, 0.1)], axis=1), labels
+
+        patcher = mock.patch('models.model_manager.predict_probabilities_batch', side_effect=fake_batch)
+        self.mock_batch = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _archive(self, files):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as zf:
+            for name, data in files.items():
+                zf.writestr(name, data)
+        return SimpleUploadedFile('photos.zip', buffer.getvalue(), content_type='application/zip')
+
+    @mock.patch('diagnosis.views.get_ai_recommendation', side_effect=lambda name, lang: f'<p>{name}</p>')
+    def test_images_are_batched_and_recommended_once_per_disease(self, mock_recommendation):
+        images = [
+            SimpleUploadedFile(f'leaf{i}.jpg', make_jpeg_bytes((320, 240), color), content_type='image/jpeg')
+            for i, color in enumerate([(150, 40, 30), (40, 200, 40), (150, 40, 30)])
+        ]
+        archive = self._archive({'field/leaf3.jpg': make_jpeg_bytes((320, 240), (150, 40, 30)), 'notes.txt': b'x'})
+        response = self.client.post(reverse('api_predict_bulk'), {'images': images, 'archive': archive})
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], 4)
+        self.assertEqual(
+            [item['disease'] for item in data['results']],
+            ['Tomato___Late_blight', 'Tomato___healthy', 'Tomato___Late_blight', 'Tomato___Late_blight']
+        )
+        self.assertEqual(data['results'][3]['filename'], 'leaf3.jpg')
+        self.mock_batch.assert_called_once()
+        self.assertEqual(len(self.mock_batch.call_args.args[0]), 4)
+        self.assertEqual(mock_recommendation.call_count, 2)
+        self.assertEqual(set(data['recommendations']), {'Tomato___Late_blight', 'Tomato___healthy'})
+
+        self.assertEqual(PlantImage.objects.filter(user=self.user, status='completed').count(), 4)
+        self.assertEqual(
+            sorted(item['image_id'] for item in data['results']),
+            sorted(PlantImage.objects.values_list('pk', flat=True))
+        )
+
+    @mock.patch('diagnosis.views.get_ai_recommendation', return_value='<p>Tavsiya</p>')
+    def test_broken_image_does_not_fail_the_batch(self, mock_recommendation):
+        response = self.client.post(reverse('api_predict_bulk'), {'images': [
+            SimpleUploadedFile('good.jpg', make_jpeg_bytes((320, 240)), content_type='image/jpeg'),
+            SimpleUploadedFile('broken.jpg', b'not an image', content_type='image/jpeg'),
+        ]})
+
+        results = response.json()['results']
+        self.assertFalse(results[0]['error'])
+        self.assertTrue(results[1]['error'])
+        self.assertEqual(PlantImage.objects.count(), 1)
+
+    @mock.patch('diagnosis.views.get_ai_recommendation', return_value='<p>Tavsiya</p>')
+    def test_low_confidence_images_get_no_diagnosis(self, mock_recommendation):
+        from diagnosis.model_loader import LOW_CONFIDENCE_LABEL
+
+        labels = np.array(['Tomato___Late_blight', 'Tomato___healthy'], dtype=object)
+        self.mock_batch.side_effect = lambda batch, *args, **kwargs: (np.tile([0.55, 0.45], (len(batch), 1)), labels)
+        response = self.client.post(reverse('api_predict_bulk'), {'images': [
+            SimpleUploadedFile('leaf.jpg', make_jpeg_bytes((320, 240)), content_type='image/jpeg'),
+        ]})
+
+        result = response.json()['results'][0]
+        self.assertFalse(result['confident'])
+        self.assertEqual(result['disease'], LOW_CONFIDENCE_LABEL)
+        mock_recommendation.assert_not_called()
+        self.assertIsNone(PlantImage.objects.get().disease)
+
+    @override_settings(INFERENCE_GATE_ENABLED=True)
+    @mock.patch('diagnosis.views.get_ai_recommendation', return_value='<p>Tavsiya</p>')
+    def test_gatekeeper_screens_each_bulk_image(self, mock_recommendation):
+        response = self.client.post(reverse('api_predict_bulk'), {'images': [
+            SimpleUploadedFile('leaf.jpg', make_leaf_jpeg(), content_type='image/jpeg'),
+            SimpleUploadedFile('me.jpg', make_leaf_jpeg(color=(215, 165, 135)), content_type='image/jpeg'),
+        ]})
+
+        leaf, selfie = response.json()['results']
+        self.assertFalse(leaf['error'])
+        self.assertTrue(selfie['rejected'])
+        self.assertEqual(selfie['reason'], 'not_plant')
+        # Only the accepted image reached the model
+        self.assertEqual(len(self.mock_batch.call_args[0][0]), 1)
+        self.assertEqual(PlantImage.objects.count(), 1)
+
+    @override_settings(INFERENCE_MODE='server', INFERENCE_MAX_BATCH_SIZE=2, MODEL_SERVER_WORKERS=2)
+    def test_server_mode_sends_batches_instead_of_single_images(self):
+        from diagnosis.model_loader import predict_detailed_batch
+
+        client = mock.Mock()
+        client.predict_batch.side_effect = lambda images, **kwargs: [TOMATO_TOP_K[0] + (TOMATO_TOP_K,)] * len(images)
+        with mock.patch('models.model_server.get_client', return_value=client):
+            predictions = predict_detailed_batch([make_jpeg_bytes((320, 240))] * 5)
+
+        self.assertEqual(len(predictions), 5)
+        self.assertEqual(predictions[4][0], 'Tomato___Late_blight')
+        self.assertEqual(sorted(len(call[0][0]) for call in client.predict_batch.call_args_list), [1, 2, 2])
+        client.predict.assert_not_called()
+        self.mock_batch.assert_not_called()
+
+    @override_settings(BULK_DIAGNOSIS_MAX_IMAGES=1)
+    def test_too_many_images_are_rejected(self):
+        response = self.client.post(reverse('api_predict_bulk'), {'images': [
+            SimpleUploadedFile(f'leaf{i}.jpg', make_jpeg_bytes((64, 64)), content_type='image/jpeg') for i in range(2)
+        ]})
+        self.assertEqual(response.status_code, 400)
+        self.mock_batch.assert_not_called()
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RescoreImagesTestCase(TestCase):
+    """Tests for re-scoring the PlantImage archive with a new model"""
+
+    def setUp(self):
+        self.ai_model = AIModel.objects.create(
+            name='Yangi model', version='2.0', plant_type=PlantType.objects.create(code='all', name_uz='Barcha'),
+            model_file='ai_models/model_v2.h5', class_indices_file='ai_models/class_indices.json',
+        )
+        for i, name in enumerate(['Tomato___healthy', 'Tomato___Late_blight', 'Tomato___Late_blight']):
+            PlantImage.objects.create(
+                image=SimpleUploadedFile(f'leaf{i}.jpg', make_jpeg_bytes((64, 64)), content_type='image/jpeg'),
+                disease_name=name, confidence=0.8, status='completed',
+            )
+        self.checkpoint = os.path.join(tempfile.mkdtemp(), 'rescore.json')
+
+        manager = mock.Mock()
+        # Yangi model hamma rasmni Late_blight deydi
+        manager.predict_batch.side_effect = lambda token, batch: np.tile([0.2, 0.8], (len(batch), 1))
+        config = {'token': 'disease_all#1', 'labels': np.array(['Tomato___healthy', 'Tomato___Late_blight'], dtype=object)}
+        patcher = mock.patch(
+            'diagnosis.management.commands.rescore_images.Command._load_model', return_value=(manager, config)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _run(self, *args):
+        out = io.StringIO()
+        call_command(
+            'rescore_images', str(self.ai_model.pk), '--workers', '1', '--chunk-size', '2',
+            '--checkpoint', self.checkpoint, *args, stdout=out,
+        )
+        return out.getvalue()
+
+    def test_resume_from_checkpoint_and_backfill(self):
+        self._run('--write', '--limit', '2')
+        with open(self.checkpoint) as f:
+            state = json.load(f)
+        self.assertEqual(state['processed'], 2)
+        self.assertEqual(state['last_id'], PlantImage.objects.order_by('pk')[1].pk)
+
+        report_path = os.path.join(os.path.dirname(self.checkpoint), 'report.json')
+        self._run('--write', '--json', report_path)
+        with open(report_path) as f:
+            report = json.load(f)
+
+        self.assertEqual(report['processed'], 3)
+        self.assertEqual(report['changed'], 1)
+        self.assertEqual(report['disagreements'], [{'old': 'Tomato___healthy', 'new': 'Tomato___Late_blight', 'count': 1}])
+        self.assertEqual(set(PlantImage.objects.values_list('disease_name', flat=True)), {'Tomato___Late_blight'})
+        self.assertEqual(PlantImage.objects.filter(disease__name='Tomato___Late_blight').count(), 3)
+
+
+@override_settings(INFERENCE_SHADOW_SAMPLE_RATE=1.0)
+class ShadowEvaluationTestCase(TestCase):
+    """Tests for running candidate models in shadow on live traffic"""
+
+    def setUp(self):
+        plant_type = PlantType.objects.create(code='all', name_uz='Barcha')
+        self.primary = AIModel.objects.create(
+            name='Asosiy', plant_type=plant_type, version='1.0',
+            model_file='ai_models/v1.h5', class_indices_file='ai_models/class_indices.json',
+        )
+        self.candidate = AIModel.objects.create(
+            name='Nomzod', plant_type=plant_type, version='2.0', is_active=False, is_shadow=True,
+            model_file='ai_models/v2.h5', class_indices_file='ai_models/class_indices.json',
+        )
+        self.labels = np.array(['Tomato___Late_blight', 'Tomato___healthy'], dtype=object)
+        # Fon threadlari ishga tushirilmaydi - navbat testda qo'lda bo'shatiladi
+        patcher = mock.patch.object(ShadowEvaluator, '_worker')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _primary_config(self):
+        return {'key': 'disease_all', 'ai_model_id': self.primary.pk, 'labels': self.labels}
+
+    def test_sampled_request_is_evaluated_off_the_hot_path(self):
+        evaluator = ShadowEvaluator(queue_size=4)
+        evaluator._maybe_refresh()
+        tensor = np.zeros((1, 224, 224, 3), dtype=np.float32)
+        with mock.patch('diagnosis.shadow.get_evaluator', return_value=evaluator):
+            self.assertTrue(maybe_shadow(self._primary_config(), tensor, np.array([0.9, 0.1])))
+            self.assertTrue(maybe_shadow(self._primary_config(), tensor, np.array([0.2, 0.8])))
+
+        manager = evaluator._registry[0]
+        candidate_config = {'token': 'disease_all#9', 'labels': self.labels}
+        with mock.patch.object(manager, 'acquire', return_value=candidate_config), \
+                mock.patch.object(manager, 'predict_batch', return_value=np.array([[0.7, 0.3]])):
+            while not evaluator._queue.empty():
+                evaluator._evaluate(*evaluator._queue.get_nowait())
+
+        self.assertEqual(ShadowPrediction.objects.count(), 2)
+        self.assertEqual(ShadowPrediction.objects.filter(agreed=True).count(), 1)
+        self.assertEqual(ShadowPrediction.objects.first().candidate, self.candidate)
+
+        staff = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'secret123')
+        self.client.force_login(staff)
+        response = self.client.get(reverse('admin:diagnosis_aimodel_shadow_report', args=[self.candidate.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['report']['agreement'], 0.5)
+        self.assertIn('p99', response.context['report']['latency_ms'])
+
+    def test_active_shadow_candidate_does_not_replace_primary(self):
+        """A candidate left with the default is_active=True is not served as the main model"""
+        self.candidate.is_active = True
+        self.candidate.save()
+
+        manager = ModelManager(lazy=True)
+        self.assertEqual(manager.models['disease_all']['ai_model_id'], self.primary.pk)
+        self.assertEqual(manager.models['disease_all']['version'], '1.0')
+
+    def test_bulk_update_of_active_and_shadow_flags_changes_generation(self):
+        """QuerySet.update() skips auto_now, but hot reload must still notice the change"""
+        generations = [AIModel.get_generation()]
+        AIModel.objects.filter(pk=self.primary.pk).update(is_active=False)
+        generations.append(AIModel.get_generation())
+        AIModel.objects.filter(pk=self.candidate.pk).update(is_shadow=False, is_active=True)
+        generations.append(AIModel.get_generation())
+        AIModel.objects.update(is_active=True)
+        generations.append(AIModel.get_generation())
+
+        self.assertEqual(len(set(generations)), 4)
+
+    def test_full_queue_drops_samples_instead_of_blocking(self):
+        evaluator = ShadowEvaluator(queue_size=1)
+        tensor = np.zeros((1, 224, 224, 3), dtype=np.float32)
+        self.assertTrue(evaluator.submit('disease_all', self.primary.pk, tensor, 'A', 0.9))
+        self.assertFalse(evaluator.submit('disease_all', self.primary.pk, tensor, 'A', 0.9))
+        self.assertEqual(evaluator.get_stats()['dropped'], 1)
+
+    def test_requests_without_candidate_are_not_sampled(self):
+        self.candidate.is_shadow = False
+        self.candidate.save()
+        evaluator = ShadowEvaluator(queue_size=4)
+        evaluator._maybe_refresh()
+        with mock.patch('diagnosis.shadow.get_evaluator', return_value=evaluator):
+            self.assertFalse(maybe_shadow(self._primary_config(), np.zeros((1, 224, 224, 3)), np.array([0.9, 0.1])))
+
+    def test_candidate_check_on_request_thread_is_a_lock_free_lookup(self):
+        evaluator = ShadowEvaluator(queue_size=4)
+        evaluator._maybe_refresh()
+
+        # The registry lock is held by a refresh in progress; requests neither wait nor query
+        with evaluator._registry_lock, self.assertNumQueries(0):
+            self.assertTrue(evaluator.has_candidate('disease_all'))
+            self.assertFalse(evaluator.has_candidate('pest_all'))
+
+    def test_background_refresh_picks_up_new_candidates(self):
+        evaluator = ShadowEvaluator(queue_size=4)
+        evaluator._maybe_refresh()
+        AIModel.objects.filter(pk=self.candidate.pk).update(is_shadow=False)
+
+        self.assertTrue(evaluator.has_candidate('disease_all'))
+        evaluator._checked_at -= REFRESH_INTERVAL
+        evaluator._maybe_refresh()
+        self.assertFalse(evaluator.has_candidate('disease_all'))
+
+
+class InferenceBenchmarkTestCase(SimpleTestCase):
+    """Baseline comparison of the benchmark_inference command"""
+
+    def _result(self, p95, ips, rss):
+        return {'models': {'disease_all': {
+            'latency_ms': {'p50': 10.0, 'p95': p95, 'p99': 20.0},
+            'cold_load': {'load_s': 1.0, 'rss_bytes': rss},
+            'throughput': {'1': 50.0, '32': ips},
+        }}}
+
+    def test_regressions_respect_metric_direction(self):
+        from diagnosis.management.commands.benchmark_inference import compare_to_baseline
+
+        baseline = self._result(p95=15.0, ips=400.0, rss=500)
+        rows = compare_to_baseline(self._result(p95=18.0, ips=300.0, rss=400), baseline, tolerance=0.10)
+        regressed = {row['metric'] for row in rows if row['regression']}
+        self.assertEqual(regressed, {'latency_ms.p95', 'throughput.32'})
+
+    def test_models_missing_from_baseline_are_skipped(self):
+        from diagnosis.management.commands.benchmark_inference import compare_to_baseline
+
+        current = self._result(p95=15.0, ips=400.0, rss=500)
+        self.assertEqual(compare_to_baseline(current, {'models': {}}), [])
+        current['models']['disease_all']['cold_load'] = None
+        rows = compare_to_baseline(current, self._result(p95=15.0, ips=400.0, rss=500))
+        self.assertFalse(any(row['metric'].startswith('cold_load') for row in rows))
+
+
+class TiledInferenceTestCase(SimpleTestCase):
+    """Tiled scoring of large field photographs"""
+
+    def test_grid_respects_tile_cap_and_tiles_are_views(self):
+        from models.tiling import plan_grid, tile_views
+
+        width, height, cols, rows = plan_grid(4000, 3000, overlap=0.25, max_tiles=64)
+        self.assertLessEqual(cols * rows, 64)
+        self.assertGreaterEqual(min(width, height), 224)
+
+        array = np.zeros((height, width, 3), dtype=np.uint8)
+        windows, ys, xs = tile_views(array, cols, rows)
+        self.assertEqual((len(ys), len(xs)), (rows, cols))
+        self.assertEqual((ys[-1] + 224, xs[-1] + 224), (height, width))
+        self.assertTrue(np.shares_memory(windows[ys[-1], xs[-1], 0], array))
+
+    def test_grid_caps_tiles_for_extreme_aspect_ratios(self):
+        from models.tiling import plan_grid
+
+        for size in [(2048, 1), (2048, 10), (1, 2048), (100000, 300)]:
+            width, height, cols, rows = plan_grid(*size, overlap=0.25, max_tiles=64)
+            self.assertLessEqual(cols * rows, 64, size)
+            self.assertGreaterEqual(min(width, height), 224, size)
+            self.assertLessEqual(width * height, 64 * 224 * 224, size)
+
+    @override_settings(INFERENCE_TILE_MAX_TILES=16, INFERENCE_MAX_BATCH_SIZE=4)
+    def test_small_lesion_drives_verdict_and_heatmap(self):
+        from models.tiling import predict_tiled
+
+        # Yashil dala, bitta burchakda kichik qizg'ish dog'
+        image = Image.new('RGB', (3000, 2000), (40, 160, 40))
+        image.paste((170, 60, 30), (2700, 1700, 3000, 2000))
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG')
+        labels = np.array(['Tomato___Late_blight', 'Tomato___healthy'], dtype=object)
+        batch_sizes = []
+
+        def fake_predict(token, batch):
+            batch_sizes.append(len(batch))
+            lesion = batch[:, :, :, 0].max(axis=(1, 2)) > 0.5
+            return np.stack([np.where(lesion, 0.9, 0.2), np.where(lesion, 0.1, 0.8)], axis=1)
+
+        config = {'token': 'disease_all#1', 'labels': labels}
+        with mock.patch('models.model_manager.model_manager') as manager:
+            manager.get_model_key.return_value = 'disease_all'
+            manager.acquire.return_value = config
+            manager.predict_batch.side_effect = fake_predict
+            result = predict_tiled(io.BytesIO(buffer.getvalue()), 'disease', 'all')
+
+        self.assertLessEqual(result['rows'] * result['cols'], 16)
+        self.assertLessEqual(max(batch_sizes), 4)
+        self.assertEqual(result['heatmap'].shape, (result['rows'], result['cols'], 2))
+        self.assertGreater(result['heatmap'][-1, -1, 0], result['heatmap'][0, 0, 0])
+        self.assertEqual(labels[int(np.argmax(result['probabilities']))], 'Tomato___Late_blight')
+        # Bo'laklar asl rasm koordinatalarida
+        x, y, w, h = result['boxes'][-1]
+        self.assertAlmostEqual(x + w, 3000, delta=2)
+        self.assertAlmostEqual(y + h, 2000, delta=2)
+
+
+def make_leaf_jpeg(size=(1600, 1200), color=(50, 140, 45), seed=0):
+    """A textured, in-focus green JPEG that passes the gatekeeper"""
+    rng = np.random.default_rng(seed)
+    # Yorug'lik bo'yicha tekstura - rang tusi o'zgarmaydi
+    cells = np.clip(np.array(color) * rng.uniform(0.6, 1.3, (size[1] // 16, size[0] // 16, 1)), 0, 255)
+    buffer = io.BytesIO()
+    Image.fromarray(cells.astype(np.uint8)).resize(size, Image.NEAREST).save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class CascadeGateTestCase(TestCase):
+    """Tests for the cheap leaf gatekeeper in front of the CNN"""
+
+    def test_heuristics_accept_leaves_and_reject_out_of_scope_images(self):
+        from PIL import ImageFilter
+        from models.gatekeeper import check
+
+        self.assertIsNone(check(make_leaf_jpeg())['reason'])
+        self.assertEqual(check(make_leaf_jpeg(size=(120, 90)))['reason'], 'low_resolution')
+        self.assertEqual(check(make_leaf_jpeg(color=(215, 165, 135)))['reason'], 'not_plant')
+
+        blurred = io.BytesIO()
+        Image.open(io.BytesIO(make_leaf_jpeg())).filter(ImageFilter.GaussianBlur(20)).save(blurred, 'JPEG')
+        self.assertEqual(check(blurred.getvalue())['reason'], 'blurry')
+
+    @mock.patch('diagnosis.views.get_ai_recommendation')
+    @mock.patch('models.model_manager.predict_top_k')
+    def test_rejected_upload_skips_cnn_and_recommendation(self, mock_predict, mock_recommendation):
+        from diagnosis import cascade
+
+        user = get_user_model().objects.create_user(username='farmer', password='secret123')
+        self.client.force_login(user)
+        rejected_before = cascade.get_stats()['rejections'].get('not_plant', 0)
+
+        selfie = SimpleUploadedFile('me.jpg', make_leaf_jpeg(color=(215, 165, 135)), content_type='image/jpeg')
+        response = self.client.post(reverse('diagnosis:test_image'), {'image': selfie})
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.json()['reason'], 'not_plant')
+        mock_predict.assert_not_called()
+        mock_recommendation.assert_not_called()
+        self.assertEqual(PlantImage.objects.get().status, 'failed')
+        stats = cascade.get_stats()
+        self.assertEqual(stats['rejections']['not_plant'], rejected_before + 1)
+        self.assertIn('p95_ms', stats['stages']['gate'])
+
+
+class VectorStoreTestCase(SimpleTestCase):
+    """Tests for the memory-mapped embedding store and its IVF search"""
+
+    def setUp(self):
+        from models.vector_store import VectorStore
+
+        self.path = tempfile.mkdtemp()
+        self.store = VectorStore(self.path, dim=16)
+        self.vectors = np.random.default_rng(0).normal(size=(3000, 16)).astype(np.float32)
+
+    def _append(self, store, start, stop, confirmed=True):
+        ids = list(range(start + 1, stop + 1))
+        return store.append(
+            self.vectors[start:stop], image_ids=ids, user_ids=[i % 7 for i in ids],
+            regions=['toshkent' if i % 2 else 'samarqand' for i in ids],
+            labels=[f'label_{i % 5}' for i in ids], confirmed=[confirmed] * len(ids),
+        )
+
+    def test_append_grows_and_is_visible_to_other_readers(self):
+        from models.vector_store import INITIAL_CAPACITY, VectorStore
+
+        reader = VectorStore(self.path)
+        self.assertEqual(self._append(self.store, 0, 2500), 2500)
+        self.assertEqual(self._append(self.store, 0, 10), 0)
+        self.assertGreater(self.store.header['capacity'], INITIAL_CAPACITY)
+
+        self.assertTrue(reader.refresh())
+        self.assertEqual(len(reader), 2500)
+        hits = reader.search(self.vectors[41], k=3, confirmed_only=False)
+        self.assertEqual(hits[0][0], 42)
+        self.assertAlmostEqual(hits[0][1], 1.0, places=2)
+
+    def test_search_filters_region_owner_and_confirmation(self):
+        self._append(self.store, 0, 100, confirmed=False)
+        self.assertEqual(self.store.search(self.vectors[0], k=5), [])
+
+        self.store.set_confirmed(list(range(1, 101)))
+        hits = self.store.search(self.vectors[0], k=100, region='toshkent', exclude_user=1, exclude_image=1)
+        self.assertTrue(hits)
+        for image_id, _, label in hits:
+            self.assertEqual(image_id % 2, 1)
+            self.assertNotEqual(image_id % 7, 1)
+            self.assertEqual(label, f'label_{image_id % 5}')
+        self.assertEqual(self.store.search(self.vectors[0], region='buxoro'), [])
+
+    def test_ivf_index_finds_exact_neighbours(self):
+        from models.vector_store import VectorStore
+
+        self._append(self.store, 0, 3000)
+        self.assertEqual(self.store.train(nlist=20), 20)
+        reopened = VectorStore(self.path)
+        self.assertEqual(reopened.header['nlist'], 20)
+        for index in (5, 1234, 2999):
+            self.assertEqual(reopened.search(self.vectors[index], k=1, nprobe=4)[0][0], index + 1)
+        np.testing.assert_allclose(
+            reopened.get_vector(1235), self.vectors[1234] / np.linalg.norm(self.vectors[1234]), atol=1e-2
+        )
+
+    def test_chunked_search_matches_brute_force(self):
+        self._append(self.store, 0, 3000)
+        normalized = self.vectors / np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        query = self.vectors[77]
+        expected = np.argsort(normalized @ (query / np.linalg.norm(query)))[::-1][:10] + 1
+
+        with mock.patch('models.vector_store.SEARCH_CHUNK', 256):
+            hits = self.store.search(query, k=10, confirmed_only=False)
+        self.assertEqual([image_id for image_id, _, _ in hits], expected.tolist())
+        self.assertEqual([score for _, score, _ in hits], sorted((score for _, score, _ in hits), reverse=True))
+
+    def test_appended_vectors_are_assigned_and_training_follows_growth(self):
+        from models.vector_store import VectorStore, _assign
+
+        self._append(self.store, 0, 1000)
+        self.assertFalse(self.store.request_training(2000))
+        self.assertEqual(self.store.train_if_requested(), 0)
+        self._append(self.store, 1000, 2000)
+        self.assertTrue(self.store.request_training(2000))
+        self.assertGreater(self.store.train_if_requested(), 0)
+        self.assertEqual(self.store.header['trained_count'], 2000)
+        self.assertFalse(self.store.header['train_requested'])
+
+        self._append(self.store, 2000, 3000)
+        snapshot = VectorStore(self.path)._snapshot
+        np.testing.assert_array_equal(
+            snapshot.rows['list'][2000:3000],
+            _assign(snapshot.vectors[2000:3000].astype(np.float32), snapshot.centroids),
+        )
+        # 3000 < 2 * 2000: not retrained yet
+        self.assertFalse(self.store.request_training(2000))
+
+    def test_append_extends_ivf_lists_without_resorting(self):
+        from models.vector_store import VectorStore, _build_lists
+
+        self._append(self.store, 0, 2000)
+        self.store.train(nlist=20)
+        before = self.store._snapshot
+
+        with mock.patch('models.vector_store._build_lists') as build_lists:
+            self._append(self.store, 2000, 3000)
+        build_lists.assert_not_called()
+
+        after = self.store._snapshot
+        rebuilt = _build_lists(after.rows, 3000, 20)
+        for incremental, full in zip(after.lists, rebuilt):
+            np.testing.assert_array_equal(incremental, full)
+        # The previous snapshot is untouched, so a search that already holds it stays consistent
+        self.assertEqual(sum(len(rows) for rows in before.lists), 2000)
+        self.assertEqual(before.header['count'], 2000)
+        self.assertEqual(self.store.search(self.vectors[2500], k=1, nprobe=4)[0][0], 2501)
+
+        # Another process's reader picks up new rows the same way on refresh
+        reader = VectorStore(self.path)
+        self.store.append(
+            self.vectors[:1] * -1, image_ids=[5000], user_ids=[1], regions=['toshkent'],
+            labels=['label_0'], confirmed=[True],
+        )
+        with mock.patch('models.vector_store._build_lists') as build_lists:
+            self.assertTrue(reader.refresh())
+        build_lists.assert_not_called()
+        self.assertEqual(sum(len(rows) for rows in reader._snapshot.lists), 3001)
+        self.assertEqual(reader.search(-self.vectors[0], k=1, nprobe=4)[0][0], 5000)
+
+
+def fake_embeddings(model_config, batch):
+    """Mean colour as a 3-dimensional embedding"""
+    return batch.mean(axis=(1, 2)) - 0.5
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), EMBEDDING_STORE_ENABLED=True)
+class SimilarCasesTestCase(TestCase):
+    """Tests for nearest-neighbour lookup over past confirmed diagnoses"""
+
+    def setUp(self):
+        from diagnosis import embeddings
+
+        store_dir = tempfile.mkdtemp()
+        patcher = override_settings(EMBEDDING_STORE_DIR=store_dir)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        self.addCleanup(embeddings.reset_stores)
+        embeddings.reset_stores()
+
+        User = get_user_model()
+        self.owner = User.objects.create_user(username='owner', password='secret123', region='toshkent')
+        self.neighbour = User.objects.create_user(username='neighbour', password='secret123', region='toshkent')
+        self.distant = User.objects.create_user(username='distant', password='secret123', region='xorazm')
+
+    def _image(self, user, color, disease_name, confirmed=True):
+        return PlantImage.objects.create(
+            user=user,
+            image=SimpleUploadedFile('leaf.jpg', make_jpeg_bytes((64, 64), color), content_type='image/jpeg'),
+            disease_name=disease_name,
+            confirmed=confirmed,
+            status='completed',
+        )
+
+    @mock.patch('diagnosis.embeddings.embed_images', side_effect=fake_embeddings)
+    def test_returns_confirmed_cases_from_same_region_only(self, mock_embed):
+        from diagnosis import embeddings
+
+        blight = self._image(self.neighbour, (120, 60, 30), 'Tomato___Late_blight')
+        self._image(self.neighbour, (40, 160, 40), 'Tomato___healthy')
+        self._image(self.neighbour, (118, 62, 32), 'Tomato___Early_blight', confirmed=False)
+        self._image(self.distant, (121, 60, 30), 'Tomato___Septoria_leaf_spot')
+        self._image(self.owner, (120, 61, 30), 'Tomato___Leaf_Mold')
+        self.assertEqual(embeddings.index_images(PlantImage.objects.select_related('user')), 5)
+
+        query = self._image(self.owner, (119, 60, 31), 'Tomato___Late_blight', confirmed=False)
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('api_similar_cases', args=[query.pk]), {'k': 3})
+
+        self.assertEqual(response.status_code, 200)
+        cases = response.json()['data']
+        self.assertEqual(cases[0]['image_id'], blight.pk)
+        self.assertEqual(cases[0]['disease'], 'Tomato___Late_blight')
+        self.assertEqual([case['disease'] for case in cases], ['Tomato___Late_blight', 'Tomato___healthy'])
+        # The query image was embedded once and added to the store for later lookups
+        self.assertEqual(mock_embed.call_count, 2)
+        self.assertEqual(len(embeddings.get_store(embeddings.model_config_for('disease', 'all'))), 6)
+
+    @override_settings(EMBEDDING_IVF_MIN_VECTORS=3)
+    @mock.patch('diagnosis.embeddings.embed_images', side_effect=fake_embeddings)
+    def test_indexing_requests_ivf_training_for_the_worker(self, mock_embed):
+        from diagnosis import embeddings
+
+        self._image(self.neighbour, (120, 60, 30), 'Tomato___Late_blight')
+        self._image(self.neighbour, (40, 160, 40), 'Tomato___healthy')
+        embeddings.index_images(PlantImage.objects.select_related('user'))
+        store = embeddings.get_store(embeddings.model_config_for('disease', 'all'))
+        self.assertEqual(store.header['nlist'], 0)
+
+        self._image(self.neighbour, (60, 60, 160), 'Tomato___Leaf_Mold')
+        with mock.patch('models.vector_store.VectorStore._train') as train:
+            embeddings.index_images(PlantImage.objects.select_related('user'))
+        # The web path only flags the store; k-means runs in the diagnosis worker
+        train.assert_not_called()
+        self.assertTrue(store.header['train_requested'])
+        self.assertEqual(store.header['nlist'], 0)
+
+        trained = embeddings.train_requested_stores()
+        self.assertEqual(list(trained), [os.path.basename(store.path)])
+        store.refresh()
+        self.assertGreater(store.header['nlist'], 0)
+        self.assertEqual(store.header['trained_count'], 3)
+        self.assertEqual(embeddings.train_requested_stores(), {})
+
+    @mock.patch('diagnosis.embeddings.embed_images', side_effect=fake_embeddings)
+    def test_admin_confirmation_updates_store(self, mock_embed):
+        from diagnosis import embeddings
+
+        image = self._image(self.neighbour, (120, 60, 30), 'Tomato___Late_blight', confirmed=False)
+        embeddings.index_images([image])
+        query = self._image(self.owner, (120, 60, 30), 'Tomato___Late_blight')
+        self.assertEqual(embeddings.similar_cases(query), [])
+
+        admin = get_user_model().objects.create_superuser(username='admin', password='secret123')
+        self.client.force_login(admin)
+        self.client.post(reverse('admin:diagnosis_plantimage_changelist'), {
+            'action': 'confirm_diagnoses', '_selected_action': [image.pk],
+        })
+        self.assertTrue(PlantImage.objects.get(pk=image.pk).confirmed)
+        self.assertEqual([case['image_id'] for case in embeddings.similar_cases(query)], [image.pk])
+
+    def test_other_users_images_are_not_found(self):
+        image = self._image(self.neighbour, (120, 60, 30), 'Tomato___Late_blight')
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('api_similar_cases', args=[image.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+def recompress(image_bytes, scale=0.8, quality=40):
+    """Re-encode a JPEG the way messengers do: downscaled and heavily compressed"""
+    img = Image.open(io.BytesIO(image_bytes))
+    buffer = io.BytesIO()
+    img.resize((int(img.width * scale), int(img.height * scale))).save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class NearDuplicateTestCase(TestCase):
+    """Tests for perceptual-hash near-duplicate detection"""
+
+    def setUp(self):
+        prediction_cache.get_cache().clear()
+        prediction_cache.reset_generation()
+
+    def test_phash_survives_recompression_and_bk_tree_matches_brute_force(self):
+        from models.image_hash import BKTree, cluster, hamming, phash
+
+        leaf = make_leaf_jpeg(seed=1)
+        self.assertLessEqual(hamming(phash(leaf), phash(recompress(leaf))), 8)
+        self.assertGreater(hamming(phash(leaf), phash(make_leaf_jpeg(seed=2))), 16)
+
+        rng = np.random.default_rng(0)
+        hashes = [int(value) for value in rng.integers(0, 2 ** 63, size=500)]
+        hashes += [hashes[0] ^ 0b101, hashes[1] ^ (1 << 40)]
+        tree = BKTree((value, index) for index, value in enumerate(hashes))
+        for query in hashes[:20]:
+            expected = sorted(i for i, value in enumerate(hashes) if hamming(query, value) <= 3)
+            self.assertEqual(sorted(item for _, _, item in tree.search(query, 3)), expected)
+        self.assertEqual(sorted(map(sorted, cluster(hashes, 3))), [[0, 500], [1, 501]])
+
+    @mock.patch('diagnosis.views.get_ai_recommendation', return_value='<p>Tavsiya</p>')
+    @mock.patch('models.model_manager.predict_top_k', return_value=TOMATO_TOP_K)
+    def test_reupload_by_same_user_reuses_earlier_result(self, mock_predict, mock_recommendation):
+        User = get_user_model()
+        farmer = User.objects.create_user(username='farmer', password='secret123')
+        leaf = make_leaf_jpeg(seed=3)
+
+        self.client.force_login(farmer)
+        first = self.client.post(reverse('diagnosis:test_image'), {
+            'image': SimpleUploadedFile('leaf.jpg', leaf, content_type='image/jpeg'),
+        })
+        second = self.client.post(reverse('diagnosis:test_image'), {
+            'image': SimpleUploadedFile('leaf_tg.jpg', recompress(leaf), content_type='image/jpeg'),
+        })
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(mock_predict.call_count, 1)
+        original, reupload = PlantImage.objects.order_by('pk')
+        self.assertEqual(second.json()['duplicate_of'], original.pk)
+        self.assertEqual(reupload.disease_name, 'Tomato___Late_blight')
+        self.assertEqual(reupload.duplicate_of, original)
+        self.assertTrue(original.phash)
+
+        # Another user's identical-looking upload is diagnosed independently
+        self.client.force_login(User.objects.create_user(username='neighbour', password='secret123'))
+        self.client.post(reverse('diagnosis:test_image'), {
+            'image': SimpleUploadedFile('leaf.jpg', recompress(leaf, scale=0.9), content_type='image/jpeg'),
+        })
+        self.assertEqual(mock_predict.call_count, 2)
+
+        from diagnosis.duplicates import find_clusters
+        clusters = find_clusters()
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual((clusters[0]['size'], clusters[0]['users']), (3, 2))
+
+        self.client.force_login(User.objects.create_superuser(username='admin', password='secret123'))
+        response = self.client.get(reverse('admin:diagnosis_plantimage_duplicates'))
+        self.assertContains(response, 'Tomato___Late_blight')
+
+    def test_concurrent_uploads_in_one_scope_are_all_remembered(self):
+        from diagnosis import duplicates
+        from models.image_hash import to_hex
+
+        hashes = [to_hex(1 << bit) if bit else to_hex(0xFFFF_FFFF_FFFF_FFFF) for bit in range(0, 60, 3)]
+        cache_backend = prediction_cache.get_cache()
+        racing_cache = mock.Mock(wraps=cache_backend)
+        # Every upload reads before any of them writes: a read-append-set keeps only one entry
+        read_barrier = threading.Barrier(len(hashes))
+
+        def racing_get(*args, **kwargs):
+            value = cache_backend.get(*args, **kwargs)
+            read_barrier.wait(timeout=5)
+            return value
+
+        racing_cache.get.side_effect = racing_get
+
+        def upload(index):
+            duplicates.remember('chat:7', hashes[index], 'disease', 'all', TOMATO_TOP_K[0] + (TOMATO_TOP_K,), index)
+
+        with mock.patch('diagnosis.prediction_cache.get_cache', return_value=racing_cache):
+            threads = [threading.Thread(target=upload, args=(i,)) for i in range(len(hashes))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        with override_settings(DUPLICATE_MAX_DISTANCE=0):
+            found = [duplicates.lookup('chat:7', value, 'disease', 'all') for value in hashes]
+        self.assertEqual([match['image_id'] for match in found], list(range(len(hashes))))
+
+    def test_scope_keeps_only_the_most_recent_uploads(self):
+        from diagnosis import duplicates
+        from models.image_hash import to_hex
+
+        for index in range(duplicates.MAX_RECENT + 5):
+            duplicates.remember('chat:8', to_hex(index), 'disease', 'all', TOMATO_TOP_K[0] + (TOMATO_TOP_K,), index)
+
+        key = duplicates._cache_key('chat:8', 'disease', 'all')
+        self.assertEqual(
+            sorted(entry[3] for entry in duplicates._recent(key)), list(range(5, duplicates.MAX_RECENT + 5))
+        )
+
+
+SESSION_LABELS = ['Tomato___Early_blight', 'Tomato___Late_blight', 'Tomato___healthy']
+
+
+def fake_session_probabilities(batch, detection_type, plant_type, batch_size=16):
+    rows = [[0.05, 0.9, 0.05], [0.05, 0.9, 0.05], [0.7, 0.25, 0.05]]
+    return np.array(rows[:len(batch)], dtype=np.float32), SESSION_LABELS
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class SessionDiagnosisTestCase(TestCase):
+    """Tests for multi-photo diagnosis sessions"""
+
+    def test_aggregate_averages_probabilities_and_reports_agreement(self):
+        from diagnosis.sessions import aggregate
+
+        probabilities, labels = fake_session_probabilities(range(3), 'disease', 'all')
+        result = aggregate(probabilities, labels)
+
+        self.assertEqual(result['disease'], 'Tomato___Late_blight')
+        self.assertAlmostEqual(result['confidence'], 0.6833, places=4)
+        self.assertAlmostEqual(result['agreement'], 0.6667)
+        self.assertEqual(result['votes'], {'Tomato___Late_blight': 2, 'Tomato___Early_blight': 1})
+        self.assertEqual(result['top_k'][0][0], 'Tomato___Late_blight')
+
+    @mock.patch('diagnosis.views.get_ai_recommendation', return_value='<p>Tavsiya</p>')
+    @mock.patch('models.model_manager.predict_probabilities_batch', side_effect=fake_session_probabilities)
+    def test_session_runs_one_batch_and_one_recommendation(self, mock_predict, mock_recommendation):
+        from diagnosis.models import DiagnosisSession
+
+        farmer = get_user_model().objects.create_user(username='farmer', password='secret123')
+        self.client.force_login(farmer)
+        response = self.client.post(reverse('api_predict_session'), {
+            'images': [
+                SimpleUploadedFile(f'leaf_{i}.jpg', make_leaf_jpeg(seed=10 + i), content_type='image/jpeg')
+                for i in range(3)
+            ],
+        })
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['disease'], 'Tomato___Late_blight')
+        self.assertAlmostEqual(data['agreement'], 0.6667)
+        self.assertEqual(len(data['images']), 3)
+        self.assertEqual(mock_predict.call_count, 1)
+        self.assertEqual(len(mock_predict.call_args[0][0]), 3)
+        mock_recommendation.assert_called_once_with('Tomato___Late_blight', lang='uz')
+
+        session = DiagnosisSession.objects.get(pk=data['session_id'])
+        self.assertEqual(session.user, farmer)
+        self.assertEqual(session.image_count, 3)
+        self.assertEqual(
+            sorted(session.images.values_list('disease_name', flat=True)),
+            ['Tomato___Early_blight', 'Tomato___Late_blight', 'Tomato___Late_blight'],
+        )
+
+    @mock.patch('diagnosis.views.get_ai_recommendation')
+    @mock.patch(
+        'models.model_manager.predict_probabilities_batch',
+        side_effect=lambda batch, *args, **kwargs: (np.tile([0.45, 0.4, 0.15], (len(batch), 1)), SESSION_LABELS),
+    )
+    def test_low_confidence_aggregate_is_not_reported_as_a_diagnosis(self, mock_predict, mock_recommendation):
+        from diagnosis.model_loader import LOW_CONFIDENCE_LABEL
+        from diagnosis.models import DiagnosisSession
+
+        self.client.force_login(get_user_model().objects.create_user(username='farmer', password='secret123'))
+        response = self.client.post(reverse('api_predict_session'), {
+            'images': [
+                SimpleUploadedFile(f'leaf_{i}.jpg', make_leaf_jpeg(seed=20 + i), content_type='image/jpeg')
+                for i in range(2)
+            ],
+        })
+
+        data = response.json()
+        self.assertFalse(data['confident'])
+        self.assertEqual(data['disease'], LOW_CONFIDENCE_LABEL)
+        self.assertFalse(any(image['confident'] for image in data['images']))
+        mock_recommendation.assert_not_called()
+        session = DiagnosisSession.objects.get(pk=data['session_id'])
+        self.assertIsNone(session.disease)
+        self.assertFalse(session.images.filter(disease__isnull=False).exists())
+
+    def test_telegram_album_is_saved_under_the_sender(self):
+        import asyncio
+        import bot.telegram_bot as telegram_bot
+
+        def run_inline(fn):
+            async def wrapper(*args, **kwargs):
+                return fn(*args, **kwargs)
+            return wrapper
+
+        update = mock.Mock()
+        update.effective_user.id, update.effective_user.first_name = 4242, 'Dehqon'
+        update.message.reply_text = mock.AsyncMock()
+        farmer = telegram_bot.resolve_user(update.effective_user)
+        self.assertEqual(farmer.username, 'tg_4242')
+        self.assertFalse(farmer.has_usable_password())
+        self.assertEqual(telegram_bot.resolve_user(update.effective_user), farmer)
+
+        context = mock.Mock()
+        context.bot.get_file = mock.AsyncMock(return_value=mock.Mock(
+            download_as_bytearray=mock.AsyncMock(return_value=bytearray(make_leaf_jpeg()))
+        ))
+        result = {
+            'confident': True, 'disease': 'Tomato___Late_blight', 'confidence': 68.3, 'agreement': 1.0,
+            'image_count': 2, 'recommendation': 'Tavsiya', 'images': [{'error': False}, {'error': False}],
+        }
+        telegram_bot._albums['album-1'] = [mock.Mock(file_id=f'photo{i}') for i in range(2)]
+        # DB work is covered above; the handler itself only has to pass the sender along
+        with mock.patch.object(telegram_bot, 'sync_to_async', run_inline), \
+                mock.patch.object(telegram_bot, 'ALBUM_WAIT_SECONDS', 0), \
+                mock.patch.object(telegram_bot, 'resolve_user', return_value=farmer), \
+                mock.patch.object(telegram_bot, 'diagnose_session', return_value=result) as mock_session:
+            asyncio.run(telegram_bot.handle_album('album-1', update, context))
+            result['confident'] = False
+            telegram_bot._albums['album-2'] = [mock.Mock(file_id='photo3')]
+            asyncio.run(telegram_bot.handle_album('album-2', update, context))
+
+        self.assertEqual(mock_session.call_args_list[0].kwargs['user'], farmer)
+        self.assertEqual(len(mock_session.call_args_list[0].args[0]), 2)
+        replies = [call.args[0] for call in update.message.reply_text.call_args_list]
+        self.assertIn('Tomato___Late_blight', replies[1])
+        self.assertIn('Kasallik aniqlanmadi', replies[-1])
+
+    def test_single_image_is_rejected(self):
+        response = self.client.post(reverse('api_predict_session'), {
+            'images': [SimpleUploadedFile('leaf.jpg', make_leaf_jpeg(), content_type='image/jpeg')],
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.json()['error'])
+
+
+class InferencePipelineTestCase(SimpleTestCase):
+    """Tests for the staged decode -> infer pipeline"""
+
+    def test_submit_decodes_in_pool_and_batches_inference(self):
+        from models.pipeline import InferencePipeline
+
+        batcher = MicroBatcher(lambda key, batch: batch[:, 0, 0, :1].copy(), window_ms=50, max_batch_size=4)
+        pipeline = InferencePipeline(batcher, decode_workers=2, queue_size=4)
+        futures = [pipeline.submit_async('disease_all', make_jpeg_bytes(color=(v, v, v))) for v in (0, 255)]
+        broken = pipeline.submit_async('disease_all', b'not an image')
+
+        tensor, probabilities = futures[1].result(timeout=5)
+        self.assertEqual(tensor.shape, (1, 224, 224, 3))
+        self.assertAlmostEqual(float(probabilities[0]), 1.0, places=2)
+        self.assertAlmostEqual(float(futures[0].result(timeout=5)[1][0]), 0.0, places=2)
+        with self.assertRaises(Exception):
+            broken.result(timeout=5)
+
+        metrics = pipeline.get_metrics()
+        self.assertEqual((metrics['decode']['items'], metrics['decode']['failed']), (3, 1))
+        self.assertEqual(metrics['infer']['batcher']['items'], 2)
+        self.assertGreater(metrics['decode']['utilisation'], 0)
+        self.assertGreater(metrics['infer']['batcher']['busy_seconds'], 0)
+        self.assertEqual(metrics['infer']['bulk']['items'], 0)
+        pipeline.close()
+
+    def test_full_queues_push_back_on_callers(self):
+        from models.pipeline import InferencePipeline
+
+        gate = threading.Event()
+
+        def slow_predict(model_key, batch):
+            gate.wait(5)
+            return batch[:, 0, 0, :1].copy()
+
+        batcher = MicroBatcher(slow_predict, window_ms=1, max_batch_size=1, max_queue_size=1)
+        pipeline = InferencePipeline(
+            batcher, decode_workers=1, queue_size=1, preprocess_fn=lambda v: np.full((1, 2, 2, 3), v, np.float32)
+        )
+        futures = []
+        submitter = threading.Thread(
+            target=lambda: futures.extend(pipeline.submit_async('disease_all', v) for v in range(5))
+        )
+        submitter.start()
+        submitter.join(timeout=0.3)
+        self.assertTrue(submitter.is_alive())
+
+        gate.set()
+        submitter.join(timeout=5)
+        self.assertEqual([float(f.result(timeout=5)[1][0]) for f in futures], [0.0, 1.0, 2.0, 3.0, 4.0])
+        metrics = pipeline.get_metrics()
+        self.assertGreater(metrics['submit_blocked_seconds'], 0)
+        self.assertGreater(metrics['decode']['blocked_seconds'], 0)
+        pipeline.close()
+
+    def test_map_batches_decodes_next_chunk_during_inference(self):
+        from models.pipeline import InferencePipeline
+
+        next_chunk_decoding = threading.Event()
+
+        def preprocess(value):
+            if value == 'bad':
+                raise ValueError('broken image')
+            if value >= 2:
+                next_chunk_decoding.set()
+            return np.full((1, 2, 2, 3), value, np.float32)
+
+        overlapped = []
+
+        def infer(batch):
+            overlapped.append(next_chunk_decoding.wait(5))
+            return batch[:, 0, 0, 0] * 10
+
+        pipeline = InferencePipeline(decode_workers=2, queue_size=2, preprocess_fn=preprocess)
+        chunks = list(pipeline.map_batches([0, 1, 2, 'bad', 4], infer, batch_size=2))
+
+        self.assertTrue(overlapped[0])
+        self.assertEqual([indices for indices, _, _ in chunks], [[0, 1], [2], [4]])
+        self.assertEqual([list(outputs) for _, outputs, _ in chunks], [[0.0, 10.0], [20.0], [40.0]])
+        self.assertIsInstance(chunks[1][2][3], ValueError)
+        metrics = pipeline.get_metrics()
+        self.assertEqual(metrics['infer']['bulk']['items'], 4)
+        self.assertIsNone(metrics['infer']['batcher'])
+        self.assertLessEqual(metrics['infer']['bulk']['utilisation'], 1.0)
+        pipeline.close()
+
+    def test_concurrent_bulk_callers_do_not_overstate_utilisation(self):
+        from models.pipeline import InferencePipeline
+
+        def infer(batch):
+            time.sleep(0.1)
+            return batch[:, 0, 0, 0]
+
+        pipeline = InferencePipeline(
+            decode_workers=2, preprocess_fn=lambda v: np.full((1, 2, 2, 3), v, np.float32)
+        )
+        callers = [
+            threading.Thread(target=lambda: list(pipeline.map_batches(range(4), infer, batch_size=2)))
+            for _ in range(3)
+        ]
+        for caller in callers:
+            caller.start()
+        for caller in callers:
+            caller.join()
+
+        bulk = pipeline.get_metrics()['infer']['bulk']
+        self.assertEqual(bulk['items'], 12)
+        self.assertLessEqual(bulk['utilisation'], 1.0)
+        pipeline.close()
+
+
+class InferenceMetricsTestCase(TestCase):
+    """Tests for the staff inference metrics endpoint"""
+
+    def test_metrics_do_not_start_inference_threads(self):
+        import models.model_manager as manager_module
+        from diagnosis import shadow
+
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'secret123'))
+        with mock.patch.object(manager_module, '_batcher', None), \
+                mock.patch.object(manager_module, '_pipeline', None), \
+                mock.patch.object(shadow, '_evaluator', None), \
+                override_settings(INFERENCE_SHADOW_SAMPLE_RATE=1.0):
+            response = self.client.get(reverse('diagnosis:inference_metrics'))
+            self.assertIsNone(manager_module._batcher)
+            self.assertIsNone(manager_module._pipeline)
+            self.assertIsNone(shadow._evaluator)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()['batching'])
+        self.assertIsNone(response.json()['pipeline'])
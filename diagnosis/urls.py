@@ -20,6 +20,8 @@ def chat_view(request):
 urlpatterns = [
     path('', views.test_image, name='test_image'),  # Default diagnosis page
     path('test/', views.test_image, name='test_image'),
+    path('session/', views.session_diagnosis, name='session_diagnosis'),
+    path('jobs/<int:pk>/', views.job_status, name='job_status'),
     path('api/', include(router.urls)),
     path('chat-ai/', chat_ai, name='chat_ai'),
     path('chat/', chat_view, name='chat'),
@@ -28,4 +30,6 @@ urlpatterns = [
     path('diseases/<int:pk>/', disease_detail, name='disease_detail'),
     # Analytics
     path('analytics/', analytics_dashboard, name='analytics_dashboard'),
+    # Inference engine metrics (staff)
+    path('inference/metrics/', views.inference_metrics, name='inference_metrics'),
 ]
@@ -5,17 +5,8 @@ from .serializers import DiseaseSerializer, PlantImageSerializer, Recommendation
 from .forms import PlantImageForm
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-import numpy as np
-from PIL import Image
-import json
 import os
 from django.conf import settings
-import sys
-
-# Add models directory to path
-models_path = os.path.join(settings.BASE_DIR, 'models')
-if models_path not in sys.path:
-    sys.path.insert(0, models_path)
 
 # Try to import AI utils, fallback to simple version
 try:
@@ -23,213 +14,38 @@ try:
 except ImportError:
     from .ai_utils_simple import get_ai_recommendation
 
-# Import the new model manager
-try:
-    from models.model_manager import model_manager, predict_with_manager
-    MODEL_MANAGER_AVAILABLE = True
-    print("✅ Model manager imported successfully")
-except ImportError as e:
-    MODEL_MANAGER_AVAILABLE = False
-    print(f"❌ Model manager import failed: {e}")
+from .model_loader import predict_detailed, is_server_mode
+from models.gatekeeper import ImageRejected
 
-# Import the new model loader
-try:
-    from .model_loader import predict_plant_disease
-    MODEL_LOADER_AVAILABLE = True
-    print("✅ Model loader imported successfully - ready for TensorFlow 2.19")
-except ImportError as e:
-    MODEL_LOADER_AVAILABLE = False
-    print(f"❌ Model loader import failed: {e}")
-
-# Legacy model loading code (kept as fallback)
-import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'  # Reduce TensorFlow logging
 
-# Initialize model and class indices
-MODEL_PATH = os.path.join(settings.BASE_DIR, 'models', 'plant_disease_model.h5')
-CLASS_INDICES_PATH = os.path.join(settings.BASE_DIR, 'models', 'class_indices.json')
 
-model = None
-class_indices = {}
+def predict_image(image_path, detection_type='disease', plant_type='all'):
+    """
+    Predict plant disease from image using the shared inference engine
 
-def load_model_and_indices():
-    """Load TensorFlow model and class indices"""
-    global model, class_indices
-    print("🚀 Starting model and indices loading...")
+    Returns:
+        tuple: (predicted_class, confidence, top_k) - top_k [(class_name, probability), ...]
+    """
     try:
-        # Import TensorFlow 2.19
-        import tensorflow as tf
-        from tensorflow.keras.models import load_model
-        print(f"✅ TensorFlow {tf.__version__} imported successfully")
-        
-        # Load class indices first
-        if os.path.exists(CLASS_INDICES_PATH):
-            with open(CLASS_INDICES_PATH, 'r') as f:
-                class_indices = json.load(f)
-                print(f"✅ Loaded {len(class_indices)} classes from JSON")
-        else:
-            print(f"❌ Class indices file not found: {CLASS_INDICES_PATH}")
-            return False
-            
-        # Load model with TensorFlow 2.19 compatibility
-        if os.path.exists(MODEL_PATH):
-            print(f"Loading model from: {MODEL_PATH}")
-            try:
-                # Load model with safe mode disabled for compatibility
-                model = load_model(MODEL_PATH, compile=False, safe_mode=False)
-                
-                # Compile the model for TensorFlow 2.19
-                model.compile(
-                    optimizer='adam',
-                    loss='sparse_categorical_crossentropy',
-                    metrics=['accuracy']
-                )
-                print(f"✅ Model loaded successfully with TensorFlow {tf.__version__}")
-                print(f"📊 Model input shape: {model.input_shape}")
-                print(f"📊 Model output shape: {model.output_shape}")
-                return True
-                
-            except Exception as model_error:
-                print(f"❌ Failed to load model: {model_error}")
-                print("🔄 Trying alternative loading method...")
-                
-                try:
-                    # Alternative method - load without safe_mode restrictions
-                    import tensorflow.keras.utils as utils
-                    model = tf.keras.models.load_model(
-                        MODEL_PATH, 
-                        custom_objects=None,
-                        compile=False
-                    )
-                    model.compile(
-                        optimizer='adam',
-                        loss='sparse_categorical_crossentropy',
-                        metrics=['accuracy']
-                    )
-                    print(f"✅ Model loaded with alternative method")
-                    return True
-                except Exception as alt_error:
-                    print(f"❌ Alternative loading also failed: {alt_error}")
-                    return False
-        else:
-            print(f"❌ Model file not found: {MODEL_PATH}")
-            return False
-            
+        predicted_class, confidence, top_k = predict_detailed(
+            image_path,
+            detection_type=detection_type,
+            plant_type=plant_type
+        )
+        print(f"🎯 Model Manager Prediction: {predicted_class} with confidence: {confidence:.4f}")
+        return predicted_class, confidence, top_k
+    except ImageRejected:
+        # Filtr rad etgan rasm - chaqiruvchi foydalanuvchiga sababini ko'rsatadi
+        raise
     except ImportError as e:
-        print(f"❌ TensorFlow import error: {e}")
-        return False
-    except Exception as e:
-        print(f"❌ Error loading model and indices: {e}")
-        return False
-
-# Load model on startup - TensorFlow 2.19 compatible
-print("🚀 Initializing PlantCare AI Model with TensorFlow 2.19...")
-load_success = load_model_and_indices()
-if load_success:
-    print("🎉 TensorFlow 2.19 Model initialization completed successfully!")
-else:
-    print("⚠️ Model initialization failed. Using fallback mode.")
-
-def predict_image(image_path, detection_type='disease', plant_type='all'):
-    """Predict plant disease from image using model manager or fallback methods"""
-    
-    # First try the new model manager if available
-    if MODEL_MANAGER_AVAILABLE:
-        try:
-            predicted_class, confidence = predict_with_manager(
-                image_path,
-                detection_type=detection_type,
-                plant_type=plant_type
-            )
-            print(f"🎯 Model Manager Prediction: {predicted_class} with confidence: {confidence:.4f}")
-            return predicted_class, confidence
-        except Exception as manager_error:
-            print(f"❌ Model manager failed: {manager_error}")
-            # Fall through to other methods
-    
-    # Use the new model loader if available
-    if MODEL_LOADER_AVAILABLE:
-        try:
-            predicted_class, confidence = predict_plant_disease(image_path)
-            print(f"🎯 New Model Loader Prediction: {predicted_class} with confidence: {confidence:.4f}")
-            return predicted_class, confidence
-        except Exception as loader_error:
-            print(f"❌ New model loader failed: {loader_error}")
-            # Fall through to legacy methods
-    
-    # Legacy fallback methods
-    global model, class_indices
-    
-    # Try to load model if not already loaded
-    if model is None:
-        if not load_model_and_indices():
-            # Fallback to using models/predic.py directly
-            try:
-                import sys
-                import os
-                models_path = os.path.join(settings.BASE_DIR, 'models')
-                sys.path.append(models_path)
-                
-                # Change to models directory for relative paths
-                original_cwd = os.getcwd()
-                os.chdir(models_path)
-                
-                # Import the prediction function
-                from predic import predict_plant_disease as legacy_predict
-                
-                # Make prediction
-                predicted_class, confidence = legacy_predict(image_path)
-                
-                # Restore original directory
-                os.chdir(original_cwd)
-                
-                print(f"🎯 Legacy fallback prediction: {predicted_class} with confidence: {confidence:.4f}")
-                return predicted_class, confidence
-                
-            except Exception as fallback_error:
-                print(f"❌ Legacy fallback prediction failed: {fallback_error}")
-                return "Model yuklanmadi", 0.0
-    
-    if not class_indices:
-        return "Class indices yuklanmadi", 0.0
-    
-    try:
-        # Import required libraries for TensorFlow 2.19
-        import tensorflow as tf
-        from PIL import Image
-        import numpy as np
-        
-        print(f"🔍 Processing image: {image_path}")
-        
-        # Load and preprocess image for TensorFlow 2.19
-        img = Image.open(image_path).convert('RGB')
-        img = img.resize((224, 224))
-        
-        # Convert to numpy array and normalize
-        img_array = np.array(img, dtype=np.float32) / 255.0
-        img_array = np.expand_dims(img_array, axis=0)
-        
-        print(f"📊 Input shape: {img_array.shape}")
-        
-        # Make prediction using TensorFlow 2.19
-        predictions = model.predict(img_array, verbose=0)
-        pred_idx = np.argmax(predictions[0])
-        confidence = float(predictions[0][pred_idx])
-        
-        # Convert index to class name
-        idx_to_class = {v: k for k, v in class_indices.items()}
-        predicted_class = idx_to_class.get(pred_idx, "Unknown")
-        
-        print(f"🎯 TensorFlow 2.19 Prediction: {predicted_class} with confidence: {confidence:.4f}")
-        print(f"📊 Prediction index: {pred_idx}")
-        
-        return predicted_class, confidence
-        
+        print(f"❌ Model manager import failed: {e}")
+        return "Model yuklanmadi", 0.0, []
     except Exception as e:
-        print(f"❌ Error in TensorFlow 2.19 prediction: {e}")
+        print(f"❌ Model manager failed: {e}")
         import traceback
         traceback.print_exc()
-        return f"Bashorat xatolik: {str(e)}", 0.0
+        return f"Bashorat xatolik: {str(e)}", 0.0, []
 
 # Create your views here.
 
@@ -252,7 +68,10 @@ from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.translation import gettext as _
 from django.contrib.auth.decorators import login_required
-from django.shortcuts import render
+from django.contrib.admin.views.decorators import staff_member_required
+from django.shortcuts import render, get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
 from .forms import PlantImageForm  # Assuming this is your form
 from .models import Disease  # Assuming this is your model
 from .ai_utils import get_ai_recommendation  # Assuming these are your utility functions
@@ -265,55 +84,63 @@ def test_image(request):
         if form.is_valid():
             plant_image = form.save(commit=False)
             plant_image.user = request.user
-            plant_image.status = 'processing'
-            plant_image.save()
 
-            try:
-                # Get detection and plant types from form
-                detection_type = request.POST.get('detection_type', 'disease')
-                plant_type = request.POST.get('plant_type', 'all')
-                
-                print(f"🔍 Detection Type: {detection_type}, Plant Type: {plant_type}")
-                
-                # Use model manager with parameters
-                label, confidence = predict_image(
-                    plant_image.image.path,
-                    detection_type=detection_type,
-                    plant_type=plant_type
-                )
-                
-                disease, _ = Disease.objects.get_or_create(
-                    name=label,
-                    defaults={
-                        'description': f'{label} kasalligi aniqlandi',
-                        'symptoms': 'Belgilar aniqlanmoqda...',
-                        'treatment': 'Davolash usullari tayyorlanmoqda...'
-                    }
-                )
+            # Get detection and plant types from form
+            detection_type = request.POST.get('detection_type', 'disease')
+            plant_type = request.POST.get('plant_type', 'all')
+            current_lang = request.session.get('django_language', 'uz')
+            
+            print(f"🔍 Detection Type: {detection_type}, Plant Type: {plant_type}")
 
-                current_lang = request.session.get('django_language', 'uz')
-                ai_tavsiya = get_ai_recommendation(label, lang=current_lang)
+            from . import jobs
+            from .streaming import diagnosis_events, sse_response, wants_stream
 
-                plant_image.disease = disease
-                plant_image.disease_name = label
-                plant_image.confidence = confidence
-                plant_image.accuracy = confidence * 100
-                plant_image.ai_result = ai_tavsiya
-                plant_image.status = 'completed'
+            if wants_stream(request):
+                # Oqimli javob: CNN natijasi darhol, Gemini tavsiyasi kelishi bilan.
+                # claimed_at - jarayon o'lsa requeue_stale_jobs yozuvni topadi
+                plant_image.status = 'processing'
+                plant_image.claimed_at = timezone.now()
+                plant_image.detection_type = detection_type
+                plant_image.plant_type_code = plant_type
+                plant_image.language = current_lang
                 plant_image.save()
+                try:
+                    jobs.predict_diagnosis(plant_image)
+                except ImageRejected as e:
+                    jobs.reject_diagnosis(plant_image, e)
+                    return JsonResponse(jobs.build_rejection(e), status=422)
+                except Exception as e:
+                    jobs.fail_diagnosis(plant_image, e)
+                    return JsonResponse({'success': False, 'error': str(e)}, status=500)
+                return sse_response(diagnosis_events(
+                    jobs.build_prediction(plant_image),
+                    current_lang,
+                    on_complete=lambda html: jobs.complete_diagnosis(plant_image, html),
+                    on_abort=lambda error: jobs.abort_streamed_diagnosis(plant_image, error),
+                ))
 
+            if settings.DIAGNOSIS_ASYNC or request.POST.get('async') in ('1', 'true'):
+                # Fon rejimi: faqat rasmni saqlab, job id qaytarish
+                jobs.enqueue_diagnosis(plant_image, detection_type, plant_type, current_lang)
                 return JsonResponse({
                     'success': True,
-                    'disease': label,
-                    'confidence': round(confidence * 100, 2),
-                    'description': disease.description,
-                    'recommendations': ai_tavsiya,
-                    'image_url': plant_image.image.url,
-                })
+                    'job_id': plant_image.pk,
+                    'status': plant_image.status,
+                    'status_url': reverse('diagnosis:job_status', args=[plant_image.pk]),
+                }, status=202)
+
+            plant_image.status = 'processing'
+            plant_image.detection_type = detection_type
+            plant_image.plant_type_code = plant_type
+            plant_image.language = current_lang
+            plant_image.save()
+
+            try:
+                jobs.run_diagnosis(plant_image)
+                return JsonResponse(jobs.build_result(plant_image))
+            except ImageRejected as e:
+                return JsonResponse(jobs.build_rejection(e), status=422)
             except Exception as e:
-                plant_image.status = 'failed'
-                plant_image.ai_result = f"Xatolik yuz berdi: {str(e)}"
-                plant_image.save()
                 return JsonResponse({'success': False, 'error': str(e)}, status=500)
         else:
             return JsonResponse({'success': False, 'error': _('Formada xatolik bor')}, status=400)
@@ -329,4 +156,105 @@ def test_image(request):
             'plant_types': plant_types,
         }
         
-        return render(request, 'diagnosis/test_image.html', context)
\ No newline at end of file
+        return render(request, 'diagnosis/test_image.html', context)
+
+
+@login_required
+@csrf_exempt
+def session_diagnosis(request):
+    """Bitta o'simlikning bir nechta rasmi (``images``) bo'yicha umumiy tashxis"""
+    from .sessions import SessionUploadError, collect_session_images, diagnose_session
+    
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'POST kerak'}, status=405)
+    try:
+        items = collect_session_images(request.FILES)
+    except SessionUploadError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    
+    try:
+        data = diagnose_session(
+            items,
+            detection_type=request.POST.get('detection_type') or 'disease',
+            plant_type=request.POST.get('plant_type') or 'all',
+            lang=request.session.get('django_language', 'uz'),
+            user=request.user,
+        )
+    except ImageRejected as e:
+        from .jobs import build_rejection
+        return JsonResponse(build_rejection(e), status=422)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+    
+    # Natija sahifasi bitta rasm tashxisi bilan bir xil maydonlarni kutadi
+    from .models import DiagnosisSession
+    session = DiagnosisSession.objects.select_related('disease').get(pk=data['session_id'])
+    first_image = session.images.filter(status='completed').order_by('pk').first()
+    return JsonResponse(dict(
+        data,
+        success=True,
+        description=session.disease.description if session.disease else '',
+        image_url=first_image.image.url if first_image else '',
+        recommendations=data['recommendation'],
+    ))
+
+
+@login_required
+def job_status(request, pk):
+    """Fon rejimidagi tahlil holati (frontend polling uchun)"""
+    from .jobs import get_job_status
+    
+    plant_image = get_object_or_404(
+        PlantImage.objects.select_related('disease'), pk=pk, user=request.user
+    )
+    return JsonResponse(get_job_status(plant_image))
+
+
+@staff_member_required
+def inference_metrics(request):
+    """Inference dvigateli holati: yuklangan modellar, micro-batching va kesh metrikalari"""
+    from . import cascade, duplicates, embeddings, prediction_cache, recommendation_cache
+    
+    data = {
+        'cascade': cascade.get_stats(),
+        'duplicates': duplicates.get_stats(),
+        'embeddings': embeddings.get_stats(),
+        'prediction_cache': prediction_cache.get_stats(),
+        'recommendation_cache': recommendation_cache.get_stats(),
+    }
+    
+    if is_server_mode():
+        from models.model_server import get_client, ModelServerError
+        data['mode'] = 'server'
+        try:
+            data.update(available=True, server=get_client().get_stats())
+        except ModelServerError as e:
+            data.update(available=False, error=str(e))
+        return JsonResponse(data)
+    
+    data['mode'] = 'local'
+    try:
+        import models.model_manager as manager_module
+    except ImportError as e:
+        data.update(available=False, error=str(e))
+        return JsonResponse(data)
+    
+    from . import shadow
+    
+    # Faqat mavjud obyektlar o'qiladi: metrika so'rovi batcher, pipeline yoki shadow
+    # threadlarini ishga tushirmasligi kerak (inference qilmaydigan jarayonlarda ham)
+    model_manager = manager_module.model_manager
+    batcher = manager_module._batcher
+    pipeline = manager_module._pipeline
+    evaluator = shadow._evaluator
+    data.update(
+        available=True,
+        models=model_manager.get_model_info(),
+        memory_bytes=model_manager.get_memory_usage(),
+        registry=model_manager.get_registry_info(),
+        residency=model_manager.get_residency_info(),
+        batching=batcher.get_metrics() if batcher is not None else None,
+        pipeline=pipeline.get_metrics() if pipeline is not None else None,
+        shadow=evaluator.get_stats() if evaluator is not None else None,
+    )
+    return JsonResponse(data)
@@ -0,0 +1,23 @@
+"""
+Gunicorn sozlamalari (joriy papkadan avtomatik o'qiladi).
+
+INFERENCE_PRELOAD=True bo'lsa ilova masterda bir marta yuklanadi va workerlar
+fork qilinadi: kutubxonalar va convert_model artefaktlarining og'irliklari
+copy-on-write orqali bo'lishiladi. TensorFlow thread pullari fork-safe emas,
+shuning uchun ular (va INFERENCE_WARMUP modellari) ``post_fork`` da har bir
+workerda alohida ishga tushiriladi.
+"""
+
+import os
+
+preload_app = os.getenv('INFERENCE_PRELOAD', 'False').lower() in ('true', '1', 'yes')
+
+
+def post_fork(server, worker):
+    if not preload_app:
+        # Ilova worker ichida yuklanadi - wsgi.py odatdagi warmup ni o'zi bajaradi
+        return
+    from models.preload import after_fork
+
+    after_fork()
+    server.log.info("Worker %s: inference tayyor (pid %s)", worker.age, worker.pid)
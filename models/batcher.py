@@ -0,0 +1,249 @@
+"""
+PlantCare AI - Micro-batching
+Bir vaqtda kelgan bashorat so'rovlarini model kaliti bo'yicha qisqa oynada
+yig'ib, bitta batch ``predict`` chaqiruvi bilan bajaradi va natijalarni
+kutayotgan chaqiruvchilarga qaytaradi.
+"""
+
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class _PendingRequest:
+    """Navbatdagi bitta rasm so'rovi"""
+
+    __slots__ = ('array', 'future', 'enqueued_at')
+
+    def __init__(self, array):
+        self.array = array
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class _KeyQueue(queue.Queue):
+    """
+    Bitta kalit navbati. ``closed`` - ``retire`` qilingan (faqat ``_lock``
+    ostida o'zgaradi), ``slots`` - cheklangan navbatdagi bo'sh o'rinlar.
+    Navbatning o'zi cheklanmagan: so'rov ``_lock`` ostida bloklanmasdan qo'yiladi.
+    """
+
+    def __init__(self, max_size=0):
+        super().__init__()
+        self.closed = False
+        self.slots = threading.Semaphore(max_size) if max_size else None
+
+
+class MicroBatcher:
+    """
+    Model kaliti bo'yicha dinamik micro-batching.
+
+    ``predict_fn(model_key, batch)`` ``(N, 224, 224, 3)`` massiv oladi va
+    ``(N, classes)`` ehtimolliklar massivini qaytaradi. Har bir kalit uchun
+    alohida navbat va fon oqimi yaratiladi. ``max_queue_size`` > 0 bo'lsa
+    navbat cheklangan: to'lganda ``submit`` bo'shashini kutadi (backpressure).
+    """
+
+    def __init__(self, predict_fn, window_ms=10, max_batch_size=16, wait_samples=1000, max_queue_size=0):
+        self.predict_fn = predict_fn
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_queue_size = max(0, int(max_queue_size))
+        self._queues = {}
+        self._workers = {}
+        self._retired = set()
+        self._lock = threading.Lock()
+        # Metrikalar
+        self._batch_sizes = Counter()
+        self._wait_times = deque(maxlen=wait_samples)
+        self._total_requests = 0
+        self._total_batches = 0
+        self._failed_batches = 0
+        self._busy_seconds = 0.0
+        self._blocked_seconds = 0.0
+        self._started_at = time.perf_counter()
+
+    def submit(self, model_key, array, timeout=None):
+        """
+        Bitta rasmni navbatga qo'yish va natijani kutish.
+
+        Args:
+            model_key (str): ModelManager kaliti (masalan ``disease_all``)
+            array (np.ndarray): ``(224, 224, 3)`` yoki ``(1, 224, 224, 3)`` massiv
+
+        Returns:
+            np.ndarray: shu rasm uchun ehtimolliklar vektori
+        """
+        return self.submit_async(model_key, array).result(timeout=timeout)
+
+    def submit_async(self, model_key, array):
+        """
+        Rasmni navbatga qo'yib, ``Future`` qaytarish. ``retire`` qilingan
+        kalit uchun Future ``RuntimeError`` bilan tugaydi (yangi navbat ochilmaydi).
+        """
+        if array.ndim == 4:
+            array = array[0]
+        request = _PendingRequest(array)
+        request_queue = self._get_queue(model_key)
+        if request_queue is not None and request_queue.slots is not None:
+            if not request_queue.slots.acquire(blocking=False):
+                request_queue.slots.acquire()
+                with self._lock:
+                    self._blocked_seconds += time.perf_counter() - request.enqueued_at
+        with self._lock:
+            # retire shu oraliqda navbatni yopgan bo'lishi mumkin - tekshiruv va
+            # qo'yish bitta lock ostida, so'rov None belgisidan keyin tushmaydi
+            if request_queue is not None and not request_queue.closed:
+                request_queue.put_nowait(request)
+                return request.future
+        if request_queue is not None and request_queue.slots is not None:
+            request_queue.slots.release()
+        request.future.set_exception(RuntimeError(f"Model navbati yopilgan: {model_key}"))
+        return request.future
+
+    def _get_queue(self, model_key):
+        """Kalit navbati (kerak bo'lsa oqimi bilan yaratiladi); retire qilingan bo'lsa None"""
+        request_queue = self._queues.get(model_key)
+        if request_queue is not None:
+            return request_queue
+        with self._lock:
+            if model_key in self._retired:
+                return None
+            if model_key not in self._queues:
+                self._queues[model_key] = _KeyQueue(self.max_queue_size)
+                worker = threading.Thread(
+                    target=self._worker_loop,
+                    args=(model_key, self._queues[model_key]),
+                    name=f"batcher-{model_key}",
+                    daemon=True,
+                )
+                self._workers[model_key] = worker
+                worker.start()
+            return self._queues[model_key]
+
+    def _collect_batch(self, request_queue):
+        """
+        Birinchi so'rovni kutib, oyna tugaguncha yoki batch to'lguncha yig'ish.
+
+        Returns:
+            tuple: (so'rovlar, to'xtash kerakmi) - ``retire`` navbatga None qo'yadi
+        """
+        first = request_queue.get()
+        if first is None:
+            return [], True
+        self._release_slot(request_queue)
+        batch = [first]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = request_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            self._release_slot(request_queue)
+            batch.append(request)
+        return batch, False
+
+    @staticmethod
+    def _release_slot(request_queue):
+        if request_queue.slots is not None:
+            request_queue.slots.release()
+
+    def retire(self, model_key):
+        """
+        Kalit navbatini yopish: navbatdagi so'rovlar bajariladi, so'ng oqim
+        tugaydi. Keyingi ``submit`` lar shu kalit uchun xato bilan tugaydi.
+        """
+        with self._lock:
+            self._retired.add(model_key)
+            request_queue = self._queues.pop(model_key, None)
+            self._workers.pop(model_key, None)
+            if request_queue is not None:
+                request_queue.closed = True
+                request_queue.put_nowait(None)
+
+    def _fail_remaining(self, model_key, request_queue):
+        """None belgisidan keyin qolgan so'rovlar (bo'lmasligi kerak) osilib qolmasin"""
+        while True:
+            try:
+                request = request_queue.get_nowait()
+            except queue.Empty:
+                return
+            if request is not None and not request.future.done():
+                request.future.set_exception(RuntimeError(f"Model navbati yopilgan: {model_key}"))
+
+    def _worker_loop(self, model_key, request_queue):
+        while True:
+            batch, stop = self._collect_batch(request_queue)
+            if not batch:
+                return self._fail_remaining(model_key, request_queue)
+            started = time.perf_counter()
+            with self._lock:
+                self._batch_sizes[len(batch)] += 1
+                self._total_batches += 1
+                self._total_requests += len(batch)
+                self._wait_times.extend(started - request.enqueued_at for request in batch)
+            try:
+                inputs = np.stack([request.array for request in batch])
+                predictions = self.predict_fn(model_key, inputs)
+                for i, request in enumerate(batch):
+                    request.future.set_result(predictions[i])
+            except Exception as e:
+                with self._lock:
+                    self._failed_batches += 1
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+            with self._lock:
+                self._busy_seconds += time.perf_counter() - started
+            if stop:
+                return self._fail_remaining(model_key, request_queue)
+
+    def get_metrics(self):
+        """
+        Navbat chuqurligi, batch hajmlari gistogrammasi, kutish vaqtlari va
+        bandlik: ``utilisation`` - ``predict_fn`` ichida o'tgan vaqt ulushi
+        (bitta model uchun 1.0 - inference bosqichi to'yingan).
+        """
+        with self._lock:
+            waits_ms = np.array(self._wait_times, dtype=np.float64) * 1000.0
+            batch_sizes = dict(sorted(self._batch_sizes.items()))
+            total_requests = self._total_requests
+            total_batches = self._total_batches
+            failed_batches = self._failed_batches
+            busy_seconds = self._busy_seconds
+            blocked_seconds = self._blocked_seconds
+        elapsed = max(time.perf_counter() - self._started_at, 1e-9)
+        wait_stats = {}
+        if waits_ms.size:
+            p50, p95, p99 = np.percentile(waits_ms, [50, 95, 99])
+            wait_stats = {
+                'mean': round(float(waits_ms.mean()), 3),
+                'p50': round(float(p50), 3),
+                'p95': round(float(p95), 3),
+                'p99': round(float(p99), 3),
+                'max': round(float(waits_ms.max()), 3),
+            }
+        return {
+            'window_ms': self.window * 1000.0,
+            'max_batch_size': self.max_batch_size,
+            'max_queue_size': self.max_queue_size,
+            'queue_depth': {key: q.qsize() for key, q in self._queues.items()},
+            'batch_size_histogram': batch_sizes,
+            'wait_time_ms': wait_stats,
+            'total_requests': total_requests,
+            'total_batches': total_batches,
+            'failed_batches': failed_batches,
+            'avg_batch_size': round(total_requests / total_batches, 2) if total_batches else 0.0,
+            'busy_seconds': round(busy_seconds, 3),
+            'utilisation': round(busy_seconds / elapsed, 4),
+            'submit_blocked_seconds': round(blocked_seconds, 3),
+        }
@@ -0,0 +1,100 @@
+"""
+PlantCare AI - Arzon "bu o'simlik bargimi?" filtri (kaskadning birinchi bosqichi)
+
+Selfi, skrinshot va xira rasmlar CNN va Gemini ga yetib bormasligi uchun
+rasm kichik masshtabda (JPEG draft) dekodlanadi va bir necha millisekundda
+vektorlangan NumPy evristikalari bilan tekshiriladi:
+
+* o'lcham - asl rasmning kichik tomoni
+* keskinlik - kulrang tasvirdagi Laplacian dispersiyasi (xira rasmda past)
+* o'simlik piksellari ulushi - HSV da sariq-yashil rang oralig'idagi to'yingan piksellar
+"""
+
+import io
+
+import numpy as np
+from PIL import Image
+
+# Evristikalar shu o'lchamdagi eskizda hisoblanadi
+GATE_SIZE = (256, 256)
+
+# PIL HSV: rang tusi 0..255 (0..360 daraja). 35..170 daraja - sarg'aygan va yashil barglar
+# (teri, yog'och va tuproqning qizg'ish-to'q sariq tuslari kirmaydi)
+PLANT_HUE_RANGE = (25, 121)
+MIN_SATURATION = 40
+MIN_VALUE = 40
+
+REJECTION_MESSAGES = {
+    'low_resolution': "Rasm o'lchami juda kichik. Bargni yaqinroqdan, yuqori sifatda suratga oling.",
+    'blurry': "Rasm xira chiqqan. Kamerani barqaror ushlab, bargga fokus qilib qayta suratga oling.",
+    'not_plant': "Rasmda o'simlik bargi topilmadi. Kasallangan bargni kadr markazida suratga oling.",
+}
+
+
+class ImageRejected(ValueError):
+    """Rasm kaskadning birinchi bosqichida rad etildi (CNN va tavsiya ishlamaydi)"""
+
+    def __init__(self, reason, metrics=None):
+        self.reason = reason
+        self.metrics = metrics or {}
+        self.message = REJECTION_MESSAGES.get(reason, "Rasm qabul qilinmadi.")
+        super().__init__(self.message)
+
+
+def measure(source):
+    """
+    Rasm ko'rsatkichlari.
+
+    Returns:
+        dict: ``width``, ``height`` (asl o'lcham), ``sharpness`` (Laplacian
+        dispersiyasi), ``plant_ratio`` (o'simlik piksellari ulushi, 0..1)
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    img = source if isinstance(source, Image.Image) else Image.open(source)
+    width, height = img.size
+    if img.format == 'JPEG':
+        img.draft('RGB', GATE_SIZE)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    img.thumbnail(GATE_SIZE)
+
+    gray = np.asarray(img.convert('L'), dtype=np.float32)
+    laplacian = (
+        4 * gray[1:-1, 1:-1]
+        - gray[:-2, 1:-1] - gray[2:, 1:-1]
+        - gray[1:-1, :-2] - gray[1:-1, 2:]
+    )
+
+    hsv = np.asarray(img.convert('HSV'))
+    hue, saturation, value = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    plant = (
+        (hue >= PLANT_HUE_RANGE[0]) & (hue <= PLANT_HUE_RANGE[1])
+        & (saturation >= MIN_SATURATION) & (value >= MIN_VALUE)
+    )
+    return {
+        'width': width,
+        'height': height,
+        'sharpness': round(float(laplacian.var()) if laplacian.size else 0.0, 2),
+        'plant_ratio': round(float(plant.mean()), 4),
+    }
+
+
+def check(source, min_side=160, min_sharpness=15.0, min_plant_ratio=0.05):
+    """
+    Rasmni filtrdan o'tkazish.
+
+    Returns:
+        dict: ``measure`` natijasi va ``reason`` (None - qabul qilindi, aks holda
+        ``REJECTION_MESSAGES`` kaliti)
+    """
+    metrics = measure(source)
+    if min(metrics['width'], metrics['height']) < min_side:
+        metrics['reason'] = 'low_resolution'
+    elif metrics['sharpness'] < min_sharpness:
+        metrics['reason'] = 'blurry'
+    elif metrics['plant_ratio'] < min_plant_ratio:
+        metrics['reason'] = 'not_plant'
+    else:
+        metrics['reason'] = None
+    return metrics
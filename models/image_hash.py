@@ -0,0 +1,166 @@
+"""
+PlantCare AI - Perseptual xesh (pHash) va Hamming masofasi bo'yicha qidiruv
+
+Bayt xeshi (``prediction_cache``) bir xil faylni topadi, lekin qayta
+suratga olingan yoki Telegram qayta siqgan rasmni topmaydi. pHash rasmning
+past chastotali tuzilishidan olinadi:
+
+1. rasm JPEG draft rejimida kichik masshtabda kulrang dekodlanadi va 32x32
+   ga o'rtacha qiymat bilan kichraytiriladi (DCT bosqichida 1/8 masshtab -
+   to'liq dekodlashdan bir necha barobar arzon, shuning uchun CNN tensori
+   kutilmaydi: xesh inference dan oldin kerak)
+2. ikki o'lchamli DCT (matritsa ko'paytmasi, ``phash_gray`` batch ham qabul qiladi)
+3. chap-yuqori 8x8 koeffitsiyentlar medianadan kattami - 64 bit
+
+Yaqin rasmlarning xeshlari bir necha bitda farq qiladi. ``BKTree`` Hamming
+masofasi bo'yicha radius ichidagi xeshlarni to'liq skanerlashsiz topadi.
+"""
+
+import io
+
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8
+SAMPLE_SIZE = 32
+
+
+def _dct_matrix(n):
+    """DCT-II ortonormal matritsasi: ``D @ x @ D.T`` - ikki o'lchamli DCT"""
+    k = np.arange(n)[:, np.newaxis]
+    i = np.arange(n)[np.newaxis, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+_DCT = _dct_matrix(SAMPLE_SIZE)
+_BIT_WEIGHTS = (1 << np.arange(HASH_SIZE * HASH_SIZE - 1, -1, -1, dtype=np.uint64)).astype(np.uint64)
+
+
+def load_gray(source, size=SAMPLE_SIZE):
+    """Rasmni ``(size, size)`` float32 kulrang massivga o'qish (JPEG draft bilan)"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    img = source if isinstance(source, Image.Image) else Image.open(source)
+    if img.format == 'JPEG':
+        img.draft('L', (size * 2, size * 2))
+    img = img.convert('L').resize((size, size), Image.BOX)
+    return np.asarray(img, dtype=np.float32)
+
+
+def phash_gray(gray):
+    """
+    ``(N, 32, 32)`` kulrang massivlar uchun pHash.
+
+    Returns:
+        list: 64 bitli ``int`` xeshlar
+    """
+    gray = np.asarray(gray, dtype=np.float32)
+    coefficients = (_DCT @ gray @ _DCT.T)[:, :HASH_SIZE, :HASH_SIZE].reshape(len(gray), -1)
+    # DC koeffitsiyent (umumiy yorug'lik) medianaga qo'shilmaydi
+    median = np.median(coefficients[:, 1:], axis=1, keepdims=True)
+    bits = (coefficients > median).astype(np.uint64)
+    return [int(value) for value in (bits * _BIT_WEIGHTS).sum(axis=1, dtype=np.uint64)]
+
+
+def phash(source):
+    """Bitta rasm (fayl yo'li, fayl obyekti, ``bytes`` yoki ``PIL.Image``) uchun pHash"""
+    return phash_gray(load_gray(source)[np.newaxis])[0]
+
+
+def to_hex(value):
+    return f"{value:016x}"
+
+
+def from_hex(text):
+    return int(text, 16)
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """
+    Hamming masofasi bo'yicha BK-daraxt. Har bir tugun bolalari ota-tugungacha
+    bo'lgan masofa bo'yicha saqlanadi; qidiruvda uchburchak tengsizligi tufayli
+    faqat ``[d - radius, d + radius]`` oralig'idagi bolalar ko'riladi.
+    """
+
+    def __init__(self, items=()):
+        self._root = None
+        self._size = 0
+        for value, item in items:
+            self.add(value, item)
+
+    def __len__(self):
+        return self._size
+
+    def add(self, value, item=None):
+        node = [value, [item], {}]
+        self._size += 1
+        if self._root is None:
+            self._root = node
+            return
+        current = self._root
+        while True:
+            distance = hamming(value, current[0])
+            if distance == 0:
+                current[1].append(item)
+                return
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, value, radius):
+        """
+        Returns:
+            list: ``[(distance, hash, item), ...]`` masofa o'sish tartibida
+        """
+        if self._root is None:
+            return []
+        found = []
+        stack = [self._root]
+        while stack:
+            node_value, items, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= radius:
+                found.extend((distance, node_value, item) for item in items)
+            for child_distance, child in children.items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        found.sort(key=lambda entry: entry[0])
+        return found
+
+
+def cluster(hashes, radius):
+    """
+    Xeshlarni yaqin-dublikat klasterlarga ajratish (masofa ``radius`` dan
+    oshmagan juftliklar bitta klasterga, tranzitiv).
+
+    Returns:
+        list: indekslar ro'yxatlari, faqat 2 va undan ko'p elementli klasterlar,
+        kattaligi bo'yicha kamayish tartibida
+    """
+    tree = BKTree((value, index) for index, value in enumerate(hashes))
+    parent = list(range(len(hashes)))
+
+    def find(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    for index, value in enumerate(hashes):
+        for _, _, other in tree.search(value, radius):
+            a, b = find(index), find(other)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+
+    groups = {}
+    for index in range(len(hashes)):
+        groups.setdefault(find(index), []).append(index)
+    return sorted((group for group in groups.values() if len(group) > 1), key=len, reverse=True)
@@ -4,26 +4,188 @@ Bu modul turli xil o'simlik kasalliklari va zararkunandalarni aniqlash uchun
 modellarni boshqaradi. Django AIModel dan ma'lumotlarni yuklaydi.
 """
 
+import gc
 import os
 import json
-import tensorflow as tf
-from tensorflow.keras.models import load_model
+import time
+import itertools
+import threading
+from collections import OrderedDict
 from pathlib import Path
 
 # Base directory
 BASE_DIR = Path(__file__).resolve().parent
 
+# Keras modelini yuklash strategiyalari (TensorFlow 2.19 / Keras 3 mosligi uchun).
+# Inference uchun compile kerak emas, shuning uchun optimizer yaratilmaydi.
+LOADING_STRATEGIES = [
+    {"compile": False, "safe_mode": False},
+    {"compile": False},
+]
+
+# Har bir konfiguratsiya uchun noyob token (micro-batcher navbati shu token bo'yicha)
+_config_tokens = itertools.count(1)
+
+
+def get_process_rss():
+    """Joriy jarayonning RSS xotirasini baytlarda qaytarish (Linux /proc, aks holda resource)"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+        # ru_maxrss Linuxda KB, macOSda baytlarda - taxminiy qiymat sifatida yetarli
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except Exception:
+        return 0
+
+
+def get_weights_nbytes(model):
+    """Model og'irliklarining umumiy hajmini baytlarda hisoblash"""
+    # TFLite/ONNX backendlari artefakt hajmini o'zi biladi
+    if hasattr(model, 'nbytes'):
+        return model.nbytes
+    total = 0
+    for weight in model.weights:
+        count = 1
+        for dim in weight.shape:
+            count *= int(dim)
+        itemsize = getattr(weight.dtype, 'size', None)
+        if itemsize is None:
+            # Keras 3 da dtype satr ko'rinishida bo'ladi ("float32")
+            import numpy as np
+            itemsize = np.dtype(str(weight.dtype)).itemsize
+        total += count * itemsize
+    return total
+
+
+def load_keras_model(model_path):
+    """Keras modelini bir nechta strategiya bilan yuklash"""
+    # TensorFlow faqat birinchi bashorat yoki warmup paytida import qilinadi
+    import tensorflow as tf
+    from models.runtimes import configure_tf_threads
+    
+    configure_tf_threads(
+        _get_setting('INFERENCE_INTRA_OP_THREADS', 0),
+        _get_setting('INFERENCE_INTER_OP_THREADS', 0),
+    )
+    
+    last_error = None
+    for i, strategy in enumerate(LOADING_STRATEGIES):
+        try:
+            return tf.keras.models.load_model(model_path, **strategy)
+        except Exception as strategy_error:
+            print(f"❌ Yuklash strategiyasi {i+1} muvaffaqiyatsiz: {strategy_error}")
+            last_error = strategy_error
+    raise last_error
+
+
+def build_label_array(class_indices):
+    """``{class_name: index}`` lug'atidan index -> class_name massivini yaratish (model uchun bir marta)"""
+    import numpy as np
+    
+    labels = np.empty(len(class_indices), dtype=object)
+    for name, idx in class_indices.items():
+        labels[int(idx)] = name
+    return labels
+
+def _read_generation():
+    """AIModel jadvali generation qiymati (Django sozlanmagan bo'lsa None)"""
+    try:
+        from django.conf import settings
+        if not settings.configured:
+            return None
+        from diagnosis.models import AIModel
+        return AIModel.get_generation()
+    except Exception as e:
+        print(f"⚠️ AIModel generation o'qilmadi: {e}")
+        return None
+
+
+def _file_mtime(path):
+    try:
+        return os.path.getmtime(path) if path else None
+    except OSError:
+        return None
+
+
+def _same_artifact(old, new):
+    """Ikki konfiguratsiya bir xil model fayllariga ishora qiladimi"""
+    fields = ('ai_model_id', 'version', 'model_path', 'indices_path', 'optimized_path', 'optimized_format')
+    if any(old[field] != new[field] for field in fields):
+        return False
+    return (
+        _file_mtime(old['model_path']) == _file_mtime(new['model_path'])
+        and _file_mtime(old['optimized_path']) == _file_mtime(new['optimized_path'])
+    )
+
+
 class ModelManager:
-    """Model va parametrlarni boshqaruvchi klass"""
+    """
+    Model va parametrlarni boshqaruvchi klass.
+
+    Jarayon bo'yicha yagona inference dvigateli: har bir model
+    ``AIModel.get_model_key()`` kaliti bo'yicha faqat bir marta yuklanadi va
+    barcha bashorat yo'llari (web, API, Telegram bot) shu obyekt orqali ishlaydi.
+
+    AIModel jadvali o'zgarsa (``check_for_updates``), yangi modellar fon
+    oqimida yuklanib, tayyor bo'lgach konfiguratsiyalar lug'ati bir marta
+    almashtiriladi; eski modellar bilan boshlangan so'rovlar shu modellarda
+    tugaydi.
+
+    Yuklangan modellar LRU tartibida kuzatiladi: umumiy hajm
+    INFERENCE_MEMORY_BUDGET_MB dan oshsa, eng uzoq ishlatilmagan modellar
+    xotiradan chiqariladi (INFERENCE_PINNED_MODELS bundan mustasno) va
+    keyingi so'rovda qayta yuklanadi.
+    """
     
-    def __init__(self):
-        self.models = {}
+    def __init__(self, lazy=False):
+        self._models = {}
+        self._configs_loaded = False
         self.class_indices = {}
         self.django_available = False
-        self.load_model_configs()
+        self._lock = threading.RLock()
+        # Hot reload holati
+        self._generation = None
+        self._tokens = {}
+        self._last_check = 0.0
+        self._reload_thread = None
+        self.reload_count = 0
+        self.last_reload_at = None
+        # Xotira budjeti: token -> konfiguratsiya, oxirgisi eng yaqinda ishlatilgan
+        self._resident = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._load_seconds = 0.0
+        # TFLite/ONNX intra-op threadlari (None - INFERENCE_INTRA_OP_THREADS)
+        self.num_threads = None
+        if not lazy:
+            self.load_model_configs()
+    
+    @property
+    def models(self):
+        """Model konfiguratsiyalari (lazy rejimda birinchi murojaatda o'qiladi)"""
+        if not self._configs_loaded:
+            self.load_model_configs()
+        return self._models
     
     def load_model_configs(self):
         """Barcha mavjud model konfiguratsiyalarini yuklash"""
+        with self._lock:
+            if self._configs_loaded:
+                return
+            # add_model_config self.models ga yozadi - qayta kirishning oldini olish
+            self._configs_loaded = True
+            self._load_model_configs()
+    
+    def _load_model_configs(self):
+        # Generation modellar ro'yxatidan oldin o'qiladi - oraliqdagi o'zgarish keyingi tekshiruvda ko'rinadi
+        self._generation = _read_generation()
+        
         # Django modellaridan yuklash
         if self._load_from_django():
             print("✅ Django modellaridan AI modellar yuklandi")
@@ -47,8 +209,9 @@ class ModelManager:
             # AIModel ni import qilish
             from diagnosis.models import AIModel
             
-            # Faqat faol modellarni yuklash
-            active_models = AIModel.objects.filter(is_active=True).select_related('plant_type')
+            # Faqat faol modellarni yuklash; shadow nomzodlar asosiy javobga ta'sir qilmaydi
+            # (is_active standart True - nomzod shu kalitdagi asosiy modelni almashtirmasin)
+            active_models = AIModel.objects.filter(is_active=True, is_shadow=False).select_related('plant_type')
             
             if not active_models.exists():
                 print("⚠️ Faol modellar topilmadi")
@@ -56,17 +219,8 @@ class ModelManager:
             
             # Har bir modelni qo'shish
             for model_obj in active_models:
-                plant_code = model_obj.plant_type.code if model_obj.plant_type else 'all'
-                
-                self.add_model_config(
-                    model_type=model_obj.detection_type,
-                    plant=plant_code,
-                    model_path=model_obj.model_file.path,
-                    indices_path=model_obj.class_indices_file.path,
-                    description=model_obj.name
-                )
-                
-                print(f"📦 Model qo'shildi: {model_obj.name} ({model_obj.detection_type}_{plant_code})")
+                key = self.add_ai_model(model_obj)
+                print(f"📦 Model qo'shildi: {model_obj.name} ({key})")
             
             self.django_available = True
             return True
@@ -75,6 +229,22 @@ class ModelManager:
             print(f"❌ Django modellaridan yuklashda xato: {e}")
             return False
     
+    def add_ai_model(self, model_obj):
+        """AIModel yozuvidan konfiguratsiya qo'shish (faol bo'lmasa ham); kalitni qaytaradi"""
+        plant_code = model_obj.plant_type.code if model_obj.plant_type else 'all'
+        self.add_model_config(
+            model_type=model_obj.detection_type,
+            plant=plant_code,
+            model_path=model_obj.model_file.path,
+            indices_path=model_obj.class_indices_file.path,
+            description=model_obj.name,
+            ai_model_id=model_obj.id,
+            version=model_obj.version,
+            optimized_path=model_obj.optimized_file.path if model_obj.optimized_file else None,
+            optimized_format=model_obj.optimized_format
+        )
+        return f"{model_obj.detection_type}_{plant_code}"
+    
     def _load_static_configs(self):
         """Statik model konfiguratsiyalarini yuklash (fallback)"""
         # Asosiy kasallik aniqlash modeli
@@ -86,19 +256,33 @@ class ModelManager:
             description='Umumiy o\'simlik kasalliklari modeli'
         )
     
-    def add_model_config(self, model_type, plant, model_path, indices_path, description=''):
+    def add_model_config(self, model_type, plant, model_path, indices_path, description='',
+                         ai_model_id=None, version='', optimized_path=None, optimized_format=''):
         """Model konfiguratsiyasini qo'shish"""
         key = f"{model_type}_{plant}"
-        self.models[key] = {
+        config = self.models[key] = {
             'type': model_type,
             'plant': plant,
             'model_path': os.path.join(BASE_DIR, model_path),
             'indices_path': os.path.join(BASE_DIR, indices_path),
             'description': description,
+            'ai_model_id': ai_model_id,
+            'version': version,
+            'optimized_path': optimized_path,
+            'optimized_format': optimized_format,
+            'backend': None,
             'loaded': False,
             'model': None,
-            'indices': None
+            'indices': None,
+            'labels': None,
+            'load_time': None,
+            'memory_bytes': None,
+            'rss_delta_bytes': None,
+            'key': key,
+            'token': f"{key}#{next(_config_tokens)}",
+            'lock': threading.Lock(),
         }
+        self._tokens[config['token']] = config
     
     def get_model_key(self, detection_type, plant_type):
         """Parametrlarga ko'ra model kalitini olish"""
@@ -120,34 +304,265 @@ class ModelManager:
         return None
     
     def load_model(self, model_key):
-        """Modelni yuklash"""
-        if model_key not in self.models:
+        """Modelni yuklash (har bir kalit uchun jarayonda faqat bir marta)"""
+        model_config = self.acquire(model_key)
+        return model_config['model'], model_config['indices']
+    
+    def acquire(self, model_key):
+        """
+        Kalit bo'yicha yuklangan konfiguratsiya. Model, ``labels`` va ``token``
+        bir konfiguratsiyadan olinadi, shuning uchun hot reload paytida ham
+        bir-biriga mos keladi.
+        """
+        model_config = self.models.get(model_key)
+        if model_config is None:
             raise ValueError(f"Model topilmadi: {model_key}")
-        
-        model_config = self.models[model_key]
-        
+        self._ensure_resident(model_config)
+        return model_config
+    
+    def _ensure_resident(self, model_config, count=True):
+        """
+        Modelni xotirada ushlab, LRU tartibini yangilash. Budjetdan oshilsa
+        boshqa modellar chiqariladi.
+
+        Returns:
+            model obyekti (chaqiruvchi ushlab turgan havola - parallel
+            chiqarilish bashoratni buzmaydi)
+        """
+        while True:
+            loaded = self._ensure_loaded(model_config)
+            with self._lock:
+                model = model_config['model']
+                if model is None:
+                    # Yuklanishi bilan boshqa oqim chiqarib yubordi - qayta urinish
+                    continue
+                if loaded:
+                    self._misses += 1
+                    self._load_seconds += model_config['load_time'] or 0.0
+                elif count:
+                    self._hits += 1
+                self._resident[model_config['token']] = model_config
+                self._resident.move_to_end(model_config['token'])
+            if loaded:
+                self._enforce_budget(keep=model_config)
+            return model
+    
+    def _footprint(self, model_config):
+        return model_config['memory_bytes'] or model_config['rss_delta_bytes'] or 0
+    
+    def _is_pinned(self, model_config):
+        return model_config['key'] in _get_setting('INFERENCE_PINNED_MODELS', ('disease_all',))
+    
+    def _enforce_budget(self, keep=None):
+        """Umumiy hajm budjetga sig'guncha eng uzoq ishlatilmagan modellarni chiqarish"""
+        budget = int(_get_setting('INFERENCE_MEMORY_BUDGET_MB', 0) * 1024 * 1024)
+        if not budget:
+            return
+        evicted = []
+        with self._lock:
+            used = sum(self._footprint(config) for config in self._resident.values())
+            for token, config in list(self._resident.items()):
+                if used <= budget:
+                    break
+                if config is keep or self._is_pinned(config):
+                    continue
+                del self._resident[token]
+                used -= self._footprint(config)
+                config['model'] = None
+                config['loaded'] = False
+                self._evictions += 1
+                evicted.append(config['key'])
+        if evicted:
+            gc.collect()
+            print(f"♻️ Xotira budjeti: {', '.join(evicted)} xotiradan chiqarildi ({used / 1024 / 1024:.1f} MB band)")
+        elif used > budget:
+            print(f"⚠️ Xotira budjetidan oshildi ({used / 1024 / 1024:.1f} MB), chiqariladigan model yo'q")
+    
+    def _ensure_loaded(self, model_config):
+        """Modelni yuklash; shu chaqiruv yuklagan bo'lsa True"""
         # Agar model allaqachon yuklangan bo'lsa
         if model_config['loaded']:
-            return model_config['model'], model_config['indices']
-        
-        print(f"🔄 Model yuklanmoqda: {model_config['description']}")
-        
-        # Class indices ni yuklash
-        with open(model_config['indices_path'], 'r', encoding='utf-8') as f:
-            indices = json.load(f)
-        
-        # Modelni yuklash
-        model = load_model(model_config['model_path'])
+            return False
         
-        # Konfiguratsiyani yangilash
-        model_config['model'] = model
-        model_config['indices'] = indices
-        model_config['loaded'] = True
+        with model_config['lock']:
+            # Boshqa oqim kutayotgan vaqtda yuklab bo'lgan bo'lishi mumkin
+            if model_config['loaded']:
+                return False
+            
+            print(f"🔄 Model yuklanmoqda: {model_config['description']}")
+            rss_before = get_process_rss()
+            started = time.perf_counter()
+            
+            # Class indices ni yuklash
+            with open(model_config['indices_path'], 'r', encoding='utf-8') as f:
+                indices = json.load(f)
+            
+            # Modelni yuklash (konvertatsiya qilingan artefakt bo'lsa - TFLite/ONNX)
+            model, backend = self._load_backend(model_config)
+            
+            # Konfiguratsiyani yangilash
+            model_config['model'] = model
+            model_config['indices'] = indices
+            model_config['labels'] = build_label_array(indices)
+            model_config['backend'] = backend
+            model_config['load_time'] = time.perf_counter() - started
+            model_config['memory_bytes'] = get_weights_nbytes(model)
+            model_config['rss_delta_bytes'] = max(get_process_rss() - rss_before, 0)
+            model_config['loaded'] = True
+            
+            print(f"✅ Model muvaffaqiyatli yuklandi: {model_config['description']} ({backend})")
+            print(f"📊 Sinflar soni: {len(indices)}")
+            print(
+                f"⏱️ Yuklash vaqti: {model_config['load_time']:.2f}s, "
+                f"og'irliklar: {model_config['memory_bytes'] / 1024 / 1024:.1f} MB, "
+                f"RSS o'sishi: {model_config['rss_delta_bytes'] / 1024 / 1024:.1f} MB"
+            )
+            return True
+    
+    def _load_backend(self, model_config):
+        """Optimallashtirilgan artefakt (INFERENCE_PREFER_OPTIMIZED) yoki Keras modeli"""
+        optimized_path = model_config.get('optimized_path')
+        if optimized_path and _get_setting('INFERENCE_PREFER_OPTIMIZED', True) and os.path.exists(optimized_path):
+            try:
+                from models.preload import get_shared_initializers
+                from models.runtimes import load_optimized_model
+                model = load_optimized_model(
+                    optimized_path, model_config['optimized_format'],
+                    num_threads=self.num_threads or _get_setting('INFERENCE_INTRA_OP_THREADS', 0) or None,
+                    shared_weights=_get_setting('INFERENCE_TFLITE_SHARED_WEIGHTS', False),
+                    initializers=get_shared_initializers(optimized_path),
+                )
+                return model, model.backend
+            except Exception as e:
+                print(f"⚠️ Optimallashtirilgan model yuklanmadi, Keras ishlatiladi: {e}")
+        model = self._load_keras_model(model_config['model_path'])
+        if not _get_setting('INFERENCE_COMPILED_CALL', True):
+            return model, 'keras'
+        from models.runtimes import DEFAULT_BATCH_BUCKETS, CompiledKerasModel
+        model = CompiledKerasModel(model, buckets=_get_setting('INFERENCE_BATCH_BUCKETS', DEFAULT_BATCH_BUCKETS))
+        model.trace()
+        return model, model.backend
+    
+    def _load_keras_model(self, model_path):
+        """Keras modelini bir nechta strategiya bilan yuklash"""
+        return load_keras_model(model_path)
+    
+    def predict_batch(self, model_key, batch):
+        """
+        Bir nechta rasmdan iborat ``(N, 224, 224, 3)`` batch uchun ehtimolliklar.
+
+        Args:
+            model_key: model kaliti yoki konfiguratsiya ``token`` i (hot reload
+                paytida so'rov boshlangan model versiyasida tugashi uchun)
+        """
+        model_config = self._tokens.get(model_key)
+        if model_config is None:
+            model_config = self.models.get(model_key)
+            if model_config is None:
+                raise ValueError(f"Model topilmadi: {model_key}")
+        # Hit acquire da hisoblangan; bu yerda faqat chiqarilgan model qayta yuklanadi
+        model = self._ensure_resident(model_config, count=False)
+        return model.predict(batch, verbose=0)
+    
+    def embed_batch(self, model_key, batch):
+        """
+        Batch uchun klassifikatordan oldingi qatlam embeddinglari ``(N, D)``.
+        Faqat kompilyatsiya qilingan Keras backendida (TFLite/ONNX artefaktlari
+        bitta chiqishli) - aks holda ValueError.
+        """
+        model_config = self._tokens.get(model_key) or self.models.get(model_key)
+        if model_config is None:
+            raise ValueError(f"Model topilmadi: {model_key}")
+        model = self._ensure_resident(model_config, count=False)
+        if not hasattr(model, 'embed'):
+            raise ValueError(f"{model_config['backend']} backendi embedding qaytarmaydi")
+        return model.embed(batch)
+    
+    def check_for_updates(self, force=False):
+        """
+        AIModel jadvali o'zgarganini arzon tekshirish (INFERENCE_RELOAD_CHECK_INTERVAL
+        soniyada bir marta) va o'zgargan bo'lsa fon oqimida qayta yuklashni boshlash.
+
+        Returns:
+            bool: qayta yuklash boshlandimi
+        """
+        if not self._configs_loaded or not _get_setting('INFERENCE_HOT_RELOAD', True):
+            return False
+        now = time.monotonic()
+        if not force and now - self._last_check < _get_setting('INFERENCE_RELOAD_CHECK_INTERVAL', 10):
+            return False
+        self._last_check = now
         
-        print(f"✅ Model muvaffaqiyatli yuklandi: {model_config['description']}")
-        print(f"📊 Sinflar soni: {len(indices)}")
+        generation = _read_generation()
+        if generation is None or generation == self._generation:
+            return False
         
-        return model, indices
+        with self._lock:
+            if self._reload_thread is not None and self._reload_thread.is_alive():
+                return False
+            self._reload_thread = threading.Thread(
+                target=self._reload, name='model-reload', daemon=True
+            )
+            self._reload_thread.start()
+        return True
+    
+    def _reload(self):
+        """Yangi konfiguratsiyalarni o'qish, o'zgargan modellarni yuklash va atomar almashtirish"""
+        try:
+            staging = ModelManager(lazy=True)
+            staging.load_model_configs()
+            current = self._models
+            
+            for key, config in staging._models.items():
+                old = current.get(key)
+                if old is None or not old['loaded']:
+                    # Ishlatilmagan modellar avvalgidek birinchi so'rovda yuklanadi
+                    continue
+                if _same_artifact(old, config):
+                    staging._models[key] = old
+                else:
+                    # So'rovlar eski modelda davom etadi, yangisi shu yerda yuklanib isitiladi
+                    staging._ensure_loaded(config)
+            
+            with self._lock:
+                retired = [config for key, config in current.items() if staging._models.get(key) is not config]
+                self._models = staging._models
+                self._tokens = {config['token']: config for config in self._models.values()}
+                # Eski tokenlar grace davrida saqlanadi - navbatdagi so'rovlar eski modelda tugaydi
+                self._tokens.update((config['token'], config) for config in retired)
+                self._generation = staging._generation
+                # Eski modellar grace davri tugaguncha budjetda hisoblanadi
+                for config in self._models.values():
+                    if config['loaded'] and config['token'] not in self._resident:
+                        self._resident[config['token']] = config
+                self.reload_count += 1
+                self.last_reload_at = time.time()
+            
+            print(f"♻️ Modellar yangilandi: {', '.join(self._models) or '-'} ({len(retired)} ta eski konfiguratsiya)")
+            self._enforce_budget()
+            if retired:
+                timer = threading.Timer(
+                    _get_setting('INFERENCE_RELOAD_GRACE_SECONDS', 60), self._release, args=(retired,)
+                )
+                timer.daemon = True
+                timer.start()
+        except Exception as e:
+            # Eski modellar ishlashda davom etadi, keyingi tekshiruvda qayta urinish
+            print(f"❌ Modellarni qayta yuklashda xato: {e}")
+    
+    def _release(self, retired):
+        """Grace davri tugagach eski modellarni xotiradan bo'shatish"""
+        with self._lock:
+            for config in retired:
+                self._tokens.pop(config['token'], None)
+                self._resident.pop(config['token'], None)
+                config['model'] = None
+                config['loaded'] = False
+        if _batcher is not None:
+            for config in retired:
+                _batcher.retire(config['token'])
+        gc.collect()
+        print(f"🗑️ {len(retired)} ta eski model xotiradan bo'shatildi")
     
     def get_model(self, detection_type, plant_type):
         """Parametrlarga ko'ra modelni olish"""
@@ -207,13 +622,36 @@ class ModelManager:
     
     def unload_all_models(self):
         """Barcha modellarni xotiradan tozalash"""
-        for key, config in self.models.items():
-            if config['loaded']:
-                config['model'] = None
-                config['indices'] = None
-                config['loaded'] = False
+        with self._lock:
+            for key, config in self.models.items():
+                if config['loaded']:
+                    config['model'] = None
+                    config['indices'] = None
+                    config['labels'] = None
+                    config['loaded'] = False
+            self._resident.clear()
         print("🗑️ Barcha modellar xotiradan tozalandi")
     
+    def warmup(self, model_keys=None):
+        """
+        Modellarni oldindan yuklash (masalan, gunicorn worker ishga tushganda).
+
+        Args:
+            model_keys: yuklanadigan kalitlar; None bo'lsa barcha faol modellar
+
+        Returns:
+            dict: {model_key: True/False}
+        """
+        results = {}
+        for model_key in model_keys or list(self.models):
+            try:
+                self.load_model(model_key)
+                results[model_key] = True
+            except Exception as e:
+                print(f"⚠️ {model_key} warmup muvaffaqiyatsiz: {e}")
+                results[model_key] = False
+        return results
+    
     def get_model_info(self):
         """Barcha modellar haqida ma'lumot olish"""
         info = []
@@ -223,46 +661,211 @@ class ModelManager:
                 'type': config['type'],
                 'plant': config['plant'],
                 'description': config['description'],
+                'ai_model_id': config['ai_model_id'],
+                'version': config['version'],
                 'loaded': config['loaded'],
+                'load_time': config['load_time'],
+                'memory_bytes': config['memory_bytes'],
+                'rss_delta_bytes': config['rss_delta_bytes'],
+                'backend': config['backend'],
+                'optimized_format': config['optimized_format'],
                 'model_exists': os.path.exists(config['model_path']),
                 'indices_exists': os.path.exists(config['indices_path'])
             })
         return info
+    
+    def get_registry_info(self):
+        """Hot reload holati (metrikalar uchun)"""
+        return {
+            'generation': self._generation,
+            'reload_count': self.reload_count,
+            'last_reload_at': self.last_reload_at,
+            'reloading': self._reload_thread is not None and self._reload_thread.is_alive(),
+        }
+    
+    def get_residency_info(self):
+        """Xotira budjeti holati: band hajm, LRU tartibi, hit/miss/eviction hisoblagichlari"""
+        with self._lock:
+            resident = [config['key'] for config in self._resident.values()]
+            used = sum(self._footprint(config) for config in self._resident.values())
+            lookups = self._hits + self._misses
+            return {
+                'budget_bytes': int(_get_setting('INFERENCE_MEMORY_BUDGET_MB', 0) * 1024 * 1024),
+                'used_bytes': used,
+                'resident': resident,
+                'pinned': [key for key in resident if key in _get_setting('INFERENCE_PINNED_MODELS', ('disease_all',))],
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0,
+                'avg_load_seconds': round(self._load_seconds / self._misses, 3) if self._misses else 0.0,
+            }
+    
+    def get_memory_usage(self):
+        """Yuklangan modellar egallagan umumiy xotira (baytlarda)"""
+        return sum(
+            config['memory_bytes'] or 0
+            for config in self.models.values()
+            if config['loaded']
+        )
 
 
 # Global model manager instance
-model_manager = ModelManager()
+# Lazy: import vaqtida na TensorFlow, na AIModel jadvali o'qiladi
+model_manager = ModelManager(lazy=True)
 
+_batcher = None
+_batcher_lock = threading.Lock()
+_pipeline = None
 
-def predict_with_manager(image, detection_type, plant_type):
-    """Model manager yordamida bashorat qilish"""
-    import numpy as np
-    from PIL import Image
+
+def _get_setting(name, default):
+    """Django sozlamasini o'qish (Django sozlanmagan bo'lsa default)"""
+    try:
+        from django.conf import settings
+        if settings.configured:
+            return getattr(settings, name, default)
+    except ImportError:
+        pass
+    return default
+
+
+def get_batcher():
+    """Jarayon bo'yicha yagona MicroBatcher (o'chirilgan bo'lsa None)"""
+    global _batcher
+    if not _get_setting('INFERENCE_BATCHING_ENABLED', True):
+        return None
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                from models.batcher import MicroBatcher
+                _batcher = MicroBatcher(
+                    model_manager.predict_batch,
+                    window_ms=_get_setting('INFERENCE_BATCH_WINDOW_MS', 10),
+                    max_batch_size=_get_setting('INFERENCE_MAX_BATCH_SIZE', 16),
+                    max_queue_size=_get_setting('INFERENCE_BATCH_QUEUE_SIZE', 64),
+                )
+    return _batcher
+
+
+def get_pipeline():
+    """
+    Jarayon bo'yicha yagona bosqichli pipeline (dekodlash threadlari ->
+    micro-batcher). Pipeline yoki micro-batching o'chirilgan bo'lsa None.
+    """
+    global _pipeline
+    if not _get_setting('INFERENCE_PIPELINE_ENABLED', True):
+        return None
+    batcher = get_batcher()
+    if batcher is None:
+        return None
+    if _pipeline is None or _pipeline.batcher is not batcher:
+        with _batcher_lock:
+            if _pipeline is None or _pipeline.batcher is not batcher:
+                from models.pipeline import InferencePipeline
+                _pipeline = InferencePipeline(
+                    batcher,
+                    decode_workers=_get_setting('INFERENCE_DECODE_WORKERS', 4),
+                    queue_size=_get_setting('INFERENCE_PIPELINE_QUEUE_SIZE', 32),
+                )
+    return _pipeline
+
+
+def predict_probabilities(image, detection_type, plant_type):
+    """
+    Rasm uchun to'liq ehtimolliklar vektorini hisoblash.
+
+    Returns:
+        tuple: (probabilities, labels) - ``labels[i]`` i-sinf nomi
+    """
+    from models.preprocessing import preprocess_image
     
-    # Modelni olish
-    model, class_indices = model_manager.get_model(detection_type, plant_type)
+    # AIModel o'zgargan bo'lsa fon rejimida yangilash (tekshiruv arzon va kamdan-kam)
+    model_manager.check_for_updates()
     
-    # Rasmni qayta ishlash
-    img = Image.open(image)
-    img = img.convert('RGB')
-    img = img.resize((224, 224))
-    img_array = np.array(img) / 255.0
-    img_array = np.expand_dims(img_array, axis=0)
+    # Model kalitini aniqlash va modelni yuklash
+    model_key = model_manager.get_model_key(detection_type, plant_type)
+    if not model_key:
+        raise ValueError(
+            f"Ushbu parametrlar uchun model topilmadi: "
+            f"detection_type={detection_type}, plant_type={plant_type}"
+        )
+    model_config = model_manager.acquire(model_key)
+    labels = model_config['labels']
     
-    # Bashorat
-    predictions = model.predict(img_array, verbose=0)
-    predicted_class_index = np.argmax(predictions[0])
-    confidence = float(predictions[0][predicted_class_index])
+    # Token orqali bashorat labels olingan model versiyasida bajariladi
+    pipeline = get_pipeline()
+    if pipeline is not None:
+        # Dekodlash pipeline threadlarida, bashorat micro-batcherda: keyingi
+        # so'rov rasmi joriy inference bilan ustma-ust tayyorlanadi
+        img_array, probabilities = pipeline.submit(model_config['token'], image)
+    else:
+        # Rasmni qayta ishlash (JPEG draft dekodlash, float32)
+        img_array = preprocess_image(image)
+        batcher = get_batcher()
+        if batcher is not None:
+            probabilities = batcher.submit(model_config['token'], img_array)
+        else:
+            probabilities = model_manager.predict_batch(model_config['token'], img_array)[0]
     
-    # Class nomini topish
-    class_name = None
-    for name, idx in class_indices.items():
-        if idx == predicted_class_index:
-            class_name = name
-            break
+    # Nomzod (shadow) model uchun namuna - fon navbatida, javob uni kutmaydi
+    if _get_setting('INFERENCE_SHADOW_SAMPLE_RATE', 0):
+        from diagnosis.shadow import maybe_shadow
+        maybe_shadow(model_config, img_array, probabilities)
+    return probabilities, labels
+
+
+def predict_probabilities_batch(batch, detection_type, plant_type, batch_size=32):
+    """
+    Oldindan tayyorlangan ``(N, 224, 224, 3)`` batch uchun ehtimolliklar matritsasi.
+    Micro-batcher chetlab o'tiladi - batch allaqachon to'liq; ``batch_size`` dan
+    katta bo'lsa bo'laklarga bo'linadi.
+
+    Returns:
+        tuple: (probabilities ``(N, C)``, labels)
+    """
+    import numpy as np
+    
+    model_manager.check_for_updates()
+    
+    model_key = model_manager.get_model_key(detection_type, plant_type)
+    if not model_key:
+        raise ValueError(
+            f"Ushbu parametrlar uchun model topilmadi: "
+            f"detection_type={detection_type}, plant_type={plant_type}"
+        )
+    model_config = model_manager.acquire(model_key)
+    probabilities = np.concatenate([
+        model_manager.predict_batch(model_config['token'], batch[i:i + batch_size])
+        for i in range(0, len(batch), batch_size)
+    ]) if len(batch) else np.empty((0, len(model_config['labels'])), dtype=np.float32)
+    return probabilities, model_config['labels']
+
+
+def top_k_predictions(probabilities, labels, k=3):
+    """
+    Eng ehtimolli k ta sinf: [(class_name, probability), ...] kamayish tartibida.
+    ``argpartition`` butun vektorni saralamaydi - faqat k ta element saralanadi.
+    """
+    import numpy as np
     
+    probabilities = np.asarray(probabilities)
+    k = max(1, min(k, probabilities.shape[-1]))
+    top = np.argpartition(probabilities, -k)[-k:]
+    top = top[np.argsort(probabilities[top])[::-1]]
+    return [(labels[idx], float(probabilities[idx])) for idx in top]
+
+
+def predict_top_k(image, detection_type, plant_type, k=3):
+    """Bitta inference natijasidan top-k bashoratlar"""
+    probabilities, labels = predict_probabilities(image, detection_type, plant_type)
+    return top_k_predictions(probabilities, labels, k)
+
+
+def predict_with_manager(image, detection_type, plant_type):
+    """Model manager yordamida bashorat qilish"""
     # Return as tuple (class_name, confidence) for compatibility
-    return class_name, confidence
+    return predict_top_k(image, detection_type, plant_type, k=1)[0]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,357 @@
+"""
+PlantCare AI - Model Server
+Inference ni alohida jarayonlar pulida bajaradi. Django workerlari va Telegram
+bot TensorFlow ni import qilmaydi: ular lokal Unix socket orqali rasm
+baytlarini yuboradi va ``(class_name, confidence, top_k)`` javob oladi.
+
+Protokol: har bir xabar 4 baytli (big-endian) JSON sarlavha uzunligi, JSON
+sarlavha va sarlavhadagi ``size`` uzunlikdagi ixtiyoriy binar ma'lumotdan iborat.
+
+Pul jarayoni bir vaqtda bitta ``apply`` bajaradi, shuning uchun unda
+micro-batcher va pipeline o'chiriladi (oyna faqat kechikish qo'shardi).
+Batch ``predict_batch`` amalida yig'iladi: bir xabarda bir nechta rasm
+(sarlavhada ``sizes``) - pul jarayonida ular bitta ``predict`` bilan o'tadi.
+"""
+
+import io
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+HEADER_LENGTH = struct.Struct('!I')
+
+
+class ModelServerError(Exception):
+    """Model server bilan aloqa yoki bashorat xatosi"""
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = sock.recv(min(remaining, 1024 * 1024))
+        if not chunk:
+            raise ModelServerError("Ulanish kutilmaganda yopildi")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def send_message(sock, header, payload=b''):
+    """Sarlavha va binar ma'lumotni yuborish"""
+    header = dict(header, size=len(payload))
+    encoded = json.dumps(header).encode('utf-8')
+    sock.sendall(HEADER_LENGTH.pack(len(encoded)) + encoded + payload)
+
+
+def recv_message(sock):
+    """Sarlavha va binar ma'lumotni qabul qilish"""
+    (length,) = HEADER_LENGTH.unpack(_recv_exactly(sock, HEADER_LENGTH.size))
+    header = json.loads(_recv_exactly(sock, length).decode('utf-8'))
+    payload = _recv_exactly(sock, header.get('size', 0))
+    return header, payload
+
+
+# ==============================================================================
+# WORKER PROCESS
+# ==============================================================================
+
+def _init_worker(warmup_keys):
+    """Pul jarayonini ishga tushirish: Django va modellarni shu yerda yuklash"""
+    try:
+        import django
+        from django.conf import settings
+        if not settings.configured:
+            os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'PlantCare.settings')
+            django.setup()
+        # Ota jarayondan meros qolgan DB ulanishlarini ishlatmaslik
+        from django.db import connections
+        connections.close_all()
+        # Jarayonda bir vaqtda bitta so'rov: batcher hech qachon batch yig'maydi
+        settings.INFERENCE_BATCHING_ENABLED = False
+        settings.INFERENCE_PIPELINE_ENABLED = False
+    except ImportError:
+        pass
+
+    for model_key in warmup_keys:
+        try:
+            from models.model_manager import model_manager
+            model_manager.load_model(model_key)
+        except Exception as e:
+            print(f"⚠️ [{os.getpid()}] {model_key} oldindan yuklanmadi: {e}")
+
+
+def _predict_bytes(image_bytes, detection_type, plant_type, top_k):
+    """Pul jarayonida bitta rasm uchun bashorat"""
+    from models.model_manager import predict_top_k
+
+    top = predict_top_k(io.BytesIO(image_bytes), detection_type, plant_type, k=max(1, top_k))
+    class_name, confidence = top[0]
+    return class_name, confidence, top
+
+
+def _predict_batch_bytes(images, detection_type, plant_type, top_k):
+    """
+    Pul jarayonida bir nechta rasm uchun bitta batch bashorat.
+
+    Returns:
+        list: har bir rasm uchun ``{'class_name', 'confidence', 'top_k'}``
+        yoki ``{'error': xabar}`` (rasm o'qilmadi)
+    """
+    from models.model_manager import _get_setting, predict_probabilities_batch, top_k_predictions
+    from models.preprocessing import preprocess_parallel
+
+    batch, errors = preprocess_parallel(
+        [io.BytesIO(data) for data in images], workers=_get_setting('INFERENCE_DECODE_WORKERS', 4)
+    )
+    results = [{'error': f"Rasm o'qilmadi: {errors[i]}"} if i in errors else None for i in range(len(images))]
+    decoded = [i for i in range(len(images)) if i not in errors]
+    if decoded:
+        probabilities, labels = predict_probabilities_batch(
+            batch[decoded] if errors else batch, detection_type, plant_type, batch_size=len(decoded)
+        )
+        for i, row in zip(decoded, probabilities):
+            top = top_k_predictions(row, labels, k=max(1, top_k))
+            results[i] = {'class_name': top[0][0], 'confidence': top[0][1], 'top_k': top}
+    return results
+
+
+# ==============================================================================
+# SERVER
+# ==============================================================================
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        server = self.server.model_server
+        try:
+            header, payload = recv_message(self.request)
+        except (ModelServerError, ValueError, struct.error) as e:
+            return server._reply_error(self.request, f"Noto'g'ri so'rov: {e}")
+
+        op = header.get('op', 'predict')
+        if op == 'ping':
+            return send_message(self.request, {'ok': True})
+        if op == 'stats':
+            return send_message(self.request, {'ok': True, 'stats': server.get_stats()})
+        if op == 'predict_batch':
+            return self._predict_batch(server, header, payload)
+        if op != 'predict':
+            return server._reply_error(self.request, f"Noma'lum amal: {op}")
+
+        started = time.perf_counter()
+        try:
+            class_name, confidence, top = server.pool.apply(
+                _predict_bytes,
+                (payload, header.get('detection_type', 'disease'),
+                 header.get('plant_type', 'all'), int(header.get('top_k', 3)))
+            )
+        except Exception as e:
+            server._record(time.perf_counter() - started, failed=True)
+            return server._reply_error(self.request, str(e))
+
+        server._record(time.perf_counter() - started)
+        send_message(self.request, {
+            'ok': True,
+            'class_name': class_name,
+            'confidence': confidence,
+            'top_k': top,
+        })
+
+    def _predict_batch(self, server, header, payload):
+        sizes = [int(size) for size in header.get('sizes', [])]
+        if sum(sizes) != len(payload):
+            return server._reply_error(self.request, "Noto'g'ri so'rov: 'sizes' ma'lumot hajmiga mos emas")
+        images, offset = [], 0
+        for size in sizes:
+            images.append(payload[offset:offset + size])
+            offset += size
+
+        started = time.perf_counter()
+        try:
+            results = server.pool.apply(
+                _predict_batch_bytes,
+                (images, header.get('detection_type', 'disease'),
+                 header.get('plant_type', 'all'), int(header.get('top_k', 3)))
+            )
+        except Exception as e:
+            server._record(time.perf_counter() - started, failed=True)
+            return server._reply_error(self.request, str(e))
+
+        server._record(time.perf_counter() - started)
+        send_message(self.request, {'ok': True, 'results': results})
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ModelServer:
+    """
+    N ta model-server jarayonidan iborat pul va uning oldidagi Unix socket.
+
+    Ota jarayon TensorFlow ni import qilmaydi; modellar faqat pul
+    jarayonlarida (har birida bitta ``ModelManager``) yuklanadi.
+    """
+
+    def __init__(self, socket_path, workers=2, warmup_keys=('disease_all',)):
+        self.socket_path = str(socket_path)
+        self.workers = workers
+        self.warmup_keys = list(warmup_keys)
+        self.pool = None
+        self._server = None
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._failures = 0
+        self._total_time = 0.0
+        self._started_at = None
+
+    def start(self):
+        """Pul jarayonlarini yaratish va socketni ochish"""
+        import multiprocessing
+
+        try:
+            from django.db import connections
+            connections.close_all()
+        except ImportError:
+            pass
+
+        self.pool = multiprocessing.Pool(
+            processes=self.workers,
+            initializer=_init_worker,
+            initargs=(self.warmup_keys,),
+        )
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = _UnixServer(self.socket_path, _RequestHandler)
+        self._server.model_server = self
+        os.chmod(self.socket_path, 0o660)
+        self._started_at = time.time()
+
+    def serve_forever(self):
+        if self._server is None:
+            self.start()
+        self._server.serve_forever()
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def _record(self, elapsed, failed=False):
+        with self._lock:
+            self._requests += 1
+            self._total_time += elapsed
+            if failed:
+                self._failures += 1
+
+    def _reply_error(self, sock, message):
+        try:
+            send_message(sock, {'ok': False, 'error': message})
+        except OSError:
+            pass
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'requests': self._requests,
+                'failures': self._failures,
+                'avg_latency_ms': round(self._total_time / self._requests * 1000, 2) if self._requests else 0.0,
+                'uptime_seconds': round(time.time() - self._started_at, 1) if self._started_at else 0.0,
+            }
+
+
+# ==============================================================================
+# CLIENT
+# ==============================================================================
+
+class ModelServerClient:
+    """Model serverga Unix socket orqali ulanuvchi yengil klient (TensorFlowsiz)"""
+
+    def __init__(self, socket_path, timeout=60):
+        self.socket_path = str(socket_path)
+        self.timeout = timeout
+
+    def _request(self, header, payload=b''):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.timeout)
+                sock.connect(self.socket_path)
+                send_message(sock, header, payload)
+                response, _ = recv_message(sock)
+        except OSError as e:
+            raise ModelServerError(f"Model serverga ulanib bo'lmadi ({self.socket_path}): {e}")
+        if not response.get('ok'):
+            raise ModelServerError(response.get('error', "Noma'lum xato"))
+        return response
+
+    def predict(self, image_bytes, detection_type='disease', plant_type='all', top_k=3):
+        """
+        Rasm baytlari bo'yicha bashorat.
+
+        Returns:
+            tuple: (class_name, confidence, top_k) - top_k [(class_name, probability), ...]
+        """
+        response = self._request({
+            'op': 'predict',
+            'detection_type': detection_type,
+            'plant_type': plant_type,
+            'top_k': top_k,
+        }, bytes(image_bytes))
+        top = [tuple(item) for item in response['top_k']]
+        return response['class_name'], response['confidence'], top
+
+    def predict_batch(self, images, detection_type='disease', plant_type='all', top_k=3):
+        """
+        Bir nechta rasm bitta so'rovda (server pul jarayonida bitta batch).
+
+        Returns:
+            list: har bir rasm uchun (class_name, confidence, top_k) yoki
+            ``ModelServerError`` (rasm o'qilmadi)
+        """
+        images = [bytes(data) for data in images]
+        response = self._request({
+            'op': 'predict_batch',
+            'detection_type': detection_type,
+            'plant_type': plant_type,
+            'top_k': top_k,
+            'sizes': [len(data) for data in images],
+        }, b''.join(images))
+        return [
+            ModelServerError(item['error']) if 'error' in item
+            else (item['class_name'], item['confidence'], [tuple(top) for top in item['top_k']])
+            for item in response['results']
+        ]
+
+    def ping(self):
+        return self._request({'op': 'ping'})['ok']
+
+    def get_stats(self):
+        return self._request({'op': 'stats'})['stats']
+
+
+_client = None
+
+
+def get_client():
+    """Django sozlamalari bo'yicha yagona klient"""
+    global _client
+    if _client is None:
+        from django.conf import settings
+        _client = ModelServerClient(
+            settings.MODEL_SERVER_SOCKET,
+            timeout=getattr(settings, 'MODEL_SERVER_TIMEOUT', 60),
+        )
+    return _client
@@ -0,0 +1,255 @@
+"""
+PlantCare AI - Bosqichli inference pipeline
+
+Oldin bitta worker ichida dekodlash, kichraytirish va ``model.predict``
+ketma-ket bajarilardi: PIL rasmni ochayotganda inference bo'sh turardi.
+Pipeline ikki bosqichdan iborat:
+
+1. ``decode`` - threadlar puli rasmni dekodlab 224x224 float32 tensorga
+   aylantiradi (PIL dekodlash paytida GIL ni bo'shatadi)
+2. ``infer`` - tayyor tensorlar micro-batcherga (``MicroBatcher``) beriladi
+
+Bosqichlar orasidagi navbatlar cheklangan: inference ulgurmasa dekodlash
+threadlari, dekodlash ulgurmasa ``submit`` chaqiruvchilari kutadi
+(backpressure) - keyingi rasm joriy inference bilan ustma-ust tayyorlanadi,
+xotira esa o'smaydi. ``get_metrics`` har bir bosqich bandligini qaytaradi:
+pullarni shu bo'yicha o'lchash mumkin (dekodlash ~1.0 va inference past
+bo'lsa - dekodlash threadlari kam).
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from models.preprocessing import preprocess_image
+
+
+class _Stage:
+    """Bitta bosqich hisobi: band vaqt, elementlar va navbatni kutish vaqti"""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.items = 0
+        self.failed = 0
+
+    def snapshot(self, elapsed):
+        return {
+            'workers': self.workers,
+            'items': self.items,
+            'failed': self.failed,
+            'busy_seconds': round(self.busy_seconds, 3),
+            'utilisation': round(self.busy_seconds / (elapsed * self.workers), 4) if self.workers else 0.0,
+            'avg_ms': round(self.busy_seconds / self.items * 1000, 3) if self.items else 0.0,
+            'blocked_seconds': round(self.blocked_seconds, 3),
+        }
+
+
+class InferencePipeline:
+    """
+    Dekodlash threadlari -> cheklangan navbat -> micro-batcher.
+
+    ``submit`` (onlayn so'rovlar) tensorni batcherga beradi; ``map_batches``
+    (bulk, qayta hisoblash) shu dekodlash threadlaridan foydalanadi, inference
+    esa chaqiruvchi oqimida bo'laklar bilan bajariladi. ``batcher`` None
+    bo'lsa faqat ``map_batches`` ishlaydi.
+    """
+
+    def __init__(self, batcher=None, decode_workers=4, queue_size=32, preprocess_fn=preprocess_image):
+        self.batcher = batcher
+        self.preprocess_fn = preprocess_fn
+        self.queue_size = max(1, int(queue_size))
+        self._input = queue.Queue(maxsize=self.queue_size)
+        self._lock = threading.Lock()
+        self._decode = _Stage(max(1, int(decode_workers)))
+        # Bulk bo'laklari inference i (batcherdan tashqari). Bir nechta chaqiruvchi
+        # parallel bo'lishi mumkin - band vaqt intervallar birlashmasi bo'yicha olinadi
+        self._infer = _Stage(1)
+        self._infer_active = 0
+        self._infer_since = 0.0
+        self._submit_blocked = 0.0
+        self._started_at = time.perf_counter()
+        self._threads = [
+            threading.Thread(target=self._decode_loop, name=f'pipeline-decode-{i}', daemon=True)
+            for i in range(self._decode.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    # --- navbat ---
+
+    def _put(self, item):
+        """Dekodlash navbatiga qo'yish; navbat to'la bo'lsa kutish (backpressure)"""
+        try:
+            self._input.put_nowait(item)
+        except queue.Full:
+            started = time.perf_counter()
+            self._input.put(item)
+            with self._lock:
+                self._submit_blocked += time.perf_counter() - started
+
+    def submit_async(self, model_key, source):
+        """
+        Rasmni pipeline ga qo'yish.
+
+        Returns:
+            Future: ``(tensor, probabilities)`` - tensor ``(1, H, W, 3)``
+            (shadow baholash uchun), dekodlash xatosi asl istisno bilan
+        """
+        if self.batcher is None:
+            raise RuntimeError("Pipeline micro-batchersiz yaratilgan")
+        future = Future()
+        self._put((model_key, source, future))
+        return future
+
+    def submit(self, model_key, source, timeout=None):
+        return self.submit_async(model_key, source).result(timeout=timeout)
+
+    def decode_async(self, source):
+        """Faqat dekodlash: Future ``(1, H, W, 3)`` tensor qaytaradi"""
+        future = Future()
+        self._put((None, source, future))
+        return future
+
+    def close(self):
+        """Dekodlash threadlarini to'xtatish (navbatdagi rasmlar bajariladi)"""
+        for _ in self._threads:
+            self._input.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    # --- bosqichlar ---
+
+    def _decode_loop(self):
+        while True:
+            item = self._input.get()
+            if item is None:
+                return
+            model_key, source, future = item
+            started = time.perf_counter()
+            try:
+                tensor = self.preprocess_fn(source)
+            except Exception as e:
+                with self._lock:
+                    self._decode.busy_seconds += time.perf_counter() - started
+                    self._decode.items += 1
+                    self._decode.failed += 1
+                future.set_exception(e)
+                continue
+            decoded = time.perf_counter()
+            with self._lock:
+                self._decode.busy_seconds += decoded - started
+                self._decode.items += 1
+            if model_key is None:
+                future.set_result(tensor)
+                continue
+            try:
+                # Batcher navbati to'la bo'lsa shu yerda kutiladi - dekodlash sekinlashadi
+                inner = self.batcher.submit_async(model_key, tensor)
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            with self._lock:
+                self._decode.blocked_seconds += time.perf_counter() - decoded
+            inner.add_done_callback(lambda done, tensor=tensor, future=future: _chain(done, tensor, future))
+
+    def map_batches(self, sources, infer_fn, batch_size=16):
+        """
+        Rasmlarni bo'laklab inference qilish: ``batch_size`` talik bo'lak
+        ``infer_fn(batch)`` da hisoblanayotganda keyingi bo'laklar dekodlanadi.
+
+        Yields:
+            tuple: (indices, outputs, errors) - ``indices`` o'qilgan rasmlar
+            indekslari (``outputs`` qatorlari tartibida), ``errors``
+            ``{index: exception}`` - shu bo'lakda o'qilmagan rasmlar
+        """
+        sources = list(sources)
+        batch_size = max(1, int(batch_size))
+        futures = {}
+        submitted = 0
+
+        def feed(limit):
+            nonlocal submitted
+            while submitted < min(limit, len(sources)):
+                futures[submitted] = self.decode_async(sources[submitted])
+                submitted += 1
+
+        # Ikki bo'lak oldinda: bittasi dekodlanayotganda ikkinchisi tayyor turadi
+        feed(2 * batch_size)
+        for start in range(0, len(sources), batch_size):
+            indices, tensors, errors = [], [], {}
+            for index in range(start, min(start + batch_size, len(sources))):
+                waited = time.perf_counter()
+                try:
+                    tensors.append(futures.pop(index).result())
+                    indices.append(index)
+                except Exception as e:
+                    errors[index] = e
+                with self._lock:
+                    self._infer.blocked_seconds += time.perf_counter() - waited
+            feed(start + 3 * batch_size)
+            if not tensors:
+                yield indices, None, errors
+                continue
+            with self._lock:
+                if not self._infer_active:
+                    self._infer_since = time.perf_counter()
+                self._infer_active += 1
+            try:
+                outputs = infer_fn(np.concatenate(tensors))
+            finally:
+                with self._lock:
+                    self._infer_active -= 1
+                    if not self._infer_active:
+                        self._infer.busy_seconds += time.perf_counter() - self._infer_since
+                    self._infer.items += len(tensors)
+            yield indices, outputs, errors
+
+    # --- metrikalar ---
+
+    def get_metrics(self):
+        """
+        Bosqichlar bandligi: ``utilisation`` - bosqich threadlari ish bilan
+        band bo'lgan vaqt ulushi (0..1), ``blocked_seconds`` - keyingi bosqich
+        navbatini kutish (dekodlash uchun batcher navbati, bulk inference
+        uchun dekodlangan tensorlar).
+
+        Inference ikki joyda bajariladi va alohida ko'rsatiladi: ``infer.batcher``
+        - onlayn so'rovlar (batcher o'z soati va oqimlari bilan), ``infer.bulk``
+        - ``map_batches`` chaqiruvchilari. Ularning bandligi qo'shilmaydi.
+        """
+        elapsed = max(time.perf_counter() - self._started_at, 1e-9)
+        with self._lock:
+            decode = self._decode.snapshot(elapsed)
+            bulk = self._infer.snapshot(elapsed)
+            submit_blocked = self._submit_blocked
+        batcher = None
+        if self.batcher is not None:
+            batching = self.batcher.get_metrics()
+            batcher = {
+                'items': batching['total_requests'],
+                'busy_seconds': batching['busy_seconds'],
+                'utilisation': batching['utilisation'],
+                'queue_depth': sum(batching['queue_depth'].values()),
+                'max_queue_size': batching['max_queue_size'],
+            }
+        infer = {'batcher': batcher, 'bulk': bulk}
+        return {
+            'uptime_seconds': round(elapsed, 1),
+            'decode': dict(decode, queue_depth=self._input.qsize(), max_queue_size=self.queue_size),
+            'infer': infer,
+            'submit_blocked_seconds': round(submit_blocked, 3),
+        }
+
+
+def _chain(done, tensor, future):
+    """Batcher natijasini pipeline Future iga o'tkazish"""
+    error = done.exception()
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result((tensor, done.result()))
@@ -0,0 +1,153 @@
+"""
+PlantCare AI - gunicorn master jarayonida modellarni fork oldidan tayyorlash
+
+``preload_app = True`` bo'lganda master jarayon ``preload_for_fork`` ni
+chaqiradi: kutubxonalar import qilinadi va og'irliklar faqat o'qish uchun
+tayyorlanadi, so'ng workerlar fork qilinadi. Linux copy-on-write tufayli
+bu sahifalar workerlar orasida bo'lishiladi (PSS bo'linadi, USS o'smaydi).
+
+TensorFlow runtime (eager kontekst, thread pullari) fork-safe emas, shuning
+uchun masterda hech qanday TF operatsiyasi bajarilmaydi: Keras (.h5)
+og'irliklari har bir workerda ``after_fork`` dan keyin yuklanadi va har
+bir workerning xususiy xotirasida (USS) qoladi - preload ularni bo'lishmaydi.
+Bo'lishiladigan og'irliklar faqat ``convert_model`` artefaktlarida va faqat
+tezlik evaziga:
+
+* TFLite - fayl ``mmap`` qilinadi (sahifa keshi umumiy); standart XNNPACK
+  delegati og'irliklarni har bir workerda qayta joylaydi, shuning uchun
+  INFERENCE_TFLITE_SHARED_WEIGHTS=True da u o'chiriladi
+* ONNX - INFERENCE_ONNX_SHARED_WEIGHTS=True da initializerlar masterda numpy
+  massivlariga o'qiladi va workerlar ularni ``SessionOptions.add_initializer``
+  orqali nusxalamasdan ishlatadi. Buning uchun sessiyada prepacking va NCHWc
+  layout o'chiriladi (``ONNXModel``); aks holda onnxruntime baribir xususiy
+  nusxa yaratadi va masterdagi massivlar faqat ortiqcha xotira bo'ladi
+
+Natijani ``benchmark_worker_memory`` bilan o'lchang (PSS/USS, preload bilan va usiz).
+"""
+
+import os
+
+# artefakt yo'li -> {initializer nomi: numpy massivi} (masterda to'ldiriladi)
+_shared_initializers = {}
+
+
+def _get_setting(name, default):
+    from models.model_manager import _get_setting as get_setting
+    return get_setting(name, default)
+
+
+def _load_onnx_initializers(path):
+    """ONNX modeli initializerlarini numpy massivlariga o'qish (``onnx`` paketi kerak)"""
+    import onnx
+    from onnx import numpy_helper
+
+    model = onnx.load(path)
+    initializers = {}
+    for tensor in model.graph.initializer:
+        array = numpy_helper.to_array(tensor)
+        # Faqat o'qish uchun - tasodifiy yozuv COW sahifani nusxalamasligi uchun
+        array.setflags(write=False)
+        initializers[tensor.name] = array
+    return initializers
+
+
+def get_shared_initializers(path):
+    """Masterda tayyorlangan ONNX initializerlari (bo'lmasa None)"""
+    return _shared_initializers.get(path)
+
+
+def preload_for_fork(manager=None):
+    """
+    gunicorn master jarayonida (fork oldidan) chaqiriladi.
+
+    Returns:
+        dict: {model_key: tayyorlangan narsa tavsifi}
+    """
+    from django.db import connections
+    from models.model_manager import model_manager
+
+    manager = manager or model_manager
+    report = {}
+
+    # numpy va PIL ning Python obyektlari ham workerlar orasida bo'lishiladi
+    import numpy  # noqa: F401
+    from PIL import Image  # noqa: F401
+
+    if _get_setting('INFERENCE_PRELOAD_IMPORT_TF', True):
+        # Faqat import - runtime workerda ishga tushadi (TF thread pullari fork-safe emas)
+        try:
+            import tensorflow  # noqa: F401
+            report['tensorflow'] = 'imported'
+        except ImportError as e:
+            report['tensorflow'] = f'unavailable: {e}'
+
+    for key, config in manager.models.items():
+        optimized_path = config['optimized_path']
+        if not optimized_path or not os.path.exists(optimized_path):
+            report[key] = 'keras (workerda yuklanadi)'
+            continue
+        if config['optimized_format'] == 'onnx':
+            if not _get_setting('INFERENCE_ONNX_SHARED_WEIGHTS', False):
+                report[key] = 'onnx (workerda yuklanadi)'
+                continue
+            try:
+                _shared_initializers[optimized_path] = _load_onnx_initializers(optimized_path)
+                nbytes = sum(a.nbytes for a in _shared_initializers[optimized_path].values())
+                report[key] = f'onnx initializers ({nbytes / 1024 / 1024:.1f} MB)'
+            except Exception as e:
+                report[key] = f'onnx (bo\'lishilmaydi: {e})'
+        else:
+            # TFLite interpreter model_path ni mmap qiladi - sahifalarni keshga oldindan o'qish
+            with open(optimized_path, 'rb') as f:
+                while f.read(16 * 1024 * 1024):
+                    pass
+            report[key] = 'tflite (mmap)'
+
+    # Ochiq DB ulanishlari fork qilingan workerlar orasida bo'lishilmasligi kerak
+    connections.close_all()
+
+    for key, value in report.items():
+        print(f"📦 Preload: {key} - {value}")
+    return report
+
+
+def after_fork():
+    """
+    Worker jarayonida fork dan keyin chaqiriladi: TF threadlari shu yerda
+    sozlanadi va (INFERENCE_WARMUP=True bo'lsa) modellar yuklanadi.
+    """
+    import models.model_manager as manager_module
+    from models.runtimes import configure_tf_threads, reset_tf_threads
+
+    # Masterdan meros qolgan oqimlar (batcher, hot reload) workerda mavjud emas
+    manager_module._batcher = None
+    manager_module._pipeline = None
+    manager_module.model_manager._reload_thread = None
+    reset_tf_threads()
+    configure_tf_threads(
+        _get_setting('INFERENCE_INTRA_OP_THREADS', 0),
+        _get_setting('INFERENCE_INTER_OP_THREADS', 0),
+    )
+
+    if _get_setting('INFERENCE_WARMUP', False):
+        from diagnosis.model_loader import warmup
+        warmup()
+
+
+def get_process_memory(pid='self'):
+    """
+    Jarayon xotirasi ``/proc/<pid>/smaps_rollup`` dan: RSS, PSS (bo'lishilgan
+    sahifalar jarayonlar soniga bo'linadi) va USS (faqat shu jarayonniki), baytlarda.
+    """
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1]) * 1024
+    return {
+        'rss': values.get('Rss', 0),
+        'pss': values.get('Pss', 0),
+        'uss': values.get('Private_Clean', 0) + values.get('Private_Dirty', 0),
+        'shared': values.get('Shared_Clean', 0) + values.get('Shared_Dirty', 0),
+    }
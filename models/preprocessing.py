@@ -0,0 +1,102 @@
+"""
+PlantCare AI - Rasmlarni oldindan qayta ishlash
+Barcha bashorat yo'llari uchun yagona preprocessing: JPEG draft rejimida
+kichraytirilgan masshtabda dekodlash va to'g'ridan-to'g'ri float32 tensor.
+"""
+
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+# Model kirish o'lchami (kenglik, balandlik)
+TARGET_SIZE = (224, 224)
+
+_SCALE = np.float32(1.0 / 255.0)
+
+
+def load_image(source, size=TARGET_SIZE, draft=True):
+    """
+    Rasmni ochish, RGB ga o'tkazish va ``size`` ga kichraytirish.
+
+    JPEG fayllar uchun ``Image.draft`` dekoderga DCT bosqichida 1/2, 1/4 yoki
+    1/8 masshtabda o'qishni buyuradi (natija ``size`` dan kichik bo'lmaydi),
+    shuning uchun 12 MP rasm to'liq dekodlanmaydi.
+
+    Args:
+        source: fayl yo'li, fayl obyekti, ``bytes`` yoki ``PIL.Image``
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    img = source if isinstance(source, Image.Image) else Image.open(source)
+    if draft and img.format == 'JPEG':
+        img.draft('RGB', size)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    if img.size != tuple(size):
+        img = img.resize(size, Image.BICUBIC)
+    return img
+
+
+def preprocess_image(source, size=TARGET_SIZE, draft=True):
+    """
+    Bitta rasmni model kirishiga tayyorlash.
+
+    Returns:
+        np.ndarray: ``(1, H, W, 3)`` float32, qiymatlar [0, 1] oralig'ida
+    """
+    array = np.asarray(load_image(source, size, draft), dtype=np.float32)
+    array *= _SCALE
+    return array[np.newaxis]
+
+
+def preprocess_batch(sources, size=TARGET_SIZE, draft=True, out=None):
+    """
+    Bir nechta rasmni bitta uzluksiz ``(N, H, W, 3)`` float32 bufferga yozish.
+
+    Args:
+        sources: rasm manbalari ro'yxati (``load_image`` qabul qiladigan turlar)
+        out: ixtiyoriy oldindan ajratilgan buffer (kamida N ta qator)
+    """
+    sources = list(sources)
+    width, height = size
+    if out is None:
+        out = np.empty((len(sources), height, width, 3), dtype=np.float32)
+    batch = out[:len(sources)]
+    for i, source in enumerate(sources):
+        # uint8 -> float32 o'tkazish to'g'ridan-to'g'ri buffer ichida
+        batch[i] = np.asarray(load_image(source, size, draft))
+    np.multiply(batch, _SCALE, out=batch)
+    return batch
+
+
+def preprocess_parallel(sources, size=TARGET_SIZE, draft=True, workers=4):
+    """
+    ``preprocess_batch`` ning parallel varianti: rasmlar threadlarda dekodlanadi
+    (PIL dekodlash paytida GIL ni bo'shatadi). Bitta buzuq rasm butun batchni
+    to'xtatmaydi.
+
+    Returns:
+        tuple: (batch ``(N, H, W, 3)``, errors ``{index: exception}``) -
+        xato bo'lgan qatorlar nol bilan to'ldiriladi
+    """
+    sources = list(sources)
+    width, height = size
+    batch = np.zeros((len(sources), height, width, 3), dtype=np.float32)
+    errors = {}
+
+    def decode(index):
+        try:
+            batch[index] = np.asarray(load_image(sources[index], size, draft))
+        except Exception as e:
+            errors[index] = e
+
+    if workers > 1 and len(sources) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(sources))) as executor:
+            list(executor.map(decode, range(len(sources))))
+    else:
+        for index in range(len(sources)):
+            decode(index)
+    np.multiply(batch, _SCALE, out=batch)
+    return batch, errors
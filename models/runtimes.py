@@ -0,0 +1,297 @@
+"""
+PlantCare AI - CPU uchun optimallashtirilgan inference backendlari
+
+Keras modelining ``tf.function`` chaqiruvi hamda ``.h5`` dan olingan TFLite
+(float16 / int8) yoki ONNX artefaktlari ``model.predict(batch, verbose=0)``
+interfeysi bilan o'raladi, shuning uchun ``ModelManager``, micro-batcher va
+model-server ularni Keras modeli kabi ishlatadi. Barcha kutubxonalar faqat kerak bo'lganda import qilinadi.
+"""
+
+import os
+import threading
+
+import numpy as np
+
+# AIModel.optimized_format qiymatlari
+FORMAT_TFLITE_FLOAT16 = 'tflite_float16'
+FORMAT_TFLITE_INT8 = 'tflite_int8'
+FORMAT_ONNX = 'onnx'
+
+FORMATS = (FORMAT_TFLITE_FLOAT16, FORMAT_TFLITE_INT8, FORMAT_ONNX)
+
+FORMAT_EXTENSIONS = {
+    FORMAT_TFLITE_FLOAT16: '.tflite',
+    FORMAT_TFLITE_INT8: '.tflite',
+    FORMAT_ONNX: '.onnx',
+}
+
+
+# Kompilyatsiya qilingan Keras chaqiruvi uchun batch o'lchamlari: N bu ro'yxatdagi
+# eng yaqin kattaroq qiymatgacha to'ldiriladi, shuning uchun oneDNN primitivlari
+# har bir yangi N uchun qayta yaratilmaydi
+DEFAULT_BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+_threads_configured = False
+
+
+def configure_tf_threads(intra_op=0, inter_op=0):
+    """
+    TensorFlow intra/inter-op threadlar sonini o'rnatish (0 - TF standarti).
+    Faqat TF runtime ishga tushishidan oldin ta'sir qiladi, shuning uchun
+    birinchi model yuklanishida bir marta chaqiriladi.
+    """
+    global _threads_configured
+    if _threads_configured:
+        return
+    _threads_configured = True
+    if not intra_op and not inter_op:
+        return
+    import tensorflow as tf
+    try:
+        if intra_op:
+            tf.config.threading.set_intra_op_parallelism_threads(int(intra_op))
+        if inter_op:
+            tf.config.threading.set_inter_op_parallelism_threads(int(inter_op))
+        print(f"🧵 TensorFlow threadlari: intra_op={intra_op or 'auto'}, inter_op={inter_op or 'auto'}")
+    except RuntimeError as e:
+        # TF allaqachon ishga tushgan (masalan, boshqa kod tomonidan)
+        print(f"⚠️ TensorFlow thread sozlamalari qo'llanmadi: {e}")
+
+
+def reset_tf_threads():
+    """Fork qilingan workerda thread sozlamalarini qayta qo'llashga ruxsat berish"""
+    global _threads_configured
+    _threads_configured = False
+
+
+class CompiledKerasModel:
+    """
+    Keras modelini ``tf.function`` bilan o'rash: ``(None, H, W, 3)`` float32
+    qat'iy signatura bitta graf hosil qiladi (batch o'lchami bo'yicha
+    qayta trace yo'q), ``model.predict`` ning har chaqiruvdagi data pipeline
+    va callback xarajatlari bo'lmaydi.
+    """
+
+    backend = 'keras_compiled'
+
+    def __init__(self, keras_model, buckets=DEFAULT_BATCH_BUCKETS):
+        import tensorflow as tf
+
+        self.model = keras_model
+        self.buckets = tuple(sorted(set(int(b) for b in buckets))) or DEFAULT_BATCH_BUCKETS
+        input_shape = (None,) + tuple(keras_model.input_shape[1:])
+        self.input_shape = input_shape
+        self._fn = tf.function(
+            lambda x: keras_model(x, training=False),
+            input_signature=[tf.TensorSpec(input_shape, tf.float32)],
+        )
+        self._embed_fn = None
+
+    @property
+    def weights(self):
+        return self.model.weights
+
+    def _bucket(self, size):
+        for bucket in self.buckets:
+            if bucket >= size:
+                return bucket
+        return None
+
+    def predict(self, batch, verbose=0):
+        batch = np.asarray(batch, dtype=np.float32)
+        size = len(batch)
+        bucket = self._bucket(size)
+        if bucket is None:
+            # Eng katta bucketdan katta batch bo'laklarga bo'linadi
+            step = self.buckets[-1]
+            return np.concatenate([self.predict(batch[i:i + step]) for i in range(0, size, step)])
+        if bucket != size:
+            padded = np.zeros((bucket,) + batch.shape[1:], dtype=np.float32)
+            padded[:size] = batch
+            batch = padded
+        return self._fn(batch).numpy()[:size]
+
+    def trace(self):
+        """Grafni oldindan qurish (warmup paytida birinchi so'rov kechikmasligi uchun)"""
+        self.predict(np.zeros((1,) + tuple(self.input_shape[1:]), dtype=np.float32))
+
+    def embed(self, batch):
+        """Klassifikatordan oldingi qatlam chiqishi ``(N, D)`` - o'xshash holatlar qidiruvi uchun"""
+        if self._embed_fn is None:
+            import tensorflow as tf
+
+            layer = find_embedding_layer(self.model)
+            embedder = tf.keras.Model(self.model.inputs, layer.output)
+            self._embed_fn = tf.function(
+                lambda x: embedder(x, training=False),
+                input_signature=[tf.TensorSpec(self.input_shape, tf.float32)],
+            )
+        batch = np.asarray(batch, dtype=np.float32)
+        return self._embed_fn(batch).numpy()
+
+
+def find_embedding_layer(keras_model):
+    """Oxirgi (klassifikator) qatlamdan oldingi, chiqishi ``(N, D)`` bo'lgan qatlam"""
+    for layer in reversed(keras_model.layers[:-1]):
+        shape = getattr(layer, 'output_shape', None) or tuple(layer.output.shape)
+        if isinstance(shape, tuple) and len(shape) == 2:
+            return layer
+    raise ValueError("Embedding qatlami topilmadi (2 o'lchamli chiqish yo'q)")
+
+
+def _get_tflite_interpreter_class():
+    """Yengil ``tflite_runtime`` bo'lsa undan, aks holda TensorFlow dan"""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+def _builtin_op_resolver(Interpreter):
+    """XNNPACK delegatisiz op resolver (og'irliklar mmap qilingan fayldan o'qiladi)"""
+    try:
+        from tflite_runtime.interpreter import OpResolverType
+    except ImportError:
+        import tensorflow as tf
+        OpResolverType = tf.lite.experimental.OpResolverType
+    return OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+
+
+class TFLiteModel:
+    """TFLite interpreter uchun Keras-ga o'xshash o'ram"""
+
+    backend = 'tflite'
+
+    def __init__(self, path, num_threads=None, shared_weights=False):
+        Interpreter = _get_tflite_interpreter_class()
+        self.path = path
+        options = {}
+        if shared_weights:
+            # XNNPACK og'irliklarni har bir jarayonda qayta joylaydi - o'chirilsa
+            # ular fayl mmap sahifalaridan o'qiladi va workerlar orasida bo'lishiladi
+            options['experimental_op_resolver_type'] = _builtin_op_resolver(Interpreter)
+        self._interpreter = Interpreter(model_path=path, num_threads=num_threads, **options)
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = int(self._input['shape'][0])
+        # Interpreter thread-safe emas - bitta invoke bir vaqtda
+        self._lock = threading.Lock()
+        self.nbytes = os.path.getsize(path)
+
+    def _resize(self, batch_size):
+        if batch_size != self._batch_size:
+            shape = [batch_size] + list(self._input['shape'][1:])
+            self._interpreter.resize_tensor_input(self._input['index'], shape)
+            self._interpreter.allocate_tensors()
+            self._input = self._interpreter.get_input_details()[0]
+            self._output = self._interpreter.get_output_details()[0]
+            self._batch_size = batch_size
+
+    def _quantize(self, batch):
+        dtype = self._input['dtype']
+        if dtype == np.float32:
+            return np.ascontiguousarray(batch, dtype=np.float32)
+        scale, zero_point = self._input['quantization']
+        info = np.iinfo(dtype)
+        return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+
+    def _dequantize(self, output):
+        if output.dtype == np.float32:
+            return output
+        scale, zero_point = self._output['quantization']
+        return (output.astype(np.float32) - zero_point) * scale
+
+    def predict(self, batch, verbose=0):
+        with self._lock:
+            self._resize(len(batch))
+            self._interpreter.set_tensor(self._input['index'], self._quantize(batch))
+            self._interpreter.invoke()
+            output = self._interpreter.get_tensor(self._output['index'])
+            return self._dequantize(output).copy()
+
+
+class ONNXModel:
+    """onnxruntime sessiyasi uchun Keras-ga o'xshash o'ram"""
+
+    backend = 'onnx'
+
+    def __init__(self, path, num_threads=None, initializers=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if initializers:
+            # MatMul/Gemm prepacking va ORT_ENABLE_ALL dagi NCHWc layout (Conv) og'irliklarning
+            # o'zgartirilgan nusxasini har bir workerda yaratadi - bo'lishish uchun ikkalasi o'chiriladi
+            options.add_session_config_entry('session.disable_prepacking', '1')
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+        # Tashqi initializerlar (fork oldidan o'qilgan numpy massivlari) nusxalanmaydi;
+        # OrtValue lar sessiya davomida tirik turishi kerak
+        self._initializers = []
+        for name, array in (initializers or {}).items():
+            value = ort.OrtValue.ortvalue_from_numpy(array)
+            options.add_initializer(name, value)
+            self._initializers.append(value)
+        self.path = path
+        self._session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self._input_name = self._session.get_inputs()[0].name
+        self.nbytes = os.path.getsize(path)
+
+    def predict(self, batch, verbose=0):
+        # InferenceSession.run thread-safe
+        return self._session.run(None, {self._input_name: np.asarray(batch, dtype=np.float32)})[0]
+
+
+def load_optimized_model(path, model_format, num_threads=None, shared_weights=False, initializers=None):
+    """Konvertatsiya qilingan artefaktni formatiga mos backend bilan yuklash"""
+    if model_format in (FORMAT_TFLITE_FLOAT16, FORMAT_TFLITE_INT8):
+        return TFLiteModel(path, num_threads=num_threads, shared_weights=shared_weights)
+    if model_format == FORMAT_ONNX:
+        return ONNXModel(path, num_threads=num_threads, initializers=initializers)
+    raise ValueError(f"Noma'lum model formati: {model_format}")
+
+
+def convert_keras_model(keras_model, model_format, output_path, representative_data=None):
+    """
+    Keras modelini CPU uchun optimallashtirilgan formatga o'tkazish.
+
+    Args:
+        model_format: ``FORMATS`` dan biri
+        representative_data: int8 kalibrlash uchun ``(N, 224, 224, 3)`` float32
+            namunalar; berilmasa faqat og'irliklar int8 ga o'tkaziladi
+            (dynamic range quantization)
+    """
+    if model_format not in FORMATS:
+        raise ValueError(f"Noma'lum model formati: {model_format}")
+
+    if model_format == FORMAT_ONNX:
+        import tensorflow as tf
+        import tf2onnx
+
+        input_shape = (None,) + tuple(keras_model.input_shape[1:])
+        signature = (tf.TensorSpec(input_shape, tf.float32, name='input'),)
+        tf2onnx.convert.from_keras(keras_model, input_signature=signature, opset=13, output_path=output_path)
+        return output_path
+
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if model_format == FORMAT_TFLITE_FLOAT16:
+        converter.target_spec.supported_types = [tf.float16]
+    elif representative_data is not None and len(representative_data):
+        def representative_dataset():
+            for sample in representative_data:
+                yield [sample[np.newaxis].astype(np.float32)]
+
+        # Kirish/chiqish float32 qoladi - preprocessing va top-k o'zgarmaydi
+        converter.representative_dataset = representative_dataset
+
+    with open(output_path, 'wb') as f:
+        f.write(converter.convert())
+    return output_path
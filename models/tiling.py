@@ -0,0 +1,186 @@
+"""
+PlantCare AI - Katta (dala / dron) rasmlar uchun bo'lakli (tiled) inference
+
+Butun kadrni 224x224 ga siqish kichik dog'larni yo'qotadi. Bu rejimda rasm
+bir-birini qoplaydigan 224x224 bo'laklarga ajratiladi: bo'laklar
+``sliding_window_view`` orqali nusxa olinmasdan (strided view) olinadi va
+faqat batch bufferiga yozilayotganda float32 ga o'tkaziladi. Bo'lak
+ehtimolliklaridan har bir sinf uchun issiqlik xaritasi (heatmap) va rasm
+darajasidagi xulosa hosil qilinadi.
+
+Bitta ulkan rasm workerni band qilmasligi uchun:
+* dekodlash INFERENCE_TILE_MAX_SIDE bilan cheklanadi (JPEG draft + kichraytirish)
+* bo'laklar soni INFERENCE_TILE_MAX_TILES dan oshsa rasm yanada kichraytiriladi
+* xotirada bir vaqtda faqat INFERENCE_MAX_BATCH_SIZE ta float32 bo'lak bo'ladi
+"""
+
+import io
+import math
+
+import numpy as np
+from PIL import Image
+
+from models.preprocessing import TARGET_SIZE
+
+TILE_SIZE = TARGET_SIZE[0]
+
+_SCALE = np.float32(1.0 / 255.0)
+
+
+def _setting(name, default):
+    from models.model_manager import _get_setting
+    return _get_setting(name, default)
+
+
+def load_full_image(source, max_side=2048):
+    """
+    Rasmni to'liq kadr sifatida o'qish (eng uzun tomoni ``max_side`` dan oshmaydi).
+
+    Returns:
+        tuple: (``PIL.Image`` RGB, asl o'lcham ``(kenglik, balandlik)``)
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    img = source if isinstance(source, Image.Image) else Image.open(source)
+    original = img.size
+    if img.format == 'JPEG' and max(original) > max_side:
+        # draft natijasi so'ralgan o'lchamdan kichik bo'lmaydi - qolgani resize da
+        ratio = max_side / max(original)
+        img.draft('RGB', (int(original[0] * ratio) + 1, int(original[1] * ratio) + 1))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    if max(img.size) > max_side:
+        ratio = max_side / max(img.size)
+        img = img.resize((max(1, round(img.width * ratio)), max(1, round(img.height * ratio))), Image.BICUBIC)
+    return img, original
+
+
+def _grid_count(length, tile, stride):
+    return 1 if length <= tile else math.ceil((length - tile) / stride) + 1
+
+
+def plan_grid(width, height, tile=TILE_SIZE, overlap=0.25, max_tiles=64):
+    """
+    Bo'laklar to'ri uchun o'lcham tanlash.
+
+    Returns:
+        tuple: (yangi kenglik, yangi balandlik, ustunlar, qatorlar) - rasm
+        ``tile`` dan kichik bo'lmaydi va ``ustunlar * qatorlar <= max_tiles``
+    """
+    stride = max(1, int(tile * (1 - overlap)))
+    # Kichik tomon kamida bitta bo'lak bo'lishi kerak
+    if min(width, height) < tile:
+        ratio = tile / min(width, height)
+        width, height = max(tile, round(width * ratio)), max(tile, round(height * ratio))
+    while True:
+        cols, rows = _grid_count(width, tile, stride), _grid_count(height, tile, stride)
+        if cols * rows <= max_tiles:
+            return width, height, cols, rows
+        if min(width, height) <= tile:
+            # Ingichka (juda cho'ziq) rasm: kichik tomonni kichraytirib bo'lmaydi -
+            # uzun tomon ``max_tiles`` ta bo'lakka sig'adigan uzunlikka siqiladi
+            span = tile + (max(1, max_tiles // min(cols, rows)) - 1) * stride
+            width, height = min(width, span), min(height, span)
+            continue
+        ratio = max(math.sqrt(max_tiles / (cols * rows)), 0.5)
+        width = max(tile, int(width * ratio))
+        height = max(tile, int(height * ratio))
+
+
+def _positions(length, tile, count):
+    # Birinchi va oxirgi bo'lak chekkalarga tegadi, oraliqdagilar bir xil qadam bilan
+    return np.linspace(0, length - tile, count).round().astype(int) if count > 1 else np.zeros(1, dtype=int)
+
+
+def tile_views(array, cols, rows, tile=TILE_SIZE):
+    """
+    ``(H, W, 3)`` massivdan bo'laklar - nusxasiz strided view lar.
+
+    Returns:
+        tuple: (windows, ys, xs) - ``windows[ys[r], xs[c], 0]`` ``(tile, tile, 3)`` view
+    """
+    windows = np.lib.stride_tricks.sliding_window_view(array, (tile, tile, 3))
+    height, width = array.shape[:2]
+    return windows, _positions(height, tile, rows), _positions(width, tile, cols)
+
+
+def aggregate(probabilities, rows, cols, top_fraction=0.05):
+    """
+    Bo'lak ehtimolliklaridan issiqlik xaritasi va rasm darajasidagi xulosa.
+
+    Har bir sinf bo'yicha eng yuqori ``top_fraction`` qism bo'laklar o'rtachasi
+    olinadi (bitta shovqinli bo'lakka emas, lekin faqat bir nechta bo'lakdagi
+    dog'ga ham sezgir) va yig'indisi 1 ga keltiriladi.
+
+    Returns:
+        tuple: (verdict ``(C,)``, heatmap ``(rows, cols, C)``)
+    """
+    probabilities = np.asarray(probabilities, dtype=np.float32)
+    heatmap = probabilities.reshape(rows, cols, -1)
+    k = max(1, math.ceil(len(probabilities) * top_fraction))
+    top = np.partition(probabilities, len(probabilities) - k, axis=0)[-k:]
+    verdict = top.mean(axis=0)
+    total = verdict.sum()
+    return (verdict / total if total > 0 else verdict), heatmap
+
+
+def predict_tiled(source, detection_type, plant_type):
+    """
+    Katta rasm uchun bo'lakli bashorat.
+
+    Returns:
+        dict: ``probabilities`` (rasm xulosasi), ``labels``, ``heatmap``
+        ``(rows, cols, C)``, ``boxes`` (asl rasm koordinatalarida ``[x, y, w, h]``),
+        ``rows``, ``cols``
+    """
+    from models.model_manager import model_manager
+
+    tile = TILE_SIZE
+    img, (original_width, original_height) = load_full_image(source, _setting('INFERENCE_TILE_MAX_SIDE', 2048))
+    width, height, cols, rows = plan_grid(
+        img.width, img.height, tile,
+        overlap=_setting('INFERENCE_TILE_OVERLAP', 0.25),
+        max_tiles=_setting('INFERENCE_TILE_MAX_TILES', 64),
+    )
+    if (width, height) != img.size:
+        img = img.resize((width, height), Image.BICUBIC)
+    scale_x, scale_y = original_width / width, original_height / height
+    array = np.asarray(img, dtype=np.uint8)
+    del img
+    windows, ys, xs = tile_views(array, cols, rows, tile)
+
+    model_manager.check_for_updates()
+    model_key = model_manager.get_model_key(detection_type, plant_type)
+    if not model_key:
+        raise ValueError(
+            f"Ushbu parametrlar uchun model topilmadi: "
+            f"detection_type={detection_type}, plant_type={plant_type}"
+        )
+    model_config = model_manager.acquire(model_key)
+
+    positions = [(y, x) for y in ys for x in xs]
+    batch_size = max(1, _setting('INFERENCE_MAX_BATCH_SIZE', 16))
+    buffer = np.empty((min(batch_size, len(positions)), tile, tile, 3), dtype=np.float32)
+    probabilities = []
+    for start in range(0, len(positions), batch_size):
+        part = positions[start:start + batch_size]
+        batch = buffer[:len(part)]
+        for i, (y, x) in enumerate(part):
+            batch[i] = windows[y, x, 0]
+        np.multiply(batch, _SCALE, out=batch)
+        probabilities.append(model_manager.predict_batch(model_config['token'], batch))
+
+    verdict, heatmap = aggregate(
+        np.concatenate(probabilities), rows, cols, _setting('INFERENCE_TILE_TOP_FRACTION', 0.05)
+    )
+    return {
+        'probabilities': verdict,
+        'labels': model_config['labels'],
+        'heatmap': heatmap,
+        'boxes': [
+            [round(x * scale_x), round(y * scale_y), round(tile * scale_x), round(tile * scale_y)]
+            for y, x in positions
+        ],
+        'rows': rows,
+        'cols': cols,
+    }
@@ -0,0 +1,440 @@
+"""
+PlantCare AI - Embeddinglar ombori va yaqin qo'shnilar qidiruvi
+
+Har bir yozuv: L2 bo'yicha normallangan float16 vektor (``vectors.f16``) va
+metama'lumot qatori (``rows.bin``: rasm id, foydalanuvchi, hudud, tashxis,
+tasdiqlangan belgisi, IVF ro'yxati). Ikkala fayl ham diskda memory-map
+qilinadi, shuning uchun 1M vektor jarayon xotirasiga to'liq yuklanmaydi va
+gunicorn workerlari OS sahifa keshini bo'lishadi.
+
+Qidiruv kosinus o'xshashlik (normallangan vektorlar uchun skalyar ko'paytma).
+Nomzodlar ``SEARCH_CHUNK`` talik bo'laklarda baholanadi - so'rov xotirasi
+ombor hajmiga bog'liq emas. Vektorlar ko'p bo'lsa ``train`` IVF (k-means
+markazlari) quradi: so'rov faqat eng yaqin ``nprobe`` ta ro'yxatdagi vektorlar
+bilan solishtiriladi. Yangi qatorlar qo'shilganda eng yaqin markazga
+biriktiriladi va ro'yxatlar oxiriga qo'shiladi (butun ustun qayta
+saralanmaydi). Ombor ``needs_training`` chegarasidan o'tganda web jarayoni
+faqat ``request_training`` belgisini qo'yadi - k-means ni tashxis worker
+(``train_if_requested``) yoki ``rebuild_embeddings`` bajaradi.
+
+Yozish ``fcntl.flock`` bilan ketma-ket bajariladi (bir nechta worker bir
+omborga qo'sha oladi); o'quvchilar ``refresh`` da sarlavha (``header.json``)
+o'zgarganini ko'rib, yangi qatorlarni oladi. Jarayon ichida holat (sarlavha,
+memmaplar, markazlar, ro'yxatlar) bitta o'zgarmas ``_Snapshot`` da: qidiruv
+boshida uni bir marta oladi, ``_open`` esa yangisini yaratib almashtiradi -
+parallel ``refresh`` ishlayotgan qidiruvni buzmaydi.
+"""
+
+import copy
+import fcntl
+import json
+import os
+import threading
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+
+import numpy as np
+
+ROW_DTYPE = np.dtype([
+    ('image_id', '<i8'),
+    ('user_id', '<i8'),
+    ('region', '<i2'),
+    ('label', '<i2'),
+    ('confirmed', 'i1'),
+    ('list', '<i4'),
+])
+
+INITIAL_CAPACITY = 1024
+# Qidiruvda bir vaqtda float32 ga o'tkaziladigan qatorlar soni
+SEARCH_CHUNK = 8192
+
+# ``lists`` - IVF ro'yxatlari bo'yicha qator indekslari (markazlar bo'lmasa None)
+_Snapshot = namedtuple('_Snapshot', 'header vectors rows centroids lists')
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _assign(vectors, centroids):
+    """Vektorlarni eng yaqin IVF markaziga biriktirish (markazlar bo'lmasa 0)"""
+    if centroids is None:
+        return np.zeros(len(vectors), dtype=np.int32)
+    return np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+
+
+def _build_lists(rows, count, nlist):
+    """Butun ``list`` ustunidan ro'yxatlar (faqat ombor ochilganda yoki qayta o'qitilganda)"""
+    lists = rows['list'][:count]
+    order = np.argsort(lists, kind='stable')
+    offsets = np.searchsorted(lists[order], np.arange(nlist + 1))
+    return tuple(order[offsets[c]:offsets[c + 1]] for c in range(nlist))
+
+
+def _extend_lists(lists, rows, start, stop):
+    """Yangi qatorlarni o'z ro'yxatlari oxiriga qo'shish (eski kortej o'zgarmaydi)"""
+    if lists is None or stop <= start:
+        return lists
+    assigned = rows['list'][start:stop]
+    ids = np.arange(start, stop)
+    extended = list(lists)
+    for c in np.unique(assigned):
+        extended[c] = np.concatenate([extended[c], ids[assigned == c]])
+    return tuple(extended)
+
+
+class VectorStore:
+    """Bitta model embeddinglari uchun diskdagi ombor va jarayon ichidagi indeks"""
+
+    def __init__(self, path, dim=None):
+        self.path = str(path)
+        self._header_mtime = None
+        self._snapshot = None
+        # Snapshot ni almashtirish ketma-ket (qidiruv qulfsiz o'qiydi)
+        self._lock = threading.RLock()
+        if not os.path.exists(self._file('header.json')):
+            if dim is None:
+                raise FileNotFoundError(f"Embedding ombori topilmadi: {self.path}")
+            self._create(dim)
+        self._open()
+
+    # ------------------------------------------------------------------
+    # Fayllar
+    # ------------------------------------------------------------------
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _create(self, dim):
+        os.makedirs(self.path, exist_ok=True)
+        with self._write_lock():
+            if os.path.exists(self._file('header.json')):
+                return
+            self._allocate(INITIAL_CAPACITY, int(dim))
+            self._write_header({
+                'dim': int(dim), 'count': 0, 'capacity': INITIAL_CAPACITY, 'nlist': 0,
+                'labels': [], 'regions': [], 'build_id': uuid.uuid4().hex,
+            })
+
+    def _allocate(self, capacity, dim):
+        # Fayl kattalashtiriladi (sparse) - mavjud ma'lumot joyida qoladi
+        with open(self._file('vectors.f16'), 'ab') as f:
+            f.truncate(capacity * dim * 2)
+        with open(self._file('rows.bin'), 'ab') as f:
+            f.truncate(capacity * ROW_DTYPE.itemsize)
+
+    def _write_header(self, header):
+        tmp_path = self._file('header.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(header, f, ensure_ascii=False)
+        os.replace(tmp_path, self._file('header.json'))
+
+    def _read_header(self):
+        with open(self._file('header.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    @contextmanager
+    def _write_lock(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file('.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _open(self):
+        """Diskdagi sarlavha bo'yicha yangi snapshot yaratib almashtirish"""
+        with self._lock:
+            header = self._read_header()
+            old = self._snapshot
+            build_changed = old is None or header['build_id'] != old.header['build_id']
+            capacity_changed = old is None or header['capacity'] != old.header['capacity']
+            if build_changed or capacity_changed:
+                vectors = np.memmap(
+                    self._file('vectors.f16'), dtype=np.float16, mode='r+',
+                    shape=(header['capacity'], header['dim'])
+                )
+                rows = np.memmap(self._file('rows.bin'), dtype=ROW_DTYPE, mode='r+', shape=(header['capacity'],))
+            else:
+                vectors, rows = old.vectors, old.rows
+            if build_changed:
+                centroids_path = self._file('centroids.npy')
+                centroids = np.load(centroids_path) if header['nlist'] and os.path.exists(centroids_path) else None
+                lists = _build_lists(rows, header['count'], header['nlist']) if centroids is not None else None
+            else:
+                centroids = old.centroids
+                lists = _extend_lists(old.lists, rows, old.header['count'], header['count'])
+            self._snapshot = _Snapshot(header, vectors, rows, centroids, lists)
+            self._header_mtime = os.path.getmtime(self._file('header.json'))
+
+    def refresh(self):
+        """Boshqa jarayon qo'shgan qatorlarni (yoki qayta qurilgan omborni) ko'rish"""
+        try:
+            mtime = os.path.getmtime(self._file('header.json'))
+        except FileNotFoundError:
+            return False
+        if mtime == self._header_mtime:
+            return False
+        self._open()
+        return True
+
+    @property
+    def header(self):
+        return self._snapshot.header
+
+    @property
+    def dim(self):
+        return self.header['dim']
+
+    def __len__(self):
+        return self.header['count']
+
+    # ------------------------------------------------------------------
+    # Yozish
+    # ------------------------------------------------------------------
+
+    def _codes(self, header, field, values):
+        table = header[field]
+        index = {value: i for i, value in enumerate(table)}
+        codes = []
+        for value in values:
+            value = value or ''
+            if value not in index:
+                index[value] = len(table)
+                table.append(value)
+            codes.append(index[value])
+        return np.array(codes, dtype=np.int16)
+
+    def append(self, vectors, image_ids, user_ids, regions, labels, confirmed):
+        """Yangi embeddinglarni qo'shish (allaqachon bor rasm id lari qayta yozilmaydi)"""
+        vectors = _normalize(vectors)
+        with self._write_lock():
+            self._open()
+            # Snapshot sarlavhasi o'quvchilarga tegishli - o'zgartirish nusxada
+            header = copy.deepcopy(self.header)
+            snapshot = self._snapshot
+            stored = snapshot.rows['image_id'][:header['count']]
+            existing = set(stored[np.isin(stored, image_ids)].tolist())
+            keep = [i for i, image_id in enumerate(image_ids) if image_id not in existing]
+            if not keep:
+                return 0
+            count, new_count = header['count'], header['count'] + len(keep)
+            if new_count > header['capacity']:
+                capacity = header['capacity']
+                while capacity < new_count:
+                    capacity *= 2
+                self._allocate(capacity, header['dim'])
+                header['capacity'] = capacity
+                self._write_header(header)
+                self._open()
+                header = copy.deepcopy(self.header)
+                snapshot = self._snapshot
+
+            part = vectors[keep]
+            snapshot.vectors[count:new_count] = part
+            rows = snapshot.rows[count:new_count]
+            rows['image_id'] = np.asarray(image_ids)[keep]
+            rows['user_id'] = [user_ids[i] or 0 for i in keep]
+            rows['region'] = self._codes(header, 'regions', [regions[i] for i in keep])
+            rows['label'] = self._codes(header, 'labels', [labels[i] for i in keep])
+            rows['confirmed'] = np.asarray(confirmed, dtype=np.int8)[keep]
+            rows['list'] = _assign(part, snapshot.centroids)
+            snapshot.vectors.flush()
+            snapshot.rows.flush()
+            header['count'] = new_count
+            self._write_header(header)
+            self._open()
+        return len(keep)
+
+    def set_confirmed(self, image_ids, value=True):
+        """Tasdiqlangan belgisini yangilash (admin tasdiqlagan tashxislar)"""
+        with self._write_lock():
+            self._open()
+            snapshot = self._snapshot
+            rows = snapshot.rows[:snapshot.header['count']]
+            mask = np.isin(rows['image_id'], image_ids)
+            rows['confirmed'][mask] = 1 if value else 0
+            snapshot.rows.flush()
+            # Boshqa jarayonlar ham ko'rishi uchun sarlavha vaqti yangilanadi
+            self._write_header(snapshot.header)
+            self._open()
+            return int(mask.sum())
+
+    def needs_training(self, min_vectors):
+        """IVF yo'q va ombor ``min_vectors`` ga yetgan, yoki o'qitilgandan beri ikki barobar o'sgan"""
+        count = self.header['count']
+        if not self.header['nlist']:
+            return count >= min_vectors
+        return count >= 2 * self.header.get('trained_count', 0)
+
+    def request_training(self, min_vectors):
+        """
+        Kerak bo'lsa sarlavhaga ``train_requested`` belgisini qo'yish (arzon -
+        web jarayonida chaqiriladi, o'qitishni ``train_if_requested`` bajaradi).
+
+        Returns:
+            bool: belgi shu chaqiruvda qo'yildimi
+        """
+        if self.header.get('train_requested') or not self.needs_training(min_vectors):
+            return False
+        with self._write_lock():
+            self._open()
+            if self.header.get('train_requested') or not self.needs_training(min_vectors):
+                return False
+            self._write_header(dict(self.header, train_requested=True))
+            self._open()
+            return True
+
+    def train_if_requested(self, **kwargs):
+        """
+        Belgi qo'yilgan bo'lsa IVF ni (qayta) o'qitish. Belgi qulf ichida qayta
+        tekshiriladi - bir nechta worker bitta omborni ikki marta o'qitmaydi.
+
+        Returns:
+            int: yangi klasterlar soni (o'qitilmagan bo'lsa 0)
+        """
+        self.refresh()
+        if not self.header.get('train_requested'):
+            return 0
+        with self._write_lock():
+            self._open()
+            if not self.header.get('train_requested'):
+                return 0
+            return self._train(**kwargs)
+
+    def train(self, nlist=None, sample=100000, iterations=10, seed=0):
+        """
+        IVF markazlarini sferik k-means bilan o'rgatish va barcha qatorlarni
+        ro'yxatlarga biriktirish. ``nlist`` berilmasa ``4 * sqrt(N)``.
+        """
+        with self._write_lock():
+            self._open()
+            return self._train(nlist, sample, iterations, seed)
+
+    def _train(self, nlist=None, sample=100000, iterations=10, seed=0):
+        header = copy.deepcopy(self.header)
+        snapshot = self._snapshot
+        count = header['count']
+        if count == 0:
+            return 0
+        nlist = int(nlist or max(1, 4 * int(np.sqrt(count))))
+        nlist = min(nlist, count)
+        rng = np.random.default_rng(seed)
+        picked = np.sort(rng.choice(count, size=min(sample, count), replace=False))
+        data = snapshot.vectors[picked].astype(np.float32)
+        centroids = data[rng.choice(len(data), size=nlist, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, data)
+            empty = np.bincount(assignment, minlength=nlist) == 0
+            # Bo'sh qolgan markaz tasodifiy nuqtaga ko'chiriladi
+            sums[empty] = data[rng.choice(len(data), size=int(empty.sum()))]
+            centroids = _normalize(sums)
+        centroids = centroids.astype(np.float32)
+        np.save(self._file('centroids.npy'), centroids)
+
+        # Ro'yxatlar joyida qayta yoziladi; o'quvchilar yangi build_id bilan
+        # butun indeksni qayta quradi
+        step = 65536
+        for start in range(0, count, step):
+            chunk = snapshot.vectors[start:start + step].astype(np.float32)
+            snapshot.rows['list'][start:start + step] = _assign(chunk, centroids)
+        snapshot.rows.flush()
+        header['nlist'] = nlist
+        header['trained_count'] = count
+        header['train_requested'] = False
+        header['build_id'] = uuid.uuid4().hex
+        self._write_header(header)
+        self._open()
+        return nlist
+
+    # ------------------------------------------------------------------
+    # O'qish
+    # ------------------------------------------------------------------
+
+    def get_vector(self, image_id):
+        """Saqlangan embedding (bo'lmasa None)"""
+        snapshot = self._snapshot
+        rows = snapshot.rows['image_id'][:snapshot.header['count']]
+        found = np.flatnonzero(rows == image_id)
+        return snapshot.vectors[found[-1]].astype(np.float32) if len(found) else None
+
+    def _candidates(self, snapshot, query, nprobe):
+        """Baholanadigan qator indekslari, ``SEARCH_CHUNK`` talik bo'laklarda"""
+        count = snapshot.header['count']
+        if snapshot.lists is None:
+            for start in range(0, count, SEARCH_CHUNK):
+                yield np.arange(start, min(start + SEARCH_CHUNK, count))
+            return
+        nprobe = min(nprobe, len(snapshot.lists))
+        probes = np.argpartition(snapshot.centroids @ query, -nprobe)[-nprobe:]
+        candidates = np.concatenate([snapshot.lists[c] for c in probes])
+        for start in range(0, len(candidates), SEARCH_CHUNK):
+            # Tartiblangan indekslar memmap ni ketma-ket o'qiydi
+            yield np.sort(candidates[start:start + SEARCH_CHUNK])
+
+    def search(self, query, k=5, region=None, exclude_user=None, exclude_image=None,
+               confirmed_only=True, nprobe=8):
+        """
+        Kosinus o'xshashligi bo'yicha eng yaqin ``k`` ta yozuv.
+
+        Nomzodlar bo'laklab baholanadi va har bo'lakdan faqat eng yaxshi ``k``
+        tasi saqlanadi: xotira ``SEARCH_CHUNK * dim`` bilan cheklangan.
+
+        Returns:
+            list: ``[(image_id, score, label), ...]`` o'xshashlik kamayish tartibida
+        """
+        snapshot = self._snapshot
+        header = snapshot.header
+        if not header['count'] or k <= 0:
+            return []
+        region_code = None
+        if region is not None:
+            regions = header['regions']
+            if region not in regions:
+                return []
+            region_code = regions.index(region)
+        query = _normalize(np.asarray(query, dtype=np.float32).reshape(1, -1))[0]
+
+        best_scores, best_rows = np.empty(0, dtype=np.float32), np.empty(0, dtype=ROW_DTYPE)
+        for candidates in self._candidates(snapshot, query, nprobe):
+            rows = snapshot.rows[candidates]
+            mask = np.ones(len(candidates), dtype=bool)
+            if confirmed_only:
+                mask &= rows['confirmed'] == 1
+            if region_code is not None:
+                mask &= rows['region'] == region_code
+            if exclude_user is not None:
+                mask &= rows['user_id'] != exclude_user
+            if exclude_image is not None:
+                mask &= rows['image_id'] != exclude_image
+            if not mask.any():
+                continue
+            candidates, rows = candidates[mask], rows[mask]
+            scores = snapshot.vectors[candidates].astype(np.float32) @ query
+            best_scores = np.concatenate([best_scores, scores])
+            best_rows = np.concatenate([best_rows, rows])
+            if len(best_scores) > k:
+                keep = np.argpartition(best_scores, -k)[-k:]
+                best_scores, best_rows = best_scores[keep], best_rows[keep]
+
+        top = np.argsort(best_scores)[::-1]
+        labels = header['labels']
+        return [
+            (int(best_rows['image_id'][i]), float(best_scores[i]), labels[best_rows['label'][i]]) for i in top
+        ]
+
+    def get_info(self):
+        header = self.header
+        return {
+            'count': header['count'],
+            'dim': header['dim'],
+            'nlist': header['nlist'],
+            'train_requested': bool(header.get('train_requested')),
+            'disk_bytes': header['capacity'] * (header['dim'] * 2 + ROW_DTYPE.itemsize),
+        }
@@ -4,7 +4,10 @@ from . import views
 
 urlpatterns = [
     path('predict/', views.predict_disease_api, name='api_predict'),
+    path('predict/bulk/', views.predict_bulk_api, name='api_predict_bulk'),
+    path('predict/session/', views.predict_session_api, name='api_predict_session'),
     path('chat/', views.chat_api, name='api_chat'),
     path('history/', views.user_history_api, name='api_history'),
+    path('images/<int:pk>/similar/', views.similar_cases_api, name='api_similar_cases'),
     path('diseases/', views.diseases_list_api, name='api_diseases'),
 ]
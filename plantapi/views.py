@@ -5,12 +5,20 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.contrib.auth import authenticate
 from django.core.files.storage import default_storage
+from django.utils import timezone
 import tempfile
 import os
 
 from diagnosis.models import Disease, PlantImage, Recommendation
 from diagnosis.serializers import DiseaseSerializer, PlantImageSerializer, RecommendationSerializer
 from diagnosis.views import predict_image
+from diagnosis.model_loader import predict_tiled_detailed
+from diagnosis.jobs import PROGRESS_PREDICTED, abort_streamed_diagnosis, complete_diagnosis
+from diagnosis.streaming import diagnosis_events, sse_response, wants_stream
+from diagnosis.bulk import BulkUploadError, collect_images, diagnose_images
+from diagnosis.sessions import SessionUploadError, collect_session_images, diagnose_session
+from diagnosis import duplicates, embeddings
+from models.gatekeeper import ImageRejected
 
 # Try to import AI utils, fallback to simple version
 try:
@@ -23,6 +31,11 @@ except ImportError:
 def predict_disease_api(request):
     """
     API endpoint for disease prediction
+    
+    ``stream=1`` bo'lsa javob Server-Sent Events: ``prediction`` (darhol),
+    ``recommendation`` bo'laklari va ``done`` (to'liq tavsiya bilan).
+    ``tiled=1`` - katta dala/dron rasmlari bo'laklarga ajratib baholanadi,
+    javobda ``tiles`` (to'r, bo'laklar va issiqlik xaritasi) qaytariladi.
     """
     try:
         if 'image' not in request.FILES:
@@ -40,8 +53,23 @@ def predict_disease_api(request):
             temp_path = temp_file.name
         
         try:
-            # Predict disease
-            disease_name, confidence = predict_image(temp_path)
+            # Predict disease (shared inference engine)
+            tiles = None
+            image_hash = duplicate = None
+            detection_type = request.data.get('detection_type', 'disease')
+            plant_type = request.data.get('plant_type', 'all')
+            scope = duplicates.scope_for(user=request.user)
+            if str(request.data.get('tiled', '')).lower() in ('1', 'true', 'yes'):
+                disease_name, confidence, top_k, tiles = predict_tiled_detailed(
+                    temp_path,
+                    detection_type=detection_type,
+                    plant_type=plant_type
+                )
+            else:
+                # Yaqin-dublikat (shu foydalanuvchi, qisqa oyna) bo'lsa CNN ishga tushirilmaydi
+                (disease_name, confidence, top_k), image_hash, duplicate = duplicates.predict(
+                    temp_path, predict_image, scope, detection_type, plant_type
+                )
             
             # Get or create disease
             disease, created = Disease.objects.get_or_create(
@@ -53,8 +81,60 @@ def predict_disease_api(request):
                 }
             )
             
-            # Get AI recommendation
             lang = request.data.get('lang', 'uz')
+            # Muqobil bashoratlar (qo'shimcha inference siz)
+            top_predictions = [
+                {'disease': name, 'confidence': round(probability * 100, 2)}
+                for name, probability in top_k
+            ]
+            
+            if wants_stream(request):
+                # stream=1: tashxis darhol, Gemini tavsiyasi SSE bo'laklari sifatida
+                plant_image = None
+                if request.user.is_authenticated:
+                    plant_image = PlantImage.objects.create(
+                        user=request.user,
+                        image=image_file,
+                        disease=disease,
+                        disease_name=disease_name,
+                        confidence=confidence,
+                        accuracy=confidence * 100,
+                        top_predictions=PlantImage.format_top_predictions(top_k),
+                        language=lang,
+                        phash=image_hash or '',
+                        duplicate_of_id=duplicate['image_id'] if duplicate else None,
+                        progress=PROGRESS_PREDICTED,
+                        status='processing',
+                        # Jarayon o'lsa requeue_stale_jobs yozuvni topadi
+                        claimed_at=timezone.now()
+                    )
+                if duplicate is None:
+                    duplicates.remember(
+                        scope, image_hash, detection_type, plant_type,
+                        (disease_name, confidence, top_k), plant_image.id if plant_image else None
+                    )
+                
+                def on_complete(recommendation):
+                    if plant_image is not None:
+                        complete_diagnosis(plant_image, recommendation)
+                
+                def on_abort(error):
+                    # Klient uzildi yoki tavsiya xatosi - yozuv 'processing' da qolmaydi
+                    if plant_image is not None:
+                        abort_streamed_diagnosis(plant_image, error)
+                
+                return sse_response(diagnosis_events({
+                    'error': False,
+                    'disease': disease_name,
+                    'confidence': round(confidence * 100, 2),
+                    'top_predictions': top_predictions,
+                    'tiles': tiles,
+                    'disease_info': DiseaseSerializer(disease).data,
+                    'image_id': plant_image.id if plant_image else None,
+                    'duplicate_of': duplicate['image_id'] if duplicate else None
+                }, lang, on_complete=on_complete, on_abort=on_abort, result_key='ai_recommendation'))
+            
+            # Get AI recommendation
             ai_recommendation = get_ai_recommendation(disease_name, lang=lang)
             
             # Save to database if user is authenticated
@@ -67,17 +147,29 @@ def predict_disease_api(request):
                     disease_name=disease_name,
                     confidence=confidence,
                     accuracy=confidence * 100,
+                    top_predictions=PlantImage.format_top_predictions(top_k),
                     ai_result=ai_recommendation,
+                    phash=image_hash or '',
+                    duplicate_of_id=duplicate['image_id'] if duplicate else None,
                     status='completed'
                 )
+                embeddings.maybe_index(plant_image)
+            if duplicate is None:
+                duplicates.remember(
+                    scope, image_hash, detection_type, plant_type,
+                    (disease_name, confidence, top_k), plant_image.id if plant_image else None
+                )
             
             return Response({
                 'error': False,
                 'disease': disease_name,
                 'confidence': round(confidence * 100, 2),
+                'top_predictions': top_predictions,
+                'tiles': tiles,
                 'ai_recommendation': ai_recommendation,
                 'disease_info': DiseaseSerializer(disease).data,
-                'image_id': plant_image.id if plant_image else None
+                'image_id': plant_image.id if plant_image else None,
+                'duplicate_of': duplicate['image_id'] if duplicate else None
             })
             
         finally:
@@ -85,12 +177,93 @@ def predict_disease_api(request):
             if os.path.exists(temp_path):
                 os.unlink(temp_path)
                 
+    except ImageRejected as e:
+        # Kaskad filtri: CNN va Gemini chaqirilmadi
+        return Response({
+            'error': True,
+            'rejected': True,
+            'reason': e.reason,
+            'message': e.message
+        }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
     except Exception as e:
         return Response({
             'error': True,
             'message': f'Server xatolik: {str(e)}'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def predict_bulk_api(request):
+    """
+    Ko'p rasm uchun tashxis: ``images`` (bir nechta fayl) va/yoki ``archive``
+    (zip). Rasmlar batch bilan bashorat qilinadi, tavsiya har bir kasallik
+    uchun bir marta ``recommendations`` da qaytariladi.
+    """
+    try:
+        items = collect_images(request.FILES)
+    except BulkUploadError as e:
+        return Response({
+            'error': True,
+            'message': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        data = diagnose_images(
+            items,
+            detection_type=request.data.get('detection_type', 'disease'),
+            plant_type=request.data.get('plant_type', 'all'),
+            lang=request.data.get('lang', 'uz'),
+            user=request.user if request.user.is_authenticated else None
+        )
+    except Exception as e:
+        return Response({
+            'error': True,
+            'message': f'Server xatolik: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    return Response(dict(error=False, count=len(data['results']), **data))
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def predict_session_api(request):
+    """
+    Bitta o'simlikning 2-10 ta rasmi (``images``) bo'yicha umumiy tashxis:
+    rasmlar bitta batch bilan baholanadi, xulosa ``agreement`` (rasmlar mosligi)
+    bilan qaytariladi va tavsiya bir marta olinadi.
+    """
+    try:
+        items = collect_session_images(request.FILES)
+    except SessionUploadError as e:
+        return Response({
+            'error': True,
+            'message': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        data = diagnose_session(
+            items,
+            detection_type=request.data.get('detection_type', 'disease'),
+            plant_type=request.data.get('plant_type', 'all'),
+            lang=request.data.get('lang', 'uz'),
+            user=request.user if request.user.is_authenticated else None
+        )
+    except ImageRejected as e:
+        return Response({
+            'error': True,
+            'rejected': True,
+            'reason': e.reason,
+            'message': e.message
+        }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    except Exception as e:
+        return Response({
+            'error': True,
+            'message': f'Server xatolik: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    return Response(dict(error=False, **data))
+
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def chat_api(request):
@@ -165,6 +338,37 @@ def user_history_api(request):
             'message': f'Server xatolik: {str(e)}'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def similar_cases_api(request, pk):
+    """
+    Shu hududdagi boshqa foydalanuvchilarning eng o'xshash tasdiqlangan
+    tashxislari (``k`` - natijalar soni, ko'pi bilan 20)
+    """
+    plant_image = PlantImage.objects.select_related('user').filter(pk=pk, user=request.user).first()
+    if plant_image is None:
+        return Response({
+            'error': True,
+            'message': 'Rasm topilmadi'
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    try:
+        k = min(max(int(request.GET.get('k', 5)), 1), 20)
+        cases = embeddings.similar_cases(plant_image, k=k)
+    except Exception as e:
+        return Response({
+            'error': True,
+            'message': f'Server xatolik: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    return Response({
+        'error': False,
+        'image_id': plant_image.pk,
+        'region': plant_image.user.region,
+        'count': len(cases),
+        'data': cases
+    })
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def diseases_list_api(request):